@@ -3,8 +3,11 @@ Academic Agent - Phân tích học tập và gợi ý lộ trình học tập
 """
 
 from typing import Dict, Any, List
+import asyncio
 import json
+import os
 from .base_agent import BaseAgent
+from .prediction_models import get_model_registry, model_scope
 
 class AcademicAgent(BaseAgent):
     def __init__(self):
@@ -17,6 +20,7 @@ class AcademicAgent(BaseAgent):
             "predict_academic_outcomes",
             "identify_learning_gaps"
         ]
+        self.pass_grade = float(os.getenv("PREDICTION_PASS_GRADE", "5.0"))
     
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý các tác vụ học thuật"""
@@ -67,8 +71,7 @@ class AcademicAgent(BaseAgent):
         
         system_prompt = "Bạn là một chuyên gia giáo dục có kinh nghiệm, luôn đưa ra phân tích khách quan và gợi ý thiết thực."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        analysis = self.extract_json_from_response(response)
+        analysis = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             analysis,
@@ -122,8 +125,7 @@ class AcademicAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia thiết kế chương trình học tập, luôn tạo lộ trình thực tế và hiệu quả."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        learning_path = self.extract_json_from_response(response)
+        learning_path = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             learning_path,
@@ -189,8 +191,7 @@ class AcademicAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia nội dung giáo dục, luôn đề xuất tài liệu chất lượng và phù hợp."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        recommendations = self.extract_json_from_response(response)
+        recommendations = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             recommendations,
@@ -210,6 +211,23 @@ class AcademicAgent(BaseAgent):
         current_performance = data.get("current_performance", {})
         external_factors = data.get("external_factors", {})
         
+        # Môn/chương trình đã có mô hình dự báo: trả kết quả ngay, không gọi LLM
+        if data.get("course_id") or data.get("program"):
+            try:
+                prediction = await asyncio.to_thread(get_model_registry().predict,
+                                                     model_scope(data.get("course_id"), data.get("program")),
+                                                     [{**current_performance, "student_id": student_id}])
+                result = prediction.students(float(data.get("pass_grade", self.pass_grade)))[0]
+                return self.format_response(
+                    {**result, "model": prediction.to_metadata()},
+                    confidence=0.8,
+                    suggestions=[
+                        "Tập trung vào các môn có nguy cơ" if result["at_risk"] else "Duy trì nhịp độ học tập hiện tại"
+                    ]
+                )
+            except LookupError:
+                pass
+        
         prompt = f"""
         Bạn là một chuyên gia phân tích dữ liệu giáo dục. Hãy dự báo kết quả học tập với thông tin:
         
@@ -235,8 +253,7 @@ class AcademicAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia dự báo học thuật, sử dụng dữ liệu để đưa ra dự báo chính xác."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        predictions = self.extract_json_from_response(response)
+        predictions = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             predictions,
@@ -289,8 +306,7 @@ class AcademicAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia nhận diện lỗ hổng kiến thức, luôn phân tích sâu và đưa ra giải pháp hiệu quả."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        gaps_analysis = self.extract_json_from_response(response)
+        gaps_analysis = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             gaps_analysis,
@@ -3,72 +3,300 @@ Base Agent Class for EduManager AI System
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Union, Callable
+from contextvars import ContextVar
 import asyncio
+import functools
 import json
+import os
+import time
 import httpx
 from datetime import datetime
+from .tracing import get_tracer, traced, SPAN_KIND_CLIENT
+from .model_manager import get_model_manager, ModelPolicy
+from .ollama_health import get_ollama_health, response_key, is_outage, CircuitOpenError, OllamaAPIError
+from .ollama_pool import OllamaPool, get_ollama_pool
+from .structured_output import (
+    IncrementalJSONParser, StructuredResult, parse_json, validate_schema, get_structured_output_stats
+)
+
+# call_ollama không raise: lỗi được trả về dưới dạng text bắt đầu bằng prefix này
+LLM_ERROR_PREFIX = "Error: Unable to process request - "
+STRUCTURED_RETRY_INSTRUCTION = "Phản hồi trước không phải JSON hợp lệ theo yêu cầu. Chỉ trả về JSON đúng cấu trúc. Lỗi:"
+
+def is_llm_error(text: Any) -> bool:
+    """True nếu text là thông báo lỗi của call_ollama chứ không phải câu trả lời của model"""
+    return isinstance(text, str) and text.startswith(LLM_ERROR_PREFIX)
+
+
+def contains_llm_error(text: Any) -> bool:
+    """True nếu thông báo lỗi của call_ollama nằm đâu đó trong text (vd. đã được format_response/template bọc lại)"""
+    return isinstance(text, str) and LLM_ERROR_PREFIX in text
+
+
+# Task đang xử lý và các model đã thực sự phục vụ trong lần gọi process hiện tại
+_process_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("agent_process_scope", default=None)
+
+
+def _with_process_scope(process):
+    @functools.wraps(process)
+    async def wrapper(self, task=None, *args, **kwargs):
+        token = _process_scope.set({"agent": self.name, "task": task, "selections": []})
+        try:
+            return await process(self, task, *args, **kwargs)
+        finally:
+            _process_scope.reset(token)
+    return wrapper
 
 class BaseAgent(ABC):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Mỗi lần gọi process của agent con được bọc trong một span
+        process = cls.__dict__.get("process")
+        if process is not None and not getattr(process, "__traced__", False):
+            cls.process = traced(
+                f"{cls.__name__}.process",
+                attributes=lambda self, task=None, *args, **kwargs: {"agent.name": self.name, "agent.task": str(task)}
+            )(_with_process_scope(process))
+
     def __init__(self, name: str, model: str = "llama3:8b-instruct"):
         self.name = name
         self.model = model
         self.description = ""
         self.capabilities = []
-        self.ollama_url = "http://localhost:11434"
+        # None = pool Ollama dùng chung (OLLAMA_URLS/OLLAMA_URL); gán OllamaPool (hoặc ollama_url) để agent dùng host riêng
+        self.ollama_pool: Optional[OllamaPool] = None
+        self.ollama_timeout = float(os.getenv("OLLAMA_TIMEOUT", "30"))
+        # Model dự phòng và latency budget (giây); None = theo OLLAMA_MODEL_FALLBACKS/OLLAMA_LATENCY_BUDGET
+        self.model_fallbacks: Optional[List[str]] = None
+        self.latency_budget: Optional[float] = None
+        # Ghi đè theo task, ví dụ {"batch_processing": {"latency_budget": 0}} để không bao giờ hạ model
+        self.task_model_policies: Dict[str, Dict[str, Any]] = {}
+        self.structured_max_retries = int(os.getenv("STRUCTURED_OUTPUT_MAX_RETRIES", "1"))
+    
+    @property
+    def ollama_url(self) -> str:
+        return (self.ollama_pool or get_ollama_pool()).urls[0]
+    
+    @ollama_url.setter
+    def ollama_url(self, url: str):
+        self.ollama_pool = OllamaPool([url])
+    
+    def model_policy(self, task: str = None) -> ModelPolicy:
+        """Policy chọn model cho task (mặc định là task của lần gọi process hiện tại)"""
+        if task is None:
+            scope = _process_scope.get()
+            task = scope["task"] if scope and scope["agent"] == self.name else None
+        overrides = self.task_model_policies.get(task, {}) if task else {}
+        return get_model_manager().policy_for(
+            overrides.get("model", self.model),
+            fallbacks=overrides.get("fallbacks", self.model_fallbacks),
+            latency_budget=overrides.get("latency_budget", self.latency_budget),
+            expected_tokens=overrides.get("expected_tokens")
+        )
     
     @abstractmethod
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Process the AI task"""
         pass
     
-    async def call_ollama(self, prompt: str, system_prompt: str = None) -> str:
+    async def call_ollama(self, prompt: str, system_prompt: str = None,
+                          format: Union[str, Dict[str, Any], None] = None,
+                          on_chunk: Callable[[str], Any] = None) -> str:
         """Call Ollama API for local LLM inference"""
+        health = get_ollama_health()
+        key = response_key(self.model, prompt, system_prompt, format)
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            text = await self._generate(prompt, system_prompt, format, on_chunk)
+            health.remember(key, text)
+            return text
+        except CircuitOpenError as e:
+            # Ollama đang sập: trả response đã có cho đúng prompt này nếu có, không chờ timeout
+            cached = health.cached_response(key)
+            if cached is not None:
+                return cached
+            print(f"Error calling Ollama: {str(e)}")
+            return f"{LLM_ERROR_PREFIX}{str(e)}"
+        except Exception as e:
+            print(f"Error calling Ollama: {str(e)}")
+            return f"{LLM_ERROR_PREFIX}{str(e)}"
+    
+    async def _generate(self, prompt: str, system_prompt: str = None,
+                        format: Union[str, Dict[str, Any], None] = None,
+                        on_chunk: Callable[[str], Any] = None) -> str:
+        """Gọi /api/generate; `format` là "json" hoặc JSON schema. Có `on_chunk` thì stream,
+        gọi on_chunk cho từng đoạn text và dừng sớm khi on_chunk trả về True"""
+        health = get_ollama_health()
+        # Circuit mở thì thất bại ngay, không xếp hàng chờ model
+        health.before_call()
+        model_manager = get_model_manager()
+        # Chọn model theo latency budget: hạ xuống model dự phòng khi hàng đợi model ưu tiên quá dài
+        selection = model_manager.select_model(self.model_policy())
+        model = selection.model
+        scope = _process_scope.get()
+        if scope is not None:
+            scope["selections"].append(selection)
+        attributes = {
+            "agent.name": self.name,
+            "llm.model": model,
+            "llm.requested_model": selection.requested,
+            "llm.degraded": selection.degraded,
+            "llm.estimated_seconds": round(selection.estimated_seconds, 3),
+            "llm.format": "schema" if isinstance(format, dict) else (format or "text"),
+            "llm.stream": on_chunk is not None,
+            "llm.prompt_chars": len(prompt or ""),
+            "llm.system_prompt_chars": len(system_prompt or "")
+        }
+        with get_tracer().start_span("ollama.generate", SPAN_KIND_CLIENT, attributes) as span:
+            recorded = False
+            try:
                 payload = {
-                    "model": self.model,
+                    "model": model,
                     "prompt": prompt,
-                    "stream": False
+                    "stream": on_chunk is not None,
+                    "keep_alive": model_manager.keep_alive_for(model)
                 }
                 
                 if system_prompt:
                     payload["system"] = system_prompt
+                if format:
+                    payload["format"] = format
                 
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json=payload
-                )
+                parts = []
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "")
-                else:
-                    raise Exception(f"Ollama API error: {response.status_code}")
-                    
-        except Exception as e:
-            print(f"Error calling Ollama: {str(e)}")
-            return f"Error: Unable to process request - {str(e)}"
+                async def send(backend):
+                    async with httpx.AsyncClient(timeout=self.ollama_timeout) as client:
+                        if on_chunk is None:
+                            response = await client.post(f"{backend.url}/api/generate", json=payload)
+                            span.set_attribute("http.status_code", response.status_code)
+                            if response.status_code != 200:
+                                raise OllamaAPIError(response.status_code)
+                            result = response.json()
+                            span.set_attribute("ollama.backend", backend.url)
+                            return result.get("response", ""), result
+                        
+                        result = {}
+                        async with client.stream("POST", f"{backend.url}/api/generate", json=payload) as response:
+                            span.set_attribute("http.status_code", response.status_code)
+                            span.set_attribute("ollama.backend", backend.url)
+                            if response.status_code != 200:
+                                raise OllamaAPIError(response.status_code)
+                            async for line in response.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                result = json.loads(line)
+                                if "error" in result:
+                                    raise Exception(f"Ollama API error: {result['error']}")
+                                piece = result.get("response", "")
+                                if piece:
+                                    parts.append(piece)
+                                    if on_chunk(piece) is True:
+                                        # Đã có đủ dữ liệu (vd. JSON đã đóng): đóng stream để Ollama dừng sinh
+                                        span.set_attribute("llm.stopped_early", True)
+                                        break
+                                if result.get("done"):
+                                    break
+                        return "".join(parts), result
+                
+                pool = self.ollama_pool or get_ollama_pool()
+                hedge = pool.should_hedge(len(prompt or "") + len(system_prompt or ""), on_chunk is not None)
+                # Chờ tới lượt của model để các request cùng model được gom lại, giảm swap
+                async with model_manager.slot(model):
+                    started = time.perf_counter()
+                    # Backend lỗi thì chuyển sang backend khác, trừ khi đã stream một phần cho caller
+                    text, result = await pool.request(model, send, hedge=hedge, can_failover=lambda: not parts)
+                    health.record_success(time.perf_counter() - started)
+                    recorded = True
+                    model_manager.observe_response(model, result)
+                    span.set_attribute("llm.response_chars", len(text))
+                    if "eval_count" in result:
+                        span.set_attribute("llm.completion_tokens", result["eval_count"])
+                    return text
+                        
+            except Exception as e:
+                span.set_error(str(e))
+                # Chỉ lỗi kết nối/timeout/5xx mới tính cho circuit breaker (404 model không có thì không)
+                if is_outage(e):
+                    health.record_failure(e)
+                    recorded = True
+                raise
+            finally:
+                if not recorded:
+                    health.release()
+    
+    async def generate_structured(self, prompt: str, system_prompt: str = None,
+                                  schema: Dict[str, Any] = None, task: str = None,
+                                  max_retries: int = None,
+                                  on_field: Callable[[Any, Any], None] = None) -> StructuredResult:
+        """Gọi LLM ở chế độ JSON (format="json" hoặc schema), parse tăng dần khi stream và kiểm tra schema
+
+        `on_field(name, value)` được gọi ngay khi một field cấp một sinh xong (mỗi lần thử).
+        Response lỗi parse/schema được thử lại tối đa `max_retries` lần kèm mô tả lỗi.
+        """
+        stats = get_structured_output_stats()
+        if task is None:
+            scope = _process_scope.get()
+            task = scope["task"] if scope and scope["agent"] == self.name else None
+        key = f"{self.name}.{task or 'default'}"
+        retries = self.structured_max_retries if max_retries is None else max_retries
+        stats.record(key, requests=1)
+        
+        current_prompt = prompt
+        for attempt in range(1, retries + 2):
+            parser = IncrementalJSONParser(on_field)
+            try:
+                text = await self._generate(current_prompt, system_prompt, schema or "json",
+                                            lambda chunk: parser.feed(chunk).done)
+            except Exception as e:
+                print(f"Error calling Ollama: {str(e)}")
+                stats.record(key, errors=1, fallbacks=1)
+                return StructuredResult(None, f"{LLM_ERROR_PREFIX}{str(e)}", False, attempt, [str(e)])
+            
+            if parser.ok:
+                errors = validate_schema(parser.value, schema)
+                if not errors:
+                    stats.record(key, succeeded=1)
+                    return StructuredResult(parser.value, text, True, attempt)
+                stats.record(key, validation_failures=1)
+            else:
+                errors = parser.errors or ["Response is not a complete JSON document"]
+                stats.record(key, parse_failures=1)
+            
+            if attempt <= retries:
+                stats.record(key, retries=1)
+                current_prompt = f"{prompt}\n\n{STRUCTURED_RETRY_INSTRUCTION} {'; '.join(errors[:5])}"
+        
+        stats.record(key, fallbacks=1)
+        return StructuredResult(parser.value if parser.started else None, text, False, attempt, errors)
+    
+    async def call_ollama_json(self, prompt: str, system_prompt: str = None,
+                               schema: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Như call_ollama + extract_json_from_response nhưng dùng JSON mode của Ollama"""
+        result = await self.generate_structured(prompt, system_prompt, schema)
+        return result.as_dict()
     
     def format_response(self, response: str, confidence: float = 0.8, suggestions: List[str] = None) -> Dict[str, Any]:
         """Format the AI response"""
-        return {
+        formatted = {
             "response": response,
             "confidence": confidence,
             "suggestions": suggestions or [],
             "timestamp": datetime.now().isoformat(),
             "agent": self.name
         }
+        scope = _process_scope.get()
+        if scope and scope["selections"]:
+            # Model thực sự phục vụ (lần gọi LLM cuối) và có bị hạ model ở lần gọi nào không
+            model_info = scope["selections"][-1].to_metadata()
+            model_info["degraded"] = any(s.degraded for s in scope["selections"])
+            model_info["llm_calls"] = len(scope["selections"])
+            formatted["model_info"] = model_info
+        return formatted
     
     def extract_json_from_response(self, response: str) -> Dict[str, Any]:
         """Extract JSON from AI response"""
-        try:
-            # Try to find JSON in the response
-            import re
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return {"raw_response": response}
-        except:
-            return {"raw_response": response}
+        # Parse một lượt từ dấu { đầu tiên, bỏ qua lời dẫn và phần thừa phía sau
+        parser = parse_json(response)
+        if parser.ok and isinstance(parser.value, dict):
+            return parser.value
+        return {"raw_response": response}
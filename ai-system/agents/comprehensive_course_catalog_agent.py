@@ -6,6 +6,7 @@ Tạo môn học chi tiết cho tất cả cấp học và lĩnh vực từ cơ
 import asyncio
 import hashlib
 import json
+import os
 import time
 from typing import Dict, Any, List, Set, Tuple, Optional
 from dataclasses import dataclass
@@ -40,6 +41,13 @@ class ComprehensiveCourseCatalogAgent(BaseAgent):
             "create_specializations"
         ]
         
+        # Tra cứu/thiết kế tương tác được hạ xuống llama3:8b khi 70b quá tải; sinh cả catalog thì chờ 70b
+        self.model_fallbacks = ["llama3:8b-instruct"]
+        self.latency_budget = float(os.getenv("COURSE_CATALOG_LATENCY_BUDGET", "30"))
+        self.task_model_policies = {
+            "generate_comprehensive_catalog": {"latency_budget": 0}
+        }
+        
         self.course_levels = {
             "basic": {"level": 100, "difficulty": 1.0, "credits": 3, "duration": 16},
             "intermediate": {"level": 200, "difficulty": 2.0, "credits": 3-4, "duration": 16},
@@ -664,6 +672,14 @@ class ComprehensiveCourseCatalogAgent(BaseAgent):
         
         return courses
     
+    async def list_courses(self, fields: Optional[List[str]] = None, levels: Optional[List[str]] = None) -> List[Course]:
+        """Mọi môn học của catalog theo thứ tự lĩnh vực/cấp độ (dùng cho tra cứu theo course_id và tạo trước nội dung)"""
+        courses = []
+        for field in fields or list(self.academic_fields.keys()):
+            for level in levels or list(self.course_levels.keys()):
+                courses.extend(await self.generate_courses_for_field_and_level(field, level))
+        return courses
+    
     async def create_degree_programs_for_field(self, field: str) -> Dict[str, Any]:
         programs = {}
         
@@ -925,3 +941,15 @@ class ComprehensiveCourseCatalogAgent(BaseAgent):
             "Cybersecurity fundamentals",
             "Communication and teamwork"
         ]
+
+
+_course_index: Optional[Dict[str, Course]] = None
+
+
+async def get_course_index() -> Dict[str, Course]:
+    """course_id -> Course của toàn bộ catalog (dựng một lần, catalog là dữ liệu tĩnh)"""
+    global _course_index
+    if _course_index is None:
+        courses = await ComprehensiveCourseCatalogAgent().list_courses()
+        _course_index = {course.course_id: course for course in courses}
+    return _course_index
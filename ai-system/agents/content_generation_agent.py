@@ -6,12 +6,113 @@ Agent chuyên tạo nội dung giáo dục với AI tiên tiến
 import asyncio
 import json
 import logging
-from typing import Dict, Any, List, Optional, Union
-from dataclasses import dataclass
+import os
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+from collections import Counter
+from dataclasses import dataclass, asdict
 from datetime import datetime
 import re
+import uuid
 
 from .base_agent import BaseAgent
+from .state_backend import SharedDict
+from .content_repository import BASE_QUALITY_SCORE, get_content_repository
+from .question_bank import ExamAssembly, DEFAULT_POINTS, get_question_bank
+from .comprehensive_course_catalog_agent import get_course_index
+
+logger = logging.getLogger(__name__)
+
+# Yêu cầu theo course_id: độ khó bài tập theo cấp độ môn học
+COURSE_LEVEL_DIFFICULTY = {"basic": "easy", "intermediate": "medium", "advanced": "hard", "expert": "hard"}
+COURSE_TASKS = ("generate_lesson", "generate_exercise", "generate_exam", "generate_quiz")
+QUIZ_QUESTION_TYPES = ["multiple_choice", "true_false", "fill_blank"]
+
+# JSON schema gửi kèm `format` của Ollama và dùng để kiểm tra output từng loại nội dung
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+LESSON_SCHEMA = {
+    "type": "object",
+    "required": ["title", "main_content"],
+    "properties": {
+        "title": {"type": "string"},
+        "objectives": _STRING_LIST,
+        "introduction": {"type": "string"},
+        "main_content": {"type": "array", "items": {"type": "object", "required": ["section", "content"]}},
+        "practice_activities": {"type": "array", "items": {"type": "object"}},
+        "summary": {"type": "string"},
+        "assessment": {"type": "object"}
+    }
+}
+EXERCISE_SCHEMA = {
+    "type": "object",
+    "required": ["exercises"],
+    "properties": {
+        "exercises": {"type": "array", "minItems": 1, "items": {"type": "object", "required": ["question"]}}
+    }
+}
+EXAM_SCHEMA = {
+    "type": "object",
+    "required": ["exam_info", "sections"],
+    "properties": {
+        "exam_info": {"type": "object", "required": ["title"]},
+        "sections": {
+            "type": "array",
+            "minItems": 1,
+            "items": {"type": "object", "required": ["questions"], "properties": {"questions": {"type": "array"}}}
+        },
+        "answer_key": {"type": "object"}
+    }
+}
+QUIZ_SCHEMA = {
+    "type": "object",
+    "required": ["questions"],
+    "properties": {
+        "quiz_info": {"type": "object"},
+        "questions": {"type": "array", "minItems": 1, "items": {"type": "object", "required": ["question"]}}
+    }
+}
+QUESTION_SCHEMA = {
+    "type": "object",
+    "required": ["questions"],
+    "properties": {
+        "questions": {"type": "array", "minItems": 1, "items": {"type": "object", "required": ["question"]}}
+    }
+}
+CURRICULUM_SCHEMA = {
+    "type": "object",
+    "required": ["overview", "modules"],
+    "properties": {
+        "overview": {"type": "string"},
+        "learning_outcomes": _STRING_LIST,
+        "prerequisites": _STRING_LIST,
+        "modules": {"type": "array", "items": {"type": "object", "required": ["title"]}},
+        "teaching_strategies": _STRING_LIST
+    }
+}
+PERSONALIZATION_SCHEMA = {
+    "type": "object",
+    "required": ["personalized_content"],
+    "properties": {
+        "personalized_content": {"type": "string"},
+        "adaptations_made": _STRING_LIST,
+        "scaffolding_provided": {"type": "object"},
+        "accessibility_features": _STRING_LIST
+    }
+}
+QUALITY_ASSESSMENT_SCHEMA = {
+    "type": "object",
+    "required": ["overall_assessment"],
+    "properties": {
+        "overall_assessment": {
+            "type": "object",
+            "required": ["score"],
+            "properties": {"score": {"type": "number", "minimum": 0, "maximum": 10}}
+        },
+        "criteria_scores": {"type": "object"},
+        "strengths": _STRING_LIST,
+        "areas_for_improvement": _STRING_LIST,
+        "recommendations": _STRING_LIST
+    }
+}
 
 @dataclass
 class ContentTemplate:
@@ -52,13 +153,27 @@ class ContentGenerationAgent(BaseAgent):
             "quiz_generation",           # Tạo câu hỏi nhanh
             "curriculum_generation",     # Tạo giáo trình chi tiết
             "content_personalization",   # Cá nhân hóa nội dung
+            "batch_personalization",     # Cá nhân hóa cho cả lớp theo nhóm hồ sơ
             "quality_assessment",        # Đánh giá chất lượng
             "template_management",       # Quản lý templates
             "multilingual_support"        # Hỗ trợ đa ngôn ngữ
         ]
         
-        # Content templates
-        self.templates = self._initialize_templates()
+        # Content templates: template mặc định có sẵn ở mọi worker, template tạo thêm nằm trên state backend
+        self.templates = SharedDict("content_templates", defaults=self._initialize_templates(),
+                                    encode=asdict, decode=lambda data: ContentTemplate(**data))
+        
+        # Nội dung đã tạo: tìm bản dùng lại được trước khi gọi LLM, lấy theo ID cho personalize/assess
+        self.content_repository = get_content_repository()
+        
+        # Ngân hàng câu hỏi: đề thi/quiz được ghép từ câu hỏi đã có, LLM chỉ tạo phần còn thiếu
+        self.question_bank = get_question_bank()
+        
+        # Cá nhân hóa theo lớp: đặc điểm hồ sơ dùng để gom nhóm và số lần gọi LLM đồng thời
+        self.personalization_traits = [
+            t.strip() for t in os.getenv("CONTENT_PERSONALIZATION_TRAITS", "level,language,accommodations").split(",") if t.strip()
+        ]
+        self.personalization_concurrency = int(os.getenv("CONTENT_PERSONALIZATION_CONCURRENCY", "4"))
         
         # Quality metrics
         self.quality_criteria = {
@@ -72,6 +187,9 @@ class ContentGenerationAgent(BaseAgent):
         """Xử lý tác vụ tạo nội dung"""
         
         try:
+            if task in COURSE_TASKS:
+                data = await self._apply_course_defaults(data)
+            
             if task == "generate_lesson":
                 return await self.generate_lesson(data)
             elif task == "generate_exercise":
@@ -84,6 +202,8 @@ class ContentGenerationAgent(BaseAgent):
                 return await self.generate_curriculum(data)
             elif task == "personalize_content":
                 return await self.personalize_content(data)
+            elif task == "personalize_content_batch":
+                return await self.personalize_content_batch(data)
             elif task == "assess_quality":
                 return await self.assess_content_quality(data)
             elif task == "get_template":
@@ -115,14 +235,22 @@ class ContentGenerationAgent(BaseAgent):
         try:
             # Get appropriate template
             template = await self._get_template_for_lesson(subject, level)
+            template_id = template.id if template else "default"
+            params = {"duration": duration, "objectives": objectives}
+            
+            reused = self._find_reusable(data, "lesson", subject, level, topic, template_id, params)
+            if reused is not None:
+                response = self._reused_response(reused, confidence=0.9)
+                response["content"] = self._content_from_dict(response["content"])
+                return response
             
             # Generate content using AI
             prompt = self._create_lesson_prompt(topic, subject, level, duration, objectives, template)
             
-            ai_response = await self._call_ai(prompt)
+            result = await self.generate_structured(prompt, schema=LESSON_SCHEMA)
             
             # Parse and structure content
-            lesson_content = self._parse_lesson_content(ai_response, template)
+            lesson_content = result.value if result.ok else self._parse_lesson_content(result.text, template)
             
             # Generate objectives if not provided
             if not objectives:
@@ -130,8 +258,8 @@ class ContentGenerationAgent(BaseAgent):
             
             # Create content object
             generated_content = GeneratedContent(
-                id=f"lesson_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                template_id=template.id if template else "default",
+                id=self._new_content_id("lesson"),
+                template_id=template_id,
                 content_type="lesson",
                 title=f"{topic} - {subject} Lesson",
                 content=lesson_content,
@@ -149,12 +277,16 @@ class ContentGenerationAgent(BaseAgent):
                 created_at=datetime.now()
             )
             
-            return {
+            response = {
                 "success": True,
                 "content": generated_content,
                 "template_used": template.name if template else "default",
                 "confidence": 0.9
             }
+            if result.ok:
+                self._store_content(response, generated_content.id, "lesson", subject, level, topic, template_id, params,
+                                    generated_content.title, generated_content.quality_score)
+            return {**response, "content_id": generated_content.id, "reused": False}
             
         except Exception as e:
             return {
@@ -171,13 +303,20 @@ class ContentGenerationAgent(BaseAgent):
         difficulty = data.get("difficulty", "medium")
         count = data.get("count", 5)
         
+        subject = data.get("subject", "general")
+        params = {"type": exercise_type, "count": count}
+        
         try:
+            reused = self._find_reusable(data, "exercise", subject, difficulty, topic, params=params)
+            if reused is not None:
+                return self._reused_response(reused, confidence=0.85)
+            
             prompt = self._create_exercise_prompt(topic, exercise_type, difficulty, count)
             
-            ai_response = await self._call_ai(prompt)
-            exercises = self._parse_exercise_content(ai_response)
+            result = await self.generate_structured(prompt, schema=EXERCISE_SCHEMA)
+            exercises = result.value["exercises"] if result.ok else self._parse_exercise_content(result.text)
             
-            return {
+            response = {
                 "success": True,
                 "exercises": exercises,
                 "metadata": {
@@ -189,6 +328,8 @@ class ContentGenerationAgent(BaseAgent):
                 },
                 "confidence": 0.85
             }
+            return await self._finish_generation(response, result.ok, "exercise", exercises, subject, difficulty, topic,
+                                                 params, f"{topic} - {exercise_type} exercises")
             
         except Exception as e:
             return {
@@ -198,21 +339,41 @@ class ContentGenerationAgent(BaseAgent):
             }
     
     async def generate_exam(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Tạo bài thi"""
+        """Tạo bài thi: ghép từ ngân hàng câu hỏi, LLM chỉ tạo phần còn thiếu"""
         
         subject = data.get("subject", "")
         topics = data.get("topics", [])
         duration = data.get("duration", 120)  # minutes
         question_types = data.get("question_types", ["multiple_choice", "short_answer", "essay"])
         total_points = data.get("total_points", 100)
+        class_id = data.get("class_id")
+        
+        level = data.get("level", "general")
+        topic = ", ".join(topics)
+        params = {"duration": duration, "question_types": question_types, "total_points": total_points}
         
         try:
-            prompt = self._create_exam_prompt(subject, topics, duration, question_types, total_points)
+            # Đề cho một lớp cụ thể không dùng lại nguyên đề đã lưu (câu hỏi không lặp lại trong lớp)
+            reused = None if class_id else self._find_reusable(data, "exam", subject, level, topic, params=params)
+            if reused is not None:
+                return self._reused_response(reused, confidence=0.8)
             
-            ai_response = await self._call_ai(prompt)
-            exam_content = self._parse_exam_content(ai_response)
+            assembly = self.question_bank.assemble(subject, topics, question_types, total_points=total_points,
+                                                   duration=duration, class_id=class_id)
+            if assembly.available:
+                questions, ok = await self._fill_question_gaps(assembly, subject, topics, level, class_id)
+                exam_content = self._exam_from_questions(questions, assembly, subject, topics, duration)
+                bank_ids = [q["bank_id"] for q in questions]
+            else:
+                # Ngân hàng chưa có câu nào cho môn/chủ đề này: tạo cả đề bằng LLM rồi đưa câu hỏi vào ngân hàng
+                prompt = self._create_exam_prompt(subject, topics, duration, question_types, total_points)
+                
+                result = await self.generate_structured(prompt, schema=EXAM_SCHEMA)
+                exam_content = result.value if result.ok else self._parse_exam_content(result.text)
+                ok = result.ok
+                bank_ids = self._bank_exam_questions(exam_content, subject, topics, level) if ok else []
             
-            return {
+            response = {
                 "success": True,
                 "exam": exam_content,
                 "metadata": {
@@ -221,10 +382,15 @@ class ContentGenerationAgent(BaseAgent):
                     "duration": duration,
                     "question_types": question_types,
                     "total_points": total_points,
+                    "assembly": self._assembly_metadata(assembly, exam_content.get("sections", [])),
                     "generated_at": datetime.now().isoformat()
                 },
                 "confidence": 0.8
             }
+            response = await self._finish_generation(response, ok, "exam", exam_content, subject, level, topic,
+                                                     params, exam_content.get("exam_info", {}).get("title") or f"{subject} exam")
+            self.question_bank.record_usage(class_id, response["content_id"], bank_ids)
+            return response
             
         except Exception as e:
             return {
@@ -234,20 +400,45 @@ class ContentGenerationAgent(BaseAgent):
             }
     
     async def generate_quiz(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Tạo câu hỏi nhanh"""
+        """Tạo câu hỏi nhanh: ghép từ ngân hàng câu hỏi, LLM chỉ tạo phần còn thiếu"""
         
         topic = data.get("topic", "")
         quiz_type = data.get("type", "quick")  # quick, formative, summative
         question_count = data.get("count", 10)
         time_limit = data.get("time_limit", 15)  # minutes
+        question_types = data.get("question_types", QUIZ_QUESTION_TYPES)
+        class_id = data.get("class_id")
+        
+        subject = data.get("subject", "general")
+        level = data.get("level", "general")
+        params = {"type": quiz_type, "count": question_count, "time_limit": time_limit}
         
         try:
-            prompt = self._create_quiz_prompt(topic, quiz_type, question_count, time_limit)
+            reused = None if class_id else self._find_reusable(data, "quiz", subject, level, topic, params=params)
+            if reused is not None:
+                return self._reused_response(reused, confidence=0.85)
             
-            ai_response = await self._call_ai(prompt)
-            quiz_content = self._parse_quiz_content(ai_response)
+            topics = [topic] if topic else []
+            assembly = self.question_bank.assemble(subject, topics, question_types, question_count=question_count,
+                                                   duration=time_limit, class_id=class_id)
+            if assembly.available:
+                questions, ok = await self._fill_question_gaps(assembly, subject, topics, level, class_id)
+                quiz_content = {
+                    "quiz_info": {"title": f"{topic} quiz", "topic": topic, "time_limit": time_limit,
+                                  "instructions": "Answer every question within the time limit."},
+                    "questions": [{**q, "id": i} for i, q in enumerate(questions, 1)]
+                }
+                bank_ids = [q["bank_id"] for q in questions]
+            else:
+                prompt = self._create_quiz_prompt(topic, quiz_type, question_count, time_limit)
+                
+                result = await self.generate_structured(prompt, schema=QUIZ_SCHEMA)
+                quiz_content = result.value if result.ok else self._parse_quiz_content(result.text)
+                ok = result.ok
+                bank_ids = self.question_bank.add_questions(quiz_content["questions"], subject, topic,
+                                                            difficulty=level) if ok else []
             
-            return {
+            response = {
                 "success": True,
                 "quiz": quiz_content,
                 "metadata": {
@@ -255,10 +446,15 @@ class ContentGenerationAgent(BaseAgent):
                     "type": quiz_type,
                     "question_count": question_count,
                     "time_limit": time_limit,
+                    "assembly": self._assembly_metadata(assembly, [quiz_content]),
                     "generated_at": datetime.now().isoformat()
                 },
                 "confidence": 0.85
             }
+            response = await self._finish_generation(response, ok, "quiz", quiz_content, subject, level, topic,
+                                                     params, quiz_content.get("quiz_info", {}).get("title") or f"{topic} quiz")
+            self.question_bank.record_usage(class_id, response["content_id"], bank_ids)
+            return response
             
         except Exception as e:
             return {
@@ -284,8 +480,8 @@ class ContentGenerationAgent(BaseAgent):
                 duration_weeks, modules_count
             )
             
-            ai_response = await self._call_ai(prompt)
-            curriculum_content = self._parse_curriculum_content(ai_response)
+            result = await self.generate_structured(prompt, schema=CURRICULUM_SCHEMA)
+            curriculum_content = result.value if result.ok else self._parse_curriculum_content(result.text)
             
             # Generate detailed syllabus
             syllabus = await self._generate_detailed_syllabus(
@@ -654,13 +850,8 @@ For literature curriculum specifically:
             # Get original content
             original_content = await self._get_content_by_id(content_id)
             
-            # Create personalization prompt
-            prompt = self._create_personalization_prompt(
-                original_content, student_profile, learning_style, adaptation_level
-            )
-            
-            ai_response = await self._call_ai(prompt)
-            personalized_content = self._parse_personalized_content(ai_response)
+            personalized_content, _, _ = await self._personalize(original_content, student_profile, learning_style,
+                                                                 adaptation_level)
             
             return {
                 "success": True,
@@ -682,22 +873,143 @@ For literature curriculum specifically:
                 "confidence": 0.0
             }
     
+    async def personalize_content_batch(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Cá nhân hóa nội dung cho cả lớp: gom học sinh có cùng learning style, adaptation level và đặc điểm hồ sơ
+        chính thành nhóm, mỗi nhóm chỉ gọi LLM một lần"""
+        
+        content_id = data.get("content_id", "")
+        students = data.get("students", [])
+        default_style = data.get("learning_style", "visual")
+        default_adaptation = data.get("adaptation_level", "medium")
+        traits = data.get("cluster_traits", self.personalization_traits)
+        max_concurrent = max(1, int(data.get("max_concurrent", self.personalization_concurrency)))
+        
+        try:
+            if not students:
+                raise ValueError("students is required")
+            # Trùng student_id thì assignments ghi đè nhau: từ chối cả yêu cầu
+            student_ids = [str(student.get("student_id", index)) for index, student in enumerate(students)]
+            duplicates = sorted(sid for sid, n in Counter(student_ids).items() if n > 1)
+            if duplicates:
+                raise ValueError(f"duplicate student_id: {', '.join(duplicates)}")
+            original_content = await self._get_content_by_id(content_id)
+            
+            clusters: Dict[tuple, Dict[str, Any]] = {}
+            assignments = {}
+            for student_id, student in zip(student_ids, students):
+                profile = student.get("student_profile", {})
+                key = self._personalization_key(student.get("learning_style", default_style),
+                                                student.get("adaptation_level", default_adaptation), profile, traits)
+                cluster = clusters.setdefault(key, {"cluster_id": f"cluster_{len(clusters) + 1}", "student_ids": [], "profiles": []})
+                cluster["student_ids"].append(student_id)
+                cluster["profiles"].append(profile)
+                assignments[student_id] = cluster["cluster_id"]
+            
+            semaphore = asyncio.Semaphore(max_concurrent)
+            
+            async def personalize_cluster(key: tuple, cluster: Dict[str, Any]) -> Dict[str, Any]:
+                learning_style, adaptation_level, trait_values = key
+                profile = {**dict(trait_values), "interests": self._shared_interests(cluster["profiles"]),
+                           "group_size": len(cluster["student_ids"])}
+                result = {
+                    "cluster_id": cluster["cluster_id"],
+                    "learning_style": learning_style,
+                    "adaptation_level": adaptation_level,
+                    "profile": profile,
+                    "student_ids": cluster["student_ids"]
+                }
+                async with semaphore:
+                    personalized, errors, attempts = await self._personalize(original_content, profile, learning_style,
+                                                                             adaptation_level)
+                result["llm_calls"] = attempts
+                if errors:
+                    # Output không qua schema (vd. LLM lỗi): nhóm này cần cá nhân hóa lại
+                    return {**result, "success": False, "error": "; ".join(errors), "personalized_content": personalized}
+                return {**result, "success": True, "personalized_content": personalized}
+            
+            results = await asyncio.gather(*(personalize_cluster(key, cluster) for key, cluster in clusters.items()))
+            
+            return {
+                "success": True,
+                "original_content": original_content,
+                "clusters": results,
+                "assignments": assignments,
+                "summary": {
+                    "students": len(assignments),
+                    "clusters": len(results),
+                    "failed_clusters": sum(1 for r in results if not r["success"]),
+                    "llm_calls": sum(r["llm_calls"] for r in results),
+                    "llm_calls_saved": len(assignments) - len(results),
+                    "cluster_traits": list(traits)
+                },
+                "confidence": 0.8
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Batch content personalization failed: {str(e)}",
+                "confidence": 0.0
+            }
+    
+    async def _personalize(self, original_content: Any, student_profile: Dict[str, Any], learning_style: str,
+                           adaptation_level: str) -> Tuple[Dict[str, Any], List[str], int]:
+        """Nội dung đã cá nhân hóa, lỗi structured output (rỗng nếu thành công) và số lần gọi LLM kể cả retry"""
+        prompt = self._create_personalization_prompt(
+            original_content, student_profile, learning_style, adaptation_level
+        )
+        
+        result = await self.generate_structured(prompt, schema=PERSONALIZATION_SCHEMA)
+        if result.ok:
+            return result.value, [], result.attempts
+        return (self._parse_personalized_content(result.text), result.errors or ["Invalid personalization output"],
+                result.attempts)
+    
+    def _personalization_key(self, learning_style: str, adaptation_level: str, profile: Dict[str, Any],
+                             traits: List[str]) -> tuple:
+        """Khóa nhóm: (learning style, adaptation level, các đặc điểm hồ sơ chính đã chuẩn hóa)"""
+        def normalize(value):
+            if isinstance(value, (list, tuple, set)):
+                return tuple(sorted(str(v).strip().lower() for v in value))
+            return str(value).strip().lower() if value is not None else None
+        
+        trait_values = tuple((trait, normalize(profile.get(trait, "intermediate" if trait == "level" else None)))
+                             for trait in traits)
+        return normalize(learning_style), normalize(adaptation_level), trait_values
+    
+    def _shared_interests(self, profiles: List[Dict[str, Any]], limit: int = 3) -> List[str]:
+        """Sở thích phổ biến nhất trong nhóm (đưa vào prompt thay cho sở thích của từng học sinh)"""
+        counts: Dict[str, int] = {}
+        for profile in profiles:
+            for interest in profile.get("interests", []):
+                counts[interest] = counts.get(interest, 0) + 1
+        return [interest for interest, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+    
     async def assess_content_quality(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Đánh giá chất lượng nội dung"""
         
         content = data.get("content", "")
         content_type = data.get("content_type", "lesson")
+        content_id = data.get("content_id")
         criteria = data.get("criteria", list(self.quality_criteria.keys()))
         
         try:
+            if content_id and not content:
+                stored = await self._get_content_by_id(content_id)
+                content = stored["content"]
+                content_type = stored["content_type"]
+            
             # Create assessment prompt
             prompt = self._create_quality_assessment_prompt(content, content_type, criteria)
             
-            ai_response = await self._call_ai(prompt)
-            assessment = self._parse_quality_assessment(ai_response, criteria)
+            result = await self.generate_structured(prompt, schema=QUALITY_ASSESSMENT_SCHEMA)
+            assessment = result.value if result.ok else self._parse_quality_assessment(result.text, criteria)
             
             # Calculate overall score
             overall_score = self._calculate_overall_quality_score(assessment, criteria)
+            if content_id and result.ok:
+                # Điểm đánh giá quyết định nội dung có được dùng lại hay không
+                self.content_repository.update_quality(content_id, overall_score)
             
             return {
                 "success": True,
@@ -955,6 +1267,35 @@ OUTPUT FORMAT:
         ...
     ]
 }}
+"""
+    
+    def _create_question_prompt(self, subject: str, topics: List[str], question_type: str, points: List[int], level: str) -> str:
+        """Tạo prompt cho các câu hỏi còn thiếu khi ghép đề từ ngân hàng"""
+        
+        return f"""
+Write {len(points)} new {question_type} questions for a {level} level {subject} exam on: {', '.join(topics) or subject}
+
+REQUIREMENTS:
+- Point values, in order: {', '.join(str(p) for p in points)}
+- Each question tests a different idea and includes the correct answer
+- Multiple choice questions have 4 options
+
+OUTPUT FORMAT:
+{{
+    "questions": [
+        {{
+            "type": "{question_type}",
+            "topic": "One of: {', '.join(topics) or subject}",
+            "difficulty": "easy/medium/hard",
+            "question": "Question text...",
+            "options": ["A", "B", "C", "D"],
+            "answer": "Correct answer",
+            "rubric": "Grading criteria...",
+            "points": {points[0]}
+        }},
+        ...
+    ]
+}}
 """
     
     def _create_personalization_prompt(self, content: str, student_profile: Dict, learning_style: str, adaptation_level: str) -> str:
@@ -1176,7 +1517,7 @@ OUTPUT FORMAT:
     async def _calculate_quality_score(self, content) -> float:
         """Tính điểm chất lượng nội dung"""
         # Simple heuristic based on content characteristics
-        score = 7.0  # Base score
+        score = BASE_QUALITY_SCORE  # Base score
         
         # Handle both string and dict content
         content_str = ""
@@ -1184,13 +1525,11 @@ OUTPUT FORMAT:
             content_str = content
         elif isinstance(content, dict):
             # Extract text content from dict
-            if "content" in content:
+            if isinstance(content.get("content"), str):
                 content_str = content["content"]
-            elif "title" in content:
-                content_str = f"{content.get('title', '')} {content.get('content', '')}"
             else:
-                # Convert dict to string for analysis
-                content_str = str(content)
+                # Nội dung có cấu trúc (main_content, exercises...): chấm trên toàn bộ văn bản, không chỉ tiêu đề
+                content_str = json.dumps(content, ensure_ascii=False)
         else:
             content_str = str(content)
         
@@ -1212,9 +1551,174 @@ OUTPUT FORMAT:
         return min(score, 10.0)
     
     async def _get_content_by_id(self, content_id: str) -> Dict[str, Any]:
-        """Lấy nội dung theo ID (mock implementation)"""
-        # In real implementation, this would query database
-        return {"id": content_id, "content": "Sample content for demonstration"}
+        """Lấy nội dung đã lưu theo ID"""
+        record = self.content_repository.get(content_id)
+        if record is None:
+            raise ValueError(f"Content '{content_id}' not found")
+        payload = record["payload"]
+        body = payload.get("content") or payload.get("exercises") or payload.get("exam") or payload.get("quiz")
+        if isinstance(body, dict) and record["content_type"] == "lesson":
+            body = body.get("content", body)
+        return {
+            "id": content_id,
+            "content_type": record["content_type"],
+            "title": record["title"],
+            "subject": record["subject"],
+            "level": record["level"],
+            "topic": record["topic"],
+            "quality_score": record["quality_score"],
+            "content": body
+        }
+    
+    async def _apply_course_defaults(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Yêu cầu theo `course_id` của catalog: subject/level/topics mặc định lấy từ môn học
+        (cùng khóa với nội dung tạo trước ngoài giờ cao điểm)"""
+        course_id = data.get("course_id")
+        if not course_id:
+            return data
+        course = (await get_course_index()).get(course_id)
+        if course is None:
+            raise ValueError(f"Course '{course_id}' not found")
+        return {
+            "subject": course.title,
+            "level": course.level,
+            "difficulty": COURSE_LEVEL_DIFFICULTY.get(course.level, "medium"),
+            "topics": list(course.topics),
+            **data
+        }
+    
+    def _new_content_id(self, content_type: str) -> str:
+        return f"{content_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    
+    def _find_reusable(self, data: Dict[str, Any], content_type: str, subject: str, level: str, topic: str,
+                       template_id: str = "default", params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Nội dung đã lưu đủ chất lượng và còn mới cho cùng yêu cầu (`force_new` để luôn tạo mới;
+        `pregenerate` chỉ kiểm tra, không tính là một lần dùng lại)"""
+        if data.get("force_new") or not topic:
+            return None
+        return self.content_repository.find_reusable(
+            content_type, subject, level, topic, template_id, params,
+            min_quality=data.get("min_quality"), max_age_seconds=data.get("max_age_seconds"),
+            touch=not data.get("pregenerate")
+        )
+    
+    def _reused_response(self, record: Dict[str, Any], confidence: float) -> Dict[str, Any]:
+        return {
+            **record["payload"],
+            "success": True,
+            "content_id": record["id"],
+            "reused": True,
+            "reuse_count": record["reuse_count"] + 1,
+            "confidence": confidence
+        }
+    
+    def _content_from_dict(self, data: Dict[str, Any]) -> GeneratedContent:
+        return GeneratedContent(**{**data, "created_at": datetime.fromisoformat(data["created_at"])})
+    
+    def _store_content(self, response: Dict[str, Any], content_id: str, content_type: str, subject: str, level: str,
+                       topic: str, template_id: str, params: Dict[str, Any], title: str, quality_score: float):
+        """Lưu kết quả tạo nội dung; lỗi lưu trữ không làm hỏng response"""
+        payload = {k: v for k, v in response.items() if k not in ("success", "confidence")}
+        if isinstance(payload.get("content"), GeneratedContent):
+            payload["content"] = asdict(payload["content"])
+        try:
+            self.content_repository.save(content_id, content_type, payload, subject, level, topic, template_id,
+                                         params, title, quality_score)
+        except Exception as e:
+            logger.warning(f"Failed to store {content_type} {content_id}: {e}")
+    
+    async def _finish_generation(self, response: Dict[str, Any], ok: bool, content_type: str, content: Any,
+                                 subject: str, level: str, topic: str, params: Dict[str, Any], title: str) -> Dict[str, Any]:
+        """Lưu nội dung tạo thành công (output đã qua schema) và gắn content_id vào response"""
+        content_id = self._new_content_id(content_type)
+        if ok:
+            quality_score = await self._calculate_quality_score(content)
+            self._store_content(response, content_id, content_type, subject, level, topic, "default", params,
+                                title, quality_score)
+        return {**response, "content_id": content_id, "reused": False}
+    
+    async def _fill_question_gaps(self, assembly: ExamAssembly, subject: str, topics: List[str], level: str,
+                                  class_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Câu hỏi của đề đã ghép cộng câu LLM tạo cho phần còn thiếu; False nếu vẫn chưa đủ"""
+        questions = list(assembly.questions)
+        # Câu LLM tạo trùng câu đã có trong đề hoặc lớp đã làm không được dùng lại
+        excluded = {q["bank_id"] for q in questions} | self.question_bank.used_question_ids(class_id)
+        complete = True
+        for gap in assembly.gaps:
+            if gap["points"] is None:
+                points = [1] * gap["count"]
+            else:
+                default = DEFAULT_POINTS.get(gap["type"], 1)
+                points = [default] * (gap["points"] // default) + ([gap["points"] % default] if gap["points"] % default else [])
+            generated = await self._generate_bank_questions(subject, topics, level, gap["type"], points, excluded)
+            questions.extend(generated)
+            complete = complete and len(generated) == len(points)
+        return questions, complete
+    
+    async def _generate_bank_questions(self, subject: str, topics: List[str], level: str, question_type: str,
+                                       points: List[int], excluded: Set[int]) -> List[Dict[str, Any]]:
+        """Tạo đúng số câu còn thiếu của một loại câu hỏi và lưu vào ngân hàng; bỏ câu có ID trong `excluded`"""
+        prompt = self._create_question_prompt(subject, topics, question_type, points, level)
+        result = await self.generate_structured(prompt, schema=QUESTION_SCHEMA)
+        if not result.ok:
+            return []
+        questions = []
+        for i, (question, value) in enumerate(zip(result.value["questions"], points)):
+            topic = question.get("topic") if question.get("topic") in topics else (topics[i % len(topics)] if topics else subject)
+            questions.append({**question, "type": question_type, "points": value, "topic": topic})
+        ids = []
+        for bank_id in self.question_bank.add_questions(questions, subject, difficulty=level):
+            if bank_id not in excluded:
+                excluded.add(bank_id)
+                ids.append(bank_id)
+        return self.question_bank.get_questions(ids)
+    
+    def _bank_exam_questions(self, exam_content: Dict[str, Any], subject: str, topics: List[str], level: str) -> List[int]:
+        """Đưa câu hỏi của đề do LLM tạo nguyên đề vào ngân hàng (topic theo section)"""
+        ids = []
+        for section in exam_content.get("sections", []):
+            topic = (section.get("topics") or topics or [subject])[0]
+            ids.extend(self.question_bank.add_questions(section.get("questions", []), subject, topic, difficulty=level))
+        return ids
+    
+    def _exam_from_questions(self, questions: List[Dict[str, Any]], assembly: ExamAssembly, subject: str,
+                             topics: List[str], duration: int) -> Dict[str, Any]:
+        """Dựng đề theo cấu trúc EXAM_SCHEMA: mỗi loại câu hỏi một section, đánh số lại câu hỏi"""
+        sections, answers, number = [], {}, 0
+        for question_type in assembly.targets:
+            section_questions = []
+            for question in (q for q in questions if q["type"] == question_type):
+                number += 1
+                section_questions.append({**question, "id": number})
+                answers[str(number)] = question.get("answer", question.get("correct_answer", ""))
+            if section_questions:
+                sections.append({
+                    "name": question_type.replace("_", " ").title(),
+                    "topics": sorted({q["topic"] for q in section_questions}),
+                    "duration": round(sum(q["minutes"] for q in section_questions)),
+                    "points": sum(q["points"] for q in section_questions),
+                    "questions": section_questions
+                })
+        return {
+            "exam_info": {
+                "title": f"{subject} exam: {', '.join(topics)}" if topics else f"{subject} exam",
+                "duration": duration,
+                "total_points": sum(section["points"] for section in sections),
+                "instructions": "Answer all questions. Points are shown for each question."
+            },
+            "sections": sections,
+            "answer_key": {"answers": answers}
+        }
+    
+    def _assembly_metadata(self, assembly: ExamAssembly, groups: List[Dict[str, Any]]) -> Dict[str, Any]:
+        total = sum(len(group.get("questions", [])) for group in groups)
+        return {
+            "from_bank": len(assembly.questions),
+            "generated": total - len(assembly.questions),
+            "gaps": assembly.gaps,
+            "candidates": assembly.candidates,
+            "solve_ms": assembly.solve_ms
+        }
     
     def _calculate_overall_quality_score(self, assessment: Dict[str, Any], criteria: List[str]) -> float:
         """Tính điểm chất lượng tổng hợp"""
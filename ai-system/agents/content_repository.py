@@ -0,0 +1,228 @@
+"""
+Content Repository
+Kho nội dung đã tạo (bài học, bài tập, bài thi, quiz) trên SQLite: body nén zlib, index theo
+(content_type, subject, level, topic, template) để tìm nội dung dùng lại được trước khi gọi LLM
+"""
+
+from typing import Dict, Any, List, Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from .knowledge_store import topic_key
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = ("lesson", "exercise", "exam", "quiz", "curriculum")
+# Điểm heuristic mọi nội dung đều có (_calculate_quality_score); ngưỡng dùng lại mặc định đòi thêm ít nhất
+# một tín hiệu chất lượng thật (độ dài, cấu trúc, độ rõ ràng) phía trên mức nền
+BASE_QUALITY_SCORE = 7.0
+DEFAULT_MIN_QUALITY = BASE_QUALITY_SCORE + 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contents (
+    id TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT 'general',
+    level TEXT NOT NULL DEFAULT 'general',
+    topic TEXT NOT NULL DEFAULT '',
+    topic_hash TEXT NOT NULL,
+    template_id TEXT NOT NULL DEFAULT 'default',
+    params_hash TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    quality_score REAL NOT NULL DEFAULT 0,
+    body BLOB NOT NULL,
+    body_size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    reuse_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_contents_lookup
+    ON contents (content_type, subject, level, topic_hash, template_id, params_hash, quality_score DESC);
+CREATE INDEX IF NOT EXISTS idx_contents_created ON contents (content_type, created_at);
+"""
+
+
+def topic_hash(topic: str) -> str:
+    """Hash của topic đã chuẩn hóa (chữ thường, bỏ dấu)"""
+    return hashlib.blake2b(topic_key(topic).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def params_hash(params: Optional[Dict[str, Any]]) -> str:
+    """Hash của các tham số tạo nội dung khác (số câu, thời lượng, loại câu hỏi...)"""
+    encoded = json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _compress(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), 6)
+
+
+def _decompress(body: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(body).decode("utf-8"))
+
+
+class ContentRepository:
+    """Kho nội dung SQLite (WAL); dùng chung một connection, khóa bằng threading.Lock"""
+
+    def __init__(self, path: Optional[str] = None, min_quality: Optional[float] = None,
+                 max_age_seconds: Optional[float] = None):
+        self.path = path or ":memory:"
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.min_quality = min_quality if min_quality is not None else \
+            float(os.getenv("CONTENT_REUSE_MIN_QUALITY", str(DEFAULT_MIN_QUALITY)))
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else \
+            float(os.getenv("CONTENT_REUSE_MAX_AGE_SECONDS", str(30 * 86400)))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.stats = {"saved": 0, "lookups": 0, "reuse_hits": 0, "reuse_misses": 0, "fetches": 0}
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def save(self, content_id: str, content_type: str, payload: Dict[str, Any], subject: str = "general",
+             level: str = "general", topic: str = "", template_id: str = "default",
+             params: Optional[Dict[str, Any]] = None, title: str = "", quality_score: float = 0.0) -> str:
+        """Lưu (hoặc ghi đè) một nội dung; `payload` là toàn bộ kết quả tạo nội dung"""
+        body = _compress(payload)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contents (id, content_type, subject, level, topic, topic_hash, template_id, "
+                "params_hash, title, quality_score, body, body_size, created_at, last_used_at, reuse_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (content_id, content_type, subject or "general", level or "general", topic or "", topic_hash(topic),
+                 template_id or "default", params_hash(params), title, float(quality_score), body,
+                 len(json.dumps(payload, ensure_ascii=False, default=str)), now, now)
+            )
+            self.stats["saved"] += 1
+        return content_id
+
+    def _record(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "content_type": row["content_type"],
+            "subject": row["subject"],
+            "level": row["level"],
+            "topic": row["topic"],
+            "template_id": row["template_id"],
+            "title": row["title"],
+            "quality_score": row["quality_score"],
+            "created_at": row["created_at"],
+            "reuse_count": row["reuse_count"],
+            "payload": _decompress(row["body"]),
+        }
+
+    def get(self, content_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy nội dung theo ID (None nếu không có)"""
+        with self._lock:
+            self.stats["fetches"] += 1
+            row = self._conn.execute("SELECT * FROM contents WHERE id = ?", (content_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def find_reusable(self, content_type: str, subject: str = "general", level: str = "general", topic: str = "",
+                      template_id: str = "default", params: Optional[Dict[str, Any]] = None,
+                      min_quality: Optional[float] = None, max_age_seconds: Optional[float] = None,
+                      touch: bool = True) -> Optional[Dict[str, Any]]:
+        """Nội dung cùng loại/môn/cấp độ/topic/template/tham số, đủ chất lượng và còn mới; chọn bản điểm cao nhất
+
+        `touch=False` chỉ kiểm tra (vd. scheduler tạo trước), không tính vào reuse_count và thống kê
+        """
+        min_quality = self.min_quality if min_quality is None else min_quality
+        max_age_seconds = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT * FROM contents WHERE content_type = ? AND subject = ? AND level = ? AND topic_hash = ? "
+                "AND template_id = ? AND params_hash = ? AND quality_score >= ? AND created_at >= ? "
+                "ORDER BY quality_score DESC, created_at DESC LIMIT 1",
+                (content_type, subject or "general", level or "general", topic_hash(topic), template_id or "default",
+                 params_hash(params), min_quality, now - max_age_seconds)
+            ).fetchone()
+            if not touch:
+                return self._record(row) if row is not None else None
+            self.stats["lookups"] += 1
+            if row is None:
+                self.stats["reuse_misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE contents SET reuse_count = reuse_count + 1, last_used_at = ? WHERE id = ?", (now, row["id"])
+            )
+            self.stats["reuse_hits"] += 1
+        return self._record(row)
+
+    def update_quality(self, content_id: str, quality_score: float) -> bool:
+        """Cập nhật điểm chất lượng (vd. sau khi đánh giá bằng LLM)"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE contents SET quality_score = ? WHERE id = ?", (float(quality_score), content_id)
+            ).rowcount > 0
+
+    def delete(self, content_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM contents WHERE id = ?", (content_id,)).rowcount > 0
+
+    def recent(self, content_type: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Danh sách nội dung mới nhất (không giải nén body)"""
+        query = "SELECT id, content_type, subject, level, topic, title, quality_score, created_at, reuse_count FROM contents"
+        params: List[Any] = []
+        if content_type:
+            query += " WHERE content_type = ?"
+            params.append(content_type)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params).fetchall()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_type = {
+                row["content_type"]: {"count": row["n"], "avg_quality": round(row["q"] or 0, 2), "reused": row["r"]}
+                for row in self._conn.execute(
+                    "SELECT content_type, COUNT(*) AS n, AVG(quality_score) AS q, SUM(reuse_count) AS r "
+                    "FROM contents GROUP BY content_type"
+                )
+            }
+            sizes = self._conn.execute("SELECT COALESCE(SUM(body_size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM contents").fetchone()
+        lookups = self.stats["reuse_hits"] + self.stats["reuse_misses"]
+        return {
+            "path": self.path,
+            "total_contents": sum(t["count"] for t in by_type.values()),
+            "content_types": by_type,
+            "raw_bytes": sizes[0],
+            "stored_bytes": sizes[1],
+            "compression_ratio": round(sizes[0] / sizes[1], 2) if sizes[1] else None,
+            "min_quality": self.min_quality,
+            "max_age_seconds": self.max_age_seconds,
+            "reuse_rate": self.stats["reuse_hits"] / lookups if lookups else 0.0,
+            **self.stats,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_repository: Optional[ContentRepository] = None
+
+
+def get_content_repository() -> ContentRepository:
+    global _repository
+    if _repository is None:
+        path = os.getenv("CONTENT_REPOSITORY_PATH", "./data/content.db")
+        _repository = ContentRepository(path or None)
+    return _repository
+
+
+def set_content_repository(repository: Optional[ContentRepository]):
+    global _repository
+    _repository = repository
@@ -5,6 +5,7 @@ Agent chuyên xử lý dữ liệu giáo dục với các tính năng nâng cao
 
 import asyncio
 import json
+import os
 import pandas as pd
 import numpy as np
 from typing import Dict, Any, List, Union, Optional
@@ -13,6 +14,7 @@ from pathlib import Path
 import aiofiles
 import logging
 from .base_agent import BaseAgent
+from .prediction_models import get_model_registry, model_scope
 
 @dataclass
 class EducationDataRecord:
@@ -59,6 +61,14 @@ class EducationDataAgent(BaseAgent):
             "performance_prediction"   # Dự đoán hiệu suất
         ]
         
+        # Request tương tác được hạ xuống llama3:8b khi hàng đợi 70b vượt budget; batch thì luôn chờ 70b
+        self.model_fallbacks = ["llama3:8b-instruct"]
+        self.latency_budget = float(os.getenv("EDUCATION_DATA_LATENCY_BUDGET", "20"))
+        self.task_model_policies = {
+            "batch_processing": {"latency_budget": 0},
+            "generate_insights": {"latency_budget": self.latency_budget * 2}
+        }
+        
         # Education-specific configurations
         self.grade_scales = {
             "4.0": {"A": 4.0, "B": 3.0, "C": 2.0, "D": 1.0, "F": 0.0},
@@ -68,6 +78,10 @@ class EducationDataAgent(BaseAgent):
         
         self.supported_formats = ["json", "csv", "excel", "xml", "txt"]
         
+        # Dự báo điểm bằng mô hình cục bộ thay vì LLM; dưới pass_grade (mặc định, yêu cầu có thể gửi riêng) là có nguy cơ
+        self.model_registry = get_model_registry()
+        self.pass_grade = float(os.getenv("PREDICTION_PASS_GRADE", "5.0"))
+        
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý tác vụ dữ liệu giáo dục"""
         
@@ -231,40 +245,34 @@ class EducationDataAgent(BaseAgent):
             }
     
     async def predict_student_performance(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Dự đoán hiệu suất sinh viên"""
+        """Dự đoán hiệu suất sinh viên bằng mô hình đã huấn luyện của môn/chương trình (cả lớp một lượt)"""
         
         student_id = data.get("student_id")
         historical_data = data.get("historical_data", [])
         current_performance = data.get("current_performance", {})
+        students = data.get("students") or [{**current_performance, "student_id": student_id}]
+        scope = model_scope(data.get("course_id"), data.get("program"))
         
         try:
-            # Analyze historical patterns
-            historical_patterns = await self.analyze_historical_patterns(historical_data)
-            
-            # Current performance analysis
-            current_analysis = await self.analyze_current_performance(current_performance)
-            
-            # Predict future performance
-            predictions = await self.predict_future_performance(
-                historical_patterns, current_analysis
-            )
-            
-            # Risk assessment
-            risk_assessment = await self.assess_academic_risk(predictions, current_analysis)
-            
-            # Recommendations
-            recommendations = await self.generate_performance_recommendations(
-                predictions, risk_assessment
-            )
+            # Kết quả lịch sử (có final_grade) là dữ liệu huấn luyện; đủ bản ghi mới thì huấn luyện lại
+            training = None
+            if historical_data:
+                # Lịch sử của một học sinh thường không lặp lại student_id trong từng bản ghi
+                if student_id:
+                    historical_data = [{"student_id": student_id, **record} for record in historical_data]
+                training = await asyncio.to_thread(self.model_registry.add_records, scope, historical_data)
+            
+            prediction = await asyncio.to_thread(self.model_registry.predict, scope, students)
+            predictions = prediction.students(float(data.get("pass_grade", self.pass_grade)))
+            at_risk = [p["student_id"] for p in predictions if p["at_risk"]]
             
             return {
                 "success": True,
                 "student_id": student_id,
-                "historical_patterns": historical_patterns,
-                "current_analysis": current_analysis,
                 "predictions": predictions,
-                "risk_assessment": risk_assessment,
-                "recommendations": recommendations,
+                "at_risk_students": at_risk,
+                "model": prediction.to_metadata(),
+                "training": training,
                 "confidence": 0.75
             }
             
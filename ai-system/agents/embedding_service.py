@@ -0,0 +1,510 @@
+"""
+Local Embedding Service
+Tính embedding trong process với micro-batching, cache vector theo hash nội dung (float16 memmap trên đĩa)
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_DIMENSION = 384
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def content_key(text: str) -> bytes:
+    """Key 16 byte của văn bản, dùng cho cache vector"""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def fold_text(text: str) -> str:
+    """Viết thường và bỏ dấu tiếng Việt để "định lý" và "dinh ly" cho cùng token"""
+    decomposed = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class HashingEmbedder:
+    """Embedder xác định dựa trên feature hashing (từ, cặp từ, char trigram)
+
+    Không cần model weights nên dùng cho test offline và làm fallback khi không load được
+    sentence-transformers. Kết quả giống nhau giữa các process (crc32, không dùng hash()).
+    """
+
+    def __init__(self, dimension: int = DEFAULT_DIMENSION):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}-v1"
+
+    def _features(self, text: str) -> Tuple[List[int], List[float]]:
+        words = _WORD_RE.findall(fold_text(text))
+        hashes: List[int] = []
+        weights: List[float] = []
+        for i, word in enumerate(words):
+            hashes.append(zlib.crc32(word.encode()))
+            weights.append(0.5)
+            if i:
+                # Cặp từ có trọng số cao hơn từ đơn để hai văn bản cùng bộ từ vựng không bị coi là trùng
+                hashes.append(zlib.crc32(f"{words[i - 1]} {word}".encode()))
+                weights.append(1.0)
+            padded = f"<{word}>"
+            for j in range(len(padded) - 2):
+                hashes.append(zlib.crc32(padded[j:j + 3].encode(), 0x9E3779B9))
+                weights.append(0.25)
+        return hashes, weights
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes, weights = self._features(text)
+            if not hashes:
+                continue
+            hashed = np.asarray(hashes, dtype=np.uint64)
+            signs = np.where((hashed >> np.uint64(31)) & np.uint64(1), -1.0, 1.0)
+            vectors[row] = np.bincount(
+                (hashed % np.uint64(self.dimension)).astype(np.int64),
+                weights=signs * np.asarray(weights), minlength=self.dimension
+            )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+class SentenceTransformerEmbedder:
+    """Embedder dùng sentence-transformers (CPU/GPU), vector đã chuẩn hóa L2"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.name = f"{model_name}-{self.dimension}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            list(texts), batch_size=max(len(texts), 1), convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def load_embedder(model_name: str = DEFAULT_MODEL, backend: str = "auto"):
+    """Load embedder theo backend: "sentence-transformers", "hashing" hoặc "auto" (fallback về hashing)"""
+    if backend != "hashing":
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            if backend != "auto":
+                raise
+            logger.warning(f"Embedding model {model_name} unavailable ({e}); using hashing embedder")
+    return HashingEmbedder()
+
+
+def _try_lock(lock_file) -> bool:
+    """Khóa độc quyền không chờ trên file; False nếu process khác đang giữ"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class EmbeddingCache:
+    """Cache vector float16 theo content hash
+
+    Với `directory`, vector nằm trong `vectors.f16` (np.memmap) và key 16 byte trong `keys.bin`
+    theo cùng thứ tự dòng, nên cache tồn tại qua các lần khởi động. Khi đầy `max_rows`,
+    dòng cũ nhất bị ghi đè (ring buffer).
+
+    Mỗi cache giữ riêng một thư mục `slot-N` (khóa độc quyền trên file `lock`), nên nhiều worker
+    dùng chung `directory` không ghi đè dòng hay truncate file mà process khác đang map.
+    Khởi động lại sẽ nhận lại slot trống đầu tiên cùng vector đã lưu trong đó.
+    """
+
+    def __init__(self, dimension: int, directory: Optional[str] = None, namespace: str = "default",
+                 max_rows: int = 1_000_000, initial_rows: int = 1024):
+        self.dimension = dimension
+        self.max_rows = max_rows
+        self.rows: Dict[bytes, int] = {}
+        self.row_keys: List[Optional[bytes]] = []
+        self.count = 0
+        self._lock = threading.Lock()
+        self._keys_file = None
+        self._lock_file = None
+        self.path = None
+
+        if directory:
+            safe_namespace = re.sub(r"[^A-Za-z0-9_.-]+", "_", namespace)
+            self.path = self._claim_slot(os.path.join(directory, safe_namespace))
+            self._open(initial_rows)
+        else:
+            self.vectors = np.zeros((min(initial_rows, max_rows), dimension), dtype=np.float16)
+
+    def _claim_slot(self, base: str) -> str:
+        """Chọn thư mục slot đầu tiên chưa bị process/cache khác giữ"""
+        for slot in itertools.count():
+            path = os.path.join(base, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, "lock"), "a+b")
+            if _try_lock(lock_file):
+                self._lock_file = lock_file
+                return path
+            lock_file.close()
+
+    def _open(self, initial_rows: int):
+        vectors_path = os.path.join(self.path, "vectors.f16")
+        keys_path = os.path.join(self.path, "keys.bin")
+        row_bytes = self.dimension * 2
+
+        if not os.path.exists(vectors_path):
+            with open(vectors_path, "wb") as f:
+                f.truncate(min(initial_rows, self.max_rows) * row_bytes)
+        if not os.path.exists(keys_path):
+            open(keys_path, "wb").close()
+
+        self._keys_file = open(keys_path, "r+b")
+        raw = self._keys_file.read()
+        capacity = os.path.getsize(vectors_path) // row_bytes
+        # Chỉ nhận các key có vector tương ứng (vector được ghi trước key)
+        self.count = min(len(raw) // 16, capacity)
+        for row in range(self.count):
+            key = raw[row * 16:(row + 1) * 16]
+            self.row_keys.append(key)
+            self.rows[key] = row
+        self.vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self.dimension))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _grow(self, needed: int):
+        capacity = min(max(len(self.vectors) * 2, needed), self.max_rows)
+        if self.path is None:
+            grown = np.zeros((capacity, self.dimension), dtype=np.float16)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+            return
+        vectors_path = os.path.join(self.path, "vectors.f16")
+        self.vectors.flush()
+        del self.vectors
+        with open(vectors_path, "r+b") as f:
+            f.truncate(capacity * self.dimension * 2)
+        self.vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self.dimension))
+
+    def get_many(self, keys: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (vectors float32, mask tìm thấy)"""
+        with self._lock:
+            rows = np.fromiter((self.rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+            found = rows >= 0
+            result = np.zeros((len(keys), self.dimension), dtype=np.float32)
+            if found.any():
+                result[found] = self.vectors[rows[found]]
+        return result, found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                if key in self.rows:
+                    continue
+                if self.count < self.max_rows:
+                    row = self.count
+                    if row >= len(self.vectors):
+                        self._grow(row + 1)
+                    self.row_keys.append(key)
+                    self.count += 1
+                else:
+                    # Ring buffer: ghi đè dòng cũ nhất
+                    row = self.count % self.max_rows
+                    self.rows.pop(self.row_keys[row], None)
+                    self.row_keys[row] = key
+                    self.count += 1
+                self.vectors[row] = vector
+                self.rows[key] = row
+                if self._keys_file is not None:
+                    self._keys_file.seek(row * 16)
+                    self._keys_file.write(key)
+
+    def flush(self):
+        with self._lock:
+            if self._keys_file is not None:
+                self.vectors.flush()
+                self._keys_file.flush()
+
+    def close(self):
+        self.flush()
+        if self._keys_file is not None:
+            self._keys_file.close()
+            self._keys_file = None
+        if self._lock_file is not None:
+            # Đóng file là nhả khóa, slot có thể được cache khác nhận lại
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class EmbeddingIndex:
+    """Tập embedding tham chiếu (vd. item đã dedup): ma trận float32 cấp phát trước và danh sách id
+
+    Thêm vector không copy lại toàn bộ ma trận (chỉ tăng gấp đôi khi đầy); quá `max_items`
+    thì dòng lâu nhất không được thêm/match bị ghi đè (LRU).
+    """
+
+    def __init__(self, dimension: int, max_items: int = 100_000, initial_rows: int = 1024):
+        self.dimension = dimension
+        self.max_items = max_items
+        self.vectors = np.zeros((min(initial_rows, max_items), dimension), dtype=np.float32)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._last_used = np.zeros(len(self.vectors), dtype=np.int64)
+        self._tick = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def matrix(self) -> np.ndarray:
+        """View (không copy) các dòng đang dùng; dòng i ứng với ids[i]"""
+        return self.vectors[:len(self.ids)]
+
+    def touch(self, rows: Sequence[int]):
+        self._tick += 1
+        self._last_used[np.asarray(rows, dtype=np.int64)] = self._tick
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray):
+        for item_id, vector in zip(ids, vectors):
+            self._tick += 1
+            row = self.rows.get(item_id)
+            if row is None:
+                count = len(self.ids)
+                if count == len(self.vectors) and count < self.max_items:
+                    capacity = min(count * 2, self.max_items)
+                    grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+                    grown[:count] = self.vectors
+                    self.vectors = grown
+                    self._last_used = np.concatenate([self._last_used, np.zeros(capacity - count, dtype=np.int64)])
+                if count < len(self.vectors):
+                    row = count
+                    self.ids.append(item_id)
+                else:
+                    row = int(self._last_used[:count].argmin())
+                    del self.rows[self.ids[row]]
+                    self.ids[row] = item_id
+                    self.evictions += 1
+                self.rows[item_id] = row
+            self.vectors[row] = vector
+            self._last_used[row] = self._tick
+
+
+class EmbeddingService:
+    """Service embedding dùng chung cho các agent
+
+    Các request đồng thời được gom thành micro-batch (tối đa `max_batch_size`, chờ tối đa
+    `max_wait_ms`) và chạy inference trên một thread riêng để không chặn event loop.
+    Văn bản đã có trong cache (kể cả đang được tính) không bị tính lại.
+    """
+
+    def __init__(self, embedder=None, cache_dir: Optional[str] = None, model_name: str = DEFAULT_MODEL,
+                 backend: str = "auto", max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_cache_rows: int = 1_000_000):
+        self._embedder = embedder
+        self.model_name = model_name
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_cache_rows = max_cache_rows
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.cache: Optional[EmbeddingCache] = None
+        self._init_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self.stats = {"requests": 0, "texts": 0, "cache_hits": 0, "encoded": 0, "batches": 0}
+
+    @property
+    def embedder(self):
+        self._ensure_ready()
+        return self._embedder
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
+    def _ensure_ready(self):
+        """Load embedder và mở cache (lần đầu sử dụng; có thể mất vài giây với model thật)"""
+        if self.cache is not None:
+            return
+        with self._init_lock:
+            if self.cache is not None:
+                return
+            if self._embedder is None:
+                self._embedder = load_embedder(self.model_name, self.backend)
+            self.cache = EmbeddingCache(
+                self._embedder.dimension, self.cache_dir, self._embedder.name, max_rows=self.max_cache_rows
+            )
+
+    def embed_sync(self, texts: Sequence[str]) -> np.ndarray:
+        """Embedding cho code đồng bộ (không micro-batch, vẫn dùng cache)"""
+        self._ensure_ready()
+        texts = [t if isinstance(t, str) else str(t) for t in texts]
+        keys = [content_key(t) for t in texts]
+        vectors, found = self.cache.get_many(keys)
+        self.stats["requests"] += 1
+        self.stats["texts"] += len(texts)
+        self.stats["cache_hits"] += int(found.sum())
+
+        missing: Dict[bytes, List[int]] = {}
+        for position in np.flatnonzero(~found):
+            missing.setdefault(keys[position], []).append(position)
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            encoded = self._encode([texts[p] for p in first], list(missing))
+            for vector, positions in zip(encoded, missing.values()):
+                vectors[positions] = vector
+        return vectors
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embedding (n, dimension) float32 đã chuẩn hóa L2 cho danh sách văn bản"""
+        if self.cache is None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._ensure_ready)
+        texts = [t if isinstance(t, str) else str(t) for t in texts]
+        keys = [content_key(t) for t in texts]
+        vectors, found = self.cache.get_many(keys)
+        self.stats["requests"] += 1
+        self.stats["texts"] += len(texts)
+        self.stats["cache_hits"] += int(found.sum())
+        if found.all():
+            return vectors
+
+        queue = self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        waiting: Dict[bytes, asyncio.Future] = {}
+        for position in np.flatnonzero(~found):
+            key = keys[position]
+            if key in waiting:
+                continue
+            future = self._inflight.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[key] = future
+                queue.put_nowait((key, texts[position], future))
+            waiting[key] = future
+
+        results = dict(zip(waiting, await asyncio.gather(*waiting.values())))
+        for position in np.flatnonzero(~found):
+            vectors[position] = results[keys[position]]
+        return vectors
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # Queue gắn với event loop; tạo lại khi chạy trên loop mới (vd. mỗi lần asyncio.run)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._inflight = {}
+            self._worker = loop.create_task(self._run_batches(self._queue))
+        return self._queue
+
+    async def _run_batches(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            if len(batch) < self.max_batch_size and self.max_wait_ms > 0:
+                await asyncio.sleep(self.max_wait_ms / 1000)
+                while len(batch) < self.max_batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+            keys = [key for key, _, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, self._encode, [text for _, text, _ in batch], keys
+                )
+            except Exception as e:
+                logger.error(f"Embedding batch failed: {e}")
+                for key, _, future in batch:
+                    self._inflight.pop(key, None)
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (key, _, future), vector in zip(batch, vectors):
+                self._inflight.pop(key, None)
+                if not future.done():
+                    future.set_result(vector)
+
+    def _encode(self, texts: List[str], keys: List[bytes]) -> np.ndarray:
+        vectors = self.embedder.encode(texts)
+        self.cache.put_many(keys, vectors)
+        self.stats["encoded"] += len(texts)
+        self.stats["batches"] += 1
+        return vectors
+
+    def flush(self):
+        if self.cache is not None:
+            self.cache.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "model": self._embedder.name if self._embedder is not None else None,
+            "dimension": self._embedder.dimension if self._embedder is not None else None,
+            "cached_vectors": len(self.cache) if self.cache is not None else 0,
+            "avg_batch_size": self.stats["encoded"] / self.stats["batches"] if self.stats["batches"] else 0.0,
+            "cache_hit_rate": self.stats["cache_hits"] / self.stats["texts"] if self.stats["texts"] else 0.0,
+        }
+
+
+def cosine_top_k(query: np.ndarray, matrix: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """Top-k (chỉ số, cosine) với vector đã chuẩn hóa"""
+    if not len(matrix):
+        return []
+    scores = matrix @ query
+    top_k = min(top_k, len(scores))
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    best = best[np.argsort(-scores[best])]
+    return [(int(i), float(scores[i])) for i in best]
+
+
+_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Service dùng chung trong process, cấu hình qua biến môi trường EMBEDDING_*"""
+    global _service
+    if _service is None:
+        _service = EmbeddingService(
+            cache_dir=os.getenv("EMBEDDING_CACHE_DIR", "./data/embeddings") or None,
+            model_name=os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL),
+            backend=os.getenv("EMBEDDING_BACKEND", "auto"),
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+        )
+    return _service
+
+
+def set_embedding_service(service: EmbeddingService):
+    global _service
+    _service = service
@@ -3,11 +3,10 @@ Enhanced Skills Integration Agent - Tích hợp kỹ năng từ antigravity-awes
 """
 
 from typing import Dict, Any, List, Optional
-import json
-import os
 import asyncio
 from datetime import datetime, timedelta
 from .base_agent import BaseAgent
+from .skills_index import get_skills_index
 
 class EnhancedSkillsAgent(BaseAgent):
     def __init__(self):
@@ -26,9 +25,8 @@ class EnhancedSkillsAgent(BaseAgent):
             "skill_performance_tracking"     # Theo dõi hiệu suất kỹ năng
         ]
         
-        # Load skills index from antigravity-awesome-skills
-        self.skills_index = self._load_skills_index()
-        self.skills_categories = self._categorize_skills()
+        # Skills index dùng chung (antigravity-awesome-skills), parse một lần và tự nạp lại khi file đổi
+        self.skills_index = get_skills_index()
         
         # Education-specific skills mapping
         self.education_skills_mapping = {
@@ -67,42 +65,6 @@ class EnhancedSkillsAgent(BaseAgent):
             ]
         }
     
-    def _load_skills_index(self) -> List[Dict[str, Any]]:
-        """Load skills index from antigravity-awesome-skills"""
-        try:
-            skills_path = os.path.join(os.path.dirname(__file__), "../../antigravity-awesome-skills/skills_index.json")
-            if os.path.exists(skills_path):
-                with open(skills_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Error loading skills index: {e}")
-        
-        # Fallback to basic skills
-        return [
-            {
-                "id": "content-creator",
-                "category": "content",
-                "name": "Content Creator",
-                "description": "Expert in creating educational content"
-            },
-            {
-                "id": "data-analyst",
-                "category": "data", 
-                "name": "Data Analyst",
-                "description": "Expert in data analysis and visualization"
-            }
-        ]
-    
-    def _categorize_skills(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Categorize skills by domain"""
-        categories = {}
-        for skill in self.skills_index:
-            category = skill.get("category", "uncategorized")
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(skill)
-        return categories
-    
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý tác vụ kỹ năng nâng cao"""
         
@@ -185,7 +147,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Tiêu chí thành công
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -205,28 +167,25 @@ class EnhancedSkillsAgent(BaseAgent):
         goals = data.get("goals", [])
         skill_level = data.get("skill_level", "intermediate")
         
-        # Find relevant skills based on profile and goals
-        recommended_skills = []
-        
+        # Xếp hạng BM25 theo từ khóa của từng mục tiêu; skill khớp nhiều mục tiêu giữ điểm cao nhất
+        best_scores = {}
         for goal in goals:
             if "teaching" in goal.lower():
-                recommended_skills.extend(self._find_skills_by_keywords(["teaching", "education", "content"]))
+                query = "teaching education content"
             elif "data" in goal.lower():
-                recommended_skills.extend(self._find_skills_by_keywords(["data", "analytics", "analysis"]))
+                query = "data analytics analysis"
             elif "development" in goal.lower():
-                recommended_skills.extend(self._find_skills_by_keywords(["development", "programming", "coding"]))
+                query = "development programming coding"
             elif "automation" in goal.lower():
-                recommended_skills.extend(self._find_skills_by_keywords(["automation", "workflow", "process"]))
-        
-        # Remove duplicates and limit to top recommendations
-        unique_skills = []
-        seen_ids = set()
-        for skill in recommended_skills:
-            if skill["id"] not in seen_ids:
-                unique_skills.append(skill)
-                seen_ids.add(skill["id"])
+                query = "automation workflow process"
+            else:
+                query = goal
+            for skill, score in self.skills_index.search(query, top_k=8):
+                if score > best_scores.get(skill["id"], (None, 0.0))[1]:
+                    best_scores[skill["id"]] = (skill, score)
         
-        top_recommendations = unique_skills[:8]
+        top_recommendations = sorted(best_scores.values(), key=lambda item: -item[1])[:8]
+        max_score = top_recommendations[0][1] if top_recommendations else 1.0
         
         return {
             "success": True,
@@ -239,9 +198,9 @@ class EnhancedSkillsAgent(BaseAgent):
                     "name": skill["name"],
                     "description": skill["description"],
                     "category": skill.get("category", "uncategorized"),
-                    "relevance_score": 0.85
+                    "relevance_score": round(score / max_score, 3)
                 }
-                for skill in top_recommendations
+                for skill, score in top_recommendations
             ],
             "recommendation_date": datetime.now().isoformat(),
             "confidence": 0.89
@@ -263,9 +222,8 @@ class EnhancedSkillsAgent(BaseAgent):
                 "confidence": 0.0
             }
         
-        # Load skill implementation if available
-        skill_path = os.path.join(os.path.dirname(__file__), "../../antigravity-awesome-skills", skill["path"])
-        skill_implementation = self._load_skill_implementation(skill_path)
+        # Load skill implementation if available (đọc ngoài event loop, cache theo mtime)
+        skill_implementation = await self.skills_index.load_implementation(skill)
         
         # Execution prompt
         prompt = f"""
@@ -292,7 +250,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Đề xuất cải tiến
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -348,7 +306,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Kết quả mong đợi
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -400,7 +358,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Kết quả mong đợi
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -452,7 +410,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Tiêu chí đánh giá
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -498,7 +456,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Kế hoạch cải thiện
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -550,7 +508,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Tiêu chí đánh giá
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -595,7 +553,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Giám sát và báo cáo
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -639,7 +597,7 @@ class EnhancedSkillsAgent(BaseAgent):
         - Đề xuất cải tiến
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -653,35 +611,12 @@ class EnhancedSkillsAgent(BaseAgent):
     
     def _find_skills_by_category(self, category: str) -> List[Dict[str, Any]]:
         """Find skills by category"""
-        return self.skills_categories.get(category, [])
+        return self.skills_index.by_category(category)
     
     def _find_skills_by_keywords(self, keywords: List[str]) -> List[Dict[str, Any]]:
-        """Find skills by keywords"""
-        matching_skills = []
-        for skill in self.skills_index:
-            skill_text = f"{skill.get('name', '')} {skill.get('description', '')}".lower()
-            if any(keyword.lower() in skill_text for keyword in keywords):
-                matching_skills.append(skill)
-        return matching_skills
+        """Find skills by keywords (inverted index, khớp theo tiền tố từ)"""
+        return self.skills_index.find_by_keywords(keywords)
     
     def _find_skill_by_id(self, skill_id: str) -> Optional[Dict[str, Any]]:
         """Find skill by ID"""
-        for skill in self.skills_index:
-            if skill.get("id") == skill_id:
-                return skill
-        return None
-    
-    def _load_skill_implementation(self, skill_path: str) -> str:
-        """Load skill implementation from file"""
-        try:
-            if os.path.exists(skill_path):
-                # Look for implementation files
-                for file in os.listdir(skill_path):
-                    if file.endswith(('.md', '.txt', '.py', '.js')):
-                        file_path = os.path.join(skill_path, file)
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            return f.read()
-        except Exception as e:
-            print(f"Error loading skill implementation: {e}")
-        
-        return "Skill implementation not available"
+        return self.skills_index.get(skill_id)
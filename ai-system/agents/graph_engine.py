@@ -0,0 +1,532 @@
+"""
+Graph Engine
+Đồ thị có kiểu trong bộ nhớ (CSR trên numpy) cho đồ thị kỹ năng, khóa học và kiến thức: k-hop, đường đi ngắn nhất, PageRank, thành phần liên thông
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+import json
+import logging
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+logger = logging.getLogger(__name__)
+
+NODE_TYPES = ("skill", "course", "topic", "source")
+DIRECTIONS = ("out", "in", "both")
+
+# Khóa cạnh int64 = src << 38 | dst << 13 | type: tối đa 2^25 node và 8192 kiểu cạnh
+_SRC_SHIFT, _DST_SHIFT = 38, 13
+
+
+def _edge_keys(src: np.ndarray, dst: np.ndarray, etype: np.ndarray) -> np.ndarray:
+    return (src.astype(np.int64) << _SRC_SHIFT) | (dst.astype(np.int64) << _DST_SHIFT) | etype.astype(np.int64)
+
+
+class CSR:
+    """Ma trận kề dạng CSR: neighbors của node i là indices[indptr[i]:indptr[i + 1]]"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, edge_ids: np.ndarray):
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_ids = edge_ids  # vị trí cạnh tương ứng trong mảng cạnh đã gộp
+
+    @classmethod
+    def build(cls, rows: np.ndarray, cols: np.ndarray, num_nodes: int, presorted: bool = False) -> "CSR":
+        order = np.arange(len(rows)) if presorted else np.argsort(rows)
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+        return cls(indptr, cols[order], order)
+
+    def gather(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vị trí (trong indices) của mọi cạnh đi ra từ nodes, kèm node nguồn tương ứng — không lặp Python"""
+        starts = self.indptr[nodes]
+        lengths = self.indptr[nodes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=nodes.dtype)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total), np.repeat(nodes, lengths)
+
+
+class GraphEngine:
+    """Đồ thị có hướng với node/cạnh có kiểu.
+
+    Cạnh mới, cập nhật trọng số và xóa cạnh được ghi vào log (O(1) mỗi thao tác) và gộp vào
+    mảng cạnh ở truy vấn kế tiếp; cạnh trùng (src, dst, type) giữ trọng số ghi sau cùng.
+    Mảng cạnh luôn sắp theo khóa (src, dst, type) nên gộp log nhỏ chỉ cần searchsorted + insert
+    và CSR chiều out dựng được không cần sort.
+    """
+
+    def __init__(self):
+        self.node_ids: Dict[str, int] = {}
+        self.node_keys: List[str] = []
+        self.node_types: List[int] = []
+        self.node_attrs: List[Dict[str, Any]] = []
+        self.node_type_names: List[str] = list(NODE_TYPES)
+        self.edge_type_names: List[str] = []
+
+        # Cạnh đã gộp (không trùng, sắp theo khóa)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.src = np.empty(0, dtype=np.int32)
+        self.dst = np.empty(0, dtype=np.int32)
+        self.etype = np.empty(0, dtype=np.int16)
+        self.weight = np.empty(0, dtype=np.float32)
+
+        # Log cạnh chưa gộp; trọng số NaN là tombstone (xóa cạnh)
+        self._log_src: List[int] = []
+        self._log_dst: List[int] = []
+        self._log_type: List[int] = []
+        self._log_weight: List[float] = []
+
+        self.version = 0
+        self._csr: Dict[str, CSR] = {}
+        self._cache: Dict[Any, Any] = {}
+        self.stats = {"compactions": 0, "queries": 0}
+
+    # ----- Node / cạnh -----
+
+    def _type_id(self, names: List[str], name: str) -> int:
+        try:
+            return names.index(name)
+        except ValueError:
+            names.append(name)
+            return len(names) - 1
+
+    def add_node(self, key: str, node_type: str = "topic", **attrs) -> int:
+        """Thêm node (hoặc cập nhật kiểu/thuộc tính nếu đã có), trả về id"""
+        type_id = self._type_id(self.node_type_names, node_type)
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.node_keys)
+            self.node_ids[key] = node_id
+            self.node_keys.append(key)
+            self.node_types.append(type_id)
+            self.node_attrs.append(dict(attrs))
+            self._invalidate()
+        else:
+            if self.node_types[node_id] != type_id:
+                self.node_types[node_id] = type_id
+                self._cache.clear()
+            self.node_attrs[node_id].update(attrs)
+        return node_id
+
+    def _node(self, key: str, node_type: Optional[str]) -> int:
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            return self.add_node(key, node_type or "topic")
+        return node_id
+
+    def add_edge(self, src: str, dst: str, edge_type: str = "related", weight: float = 1.0,
+                 symmetric: bool = False, src_type: Optional[str] = None, dst_type: Optional[str] = None):
+        """Thêm/cập nhật cạnh src -> dst (node chưa có được tạo với src_type/dst_type, mặc định "topic")"""
+        s, d = self._node(src, src_type), self._node(dst, dst_type)
+        t = self._type_id(self.edge_type_names, edge_type)
+        self._log(s, d, t, float(weight))
+        if symmetric:
+            self._log(d, s, t, float(weight))
+
+    def add_edges(self, edges: Iterable[Tuple], edge_type: str = "related", symmetric: bool = False,
+                  src_type: Optional[str] = None, dst_type: Optional[str] = None):
+        """Thêm nhiều cạnh dạng (src, dst) hoặc (src, dst, weight)"""
+        for edge in edges:
+            self.add_edge(edge[0], edge[1], edge_type, edge[2] if len(edge) > 2 else 1.0,
+                          symmetric=symmetric, src_type=src_type, dst_type=dst_type)
+
+    def remove_edge(self, src: str, dst: str, edge_type: str = "related", symmetric: bool = False):
+        if src not in self.node_ids or dst not in self.node_ids or edge_type not in self.edge_type_names:
+            return
+        s, d, t = self.node_ids[src], self.node_ids[dst], self.edge_type_names.index(edge_type)
+        self._log(s, d, t, float("nan"))
+        if symmetric:
+            self._log(d, s, t, float("nan"))
+
+    def _log(self, s: int, d: int, t: int, w: float):
+        self._log_src.append(s)
+        self._log_dst.append(d)
+        self._log_type.append(t)
+        self._log_weight.append(w)
+        self._invalidate()
+
+    def _invalidate(self):
+        self.version += 1
+        self._csr.clear()
+        self._cache.clear()
+
+    def compact(self):
+        """Gộp log cạnh vào mảng cạnh đã sắp: cập nhật tại chỗ, chèn cạnh mới, bỏ cạnh bị xóa"""
+        if not self._log_src:
+            return
+        src = np.asarray(self._log_src, dtype=np.int32)
+        dst = np.asarray(self._log_dst, dtype=np.int32)
+        etype = np.asarray(self._log_type, dtype=np.int16)
+        weight = np.asarray(self._log_weight, dtype=np.float32)
+        self._log_src, self._log_dst, self._log_type, self._log_weight = [], [], [], []
+
+        # Khử trùng trong log: np.unique lấy lần xuất hiện đầu tiên -> đảo ngược để giữ bản ghi sau cùng
+        keys, first = np.unique(_edge_keys(src, dst, etype)[::-1], return_index=True)
+        last = len(src) - 1 - first
+        src, dst, etype, weight = src[last], dst[last], etype[last], weight[last]
+
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        removed = np.isnan(weight)
+
+        # Cạnh đã có: cập nhật trọng số hoặc xóa
+        self.weight[positions[found & ~removed]] = weight[found & ~removed]
+        drop = positions[found & removed]
+
+        # Cạnh mới (bỏ qua tombstone của cạnh chưa từng có)
+        fresh = ~found & ~removed
+        if fresh.any():
+            at = positions[fresh]
+            self.keys = np.insert(self.keys, at, keys[fresh])
+            self.src = np.insert(self.src, at, src[fresh])
+            self.dst = np.insert(self.dst, at, dst[fresh])
+            self.etype = np.insert(self.etype, at, etype[fresh])
+            self.weight = np.insert(self.weight, at, weight[fresh])
+            # vị trí cần xóa dịch theo số cạnh chèn phía trước
+            drop = drop + np.searchsorted(at, drop, side="right")
+        if len(drop):
+            self.keys, self.src, self.dst, self.etype, self.weight = (
+                np.delete(a, drop) for a in (self.keys, self.src, self.dst, self.etype, self.weight)
+            )
+        self.stats["compactions"] += 1
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_keys)
+
+    @property
+    def num_edges(self) -> int:
+        self.compact()
+        return len(self.src)
+
+    def csr(self, direction: str = "out") -> CSR:
+        """CSR theo chiều out (src -> dst) hoặc in (dst -> src); dựng lại khi đồ thị đổi"""
+        self.compact()
+        if direction not in self._csr:
+            if direction == "out":
+                self._csr[direction] = CSR.build(self.src, self.dst, self.num_nodes, presorted=True)
+            elif direction == "in":
+                self._csr[direction] = CSR.build(self.dst, self.src, self.num_nodes)
+            else:
+                raise ValueError("direction must be 'out' or 'in'")
+        return self._csr[direction]
+
+    def _adjacency(self, direction: str) -> List[CSR]:
+        """Các CSR cần duyệt cho một chiều; both = out + in (vô hướng)"""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+        return [self.csr("out"), self.csr("in")] if direction == "both" else [self.csr(direction)]
+
+    def _expand(self, nodes: np.ndarray, direction: str, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(node đích, node nguồn, id cạnh) của mọi cạnh kề với nodes, đã lọc theo mask kiểu cạnh"""
+        targets, origins, edge_ids = [], [], []
+        for csr in self._adjacency(direction):
+            positions, sources = csr.gather(nodes)
+            ids = csr.edge_ids[positions]
+            if mask is not None:
+                keep = mask[ids]
+                positions, sources, ids = positions[keep], sources[keep], ids[keep]
+            targets.append(csr.indices[positions])
+            origins.append(sources)
+            edge_ids.append(ids)
+        if len(targets) == 1:
+            return targets[0], origins[0], edge_ids[0]
+        return np.concatenate(targets), np.concatenate(origins), np.concatenate(edge_ids)
+
+    # ----- Truy vấn -----
+
+    def _ids(self, keys: Iterable[str]) -> np.ndarray:
+        missing = [k for k in keys if k not in self.node_ids]
+        if missing:
+            raise KeyError(f"Unknown node(s): {missing[:5]}")
+        return np.asarray([self.node_ids[k] for k in keys], dtype=np.int64)
+
+    def _edge_mask(self, edge_types: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if not edge_types:
+            return None
+        self.compact()
+        wanted = [self.edge_type_names.index(t) for t in edge_types if t in self.edge_type_names]
+        return np.isin(self.etype, wanted)
+
+    def _type_ids(self, node_types: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if not node_types:
+            return None
+        return np.asarray([self.node_type_names.index(t) for t in node_types if t in self.node_type_names], dtype=np.int64)
+
+    def node_type_array(self) -> np.ndarray:
+        return np.asarray(self.node_types, dtype=np.int16)
+
+    def neighbors(self, key: str, direction: str = "out", edge_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        targets, _, edge_ids = self._expand(self._ids([key]), direction, self._edge_mask(edge_types))
+        return [
+            {"node": self.node_keys[n], "edge_type": self.edge_type_names[self.etype[e]], "weight": float(self.weight[e])}
+            for n, e in zip(targets, edge_ids)
+        ]
+
+    def _bfs(self, sources: np.ndarray, max_depth: Optional[int], direction: str,
+             edge_types: Optional[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """BFS theo frontier (vector hóa): trả về (distance, parent), -1 nếu không tới được"""
+        mask = self._edge_mask(edge_types)
+        n = self.num_nodes
+        distance = np.full(n, -1, dtype=np.int32)
+        parent = np.full(n, -1, dtype=np.int64)
+        distance[sources] = 0
+        frontier = sources
+        depth = 0
+        while len(frontier) and (max_depth is None or depth < max_depth):
+            targets, origins, _ = self._expand(frontier, direction, mask)
+            fresh = distance[targets] < 0
+            targets, origins = targets[fresh], origins[fresh]
+            targets, first = np.unique(targets, return_index=True)
+            depth += 1
+            distance[targets] = depth
+            parent[targets] = origins[first]
+            frontier = targets.astype(np.int64)
+        return distance, parent
+
+    def k_hop(self, key: str, k: int = 2, direction: str = "both", edge_types: Optional[List[str]] = None,
+              node_types: Optional[List[str]] = None) -> Dict[str, int]:
+        """Các node cách key tối đa k bước (không gồm key) -> khoảng cách, sắp theo khoảng cách"""
+        self.stats["queries"] += 1
+        distance, _ = self._bfs(self._ids([key]), k, direction, edge_types)
+        hits = np.flatnonzero(distance > 0)
+        type_ids = self._type_ids(node_types)
+        if type_ids is not None:
+            hits = hits[np.isin(self.node_type_array()[hits], type_ids)]
+        hits = hits[np.argsort(distance[hits], kind="stable")]
+        return {self.node_keys[i]: int(distance[i]) for i in hits}
+
+    def shortest_path(self, src: str, dst: str, direction: str = "out", edge_types: Optional[List[str]] = None,
+                      weighted: bool = False) -> Optional[Dict[str, Any]]:
+        """Đường đi ngắn nhất theo số cạnh (BFS) hoặc theo tổng trọng số (Dijkstra); None nếu không có"""
+        self.stats["queries"] += 1
+        s, d = self._ids([src, dst])
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+        if not weighted:
+            distance, parent = self._bfs(np.asarray([s]), None, direction, edge_types)
+            if distance[d] < 0:
+                return None
+            cost = float(distance[d])
+        else:
+            parent, cost = self._dijkstra(int(s), int(d), direction, edge_types)
+            if cost is None:
+                return None
+        path = [int(d)]
+        while path[-1] != s:
+            path.append(int(parent[path[-1]]))
+        return {"path": [self.node_keys[i] for i in reversed(path)], "hops": len(path) - 1, "cost": cost}
+
+    def _dijkstra(self, s: int, d: int, direction: str, edge_types: Optional[List[str]]):
+        """Dijkstra (scipy.sparse.csgraph) với trọng số cạnh là chi phí; cạnh song song lấy chi phí nhỏ nhất"""
+        self.compact()
+        src, dst, weight = self.src, self.dst, self.weight
+        mask = self._edge_mask(edge_types)
+        if mask is not None:
+            src, dst, weight = src[mask], dst[mask], weight[mask]
+        if len(src):
+            # mảng cạnh sắp theo (src, dst) nên các cạnh song song khác kiểu nằm liền nhau
+            pair = (src.astype(np.int64) << 32) | dst
+            starts = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+            src, dst, weight = src[starts], dst[starts], np.minimum.reduceat(weight, starts)
+        if direction == "in":
+            src, dst = dst, src
+        n = self.num_nodes
+        graph = csr_matrix((weight.astype(np.float64), (src, dst)), shape=(n, n))
+        distance, parent = dijkstra(graph, directed=direction != "both", indices=s, return_predecessors=True)
+        if not np.isfinite(distance[d]):
+            return parent, None
+        return parent, float(distance[d])
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-6, max_iter: int = 100,
+                 edge_types: Optional[List[str]] = None) -> np.ndarray:
+        """PageRank có trọng số (power iteration, node cụt chia đều); cache theo version của đồ thị"""
+        self.stats["queries"] += 1
+        cache_key = ("pagerank", damping, tuple(edge_types or ()))
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+        self.compact()
+        n = self.num_nodes
+        if n == 0:
+            return np.zeros(0)
+        src, dst, weight = self.src, self.dst, self.weight.astype(np.float64)
+        mask = self._edge_mask(edge_types)
+        if mask is not None:
+            src, dst, weight = src[mask], dst[mask], weight[mask]
+        out_weight = np.bincount(src, weights=weight, minlength=n)
+        dangling = out_weight == 0
+        edge_share = weight / np.where(out_weight[src] > 0, out_weight[src], 1.0)
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            spread = np.bincount(dst, weights=rank[src] * edge_share, minlength=n)
+            new_rank = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+            converged = np.abs(new_rank - rank).sum() < tol
+            rank = new_rank
+            if converged:
+                break
+        self._cache[cache_key] = rank
+        return rank
+
+    def degree_centrality(self, direction: str = "both") -> np.ndarray:
+        n = self.num_nodes
+        degree = sum(np.diff(csr.indptr) for csr in self._adjacency(direction)).astype(np.float64)
+        return degree / max(n - 1, 1)
+
+    def connected_components(self, edge_types: Optional[List[str]] = None) -> np.ndarray:
+        """Nhãn thành phần liên thông yếu (min-label hooking + nén đường đi, vector hóa); cache theo version"""
+        self.stats["queries"] += 1
+        cache_key = ("components", tuple(edge_types or ()))
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+        self.compact()
+        labels = np.arange(self.num_nodes, dtype=np.int64)
+        src, dst = self.src.astype(np.int64), self.dst.astype(np.int64)
+        mask = self._edge_mask(edge_types)
+        if mask is not None:
+            src, dst = src[mask], dst[mask]
+        while True:
+            before = labels.copy()
+            low, high = labels[src], labels[dst]
+            smallest = np.minimum(low, high)
+            np.minimum.at(labels, low, smallest)
+            np.minimum.at(labels, high, smallest)
+            while True:
+                jumped = labels[labels]
+                if np.array_equal(jumped, labels):
+                    break
+                labels = jumped
+            if np.array_equal(labels, before):
+                break
+        self._cache[cache_key] = labels
+        return labels
+
+    def component_of(self, key: str, edge_types: Optional[List[str]] = None) -> List[str]:
+        labels = self.connected_components(edge_types)
+        return [self.node_keys[i] for i in np.flatnonzero(labels == labels[self.node_ids[key]])]
+
+    def top_nodes(self, scores: np.ndarray, k: int = 10, node_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """k node có điểm cao nhất (lọc theo kiểu node)"""
+        if k <= 0:
+            return []
+        candidates = np.arange(len(scores))
+        type_ids = self._type_ids(node_types)
+        if type_ids is not None:
+            candidates = candidates[np.isin(self.node_type_array(), type_ids)]
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [{"node": self.node_keys[i], "type": self.node_type_names[self.node_types[i]], "score": round(float(scores[i]), 6)}
+                for i in candidates]
+
+    # ----- Xuất / lưu snapshot -----
+
+    def subgraph(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Node và cạnh nội bộ của một tập node (dạng dict cho API)"""
+        ids = self._ids(list(keys))
+        self.compact()
+        inside = np.zeros(self.num_nodes, dtype=bool)
+        inside[ids] = True
+        edges = np.flatnonzero(inside[self.src] & inside[self.dst])
+        return {
+            "nodes": [{"id": self.node_keys[i], "type": self.node_type_names[self.node_types[i]], **self.node_attrs[i]} for i in ids],
+            "edges": [
+                {"source": self.node_keys[self.src[e]], "target": self.node_keys[self.dst[e]],
+                 "type": self.edge_type_names[self.etype[e]], "weight": float(self.weight[e])}
+                for e in edges
+            ]
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.compact()
+        labels = self.connected_components()
+        node_types = np.bincount(self.node_type_array(), minlength=len(self.node_type_names)) if self.num_nodes else []
+        edge_types = np.bincount(self.etype, minlength=len(self.edge_type_names)) if len(self.etype) else []
+        return {
+            "nodes": self.num_nodes,
+            "edges": len(self.src),
+            "node_types": {name: int(c) for name, c in zip(self.node_type_names, node_types) if c},
+            "edge_types": {name: int(c) for name, c in zip(self.edge_type_names, edge_types) if c},
+            "components": int(len(np.unique(labels))),
+            "version": self.version,
+            **self.stats,
+        }
+
+    def save(self, path: str):
+        """Lưu snapshot (.npz: mảng cạnh + metadata JSON), ghi file tạm riêng của lần lưu rồi đổi tên
+        (nhiều worker cùng lưu vẫn để lại một snapshot đầy đủ)"""
+        self.compact()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            "node_keys": self.node_keys,
+            "node_attrs": self.node_attrs,
+            "node_type_names": self.node_type_names,
+            "edge_type_names": self.edge_type_names,
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f, keys=self.keys, src=self.src, dst=self.dst, etype=self.etype, weight=self.weight,
+                    node_types=self.node_type_array(), meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "GraphEngine":
+        graph = cls()
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            graph.node_keys = meta["node_keys"]
+            graph.node_attrs = meta["node_attrs"]
+            graph.node_type_names = meta["node_type_names"]
+            graph.edge_type_names = meta["edge_type_names"]
+            graph.node_ids = {key: i for i, key in enumerate(graph.node_keys)}
+            graph.node_types = data["node_types"].astype(int).tolist()
+            graph.keys, graph.src, graph.dst = data["keys"], data["src"], data["dst"]
+            graph.etype, graph.weight = data["etype"], data["weight"]
+        return graph
+
+
+_graph: Optional[GraphEngine] = None
+
+
+def get_graph_engine() -> GraphEngine:
+    """Đồ thị dùng chung giữa các agent; nạp snapshot GRAPH_SNAPSHOT_PATH nếu có"""
+    global _graph
+    if _graph is None:
+        path = os.getenv("GRAPH_SNAPSHOT_PATH", "")
+        _graph = GraphEngine()
+        if path and os.path.exists(path):
+            try:
+                _graph = GraphEngine.load(path)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                logger.warning(f"Could not load graph snapshot {path}: {e}")
+    return _graph
+
+
+def set_graph_engine(graph: Optional[GraphEngine]):
+    global _graph
+    _graph = graph
+
+
+def save_graph_snapshot() -> Optional[str]:
+    """Lưu đồ thị dùng chung vào GRAPH_SNAPSHOT_PATH (không cấu hình thì bỏ qua)"""
+    path = os.getenv("GRAPH_SNAPSHOT_PATH", "")
+    if path and _graph is not None:
+        _graph.save(path)
+        return path
+    return None
@@ -7,8 +7,13 @@ import json
 import os
 import asyncio
 from datetime import datetime, timedelta
-from .base_agent import BaseAgent
-from .web_search_agent import WebSearchAgent
+from .base_agent import BaseAgent, is_llm_error
+from .search_service import get_search_service
+from .knowledge_store import get_knowledge_store, topic_key
+from .graph_engine import get_graph_engine
+
+# Khoảng thời gian kiến thức còn "mới" theo tần suất cập nhật
+FREQUENCY_MAX_AGE = {"hourly": 3600, "daily": 86400, "weekly": 7 * 86400, "monthly": 30 * 86400}
 
 class KnowledgeIntegrationAgent(BaseAgent):
     def __init__(self):
@@ -22,11 +27,12 @@ class KnowledgeIntegrationAgent(BaseAgent):
             "knowledge_graph_building",       # Xây dựng đồ thị kiến thức
             "adaptive_learning",              # Học tập thích ứng
             "source_credibility",             # Độ tin cậy nguồn
-            "knowledge_synthesis"             # Tổng hợp kiến thức
+            "knowledge_synthesis",            # Tổng hợp kiến thức
+            "knowledge_search"                # Tra cứu kho kiến thức
         ]
         
-        # Initialize web search agent
-        self.web_search_agent = WebSearchAgent()
+        # Search service dùng chung với WebSearchAgent: chạy lại cùng chủ đề sẽ lấy kết quả từ cache
+        self.search_service = get_search_service()
         
         # Knowledge domains
         self.knowledge_domains = {
@@ -37,13 +43,13 @@ class KnowledgeIntegrationAgent(BaseAgent):
             "industry": ["future_trends", "job_market", "skills_demand", "professional_development"]
         }
         
-        # Knowledge base
-        self.knowledge_base = {
-            "static_knowledge": {},  # Knowledge from training data
-            "dynamic_knowledge": {}, # Knowledge from web
-            "validated_knowledge": {}, # Validated knowledge
-            "application_knowledge": {} # Applied knowledge
-        }
+        # Knowledge base: kho SQLite bền vững (static/dynamic/validated/application_knowledge)
+        # Kiến thức còn mới hơn knowledge_max_age được dùng lại thay vì tìm kiếm + sinh lại
+        self.knowledge_store = get_knowledge_store()
+        self.knowledge_max_age = float(os.getenv("KNOWLEDGE_MAX_AGE_SECONDS", str(FREQUENCY_MAX_AGE["daily"])))
+        
+        # Đồ thị kiến thức trong graph engine dùng chung: topic -> nguồn (cites), topic -> domain (in_domain)
+        self.knowledge_graph = get_graph_engine()
         
         # Credibility scores
         self.source_credibility = {
@@ -70,6 +76,8 @@ class KnowledgeIntegrationAgent(BaseAgent):
             return await self.adaptive_learning(data)
         elif task == "content_validation":
             return await self.validate_content(data)
+        elif task == "knowledge_search":
+            return self.search_knowledge(data)
         else:
             return {"success": False, "error": f"Unknown task: {task}"}
 
@@ -79,6 +87,27 @@ class KnowledgeIntegrationAgent(BaseAgent):
         topic = data.get("topic", "")
         integration_scope = data.get("scope", "comprehensive")
         knowledge_types = data.get("types", ["theoretical", "practical", "research"])
+        max_age = data.get("max_age_seconds", self.knowledge_max_age)
+        
+        # Dùng lại kiến thức đã tích hợp nếu nội dung còn mới (tuổi tính từ lần LLM tạo nội dung, không phải lần
+        # làm mới nguồn gần nhất); thông báo lỗi LLM lưu từ bản cũ thì sinh lại
+        existing = self.knowledge_store.get(topic, "dynamic_knowledge")
+        if existing and existing.content and not is_llm_error(existing.content) \
+                and not data.get("force_refresh") and existing.is_content_fresh(max_age):
+            return {
+                "success": True,
+                "topic": topic,
+                "integration_scope": integration_scope,
+                "integrated_knowledge": existing.content,
+                "sources_count": existing.source_count,
+                "credibility_score": existing.credibility,
+                "domain": existing.domain,
+                "knowledge_version": existing.version,
+                "reused": True,
+                "knowledge_age_seconds": round(existing.content_age_seconds, 1),
+                "integration_timestamp": datetime.fromtimestamp(existing.updated_at).isoformat(),
+                "confidence": 0.92
+            }
         
         prompt = f"""
         Tích hợp kiến thức web: {topic}
@@ -95,13 +124,7 @@ class KnowledgeIntegrationAgent(BaseAgent):
         
         try:
             # Search for information
-            search_data = {
-                "query": topic,
-                "search_type": "comprehensive",
-                "max_results": 15
-            }
-            
-            search_results = await self.web_search_agent.web_search(search_data)
+            search_results = await self.web_search(topic, "comprehensive", 15)
             
             if not search_results["success"]:
                 return {
@@ -110,16 +133,23 @@ class KnowledgeIntegrationAgent(BaseAgent):
                     "topic": topic
                 }
             
-            # Process and integrate knowledge
-            ai_response = await self.call_ollama(prompt)
+            # Process and integrate knowledge; _generate raise khi LLM lỗi nên thông báo lỗi không bao giờ được lưu
+            try:
+                ai_response = await self._generate(prompt)
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"Knowledge integration failed: {str(e)}",
+                    "topic": topic
+                }
             
             # Update knowledge base
-            self.knowledge_base["dynamic_knowledge"][topic] = {
-                "content": ai_response,
-                "sources": search_results["search_results"],
-                "integration_date": datetime.now(),
-                "credibility_score": self.calculate_credibility_score(search_results["search_results"])
-            }
+            credibility_score = self.calculate_credibility_score(search_results["search_results"])
+            domain = self.classify_domain(topic)
+            self.knowledge_store.upsert(
+                topic, ai_response, search_results["search_results"],
+                kind="dynamic_knowledge", domain=domain, credibility=credibility_score
+            )
             
             return {
                 "success": True,
@@ -127,7 +157,9 @@ class KnowledgeIntegrationAgent(BaseAgent):
                 "integration_scope": integration_scope,
                 "integrated_knowledge": ai_response,
                 "sources_count": len(search_results["search_results"]),
-                "credibility_score": self.calculate_credibility_score(search_results["search_results"]),
+                "credibility_score": credibility_score,
+                "domain": domain,
+                "reused": False,
                 "integration_timestamp": datetime.now().isoformat(),
                 "confidence": 0.92
             }
@@ -205,6 +237,7 @@ class KnowledgeIntegrationAgent(BaseAgent):
         update_topics = data.get("topics", [])
         update_frequency = data.get("frequency", "daily")
         update_sources = data.get("sources", ["academic", "news", "research"])
+        max_age = data.get("max_age_seconds", FREQUENCY_MAX_AGE.get(update_frequency, self.knowledge_max_age))
         
         prompt = f"""
         Cập nhật kiến thức real-time:
@@ -222,21 +255,29 @@ class KnowledgeIntegrationAgent(BaseAgent):
         """
         
         try:
-            # Collect updates for all topics
+            # Chỉ tìm kiếm lại các topic đã cũ hơn max_age (tìm kiếm song song)
+            stale_topics = update_topics if data.get("force_refresh") else \
+                self.knowledge_store.stale_topics(update_topics, max_age, "dynamic_knowledge")
             all_updates = {}
+            changed_topics = []
             total_sources = 0
             
-            for topic in update_topics:
-                search_data = {
-                    "query": f"{topic} latest research developments",
-                    "search_type": "news",
-                    "max_results": 5
-                }
-                
-                search_result = await self.web_search_agent.web_search(search_data)
+            search_results = await asyncio.gather(*(
+                self.web_search(f"{topic} latest research developments", "news", 5) for topic in stale_topics
+            ))
+            for topic, search_result in zip(stale_topics, search_results):
                 if search_result["success"]:
-                    all_updates[topic] = search_result["search_results"]
-                    total_sources += len(search_result["search_results"])
+                    sources = search_result["search_results"]
+                    all_updates[topic] = sources
+                    total_sources += len(sources)
+                    # Nội dung đã tích hợp được giữ nguyên, chỉ cập nhật nguồn (content_at không đổi nên nội dung
+                    # vẫn hết hạn theo tuổi của chính nó)
+                    status = self.knowledge_store.upsert(
+                        topic, sources=sources, kind="dynamic_knowledge", domain=self.classify_domain(topic),
+                        credibility=self.calculate_credibility_score(sources)
+                    )
+                    if status != "unchanged":
+                        changed_topics.append(topic)
             
             # Generate update plan
             ai_response = await self.call_ollama(prompt)
@@ -248,6 +289,9 @@ class KnowledgeIntegrationAgent(BaseAgent):
                 "update_sources": update_sources,
                 "total_updates": len(all_updates),
                 "total_sources": total_sources,
+                "refreshed_topics": list(all_updates),
+                "changed_topics": changed_topics,
+                "fresh_topics": [topic for topic in update_topics if topic not in stale_topics],
                 "update_plan": ai_response,
                 "update_timestamp": datetime.now().isoformat(),
                 "confidence": 0.88
@@ -299,6 +343,11 @@ class KnowledgeIntegrationAgent(BaseAgent):
                 }
             
             # Build knowledge graph
+            node = self.link_topic_graph(graph_topic)
+            graph = self.knowledge_graph
+            neighborhood = graph.k_hop(node, graph_depth)
+            related_topics = graph.k_hop(node, 2, edge_types=["cites"], node_types=["topic"])
+            subgraph = graph.subgraph([node] + list(neighborhood)[:data.get("max_nodes", 50)])
             ai_response = await self.call_ollama(prompt)
             
             return {
@@ -307,6 +356,9 @@ class KnowledgeIntegrationAgent(BaseAgent):
                 "graph_depth": graph_depth,
                 "relationship_types": relationship_types,
                 "knowledge_graph": ai_response,
+                "graph": subgraph,
+                "related_topics": list(related_topics),
+                "neighborhood_size": len(neighborhood),
                 "source_knowledge": knowledge_result["sources_count"],
                 "graph_timestamp": datetime.now().isoformat(),
                 "confidence": 0.90
@@ -343,13 +395,7 @@ class KnowledgeIntegrationAgent(BaseAgent):
         
         try:
             # Get relevant learning materials
-            search_data = {
-                "query": f"{learning_goal} best practices methods",
-                "search_type": "educational",
-                "max_results": 10
-            }
-            
-            search_result = await self.web_search_agent.web_search(search_data)
+            search_result = await self.web_search(f"{learning_goal} best practices methods", "educational", 10)
             
             # Generate adaptive learning plan
             ai_response = await self.call_ollama(prompt)
@@ -394,13 +440,7 @@ class KnowledgeIntegrationAgent(BaseAgent):
         
         try:
             # Search for supporting/contradicting information
-            search_data = {
-                "query": f"fact check {content_to_validate[:100]}",
-                "search_type": "academic",
-                "max_results": 5
-            }
-            
-            search_result = await self.web_search_agent.web_search(search_data)
+            search_result = await self.web_search(f"fact check {content_to_validate[:100]}", "academic", 5)
             
             # Validate content
             ai_response = await self.call_ollama(prompt)
@@ -422,6 +462,66 @@ class KnowledgeIntegrationAgent(BaseAgent):
                 "content_length": len(content_to_validate)
             }
 
+    async def web_search(self, query: str, search_type: str, max_results: int) -> Dict[str, Any]:
+        """Tìm kiếm qua search service dùng chung (không cần LLM tổng hợp kết quả)"""
+        search = await self.search_service.search(query, search_type, max_results)
+        return {
+            "success": any(engine["status"] == "ok" for engine in search["engines"].values()),
+            "search_results": search["results"],
+            "cached": search["cached"]
+        }
+
+    def link_topic_graph(self, topic: str) -> str:
+        """Đồng bộ topic trong kho kiến thức vào đồ thị: thêm nguồn mới, bỏ cạnh tới nguồn không còn dùng"""
+        
+        graph = self.knowledge_graph
+        record = self.knowledge_store.get(topic, "dynamic_knowledge")
+        node = f"topic:{topic_key(topic)}"
+        if record is None:
+            graph.add_node(node, "topic", label=topic)
+            return node
+        
+        graph.add_node(node, "topic", label=record.topic, domain=record.domain, credibility=record.credibility)
+        graph.add_edge(node, f"domain:{record.domain}", "in_domain", dst_type="domain")
+        current = {f"source:{source.get('url')}": source for source in record.sources if source.get("url")}
+        for neighbor in graph.neighbors(node, "out", edge_types=["cites"]):
+            if neighbor["node"] not in current:
+                graph.remove_edge(node, neighbor["node"], "cites")
+        for source_node, source in current.items():
+            graph.add_node(source_node, "source", title=source.get("title", ""))
+            graph.add_edge(node, source_node, "cites", weight=source.get("relevance", 1.0))
+        return node
+
+    def search_knowledge(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Tra cứu full-text trong kho kiến thức, lọc theo domain/độ tin cậy"""
+        
+        query = data.get("query", "")
+        records = self.knowledge_store.search(
+            query,
+            domain=data.get("domain"),
+            min_credibility=data.get("min_credibility"),
+            kind=data.get("kind"),
+            limit=data.get("limit", 10)
+        )
+        return {
+            "success": True,
+            "query": query,
+            "results": [record.to_dict() for record in records],
+            "total_results": len(records),
+            "search_timestamp": datetime.now().isoformat()
+        }
+
+    def classify_domain(self, topic: str) -> str:
+        """Xác định domain của topic theo từ khóa trong knowledge_domains"""
+        
+        text = f" {topic_key(topic)} "
+        best_domain, best_hits = "general", 0
+        for domain, keywords in self.knowledge_domains.items():
+            hits = sum(1 for keyword in [domain] + keywords if f" {keyword.replace('_', ' ')} " in text)
+            if hits > best_hits:
+                best_domain, best_hits = domain, hits
+        return best_domain
+
     def calculate_credibility_score(self, sources: List[Dict[str, Any]]) -> float:
         """Calculate credibility score for sources"""
         
@@ -453,10 +553,17 @@ class KnowledgeIntegrationAgent(BaseAgent):
     def get_knowledge_base_stats(self) -> Dict[str, Any]:
         """Get knowledge base statistics"""
         
+        stats = self.knowledge_store.get_stats(self.knowledge_max_age)
+        last_update = stats["last_update"]
         return {
-            "static_knowledge_size": len(self.knowledge_base["static_knowledge"]),
-            "dynamic_knowledge_size": len(self.knowledge_base["dynamic_knowledge"]),
-            "validated_knowledge_size": len(self.knowledge_base["validated_knowledge"]),
-            "application_knowledge_size": len(self.knowledge_base["application_knowledge"]),
-            "last_update": datetime.now().isoformat()
+            "static_knowledge_size": stats["kinds"].get("static_knowledge", 0),
+            "dynamic_knowledge_size": stats["kinds"].get("dynamic_knowledge", 0),
+            "validated_knowledge_size": stats["kinds"].get("validated_knowledge", 0),
+            "application_knowledge_size": stats["kinds"].get("application_knowledge", 0),
+            "domains": stats["domains"],
+            "total_sources": stats["total_sources"],
+            "stale_topics": stats["stale_topics"],
+            "max_age_seconds": self.knowledge_max_age,
+            "store": {key: stats[key] for key in ("path", "fts_enabled", "upserts", "inserted", "updated", "unchanged", "lookups", "searches")},
+            "last_update": datetime.fromtimestamp(last_update).isoformat() if last_update else None
         }
@@ -0,0 +1,354 @@
+"""
+Knowledge Store
+Kho kiến thức bền vững trên SQLite: upsert tăng dần theo topic, index theo domain/độ tin cậy/độ mới và tìm kiếm full-text (FTS5)
+"""
+
+from typing import Dict, Any, List, Optional, Iterable
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_KINDS = ("static_knowledge", "dynamic_knowledge", "validated_knowledge", "application_knowledge")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS knowledge (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    topic_key TEXT NOT NULL,
+    domain TEXT NOT NULL DEFAULT 'general',
+    content TEXT NOT NULL DEFAULT '',
+    sources TEXT NOT NULL DEFAULT '[]',
+    source_text TEXT NOT NULL DEFAULT '',
+    source_count INTEGER NOT NULL DEFAULT 0,
+    credibility REAL NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    content_at REAL NOT NULL DEFAULT 0,
+    UNIQUE (kind, topic_key)
+);
+CREATE INDEX IF NOT EXISTS idx_knowledge_domain ON knowledge (domain, credibility DESC);
+CREATE INDEX IF NOT EXISTS idx_knowledge_credibility ON knowledge (credibility DESC);
+CREATE INDEX IF NOT EXISTS idx_knowledge_fetched ON knowledge (kind, fetched_at);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+    topic, content, source_text,
+    content='knowledge', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS knowledge_ai AFTER INSERT ON knowledge BEGIN
+    INSERT INTO knowledge_fts (rowid, topic, content, source_text) VALUES (new.id, new.topic, new.content, new.source_text);
+END;
+CREATE TRIGGER IF NOT EXISTS knowledge_ad AFTER DELETE ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, topic, content, source_text) VALUES ('delete', old.id, old.topic, old.content, old.source_text);
+END;
+CREATE TRIGGER IF NOT EXISTS knowledge_au AFTER UPDATE OF topic, content, source_text ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, topic, content, source_text) VALUES ('delete', old.id, old.topic, old.content, old.source_text);
+    INSERT INTO knowledge_fts (rowid, topic, content, source_text) VALUES (new.id, new.topic, new.content, new.source_text);
+END;
+"""
+
+
+def topic_key(topic: str) -> str:
+    """Khóa chuẩn của topic: chữ thường, bỏ dấu, gộp khoảng trắng"""
+    folded = unicodedata.normalize("NFKD", (topic or "").lower().replace("đ", "d"))
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", folded))
+
+
+@dataclass
+class KnowledgeRecord:
+    """Một mục kiến thức theo (kind, topic)"""
+    kind: str
+    topic: str
+    domain: str
+    content: str
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    credibility: float = 0.0
+    version: int = 1
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    fetched_at: float = 0.0
+    # Lần cuối nội dung được tạo (LLM); fetched_at chỉ là lần cuối nguồn được làm mới
+    content_at: float = 0.0
+    score: Optional[float] = None
+
+    @property
+    def source_count(self) -> int:
+        return len(self.sources)
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.fetched_at
+
+    def is_fresh(self, max_age_seconds: float) -> bool:
+        return self.age_seconds <= max_age_seconds
+
+    @property
+    def content_age_seconds(self) -> float:
+        return time.time() - self.content_at
+
+    def is_content_fresh(self, max_age_seconds: float) -> bool:
+        return self.content_age_seconds <= max_age_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "kind": self.kind,
+            "topic": self.topic,
+            "domain": self.domain,
+            "content": self.content,
+            "sources": self.sources,
+            "source_count": self.source_count,
+            "credibility": self.credibility,
+            "version": self.version,
+            "updated_at": self.updated_at,
+            "fetched_at": self.fetched_at,
+            "age_seconds": round(self.age_seconds, 1),
+            "content_age_seconds": round(self.content_age_seconds, 1),
+        }
+        if self.score is not None:
+            data["score"] = self.score
+        return data
+
+
+def _content_hash(content: str, sources: List[Dict[str, Any]]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((content or "").encode("utf-8"))
+    for source in sources:
+        digest.update(b"\0")
+        digest.update(str(source.get("url", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _source_text(sources: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{s.get('title', '')} {s.get('snippet', '')}" for s in sources)
+
+
+class KnowledgeStore:
+    """Kho kiến thức SQLite (WAL) có FTS5; dùng chung một connection, khóa bằng threading.Lock"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.stats = {"upserts": 0, "inserted": 0, "updated": 0, "unchanged": 0, "lookups": 0, "searches": 0}
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(knowledge)")}
+            if "content_at" not in columns:
+                # DB tạo trước khi có content_at: coi nội dung cũ là đã hết hạn
+                self._conn.execute("ALTER TABLE knowledge ADD COLUMN content_at REAL NOT NULL DEFAULT 0")
+            try:
+                self._conn.executescript(_FTS_SCHEMA)
+                self.fts_enabled = True
+            except sqlite3.OperationalError as e:
+                # SQLite build không có FTS5: tìm kiếm bằng LIKE
+                logger.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+                self.fts_enabled = False
+
+    # ----- Ghi -----
+
+    def upsert(self, topic: str, content: Optional[str] = None, sources: Optional[List[Dict[str, Any]]] = None,
+               kind: str = "dynamic_knowledge", domain: Optional[str] = None,
+               credibility: Optional[float] = None) -> str:
+        """Thêm hoặc cập nhật một topic; trường None giữ nguyên giá trị cũ.
+        Trả về "inserted", "updated" hoặc "unchanged" (chỉ làm mới fetched_at, không ghi lại FTS).
+        content_at chỉ đổi khi có content mới được ghi, không đổi khi chỉ làm mới nguồn."""
+        key = topic_key(topic)
+        now = time.time()
+        with self._lock, self._conn:
+            self.stats["upserts"] += 1
+            row = self._conn.execute(
+                "SELECT id, content, sources, domain, credibility, content_hash, content_at FROM knowledge "
+                "WHERE kind = ? AND topic_key = ?",
+                (kind, key)
+            ).fetchone()
+
+            if row is None:
+                sources = sources or []
+                self._conn.execute(
+                    "INSERT INTO knowledge (kind, topic, topic_key, domain, content, sources, source_text, source_count, "
+                    "credibility, content_hash, version, created_at, updated_at, fetched_at, content_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?)",
+                    (kind, topic, key, domain or "general", content or "", json.dumps(sources, ensure_ascii=False),
+                     _source_text(sources), len(sources), credibility or 0.0, _content_hash(content or "", sources),
+                     now, now, now, now if content is not None else 0.0)
+                )
+                self.stats["inserted"] += 1
+                return "inserted"
+
+            new_content = row["content"] if content is None else content
+            new_sources = json.loads(row["sources"]) if sources is None else sources
+            new_hash = _content_hash(new_content, new_sources)
+            new_domain = domain or row["domain"]
+            new_credibility = row["credibility"] if credibility is None else credibility
+            content_at = row["content_at"] if content is None else now
+
+            if new_hash == row["content_hash"]:
+                self._conn.execute(
+                    "UPDATE knowledge SET fetched_at = ?, content_at = ?, domain = ?, credibility = ? WHERE id = ?",
+                    (now, content_at, new_domain, new_credibility, row["id"])
+                )
+                self.stats["unchanged"] += 1
+                return "unchanged"
+
+            self._conn.execute(
+                "UPDATE knowledge SET topic = ?, domain = ?, content = ?, sources = ?, source_text = ?, source_count = ?, "
+                "credibility = ?, content_hash = ?, version = version + 1, updated_at = ?, fetched_at = ?, content_at = ? "
+                "WHERE id = ?",
+                (topic, new_domain, new_content, json.dumps(new_sources, ensure_ascii=False), _source_text(new_sources),
+                 len(new_sources), new_credibility, new_hash, now, now, content_at, row["id"])
+            )
+            self.stats["updated"] += 1
+            return "updated"
+
+    def delete(self, topic: str, kind: str = "dynamic_knowledge") -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM knowledge WHERE kind = ? AND topic_key = ?", (kind, topic_key(topic)))
+            return cursor.rowcount > 0
+
+    # ----- Đọc -----
+
+    def _record(self, row: sqlite3.Row, score: Optional[float] = None) -> KnowledgeRecord:
+        return KnowledgeRecord(
+            kind=row["kind"], topic=row["topic"], domain=row["domain"], content=row["content"],
+            sources=json.loads(row["sources"]), credibility=row["credibility"], version=row["version"],
+            created_at=row["created_at"], updated_at=row["updated_at"], fetched_at=row["fetched_at"],
+            content_at=row["content_at"], score=score
+        )
+
+    def get(self, topic: str, kind: str = "dynamic_knowledge") -> Optional[KnowledgeRecord]:
+        with self._lock:
+            self.stats["lookups"] += 1
+            row = self._conn.execute(
+                "SELECT * FROM knowledge WHERE kind = ? AND topic_key = ?", (kind, topic_key(topic))
+            ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def fetched_at(self, topics: Iterable[str], kind: str = "dynamic_knowledge") -> Dict[str, float]:
+        """fetched_at của nhiều topic trong một truy vấn (topic chưa có thì không xuất hiện)"""
+        keys = {topic_key(t): t for t in topics}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT topic_key, fetched_at FROM knowledge WHERE kind = ? AND topic_key IN ({placeholders})",
+                (kind, *keys)
+            ).fetchall()
+        return {keys[row["topic_key"]]: row["fetched_at"] for row in rows}
+
+    def stale_topics(self, topics: Iterable[str], max_age_seconds: float, kind: str = "dynamic_knowledge") -> List[str]:
+        """Topic chưa có hoặc đã cũ hơn max_age_seconds (giữ thứ tự đầu vào)"""
+        topics = list(topics)
+        fetched = self.fetched_at(topics, kind)
+        cutoff = time.time() - max_age_seconds
+        return [t for t in topics if fetched.get(t, 0.0) < cutoff]
+
+    def search(self, query: str, domain: Optional[str] = None, min_credibility: Optional[float] = None,
+               kind: Optional[str] = None, limit: int = 10) -> List[KnowledgeRecord]:
+        """Tìm kiếm full-text trên topic, nội dung và tiêu đề/trích đoạn nguồn; xếp hạng theo BM25"""
+        terms = re.findall(r"\w+", query or "")
+        filters, params = [], []
+        if domain is not None:
+            filters.append("k.domain = ?")
+            params.append(domain)
+        if min_credibility is not None:
+            filters.append("k.credibility >= ?")
+            params.append(min_credibility)
+        if kind is not None:
+            filters.append("k.kind = ?")
+            params.append(kind)
+
+        with self._lock:
+            self.stats["searches"] += 1
+            if not terms:
+                where = f"WHERE {' AND '.join(filters)}" if filters else ""
+                rows = self._conn.execute(
+                    f"SELECT k.*, NULL AS score FROM knowledge k {where} ORDER BY k.credibility DESC, k.updated_at DESC LIMIT ?",
+                    (*params, limit)
+                ).fetchall()
+            elif self.fts_enabled:
+                match = " ".join(f'"{term}"' for term in terms)
+                where = "".join(f" AND {f}" for f in filters)
+                rows = self._conn.execute(
+                    "SELECT k.*, -bm25(knowledge_fts, 4.0, 1.0, 2.0) AS score FROM knowledge_fts "
+                    f"JOIN knowledge k ON k.id = knowledge_fts.rowid WHERE knowledge_fts MATCH ?{where} "
+                    "ORDER BY bm25(knowledge_fts, 4.0, 1.0, 2.0) LIMIT ?",
+                    (match, *params, limit)
+                ).fetchall()
+            else:
+                like = ["(k.topic || ' ' || k.content || ' ' || k.source_text) LIKE ?" for _ in terms]
+                rows = self._conn.execute(
+                    f"SELECT k.*, NULL AS score FROM knowledge k WHERE {' AND '.join(like + filters)} "
+                    "ORDER BY k.credibility DESC LIMIT ?",
+                    (*[f"%{t}%" for t in terms], *params, limit)
+                ).fetchall()
+        return [self._record(row, round(row["score"], 4) if row["score"] is not None else None) for row in rows]
+
+    def get_stats(self, max_age_seconds: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            kinds = {row[0]: row[1] for row in self._conn.execute("SELECT kind, COUNT(*) FROM knowledge GROUP BY kind")}
+            domains = {
+                row[0]: {"topics": row[1], "avg_credibility": round(row[2] or 0.0, 4)}
+                for row in self._conn.execute("SELECT domain, COUNT(*), AVG(credibility) FROM knowledge GROUP BY domain")
+            }
+            total, sources, last_update = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(source_count), 0), MAX(updated_at) FROM knowledge"
+            ).fetchone()
+            stale = None
+            if max_age_seconds is not None:
+                stale = self._conn.execute(
+                    "SELECT COUNT(*) FROM knowledge WHERE fetched_at < ?", (time.time() - max_age_seconds,)
+                ).fetchone()[0]
+        return {
+            "path": self.path,
+            "fts_enabled": self.fts_enabled,
+            "total_topics": total,
+            "total_sources": sources,
+            "kinds": kinds,
+            "domains": domains,
+            "stale_topics": stale,
+            "last_update": last_update,
+            **self.stats,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[KnowledgeStore] = None
+
+
+def get_knowledge_store() -> KnowledgeStore:
+    global _store
+    if _store is None:
+        path = os.getenv("KNOWLEDGE_STORE_PATH", "./data/knowledge.db")
+        _store = KnowledgeStore(path or None)
+    return _store
+
+
+def set_knowledge_store(store: Optional[KnowledgeStore]):
+    global _store
+    _store = store
@@ -8,6 +8,7 @@ import asyncio
 import httpx
 from urllib.parse import quote
 from .base_agent import BaseAgent
+from .tracing import get_tracer, SPAN_KIND_CLIENT
 
 class LibraryAgent(BaseAgent):
     def __init__(self):
@@ -150,8 +151,7 @@ class LibraryAgent(BaseAgent):
         
         system_prompt = "Bạn là thủ thư số chuyên nghiệp, luôn tìm kiếm tài liệu chính xác và cung cấp thông tin đầy đủ."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        search_results = self.extract_json_from_response(response)
+        search_results = await self.call_ollama_json(prompt, system_prompt)
         
         # Thực hiện tìm kiếm thực tế từ các API
         real_results = await self.search_multiple_sources(query, subject, language, format_type, max_results)
@@ -202,13 +202,21 @@ class LibraryAgent(BaseAgent):
             "sources": ["Project Gutenberg", "Internet Archive", "Open Library", "arXiv"]
         }
     
+    async def _http_get(self, client: httpx.AsyncClient, url: str, timeout: float = 10.0) -> httpx.Response:
+        """GET có tracing span cho các nguồn thư viện ngoài"""
+        with get_tracer().start_span("http.get", SPAN_KIND_CLIENT, {"http.url": url}) as span:
+            response = await client.get(url, timeout=timeout)
+            span.set_attribute("http.status_code", response.status_code)
+            span.set_attribute("http.response_bytes", len(response.content))
+            return response
+    
     async def search_project_gutenberg(self, query: str, language: str, max_results: int) -> List[Dict]:
         """Tìm kiếm trong Project Gutenberg"""
         try:
             async with httpx.AsyncClient() as client:
                 # Search using Gutendex API
                 search_url = f"https://gutendex.com/books?search={quote(query)}&languages={language}&limit={max_results}"
-                response = await client.get(search_url, timeout=10.0)
+                response = await self._http_get(client, search_url)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -242,7 +250,7 @@ class LibraryAgent(BaseAgent):
                 search_query = f"{query} subject:{subject}" if subject else query
                 search_url = f"https://archive.org/advancedsearch.php?q={quote(search_query)}&output=json&rows={max_results}"
                 
-                response = await client.get(search_url, timeout=10.0)
+                response = await self._http_get(client, search_url)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -276,7 +284,7 @@ class LibraryAgent(BaseAgent):
             async with httpx.AsyncClient() as client:
                 search_url = f"https://openlibrary.org/search.json?q={quote(query)}&language={language}&limit={max_results}"
                 
-                response = await client.get(search_url, timeout=10.0)
+                response = await self._http_get(client, search_url)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -310,7 +318,7 @@ class LibraryAgent(BaseAgent):
             async with httpx.AsyncClient() as client:
                 search_url = f"https://export.arxiv.org/api/query?search_query=all:{quote(query)}&start=0&max_results={max_results}"
                 
-                response = await client.get(search_url, timeout=10.0)
+                response = await self._http_get(client, search_url)
                 
                 if response.status_code == 200:
                     # Parse XML response (simplified)
@@ -387,8 +395,7 @@ class LibraryAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia推荐 sách, luôn đưa ra gợi ý phù hợp và cá nhân hóa."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        recommendations = self.extract_json_from_response(response)
+        recommendations = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             recommendations,
@@ -451,8 +458,7 @@ class LibraryAgent(BaseAgent):
         }}
         """
         
-        response = await self.call_ollama(prompt)
-        reading_list = self.extract_json_from_response(response)
+        reading_list = await self.call_ollama_json(prompt)
         
         return self.format_response(
             reading_list,
@@ -511,8 +517,7 @@ class LibraryAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia tài nguyên giáo dục, luôn tìm kiếm các nguồn miễn phí chất lượng cao."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        resources = self.extract_json_from_response(response)
+        resources = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             resources,
@@ -571,8 +576,7 @@ class LibraryAgent(BaseAgent):
         }}
         """
         
-        response = await self.call_ollama(prompt)
-        catalog = self.extract_json_from_response(response)
+        catalog = await self.call_ollama_json(prompt)
         
         return self.format_response(
             catalog,
@@ -628,8 +632,7 @@ class LibraryAgent(BaseAgent):
         
         system_prompt = "Bạn là biên tập viên nội dung chuyên nghiệp, luôn chọn lọc tài liệu chất lượng cao."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        curated_content = self.extract_json_from_response(response)
+        curated_content = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             curated_content,
@@ -687,8 +690,7 @@ class LibraryAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia về truy cập, luôn đảm bảo nội dung phù hợp cho mọi người dùng."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        accessibility_info = self.extract_json_from_response(response)
+        accessibility_info = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             accessibility_info,
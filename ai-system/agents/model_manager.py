@@ -0,0 +1,559 @@
+"""
+Ollama Model Manager
+Giữ model nóng (keep_alive), theo dõi model đang nạp và gom request theo model để giảm load/unload trên các host Ollama;
+chọn model theo latency budget (hạ xuống model nhỏ hơn khi hàng đợi model lớn quá dài)
+"""
+
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+import time
+import httpx
+
+from .ollama_pool import get_ollama_pool
+
+logger = logging.getLogger(__name__)
+
+# Ollama luôn báo load_duration; dưới ngưỡng này coi như model đã nằm sẵn trong bộ nhớ
+LOAD_DETECTION_SECONDS = 0.5
+
+# Hệ số làm mượt trung bình động cho tokens/sec, overhead và độ dài output
+EWMA_ALPHA = 0.2
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+def _split_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_aliases(value: str) -> Dict[str, str]:
+    aliases = {}
+    for pair in _split_list(value):
+        if "=" in pair:
+            alias, target = pair.split("=", 1)
+            aliases[alias.strip()] = target.strip()
+    return aliases
+
+
+def _parse_fallbacks(value: str) -> Dict[str, List[str]]:
+    """"llama3:70b-instruct=llama3:8b-instruct|mistral:7b-instruct,..." -> {model: [fallback, ...]}"""
+    fallbacks = {}
+    for model, targets in _parse_aliases(value).items():
+        fallbacks[model] = [t.strip() for t in targets.split("|") if t.strip()]
+    return fallbacks
+
+
+def _ewma(current: Optional[float], value: float) -> float:
+    return value if current is None else current + EWMA_ALPHA * (value - current)
+
+
+@dataclass
+class ModelManagerConfig:
+    """Cấu hình model manager"""
+    preload_models: List[str] = field(default_factory=list)
+    pinned_models: List[str] = field(default_factory=list)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    keep_alive: str = "30m"
+    max_loaded_models: int = 1
+    max_concurrent_per_model: int = 4
+    max_batch_per_model: int = 16
+    queue_timeout: float = 120.0
+    unload_on_swap: bool = False
+    scheduling_enabled: bool = True
+    slo_routing_enabled: bool = True
+    model_fallbacks: Dict[str, List[str]] = field(default_factory=dict)
+    latency_budget: Optional[float] = None
+    default_tokens_per_second: float = 20.0
+    assumed_load_seconds: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "ModelManagerConfig":
+        return cls(
+            preload_models=_split_list(os.getenv("OLLAMA_PRELOAD_MODELS", "")),
+            pinned_models=_split_list(os.getenv("OLLAMA_PINNED_MODELS", "")),
+            aliases=_parse_aliases(os.getenv("OLLAMA_MODEL_ALIASES", "")),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+            max_loaded_models=int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "1")),
+            max_concurrent_per_model=int(os.getenv("OLLAMA_MAX_CONCURRENT_PER_MODEL", "4")),
+            max_batch_per_model=int(os.getenv("OLLAMA_MAX_BATCH_PER_MODEL", "16")),
+            queue_timeout=float(os.getenv("OLLAMA_QUEUE_TIMEOUT", os.getenv("OLLAMA_TIMEOUT", "120"))),
+            unload_on_swap=os.getenv("OLLAMA_UNLOAD_ON_SWAP", "false").lower() == "true",
+            scheduling_enabled=os.getenv("OLLAMA_MODEL_SCHEDULING", "true").lower() != "false",
+            slo_routing_enabled=os.getenv("OLLAMA_SLO_ROUTING", "true").lower() != "false",
+            model_fallbacks=_parse_fallbacks(os.getenv("OLLAMA_MODEL_FALLBACKS", "")),
+            latency_budget=float(os.getenv("OLLAMA_LATENCY_BUDGET", "0")) or None,
+            default_tokens_per_second=float(os.getenv("OLLAMA_DEFAULT_TOKENS_PER_SECOND", "20")),
+            assumed_load_seconds=float(os.getenv("OLLAMA_ASSUMED_LOAD_SECONDS", "10")),
+        )
+
+
+@dataclass
+class ModelPolicy:
+    """Model ưu tiên, các model dự phòng chấp nhận được và latency budget (giây) của một agent/task"""
+    preferred: str
+    fallbacks: List[str] = field(default_factory=list)
+    latency_budget: Optional[float] = None
+    expected_tokens: Optional[int] = None
+
+
+@dataclass
+class ModelSelection:
+    """Model được chọn cho một request và lý do"""
+    requested: str
+    model: str
+    estimated_seconds: float
+    latency_budget: Optional[float] = None
+    reason: str = "preferred"
+    degraded: bool = False
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "requested": self.requested,
+            "served": self.model,
+            "degraded": self.degraded,
+            "reason": self.reason,
+            "estimated_seconds": round(self.estimated_seconds, 3),
+            "latency_budget": self.latency_budget,
+        }
+
+
+@dataclass
+class ModelStats:
+    """Thống kê theo model"""
+    requests: int = 0
+    queued: int = 0
+    loads: int = 0
+    load_seconds_total: float = 0.0
+    last_load_seconds: float = 0.0
+    queue_wait_total: float = 0.0
+    max_queue_wait: float = 0.0
+    tokens_per_second: Optional[float] = None
+    overhead_seconds: Optional[float] = None
+    completion_tokens: Optional[float] = None
+    selected: int = 0
+    downgraded_to: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "queued": self.queued,
+            "loads": self.loads,
+            "avg_load_seconds": self.load_seconds_total / self.loads if self.loads else 0.0,
+            "last_load_seconds": self.last_load_seconds,
+            "avg_queue_wait_ms": self.queue_wait_total / self.requests * 1000 if self.requests else 0.0,
+            "max_queue_wait_ms": self.max_queue_wait * 1000,
+            "tokens_per_second": self.tokens_per_second,
+            "overhead_seconds": self.overhead_seconds,
+            "avg_completion_tokens": self.completion_tokens,
+            "selected": self.selected,
+            "downgraded_to": self.downgraded_to,
+        }
+
+
+class ModelManager:
+    """Scheduler theo model cho các host Ollama của OllamaPool
+
+    Mỗi backend còn hoạt động giữ tối đa `max_loaded_models` model (không tính model pinned, có trên mọi
+    backend). Request cho model resident chạy ngay (tối đa `max_concurrent_per_model` song song trên mỗi
+    backend đang giữ model); request cho model khác xếp hàng theo model. Model đang chờ được nạp lên backend
+    còn chỗ, nếu không thì thay một model đã hết request đang chạy trên backend đó (một lần swap), rồi phục vụ
+    cả nhóm. `max_batch_per_model` giới hạn số request liên tiếp của một model khi model khác đang chờ,
+    để không model nào bị bỏ đói.
+    """
+
+    def __init__(self, config: Optional[ModelManagerConfig] = None):
+        self.config = config or ModelManagerConfig.from_env()
+        self.pinned = set(self.resolve(m) for m in self.config.pinned_models)
+        # backend url -> model đã xếp lên backend đó (thứ tự nạp)
+        self._loaded: Dict[str, "OrderedDict[str, float]"] = {}
+        self._queues: Dict[str, deque] = {}
+        self._running: Dict[str, int] = {}
+        self._served_since_load: Dict[str, int] = {}
+        self.model_stats: Dict[str, ModelStats] = {}
+        self.resident: Dict[str, Dict[str, Any]] = {}
+        self.resident_checked_at: Optional[float] = None
+        self.swaps = 0
+        self.unloads = 0
+        self.downgrades: Dict[str, int] = {}
+
+    # ----- Aliases và keep_alive -----
+
+    def resolve(self, model: str) -> str:
+        """Tag thực sự dùng để gọi Ollama (alias trỏ các tag tương đương về một model)"""
+        seen = set()
+        while model in self.config.aliases and model not in seen:
+            seen.add(model)
+            model = self.config.aliases[model]
+        return model
+
+    def keep_alive_for(self, model: str):
+        """Model pinned được giữ vĩnh viễn (-1); model khác theo OLLAMA_KEEP_ALIVE"""
+        return -1 if model in self.pinned else self.config.keep_alive
+
+    def _stats(self, model: str) -> ModelStats:
+        return self.model_stats.setdefault(model, ModelStats())
+
+    # ----- Scheduling -----
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """Chờ tới lượt chạy một request cho `model` (đã resolve alias)"""
+        if not self.config.scheduling_enabled:
+            self._stats(model).requests += 1
+            yield
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = time.monotonic()
+        self._queues.setdefault(model, deque()).append(future)
+        self._stats(model).queued += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            self._cancel_waiter(model, future)
+            raise Exception(f"Timed out waiting {self.config.queue_timeout}s for model {model}")
+        except asyncio.CancelledError:
+            self._cancel_waiter(model, future)
+            raise
+
+        waited = time.monotonic() - enqueued
+        stats = self._stats(model)
+        stats.requests += 1
+        stats.queue_wait_total += waited
+        stats.max_queue_wait = max(stats.max_queue_wait, waited)
+        try:
+            yield
+        finally:
+            self._running[model] -= 1
+            self._dispatch()
+
+    def _cancel_waiter(self, model: str, future: asyncio.Future):
+        if future.done() and not future.cancelled():
+            # Đã được cấp slot nhưng caller bỏ đi: trả slot lại
+            self._running[model] -= 1
+        else:
+            future.cancel()
+            queue = self._queues.get(model)
+            if queue is not None and future in queue:
+                queue.remove(future)
+        self._dispatch()
+
+    def _waiting(self, model: str) -> int:
+        queue = self._queues.get(model)
+        return sum(1 for f in queue if not f.done()) if queue else 0
+
+    def _active_urls(self) -> List[str]:
+        backends = get_ollama_pool().backends
+        return [b.url for b in backends if not b.ejected] or [b.url for b in backends]
+
+    def _hosts(self, model: str) -> List[str]:
+        """Backend còn hoạt động đang giữ model (không tính pinned)"""
+        return [url for url in self._active_urls() if model in self._loaded.get(url, ())]
+
+    def _scheduled(self) -> List[str]:
+        return list(dict.fromkeys(m for url in self._active_urls() for m in self._loaded.get(url, ())))
+
+    def _is_resident(self, model: str) -> bool:
+        return model in self.pinned or bool(self._hosts(model))
+
+    def _others_waiting(self, model: str) -> bool:
+        return any(self._waiting(m) for m in self._queues if m != model and not self._is_resident(m))
+
+    def _should_yield(self, model: str) -> bool:
+        return (
+            model not in self.pinned
+            and self._served_since_load.get(model, 0) >= self.config.max_batch_per_model
+            and self._others_waiting(model)
+        )
+
+    def _grant(self, model: str) -> bool:
+        queue = self._queues.get(model)
+        while queue:
+            future = queue.popleft()
+            if future.done():
+                continue
+            future.set_result(None)
+            self._running[model] = self._running.get(model, 0) + 1
+            self._served_since_load[model] = self._served_since_load.get(model, 0) + 1
+            return True
+        return False
+
+    def _concurrency(self, model: str) -> int:
+        hosts = len(self._active_urls()) if model in self.pinned else len(self._hosts(model))
+        return self.config.max_concurrent_per_model * max(hosts, 1)
+
+    def _place(self, url: str, model: str):
+        self._loaded.setdefault(url, OrderedDict())[model] = time.time()
+        backend = get_ollama_pool().backend(url)
+        if backend is not None:
+            backend.scheduled.add(model)
+
+    def _placement(self, model: str, capacity: int) -> Optional[str]:
+        """Backend để nạp model: backend còn chỗ, nếu không thì backend có model rảnh để swap ra"""
+        pool = get_ollama_pool()
+        urls = [b.url for b in pool.candidates(model)] or self._active_urls()
+        for url in urls:
+            if len(self._loaded.get(url, ())) < capacity:
+                return url
+        for url in urls:
+            idle = [
+                m for m in self._loaded.get(url, ())
+                if self._running.get(m, 0) == 0 and (not self._waiting(m) or self._should_yield(m))
+            ]
+            if idle:
+                self._evict(url, idle[0])
+                return url
+        return None
+
+    def _dispatch(self):
+        """Cấp slot cho các request có thể chạy và swap model khi model hiện tại đã rảnh"""
+        capacity = max(self.config.max_loaded_models, 1)
+
+        # 1. Phục vụ model đang resident
+        for model in list(self.pinned) + self._scheduled():
+            concurrency = self._concurrency(model)
+            while (self._running.get(model, 0) < concurrency
+                   and not self._should_yield(model) and self._grant(model)):
+                pass
+
+        # 2. Nạp model đang chờ: ưu tiên hàng đợi dài nhất
+        while True:
+            waiting = [m for m in self._queues if not self._is_resident(m) and self._waiting(m)]
+            if not waiting:
+                return
+            candidate = max(waiting, key=self._waiting)
+            url = self._placement(candidate, capacity)
+            if url is None:
+                return
+
+            self._place(url, candidate)
+            self._served_since_load[candidate] = 0
+            concurrency = self._concurrency(candidate)
+            while (self._running.get(candidate, 0) < concurrency
+                   and self._grant(candidate)):
+                pass
+
+    def _evict(self, url: str, model: str):
+        self._loaded.get(url, {}).pop(model, None)
+        backend = get_ollama_pool().backend(url)
+        if backend is not None:
+            backend.scheduled.discard(model)
+        self.swaps += 1
+        logger.info(f"Swapping out model {model} on {url} (swap #{self.swaps})")
+        if self.config.unload_on_swap:
+            try:
+                asyncio.get_running_loop().create_task(self.unload(model, [url]))
+            except RuntimeError:
+                pass
+
+    # ----- Ollama API -----
+
+    def observe_response(self, model: str, result: Dict[str, Any]):
+        """Ghi nhận load_duration, tốc độ sinh token và overhead (ns) từ response của /api/generate"""
+        stats = self._stats(model)
+        load_seconds = result.get("load_duration", 0) / 1e9
+        if load_seconds >= LOAD_DETECTION_SECONDS:
+            stats.loads += 1
+            stats.load_seconds_total += load_seconds
+            stats.last_load_seconds = load_seconds
+
+        eval_count = result.get("eval_count", 0)
+        eval_seconds = result.get("eval_duration", 0) / 1e9
+        if eval_count and eval_seconds > 0:
+            stats.tokens_per_second = _ewma(stats.tokens_per_second, eval_count / eval_seconds)
+            stats.completion_tokens = _ewma(stats.completion_tokens, eval_count)
+            total_seconds = result.get("total_duration", 0) / 1e9
+            if total_seconds:
+                # Prompt eval + overhead, không tính thời gian nạp model (đã tính riêng khi ước lượng)
+                overhead = max(total_seconds - eval_seconds - load_seconds, 0.0)
+                stats.overhead_seconds = _ewma(stats.overhead_seconds, overhead)
+
+    # ----- Chọn model theo latency budget -----
+
+    def _service_seconds(self, model: str, tokens: Optional[float] = None) -> float:
+        stats = self._stats(model)
+        if tokens is None:
+            tokens = stats.completion_tokens or DEFAULT_COMPLETION_TOKENS
+        tokens_per_second = stats.tokens_per_second or self.config.default_tokens_per_second
+        return (stats.overhead_seconds or 0.0) + tokens / max(tokens_per_second, 1e-6)
+
+    def _load_seconds(self, model: str) -> float:
+        stats = self._stats(model)
+        return stats.load_seconds_total / stats.loads if stats.loads else self.config.assumed_load_seconds
+
+    def _backlog_seconds(self, model: str) -> float:
+        """Thời gian để xử lý hết các request đang chạy/chờ của model (theo từng đợt max_concurrent)"""
+        ahead = self._waiting(model) + self._running.get(model, 0)
+        rounds = ahead // max(self._concurrency(model), 1)
+        return rounds * self._service_seconds(model)
+
+    def estimate_latency(self, model: str, expected_tokens: Optional[int] = None) -> float:
+        """Ước lượng thời gian (giây) từ lúc xếp hàng tới khi có response cho một request mới tới `model`"""
+        model = self.resolve(model)
+        estimate = self._service_seconds(model, expected_tokens)
+        if not self.config.scheduling_enabled:
+            return estimate
+
+        estimate += self._backlog_seconds(model)
+        if not self._is_resident(model):
+            estimate += self._load_seconds(model)
+            capacity = max(self.config.max_loaded_models, 1)
+            urls = self._active_urls()
+            if all(len(self._loaded.get(url, ())) >= capacity for url in urls):
+                # Mọi backend đã đầy: phải chờ một model resident rảnh mới được swap vào
+                estimate += min(self._backlog_seconds(m) for url in urls for m in self._loaded[url])
+        return estimate
+
+    def policy_for(self, model: str, fallbacks: Optional[List[str]] = None,
+                   latency_budget: Optional[float] = None, expected_tokens: Optional[int] = None) -> ModelPolicy:
+        """Policy mặc định cho `model`: fallback và budget lấy từ OLLAMA_MODEL_FALLBACKS/OLLAMA_LATENCY_BUDGET"""
+        return ModelPolicy(
+            preferred=model,
+            fallbacks=list(fallbacks) if fallbacks is not None else list(self.config.model_fallbacks.get(model, [])),
+            latency_budget=latency_budget if latency_budget is not None else self.config.latency_budget,
+            expected_tokens=expected_tokens
+        )
+
+    def select_model(self, policy: ModelPolicy) -> ModelSelection:
+        """Chọn model đầu tiên (theo thứ tự ưu tiên) có latency ước lượng nằm trong budget;
+        nếu không model nào kịp thì chọn model nhanh nhất thay vì để tail latency tăng vọt"""
+        preferred = self.resolve(policy.preferred)
+        budget = policy.latency_budget
+        if not budget or not policy.fallbacks or not self.config.slo_routing_enabled:
+            selection = ModelSelection(policy.preferred, preferred, self.estimate_latency(preferred, policy.expected_tokens), budget)
+        else:
+            candidates = []
+            for model in [policy.preferred] + list(policy.fallbacks):
+                resolved = self.resolve(model)
+                if resolved not in (c[1] for c in candidates):
+                    candidates.append((model, resolved, self.estimate_latency(resolved, policy.expected_tokens)))
+
+            within = [c for c in candidates if c[2] <= budget]
+            if within:
+                _, model, estimate = within[0]
+                reason = "preferred" if model == preferred else "over_budget"
+            else:
+                _, model, estimate = min(candidates, key=lambda c: c[2])
+                reason = "preferred" if model == preferred else "fastest_available"
+            selection = ModelSelection(policy.preferred, model, estimate, budget, reason, model != preferred)
+
+        self._stats(selection.model).selected += 1
+        if selection.degraded:
+            self._stats(selection.model).downgraded_to += 1
+            key = f"{preferred}->{selection.model}"
+            self.downgrades[key] = self.downgrades.get(key, 0) + 1
+            logger.info(
+                f"Downgraded {preferred} to {selection.model} "
+                f"(estimated {selection.estimated_seconds:.1f}s, budget {budget}s)"
+            )
+        return selection
+
+    async def _preload_on(self, client: httpx.AsyncClient, url: str, model: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{url}/api/generate",
+                json={"model": model, "prompt": "", "stream": False, "keep_alive": self.keep_alive_for(model)}
+            )
+            if response.status_code != 200:
+                return {"success": False, "error": f"HTTP {response.status_code}"}
+            self.observe_response(model, response.json())
+            return {"success": True, "seconds": time.perf_counter() - started}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    async def preload(self, models: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Nạp trước model (prompt rỗng + keep_alive) trên mọi backend có model để request đầu tiên không phải chờ load"""
+        results = {}
+        pool = get_ollama_pool()
+        async with httpx.AsyncClient(timeout=self.config.queue_timeout) as client:
+            for model in models if models is not None else self.config.preload_models:
+                model = self.resolve(model)
+                started = time.perf_counter()
+                urls = [b.url for b in pool.candidates(model)]
+                if not urls:
+                    results[model] = {"success": False, "error": "No Ollama backend available"}
+                    continue
+                outcomes = await asyncio.gather(*(self._preload_on(client, url, model) for url in urls))
+                by_backend = dict(zip(urls, outcomes))
+                if any(o["success"] for o in outcomes):
+                    if model not in self.pinned:
+                        for url, outcome in by_backend.items():
+                            if outcome["success"] and len(self._loaded.get(url, ())) < max(self.config.max_loaded_models, 1):
+                                self._place(url, model)
+                                self._served_since_load[model] = 0
+                    results[model] = {"success": True, "seconds": time.perf_counter() - started, "backends": by_backend}
+                else:
+                    results[model] = {"success": False, "error": outcomes[0]["error"], "backends": by_backend}
+        return results
+
+    async def unload(self, model: str, urls: Optional[List[str]] = None) -> bool:
+        """Yêu cầu các backend Ollama (mặc định: mọi backend) giải phóng model ngay (keep_alive = 0)"""
+        if model in self.pinned:
+            return False
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                responses = await asyncio.gather(*(
+                    client.post(f"{url}/api/generate", json={"model": model, "keep_alive": 0})
+                    for url in (urls if urls is not None else get_ollama_pool().urls)
+                ), return_exceptions=True)
+            self.unloads += 1
+            return any(not isinstance(r, Exception) and r.status_code == 200 for r in responses)
+        except Exception as e:
+            logger.warning(f"Failed to unload model {model}: {e}")
+            return False
+
+    async def refresh_resident(self) -> Dict[str, Dict[str, Any]]:
+        """Đọc danh sách model đang nằm trong bộ nhớ từ /api/ps của mọi backend"""
+        pool = get_ollama_pool()
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                results = await pool.probe_all(client)
+            if any(results):
+                self.resident = pool.loaded_models()
+                self.resident_checked_at = time.time()
+        except Exception as e:
+            logger.warning(f"Failed to read resident models: {e}")
+        return self.resident
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "scheduling_enabled": self.config.scheduling_enabled,
+            "max_loaded_models": self.config.max_loaded_models,
+            "pinned": sorted(self.pinned),
+            "aliases": dict(self.config.aliases),
+            "scheduled_models": self._scheduled(),
+            "scheduled_by_backend": {url: list(models) for url, models in self._loaded.items() if models},
+            "resident_models": self.resident,
+            "resident_checked_at": self.resident_checked_at,
+            "swaps": self.swaps,
+            "unloads": self.unloads,
+            "slo_routing_enabled": self.config.slo_routing_enabled,
+            "model_fallbacks": dict(self.config.model_fallbacks),
+            "downgrades": dict(self.downgrades),
+            "running": {m: n for m, n in self._running.items() if n},
+            "waiting": {m: self._waiting(m) for m in self._queues if self._waiting(m)},
+            "models": {m: s.to_dict() for m, s in self.model_stats.items()},
+        }
+
+
+_manager: Optional[ModelManager] = None
+
+
+def get_model_manager() -> ModelManager:
+    global _manager
+    if _manager is None:
+        _manager = ModelManager()
+    return _manager
+
+
+def set_model_manager(manager: ModelManager):
+    global _manager
+    _manager = manager
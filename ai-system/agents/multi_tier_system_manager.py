@@ -4,10 +4,14 @@ Multi-Tier Agent System Manager
 """
 
 from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
 import json
 import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from enum import Enum
 import uuid
 import logging
@@ -17,6 +21,11 @@ from .multi_tier_agent_system import (
     SkillRoutingAgent, ProcessingAgent, FilteringAgent, SynthesisAgent,
     EvaluationAgent, ResponseAgent
 )
+from .tracing import traced
+from .semantic_cache import get_semantic_cache
+from .ollama_health import get_ollama_health
+from .search_service import get_search_service
+from .state_backend import SharedCounters
 
 class TaskStatus(Enum):
     """Trạng thái của task"""
@@ -51,10 +60,120 @@ class ProcessingPipeline:
     final_result: Dict[str, Any] = field(default_factory=dict)
     error_log: List[str] = field(default_factory=list)
 
+class PipelineOverloadedError(Exception):
+    """Hệ thống đang chạy đủ pipeline và hàng đợi đầy (hoặc chờ quá lâu): trả 429 cho client"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class PipelineSummary:
+    """Bản tóm tắt gọn của pipeline đã xong (không giữ task và text LLM)"""
+    pipeline_id: str
+    query: str
+    state: str
+    success: bool
+    created_at: str
+    queue_wait: float
+    duration: Optional[float]
+    retry_count: int
+    tasks_completed: int
+    last_tier: str
+    quality_score: Optional[float] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_pipeline(cls, pipeline: ProcessingPipeline, result: Dict[str, Any], queue_wait: float) -> "PipelineSummary":
+        end = pipeline.completed_at or datetime.now()
+        error = result.get("error") or (pipeline.error_log[-1] if pipeline.error_log else None)
+        return cls(
+            pipeline_id=pipeline.pipeline_id,
+            query=pipeline.original_query[:80],
+            state=pipeline.state.value,
+            success=bool(result.get("success", False)),
+            created_at=pipeline.created_at.isoformat(),
+            queue_wait=round(queue_wait, 4),
+            duration=round((end - pipeline.started_at).total_seconds(), 4) if pipeline.started_at else None,
+            retry_count=pipeline.retry_count,
+            tasks_completed=len([t for t in pipeline.tasks if t.status == TaskStatus.COMPLETED]),
+            last_tier=pipeline.current_tier.value,
+            quality_score=result.get("quality_scores", {}).get("overall"),
+            error=str(error)[:200] if error else None
+        )
+
+class PipelineAdmission:
+    """Giới hạn số pipeline chạy đồng thời: semaphore + hàng đợi có giới hạn và timeout
+
+    Hàng đợi đầy thì từ chối ngay; chờ quá `queue_timeout` giây cũng bị từ chối (PipelineOverloadedError).
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait = 0.0
+
+    def retry_after(self) -> float:
+        return max(1.0, self.queue_timeout)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Giữ một slot trong suốt khối `async with`; yield thời gian đã chờ trong hàng đợi (giây)"""
+        started = time.perf_counter()
+        if self._semaphore.locked() or self.waiting:
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise PipelineOverloadedError(
+                    f"Multi-tier system busy: {self.active} pipelines running, {self.waiting} queued",
+                    self.retry_after()
+                )
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise PipelineOverloadedError(
+                    f"Multi-tier system busy: waited {self.queue_timeout:.1f}s for a pipeline slot", self.retry_after()
+                )
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        waited = time.perf_counter() - started
+        self.active += 1
+        self.admitted += 1
+        self.total_wait += waited
+        try:
+            yield waited
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "average_queue_wait": self.total_wait / self.admitted if self.admitted else 0.0
+        }
+
 class MultiTierAgentSystemManager:
     """Manager điều phối hệ thống multi-tier agents"""
     
-    def __init__(self):
+    def __init__(self, max_concurrent_pipelines: Optional[int] = None, max_queued_pipelines: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, history_size: Optional[int] = None):
         self.logger = logging.getLogger(__name__)
         
         # Initialize all tier agents
@@ -67,26 +186,58 @@ class MultiTierAgentSystemManager:
         self.evaluation_agent = EvaluationAgent()
         self.response_agent = ResponseAgent()
         
-        # System state
+        # System state: chỉ giữ pipeline đang chạy (thuộc về worker xử lý request đó)
         self.current_pipelines: Dict[str, ProcessingPipeline] = {}
         self.system_state = SystemState.IDLE
-        self.max_concurrent_pipelines = 5
+        self.max_concurrent_pipelines = max_concurrent_pipelines if max_concurrent_pipelines is not None else \
+            int(os.getenv("MULTI_TIER_MAX_CONCURRENT", "5"))
+        self.admission = PipelineAdmission(
+            self.max_concurrent_pipelines,
+            max_queued_pipelines if max_queued_pipelines is not None else int(os.getenv("MULTI_TIER_MAX_QUEUE", "20")),
+            queue_timeout if queue_timeout is not None else float(os.getenv("MULTI_TIER_QUEUE_TIMEOUT", "30"))
+        )
         
-        # Performance metrics
-        self.metrics = {
+        # Pipeline đã xong: ring buffer tóm tắt, đầy thì bỏ bản cũ nhất (theo thời điểm xong)
+        self.history_size = history_size if history_size is not None else int(os.getenv("MULTI_TIER_HISTORY_SIZE", "200"))
+        self.pipeline_history: deque = deque(maxlen=max(1, self.history_size))
+        
+        # Performance metrics: counter dùng chung giữa các worker
+        self.counters = SharedCounters("multi_tier_metrics", defaults={
             "total_processed": 0,
             "successful_pipelines": 0,
             "failed_pipelines": 0,
-            "average_processing_time": 0.0,
-            "retry_count": 0
-        }
+            "timed_pipelines": 0,
+            "total_processing_time": 0.0,
+            "retry_count": 0,
+            "cache_hits": 0
+        })
+        
+        # Semantic cache: câu hỏi diễn đạt lại được trả lời không cần chạy pipeline
+        self.semantic_cache = get_semantic_cache()
+        # Search service dùng chung với WebSearchAgent/KnowledgeIntegrationAgent
+        self.search_service = get_search_service()
     
+    @traced("multi_tier.process_query", attributes=lambda self, query, context=None: {"query.chars": len(query)})
     async def process_query(self, query: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý query qua hệ thống multi-tier agents"""
         
         if context is None:
             context = {}
         
+        bypass_cache = bool(context.get("bypass_cache", False))
+        cache_scope = f"multi_tier:{context.get('context', 'general')}"
+        hit = await self.semantic_cache.lookup(query, cache_scope, bypass=bypass_cache)
+        if hit is not None:
+            self.counters.incr("cache_hits")
+            return {**hit.response, "cache": hit.to_metadata()}
+        
+        # Admission control: hàng đợi đầy hoặc chờ quá lâu thì PipelineOverloadedError
+        async with self.admission.admit() as queue_wait:
+            return await self._run_pipeline(query, cache_scope, bypass_cache, queue_wait)
+    
+    async def _run_pipeline(self, query: str, cache_scope: str, bypass_cache: bool, queue_wait: float) -> Dict[str, Any]:
+        """Chạy một pipeline đã được nhận; xong thì chỉ giữ lại bản tóm tắt"""
+        
         # Create pipeline
         pipeline_id = str(uuid.uuid4())
         pipeline = ProcessingPipeline(
@@ -96,17 +247,21 @@ class MultiTierAgentSystemManager:
         
         self.current_pipelines[pipeline_id] = pipeline
         self.system_state = SystemState.PROCESSING
+        result: Dict[str, Any] = {}
         
         try:
             # Process through all tiers
             result = await self.execute_pipeline(pipeline)
             
             # Update metrics
-            self.metrics["total_processed"] += 1
+            self.counters.incr("total_processed")
             if result.get("success", False):
-                self.metrics["successful_pipelines"] += 1
+                self.counters.incr("successful_pipelines")
+                # Chỉ cache câu trả lời đầy đủ; circuit mở thì câu trả lời có thể là response cũ (degraded)
+                if not bypass_cache and result.get("final_response") and get_ollama_health().available:
+                    await self.semantic_cache.store(query, result, cache_scope, tags=["multi_tier"])
             else:
-                self.metrics["failed_pipelines"] += 1
+                self.counters.incr("failed_pipelines")
             
             return result
             
@@ -115,16 +270,17 @@ class MultiTierAgentSystemManager:
             pipeline.error_log.append(str(e))
             pipeline.state = SystemState.ERROR
             
-            return {
+            result = {
                 "success": False,
                 "error": str(e),
                 "pipeline_id": pipeline_id,
                 "query": query
             }
+            return result
         finally:
-            # Clean up old pipelines
-            await self.cleanup_pipelines()
+            self.finish_pipeline(pipeline, result, queue_wait)
     
+    @traced("multi_tier.execute_pipeline", attributes=lambda self, pipeline: {"pipeline.id": pipeline.pipeline_id})
     async def execute_pipeline(self, pipeline: ProcessingPipeline) -> Dict[str, Any]:
         """Thực thi pipeline qua các tier"""
         
@@ -172,6 +328,8 @@ class MultiTierAgentSystemManager:
             # Tier 7: Response Generation
             self.logger.info(f"Pipeline {pipeline.pipeline_id}: Starting Response Generation")
             response_result = await self.tier_response(pipeline, evaluation_result)
+            if not response_result.get("success", False):
+                return await self.handle_failure(pipeline, response_result, "response")
             
             # Pipeline completed successfully
             pipeline.completed_at = datetime.now()
@@ -200,6 +358,7 @@ class MultiTierAgentSystemManager:
             pipeline.state = SystemState.ERROR
             raise
     
+    @traced("multi_tier.tier_input_analysis")
     async def tier_input_analysis(self, pipeline: ProcessingPipeline) -> Dict[str, Any]:
         """Tier 1: Input Analysis"""
         
@@ -226,6 +385,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_skill_routing")
     async def tier_skill_routing(self, pipeline: ProcessingPipeline, analysis_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 2: Skill Routing"""
         
@@ -254,6 +414,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_processing")
     async def tier_processing(self, pipeline: ProcessingPipeline, routing_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 3: Processing"""
         
@@ -265,7 +426,7 @@ class MultiTierAgentSystemManager:
         # Execute skill agents in parallel
         agent_results = []
         
-        # Simulate calling selected agents
+        # Simulate calling selected agents (skill tìm kiếm lấy kết quả thật từ search service)
         for agent_name in selected_agents[:2]:  # Limit for demo
             agent_result = {
                 "agent": agent_name,
@@ -273,6 +434,11 @@ class MultiTierAgentSystemManager:
                 "confidence": 0.85,
                 "processed_at": datetime.now().isoformat()
             }
+            if agent_name == "web_search_agent":
+                search = await self.search_service.search(pipeline.original_query, "general", 5)
+                agent_result["content"] = "\n".join(f"{r['title']}: {r['snippet']}" for r in search["results"])
+                agent_result["sources"] = search["results"]
+                agent_result["cached"] = search["cached"]
             agent_results.append(agent_result)
         
         # Create processing task
@@ -296,6 +462,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_filtering")
     async def tier_filtering(self, pipeline: ProcessingPipeline, processing_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 4: Filtering"""
         
@@ -325,6 +492,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_synthesis")
     async def tier_synthesis(self, pipeline: ProcessingPipeline, filtering_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 5: Synthesis"""
         
@@ -354,6 +522,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_evaluation")
     async def tier_evaluation(self, pipeline: ProcessingPipeline, synthesis_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 6: Evaluation"""
         
@@ -384,6 +553,7 @@ class MultiTierAgentSystemManager:
         
         return result
     
+    @traced("multi_tier.tier_response")
     async def tier_response(self, pipeline: ProcessingPipeline, evaluation_result: Dict[str, Any]) -> Dict[str, Any]:
         """Tier 7: Response Generation"""
         
@@ -424,7 +594,7 @@ class MultiTierAgentSystemManager:
         if pipeline.retry_count < pipeline.max_retries:
             pipeline.retry_count += 1
             pipeline.state = SystemState.RETRYING
-            self.metrics["retry_count"] += 1
+            self.counters.incr("retry_count")
             
             self.logger.info(f"Pipeline {pipeline.pipeline_id}: Retrying {failed_tier} (attempt {pipeline.retry_count})")
             
@@ -466,42 +636,48 @@ class MultiTierAgentSystemManager:
             pipeline.state = SystemState.ERROR
             return failed_result
     
-    async def cleanup_pipelines(self):
-        """Dọn dẹp các pipeline cũ"""
-        
-        current_time = datetime.now()
-        pipelines_to_remove = []
-        
-        for pipeline_id, pipeline in self.current_pipelines.items():
-            # Remove pipelines older than 1 hour or completed
-            if (pipeline.state == SystemState.IDLE and 
-                pipeline.completed_at and 
-                (current_time - pipeline.completed_at).total_seconds() > 3600):
-                pipelines_to_remove.append(pipeline_id)
-        
-        for pipeline_id in pipelines_to_remove:
-            del self.current_pipelines[pipeline_id]
-            self.logger.info(f"Cleaned up pipeline {pipeline_id}")
+    def finish_pipeline(self, pipeline: ProcessingPipeline, result: Dict[str, Any], queue_wait: float = 0.0):
+        """Bỏ pipeline khỏi danh sách đang chạy và lưu bản tóm tắt vào ring buffer (O(1))"""
+        
+        self.current_pipelines.pop(pipeline.pipeline_id, None)
+        self.pipeline_history.append(PipelineSummary.from_pipeline(pipeline, result, queue_wait))
+        if not self.current_pipelines:
+            self.system_state = SystemState.IDLE
+    
+    def get_pipeline_summary(self, pipeline_id: str) -> Optional[Dict[str, Any]]:
+        """Tóm tắt pipeline gần đây theo ID (None nếu đã bị đẩy khỏi ring buffer)"""
+        
+        for summary in reversed(self.pipeline_history):
+            if summary.pipeline_id == pipeline_id:
+                return asdict(summary)
+        return None
     
     def update_average_processing_time(self, processing_time: float):
         """Cập nhật thời gian xử lý trung bình"""
         
-        if self.metrics["total_processed"] <= 1:
-            self.metrics["average_processing_time"] = processing_time
-        else:
-            # Weighted average
-            total = self.metrics["total_processed"] - 1
-            current_avg = self.metrics["average_processing_time"]
-            self.metrics["average_processing_time"] = (current_avg * total + processing_time) / (total + 1)
+        self.counters.incr("timed_pipelines")
+        self.counters.incr("total_processing_time", processing_time)
+    
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        """Metrics của mọi worker (thời gian trung bình tính từ tổng thời gian)"""
+        metrics = self.counters.snapshot()
+        timed = metrics.pop("timed_pipelines")
+        total_time = metrics.pop("total_processing_time")
+        metrics["average_processing_time"] = total_time / timed if timed else 0.0
+        return metrics
     
-    def get_system_status(self) -> Dict[str, Any]:
+    def get_system_status(self, recent: int = 20) -> Dict[str, Any]:
         """Lấy trạng thái hệ thống"""
         
         return {
             "system_state": self.system_state.value,
             "active_pipelines": len(self.current_pipelines),
             "max_concurrent_pipelines": self.max_concurrent_pipelines,
+            "admission": self.admission.get_stats(),
             "metrics": self.metrics.copy(),
+            "history_size": self.history_size,
+            "recent_pipelines": [asdict(summary) for summary in list(self.pipeline_history)[-recent:]],
             "pipeline_details": {
                 pipeline_id: {
                     "original_query": pipeline.original_query[:50] + "...",
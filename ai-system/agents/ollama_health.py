@@ -0,0 +1,378 @@
+"""
+Ollama Health Monitor
+Theo dõi Ollama ở nền (trạng thái, model có sẵn/đang nạp, latency gần đây) và circuit breaker cho mọi lần gọi LLM:
+khi Ollama sập hoặc quá tải thì request thất bại ngay (hoặc dùng response đã cache) thay vì chờ hết timeout
+"""
+
+from typing import Dict, Any, List, Optional, Callable
+from collections import OrderedDict, deque
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Số mẫu latency giữ lại để tính p50/p95
+LATENCY_WINDOW = 100
+EWMA_ALPHA = 0.2
+
+
+class CircuitOpenError(Exception):
+    """Circuit đang mở: không gọi Ollama"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM service unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class OllamaAPIError(Exception):
+    """Ollama trả về HTTP status khác 200"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Ollama API error: {status_code}")
+        self.status_code = status_code
+
+
+class OllamaUnavailableError(Exception):
+    """Không còn backend Ollama nào nhận request"""
+
+
+def is_outage(error: BaseException) -> bool:
+    """Lỗi cho thấy Ollama không phục vụ được (kết nối, timeout, 5xx), khác với lỗi của request (vd. 404 model)"""
+    if isinstance(error, (httpx.TransportError, OllamaUnavailableError)):
+        return True
+    return isinstance(error, OllamaAPIError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Circuit breaker closed/open/half-open
+
+    - closed: cho qua mọi request; `failure_threshold` lỗi liên tiếp thì mở
+    - open: từ chối ngay trong `recovery_timeout` giây, sau đó chuyển half-open
+    - half-open: cho tối đa `half_open_max_calls` request thử đồng thời; `success_threshold` lần
+      thành công thì đóng lại, một lỗi thì mở lại
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1, success_threshold: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.success_threshold = max(1, success_threshold)
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._successes = 0
+        self._trials = 0
+        self._opened_at = 0.0
+        self.transitions: Dict[str, int] = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (self._clock() - self._opened_at))
+
+    def _transition(self, state: str):
+        self._state = state
+        self._successes = 0
+        self._trials = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+        elif state == CLOSED:
+            self._failures = 0
+        self.transitions[state] += 1
+        logger.info(f"Ollama circuit -> {state}")
+
+    def allow(self) -> bool:
+        """True nếu request được đi tiếp (half-open: chiếm một lượt thử)"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._trials < self.half_open_max_calls:
+            self._trials += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def check(self):
+        """Như allow nhưng raise CircuitOpenError khi bị từ chối"""
+        if not self.allow():
+            raise CircuitOpenError(self.retry_after() or self.recovery_timeout)
+
+    def release(self):
+        """Trả lượt thử half-open khi request kết thúc mà không kết luận được (vd. bị hủy)"""
+        if self._state == HALF_OPEN and self._trials:
+            self._trials -= 1
+
+    def record_success(self):
+        if self._state == HALF_OPEN:
+            self._trials = max(0, self._trials - 1)
+            self._successes += 1
+            if self._successes >= self.success_threshold:
+                self._transition(CLOSED)
+        else:
+            self._failures = 0
+
+    def record_failure(self):
+        state = self.state
+        if state == HALF_OPEN:
+            self._transition(OPEN)
+        elif state == CLOSED:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def probe_succeeded(self):
+        """Probe nền thấy Ollama đã sống lại: không cần chờ hết recovery_timeout"""
+        if self.state == OPEN:
+            self._transition(HALF_OPEN)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_after": round(self.retry_after(), 1),
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+def response_key(model: str, prompt: str, system_prompt: Optional[str] = None, format: Any = None) -> str:
+    """Khóa cache cho một lần gọi LLM"""
+    raw = json.dumps([model, system_prompt or "", prompt or "", format], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class OllamaHealthMonitor:
+    """Probe định kỳ mọi backend trong OllamaPool (/api/tags, /api/ps) và giữ sẵn snapshot trạng thái để /health đọc O(1)
+
+    Kết quả probe và kết quả của các lần gọi LLM thật cùng điều khiển một CircuitBreaker cho toàn bộ pool
+    (mỗi backend còn có breaker riêng để bị loại khỏi pool). Response thành công gần đây được giữ (LRU)
+    để trả lời khi circuit mở.
+    """
+
+    def __init__(self, pool=None, interval: Optional[float] = None,
+                 probe_timeout: Optional[float] = None, breaker: Optional[CircuitBreaker] = None,
+                 enabled: Optional[bool] = None, max_cached_responses: Optional[int] = None):
+        self._pool = pool
+        self.interval = interval if interval is not None else float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+        self.probe_timeout = probe_timeout if probe_timeout is not None else float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "3"))
+        self.enabled = enabled if enabled is not None else os.getenv("OLLAMA_BREAKER_ENABLED", "true").lower() != "false"
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("OLLAMA_BREAKER_RECOVERY_SECONDS", "30")),
+            half_open_max_calls=int(os.getenv("OLLAMA_BREAKER_HALF_OPEN_CALLS", "1")),
+            success_threshold=int(os.getenv("OLLAMA_BREAKER_SUCCESS_THRESHOLD", "1")),
+        )
+        self.max_cached_responses = max_cached_responses if max_cached_responses is not None else \
+            int(os.getenv("OLLAMA_DEGRADED_CACHE_SIZE", "256"))
+        self._responses: "OrderedDict[str, str]" = OrderedDict()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.status = "unknown"
+        self.available_models: List[str] = []
+        self.loaded_models: Dict[str, Dict[str, Any]] = {}
+        self.last_checked: Optional[float] = None
+        self.last_healthy: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.probe_latency_ms: Optional[float] = None
+        self.call_latency_ms: Optional[float] = None
+        self.probes = 0
+        self.calls = {"succeeded": 0, "failed": 0, "rejected": 0, "served_from_cache": 0}
+        # Snapshot chỉ tính lại khi /health đọc sau khi trạng thái đổi, không tính trong mỗi lần gọi LLM
+        self._snapshot: Dict[str, Any] = {}
+        self._dirty = True
+
+    @property
+    def pool(self):
+        """Pool được probe (mặc định là pool dùng chung của gateway)"""
+        if self._pool is not None:
+            return self._pool
+        from .ollama_pool import get_ollama_pool
+        return get_ollama_pool()
+
+    # --- Probe nền ---
+
+    def start(self):
+        """Chạy probe nền (gọi trong event loop, ví dụ lúc startup)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
+
+    async def probe(self) -> Dict[str, Any]:
+        """Một lần probe mọi backend: /api/tags (model có sẵn) và /api/ps (model đang nạp)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.probe_timeout)
+        pool = self.pool
+        started = time.perf_counter()
+        self.probes += 1
+        results = await pool.probe_all(self._client)
+        self.probe_latency_ms = (time.perf_counter() - started) * 1000
+        self.available_models = pool.available_models()
+        self.loaded_models = pool.loaded_models()
+        if all(results):
+            self.status = "healthy"
+        elif any(results):
+            self.status = "degraded"
+        else:
+            self.status = "unhealthy"
+        if any(results):
+            self.last_healthy = time.time()
+            self.last_error = None
+            self._share_resident_models()
+            self.breaker.probe_succeeded()
+        else:
+            self.last_error = next((b.last_error for b in pool.backends if b.last_error), None)
+            self.breaker.record_failure()
+        self.last_checked = time.time()
+        self._dirty = True
+        return self.snapshot()
+
+    def _share_resident_models(self):
+        # Model manager dùng cùng thông tin /api/ps, không cần tự gọi lại
+        from .model_manager import get_model_manager
+        manager = get_model_manager()
+        manager.resident = dict(self.loaded_models)
+        manager.resident_checked_at = self.last_checked or time.time()
+
+    # --- Gọi LLM ---
+
+    def before_call(self):
+        """Gọi trước mỗi request LLM; raise CircuitOpenError khi circuit mở"""
+        if not self.enabled:
+            return
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            self.calls["rejected"] += 1
+            self._dirty = True
+            raise
+
+    def record_success(self, latency: float):
+        self.calls["succeeded"] += 1
+        self._latencies.append(latency * 1000)
+        self.call_latency_ms = latency * 1000 if self.call_latency_ms is None else \
+            self.call_latency_ms + EWMA_ALPHA * (latency * 1000 - self.call_latency_ms)
+        if self.enabled:
+            self.breaker.record_success()
+        self._dirty = True
+
+    def record_failure(self, error: Exception):
+        self.calls["failed"] += 1
+        self.last_error = str(error) or error.__class__.__name__
+        if self.enabled:
+            self.breaker.record_failure()
+        self._dirty = True
+
+    def release(self):
+        if self.enabled:
+            self.breaker.release()
+
+    def remember(self, key: str, text: str):
+        """Giữ response thành công để dùng khi circuit mở"""
+        if self.max_cached_responses <= 0 or not text:
+            return
+        self._responses[key] = text
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_cached_responses:
+            self._responses.popitem(last=False)
+
+    def cached_response(self, key: str) -> Optional[str]:
+        text = self._responses.get(key)
+        if text is not None:
+            self.calls["served_from_cache"] += 1
+            self._dirty = True
+        return text
+
+    # --- Trạng thái ---
+
+    @property
+    def available(self) -> bool:
+        return not self.enabled or self.breaker.state != OPEN
+
+    def _latency_percentiles(self) -> Dict[str, Optional[float]]:
+        if not self._latencies:
+            return {"p50": None, "p95": None}
+        ordered = sorted(self._latencies)
+        return {
+            "p50": round(ordered[len(ordered) // 2], 1),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+        }
+
+    def _refresh_snapshot(self):
+        self._dirty = False
+        self._snapshot = {
+            "status": self.status,
+            "backends": self.pool.get_stats(),
+            "circuit": self.breaker.to_dict() if self.enabled else {"state": "disabled"},
+            "available_models": self.available_models,
+            "loaded_models": self.loaded_models,
+            "last_checked": self.last_checked,
+            "last_healthy": self.last_healthy,
+            "last_error": self.last_error,
+            "probe_latency_ms": round(self.probe_latency_ms, 1) if self.probe_latency_ms is not None else None,
+            "call_latency_ms": round(self.call_latency_ms, 1) if self.call_latency_ms is not None else None,
+            "call_latency_percentiles_ms": self._latency_percentiles(),
+            "probe_interval": self.interval,
+            "probes": self.probes,
+            "calls": dict(self.calls),
+            "cached_responses": len(self._responses),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Trạng thái đã tính sẵn (không gọi mạng); tính lại khi có probe/lần gọi mới hoặc circuit đổi trạng thái
+        (open -> half-open theo thời gian)"""
+        if self._dirty or (self.enabled and self._snapshot["circuit"]["state"] != self.breaker.state):
+            self._refresh_snapshot()
+        return self._snapshot
+
+
+_monitor: Optional[OllamaHealthMonitor] = None
+
+
+def get_ollama_health() -> OllamaHealthMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = OllamaHealthMonitor()
+    return _monitor
+
+
+def set_ollama_health(monitor: Optional[OllamaHealthMonitor]):
+    global _monitor
+    _monitor = monitor
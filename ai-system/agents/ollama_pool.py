@@ -0,0 +1,302 @@
+"""
+Ollama Backend Pool
+Nhiều host Ollama phía sau gateway: inventory model theo từng backend (/api/tags, /api/ps), định tuyến
+least-outstanding-requests hoặc theo latency có ưu tiên backend đã nạp sẵn model, hedged request cho prompt
+ngắn, failover và loại/nhận lại backend lỗi bằng circuit breaker riêng của từng backend
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable, TypeVar
+import asyncio
+import logging
+import os
+import time
+import httpx
+
+from .ollama_health import CircuitBreaker, OllamaAPIError, OllamaUnavailableError, is_outage, OPEN
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ROUTING_STRATEGIES = ("least_outstanding", "latency")
+EWMA_ALPHA = 0.2
+# Latency giả định (giây) cho backend chưa có mẫu nào
+DEFAULT_LATENCY = 1.0
+
+
+def parse_urls(value: str) -> List[str]:
+    """"http://a:11434, http://b:11434/" -> ["http://a:11434", "http://b:11434"] (bỏ trùng, giữ thứ tự)"""
+    urls = []
+    for url in value.split(","):
+        url = url.strip().rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+class OllamaBackend:
+    """Một host Ollama: số request đang chạy, latency EWMA, model có sẵn/đang nạp và circuit breaker (ejection)"""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.models: set = set()
+        self.loaded: Dict[str, Dict[str, Any]] = {}
+        # Model mà ModelManager đã xếp lên backend này (chưa chắc đã thấy trong /api/ps)
+        self.scheduled: set = set()
+        self.healthy: Optional[bool] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def ejected(self) -> bool:
+        return self.breaker.state == OPEN
+
+    def serves(self, model: str) -> bool:
+        """Inventory chưa biết (chưa probe được) thì coi như có model"""
+        return not self.models or model in self.models
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latency = latency if self.latency is None else self.latency + EWMA_ALPHA * (latency - self.latency)
+        self.breaker.record_success()
+
+    def record_failure(self, error: BaseException):
+        self.requests += 1
+        self.failures += 1
+        self.last_error = str(error) or error.__class__.__name__
+        was_open = self.ejected
+        self.breaker.record_failure()
+        if self.ejected and not was_open:
+            logger.warning(f"Ejected Ollama backend {self.url}: {self.last_error}")
+
+    async def probe(self, client: httpx.AsyncClient) -> bool:
+        """Đọc /api/tags và /api/ps; probe thành công nhận lại backend đã bị loại (half-open)"""
+        try:
+            tags = await client.get(f"{self.url}/api/tags")
+            if tags.status_code != 200:
+                raise OllamaAPIError(tags.status_code)
+            self.models = {m.get("name", m.get("model", "")) for m in tags.json().get("models", [])}
+            ps = await client.get(f"{self.url}/api/ps")
+            if ps.status_code == 200:
+                self.loaded = {
+                    m.get("name", m.get("model", "")): {
+                        "size": m.get("size", 0),
+                        "size_vram": m.get("size_vram", 0),
+                        "expires_at": m.get("expires_at")
+                    }
+                    for m in ps.json().get("models", [])
+                }
+            self.healthy = True
+            self.last_error = None
+            if self.ejected:
+                logger.info(f"Re-admitting Ollama backend {self.url}")
+            self.breaker.probe_succeeded()
+        except Exception as e:
+            self.healthy = False
+            self.last_error = str(e) or e.__class__.__name__
+            self.breaker.record_failure()
+        self.last_checked = time.time()
+        return self.healthy
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "models": sorted(self.models),
+            "loaded_models": sorted(self.loaded),
+            "scheduled_models": sorted(self.scheduled),
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """Chọn backend cho từng request LLM
+
+    - `least_outstanding`: ít request đang chạy nhất; `latency`: (outstanding + 1) * latency EWMA
+    - backend chưa nạp (và chưa được ModelManager xếp) model bị cộng `affinity_weight` request ảo, nên request
+      dồn về host đã có model cho tới khi host đó bận hơn hẳn
+    - lỗi kết nối/timeout/5xx thì thử backend kế tiếp; lỗi liên tiếp làm backend bị loại tới khi probe thấy sống lại
+    - hedging: request không stream, prompt ngắn mà sau `hedge_delay` giây chưa xong thì gửi thêm tới backend
+      thứ hai, lấy kết quả về trước
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None, strategy: Optional[str] = None,
+                 affinity_weight: Optional[float] = None, hedge_delay: Optional[float] = None,
+                 hedge_max_prompt_chars: Optional[int] = None, failure_threshold: Optional[int] = None,
+                 eject_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        if urls is None:
+            urls = parse_urls(os.getenv("OLLAMA_URLS", "")) or parse_urls(os.getenv("OLLAMA_URL", "http://localhost:11434"))
+        self.strategy = strategy or os.getenv("OLLAMA_ROUTING", "least_outstanding")
+        if self.strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy '{self.strategy}', expected one of {ROUTING_STRATEGIES}")
+        self.affinity_weight = affinity_weight if affinity_weight is not None else float(os.getenv("OLLAMA_AFFINITY_WEIGHT", "2"))
+        self.hedge_delay = hedge_delay if hedge_delay is not None else float(os.getenv("OLLAMA_HEDGE_DELAY_MS", "0")) / 1000
+        self.hedge_max_prompt_chars = hedge_max_prompt_chars if hedge_max_prompt_chars is not None else \
+            int(os.getenv("OLLAMA_HEDGE_MAX_PROMPT_CHARS", "2000"))
+        failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv("OLLAMA_EJECT_FAILURES", "3"))
+        eject_seconds = eject_seconds if eject_seconds is not None else float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))
+        self.backends = [
+            OllamaBackend(url, CircuitBreaker(failure_threshold, eject_seconds, clock=clock))
+            for url in parse_urls(",".join(urls))
+        ]
+        if not self.backends:
+            raise ValueError("OllamaPool needs at least one backend URL")
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @property
+    def urls(self) -> List[str]:
+        return [b.url for b in self.backends]
+
+    def backend(self, url: str) -> Optional[OllamaBackend]:
+        url = url.rstrip("/")
+        return next((b for b in self.backends if b.url == url), None)
+
+    def should_hedge(self, prompt_chars: int, stream: bool) -> bool:
+        return self.hedge_delay > 0 and not stream and len(self.backends) > 1 and prompt_chars <= self.hedge_max_prompt_chars
+
+    def _cost(self, backend: OllamaBackend, model: str) -> tuple:
+        penalty = 0.0 if model in backend.loaded or model in backend.scheduled else self.affinity_weight
+        latency = backend.latency if backend.latency is not None else DEFAULT_LATENCY
+        if self.strategy == "latency":
+            return ((backend.outstanding + 1 + penalty) * latency,)
+        return (backend.outstanding + penalty, latency)
+
+    def candidates(self, model: str, exclude: List[OllamaBackend] = ()) -> List[OllamaBackend]:
+        """Backend còn nhận request, có model (nếu có backend nào có), sắp theo chi phí tăng dần"""
+        available = [b for b in self.backends if b not in exclude and not b.ejected]
+        serving = [b for b in available if b.serves(model)] or available
+        return sorted(serving, key=lambda b: self._cost(b, model))
+
+    def pick(self, model: str, exclude: List[OllamaBackend] = ()) -> Optional[OllamaBackend]:
+        for backend in self.candidates(model, exclude):
+            # Backend half-open chỉ nhận một số request thử
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    async def _send(self, backend: OllamaBackend, send: Callable[[OllamaBackend], Awaitable[T]]) -> T:
+        backend.outstanding += 1
+        started = time.perf_counter()
+        recorded = False
+        try:
+            result = await send(backend)
+            backend.record_success(time.perf_counter() - started)
+            recorded = True
+            return result
+        except Exception as e:
+            if is_outage(e):
+                backend.record_failure(e)
+                recorded = True
+            raise
+        finally:
+            backend.outstanding -= 1
+            if not recorded:
+                backend.breaker.release()
+
+    async def _hedged(self, model: str, primary: OllamaBackend, send: Callable[[OllamaBackend], Awaitable[T]],
+                      tried: List[OllamaBackend]) -> T:
+        tasks = [asyncio.ensure_future(self._send(primary, send))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if not done:
+                secondary = self.pick(model, tried)
+                if secondary is not None:
+                    tried.append(secondary)
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(self._send(secondary, send)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Bản còn lại bị hủy: đóng kết nối để Ollama dừng sinh
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def request(self, model: str, send: Callable[[OllamaBackend], Awaitable[T]], hedge: bool = False,
+                      can_failover: Optional[Callable[[], bool]] = None) -> T:
+        """Gửi `send(backend)` tới backend tốt nhất, failover sang backend khác khi backend lỗi
+
+        `can_failover()` trả về False khi không được gửi lại nữa (vd. đã stream một phần cho client).
+        """
+        tried: List[OllamaBackend] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            backend = self.pick(model, tried)
+            if backend is None:
+                if last_error is not None:
+                    raise last_error
+                raise OllamaUnavailableError(f"No Ollama backend available for model '{model}'")
+            if tried:
+                self.failovers += 1
+            tried.append(backend)
+            try:
+                if hedge:
+                    return await self._hedged(model, backend, send, tried)
+                return await self._send(backend, send)
+            except Exception as e:
+                if not is_outage(e) or (can_failover is not None and not can_failover()):
+                    raise
+                last_error = e
+
+    async def probe_all(self, client: httpx.AsyncClient) -> List[bool]:
+        return list(await asyncio.gather(*(b.probe(client) for b in self.backends)))
+
+    def available_models(self) -> List[str]:
+        return sorted(set().union(*(b.models for b in self.backends if b.healthy)))
+
+    def loaded_models(self) -> Dict[str, Dict[str, Any]]:
+        loaded = {}
+        for backend in self.backends:
+            if backend.healthy:
+                for name, info in backend.loaded.items():
+                    loaded.setdefault(name, dict(info, backends=[]))["backends"].append(backend.url)
+        return loaded
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "affinity_weight": self.affinity_weight,
+            "hedge_delay_ms": self.hedge_delay * 1000,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "available_backends": sum(1 for b in self.backends if not b.ejected),
+            "backends": [b.to_dict() for b in self.backends],
+        }
+
+
+_pool: Optional[OllamaPool] = None
+
+
+def get_ollama_pool() -> OllamaPool:
+    global _pool
+    if _pool is None:
+        _pool = OllamaPool()
+    return _pool
+
+
+def set_ollama_pool(pool: Optional[OllamaPool]):
+    global _pool
+    _pool = pool
@@ -0,0 +1,431 @@
+"""
+Student Performance Prediction Models
+Registry mô hình dự báo điểm tổng kết trên đĩa: mô hình scikit-learn nhỏ (ridge, gradient boosting) huấn luyện
+theo từng môn/chương trình từ dữ liệu lịch sử, có version, nạp lười và giữ ấm trong cache, dự báo vector hóa
+cho cả lớp và tự huấn luyện lại khi có đủ điểm mới
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .risk_engine import numeric_series, percent_matrix, row_trends, series_matrix
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = "global"
+MODEL_KINDS = ("ridge", "gradient_boosting")
+
+# Field đầu vào của mỗi nhóm đặc trưng (theo thứ tự ưu tiên); điểm giữ nguyên thang của dữ liệu
+INPUT_FIELDS = {
+    "assignment": ("assignment_scores", "homework_scores"),
+    "exam": ("exam_scores", "test_scores", "recent_grades"),
+    "attendance": ("attendance_rate", "attendance"),
+    "participation": ("participation_score", "participation"),
+    "prior_grade": ("prior_grade", "previous_gpa", "gpa"),
+}
+TARGET_FIELD = "final_grade"
+FEATURES = ("assignment_mean", "assignment_trend", "assignment_count", "exam_mean", "exam_trend", "attendance",
+            "participation", "prior_grade")
+# Số giá trị gần nhất của mỗi chuỗi điểm được dùng
+SERIES_WINDOW = 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outcomes (
+    scope TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (scope, record_key)
+);
+CREATE INDEX IF NOT EXISTS idx_outcomes_added ON outcomes (scope, added_at);
+CREATE TABLE IF NOT EXISTS models (
+    scope TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    metrics TEXT NOT NULL,
+    artifact TEXT NOT NULL DEFAULT '',
+    trained_at REAL NOT NULL,
+    active INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, version)
+);
+"""
+
+
+def model_scope(course_id: Optional[str] = None, program: Optional[str] = None) -> str:
+    """Phạm vi mô hình: theo môn, theo chương trình, hoặc mô hình chung"""
+    if course_id:
+        return f"course:{course_id}"
+    if program:
+        return f"program:{program}"
+    return GLOBAL_SCOPE
+
+
+def performance_features(records: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Ma trận đặc trưng n x len(FEATURES), NaN khi thiếu dữ liệu (được điền khi huấn luyện/dự báo)"""
+    columns = {}
+    for group in ("assignment", "exam"):
+        matrix = series_matrix([numeric_series(r, INPUT_FIELDS[group]) for r in records], SERIES_WINDOW)
+        means, slopes, counts = row_trends(matrix)
+        observed = counts > 0
+        columns[f"{group}_mean"] = np.where(observed, means, np.nan)
+        columns[f"{group}_trend"] = np.where(counts > 1, slopes, np.nan)
+        if group == "assignment":
+            columns["assignment_count"] = counts.astype(np.float64)
+    for group in ("attendance", "participation", "prior_grade"):
+        matrix = series_matrix([numeric_series(r, INPUT_FIELDS[group]) for r in records], SERIES_WINDOW)
+        if group == "attendance":
+            # Nhận cả tỷ lệ 0-1 và phần trăm 0-100 (theo từng chuỗi)
+            matrix = percent_matrix(matrix)
+        means, _, counts = row_trends(matrix)
+        columns[group] = np.where(counts > 0, means, np.nan)
+    if not len(records):
+        return np.zeros((0, len(FEATURES)))
+    return np.column_stack([columns[name] for name in FEATURES])
+
+
+def _valid_target(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _record_key(record: Dict[str, Any]) -> str:
+    """Khóa của một kết quả: học sinh + học kỳ + năm học; không có student_id thì dùng hash nội dung
+    để các bản ghi ẩn danh khác nhau không ghi đè lên nhau"""
+    if record.get("student_id") in (None, ""):
+        payload = json.dumps(record, ensure_ascii=False, sort_keys=True, default=str)
+        return "hash:" + hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{record['student_id']}|{record.get('semester', '')}|{record.get('academic_year', '')}"
+
+
+def _targets(records: Sequence[Dict[str, Any]]) -> np.ndarray:
+    return np.array([float(v) if _valid_target(v) else np.nan for v in (r.get(TARGET_FIELD) for r in records)])
+
+
+def _build_estimator(kind: str):
+    if kind == "ridge":
+        from sklearn.linear_model import RidgeCV
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        return make_pipeline(StandardScaler(), RidgeCV(alphas=(0.1, 1.0, 10.0, 100.0)))
+    if kind == "gradient_boosting":
+        from sklearn.ensemble import GradientBoostingRegressor
+        return GradientBoostingRegressor(n_estimators=150, max_depth=3, learning_rate=0.05, subsample=0.8,
+                                         random_state=0)
+    raise ValueError(f"Unknown model kind '{kind}'. Available: {', '.join(MODEL_KINDS)}, auto")
+
+
+@dataclass
+class BatchPrediction:
+    scope: str
+    version: int
+    kind: str
+    student_ids: List[Any]
+    predictions: np.ndarray
+    interval: float  # nửa độ rộng khoảng tin cậy ~95% (1.96 x RMSE holdout)
+    bounds: Tuple[float, float]  # khoảng điểm của dữ liệu huấn luyện; dự báo và khoảng tin cậy không vượt ra ngoài
+    elapsed_ms: float
+
+    def students(self, pass_grade: float) -> List[Dict[str, Any]]:
+        low, high = self.bounds
+        return [{
+            "student_id": student_id,
+            "predicted_grade": round(float(p), 2),
+            "confidence_interval": [round(max(low, float(p - self.interval)), 2),
+                                    round(min(high, float(p + self.interval)), 2)],
+            "at_risk": bool(p < pass_grade),
+        } for student_id, p in zip(self.student_ids, self.predictions)]
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {"scope": self.scope, "version": self.version, "kind": self.kind, "students": len(self.predictions),
+                "inference_ms": round(self.elapsed_ms, 3)}
+
+
+class ModelRegistry:
+    """Registry mô hình: dữ liệu huấn luyện và danh sách version trong SQLite, artifact joblib theo scope/version"""
+
+    def __init__(self, root: Optional[str] = None, kind: Optional[str] = None, cache_size: Optional[int] = None,
+                 min_samples: Optional[int] = None, retrain_min_new: Optional[int] = None,
+                 grade_scale: Optional[float] = None):
+        self.root = root or None
+        self.kind = kind or os.getenv("PREDICTION_MODEL_KIND", "auto")
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("PREDICTION_MODEL_CACHE_SIZE", "16"))
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv("PREDICTION_MIN_SAMPLES", "20"))
+        self.retrain_min_new = retrain_min_new if retrain_min_new is not None else \
+            int(os.getenv("PREDICTION_RETRAIN_MIN_NEW", "25"))
+        # Chỉ dùng cho artifact cũ chưa lưu khoảng điểm huấn luyện
+        self.grade_scale = grade_scale if grade_scale is not None else float(os.getenv("PREDICTION_GRADE_SCALE", "10"))
+        path = ":memory:"
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+            path = os.path.join(self.root, "registry.db")
+        self._lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # (scope, version) -> artifact đã nạp, LRU; khi không có root thì đây là nơi lưu duy nhất
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"records_added": 0, "trainings": 0, "auto_retrains": 0, "predictions": 0,
+                      "students_predicted": 0, "cache_hits": 0, "model_loads": 0}
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    # ----- Dữ liệu huấn luyện -----
+
+    def add_records(self, scope: str, records: Sequence[Dict[str, Any]], retrain: bool = True) -> Dict[str, Any]:
+        """Thêm/cập nhật kết quả học tập (final_grade là số hữu hạn); huấn luyện lại khi đủ `retrain_min_new` bản ghi mới
+
+        Bản ghi cùng student_id/semester/academic_year thay bản cũ ("updated"); "added" chỉ đếm dòng mới thật sự lưu.
+        """
+        now = time.time()
+        rows: Dict[str, Tuple[str, str, str, float]] = {}
+        valid = 0
+        for record in records:
+            if not _valid_target(record.get(TARGET_FIELD)):
+                continue
+            valid += 1
+            key = _record_key(record)
+            rows[key] = (scope, key, json.dumps(record, ensure_ascii=False, default=str), now)
+        with self._lock, self._conn:
+            before = self._conn.execute("SELECT COUNT(*) FROM outcomes WHERE scope = ?", (scope,)).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO outcomes (scope, record_key, record, added_at) VALUES (?, ?, ?, ?)",
+                list(rows.values())
+            )
+            added = self._conn.execute("SELECT COUNT(*) FROM outcomes WHERE scope = ?", (scope,)).fetchone()[0] - before
+            self.stats["records_added"] += added
+        pending = self.pending(scope)
+        retrained = None
+        if retrain and rows and pending >= self.retrain_min_new and self._count(scope) >= self.min_samples:
+            retrained = self.train(scope)
+            self.stats["auto_retrains"] += 1
+        return {"added": added, "updated": valid - added, "skipped": len(records) - valid,
+                "pending": 0 if retrained else pending, "retrained": retrained}
+
+    def _count(self, scope: str) -> int:
+        with self._lock:
+            if scope == GLOBAL_SCOPE:
+                return self._conn.execute("SELECT COUNT(*) FROM outcomes").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM outcomes WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def pending(self, scope: str) -> int:
+        """Số bản ghi thêm sau lần huấn luyện gần nhất của scope"""
+        active = self.active_model(scope)
+        since = active["trained_at"] if active else 0.0
+        with self._lock:
+            if scope == GLOBAL_SCOPE:
+                return self._conn.execute("SELECT COUNT(*) FROM outcomes WHERE added_at > ?", (since,)).fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM outcomes WHERE scope = ? AND added_at > ?",
+                                      (scope, since)).fetchone()[0]
+
+    def _records(self, scope: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            if scope == GLOBAL_SCOPE:
+                rows = self._conn.execute("SELECT record FROM outcomes ORDER BY scope, record_key").fetchall()
+            else:
+                rows = self._conn.execute("SELECT record FROM outcomes WHERE scope = ? ORDER BY record_key",
+                                          (scope,)).fetchall()
+        return [json.loads(row["record"]) for row in rows]
+
+    # ----- Huấn luyện -----
+
+    def _fit(self, kind: str, X: np.ndarray, y: np.ndarray):
+        estimator = _build_estimator(kind)
+        estimator.fit(X, y)
+        return estimator
+
+    def train(self, scope: str, kind: Optional[str] = None) -> Dict[str, Any]:
+        """Huấn luyện version mới trên toàn bộ dữ liệu của scope (GLOBAL_SCOPE = mọi scope) và kích hoạt nó
+
+        kind="auto" thử mọi loại trên tập holdout 20% và giữ loại có MAE thấp nhất.
+        """
+        kind = kind or self.kind
+        # Bỏ bản ghi final_grade không hợp lệ đã lưu trước khi add_records kiểm tra
+        records = [r for r in self._records(scope) if _valid_target(r.get(TARGET_FIELD))]
+        if len(records) < self.min_samples:
+            raise ValueError(f"Scope '{scope}' has {len(records)} records; at least {self.min_samples} are needed")
+        started = time.time()
+        X = performance_features(records)
+        y = _targets(records)
+        fill = np.nanmean(np.where(np.isnan(X).all(axis=0), 0.0, X), axis=0)
+        X = np.where(np.isnan(X), fill, X)
+
+        with self._train_lock:
+            rng = np.random.default_rng(0)
+            order = rng.permutation(len(y))
+            cut = max(1, len(y) // 5)
+            test, fit_rows = order[:cut], order[cut:]
+            candidates = MODEL_KINDS if kind == "auto" else (kind,)
+            scores = {}
+            for candidate in candidates:
+                predicted = self._fit(candidate, X[fit_rows], y[fit_rows]).predict(X[test])
+                residuals = predicted - y[test]
+                scores[candidate] = {"mae": float(np.abs(residuals).mean()),
+                                     "rmse": float(np.sqrt((residuals ** 2).mean()))}
+            chosen = min(scores, key=lambda c: scores[c]["mae"])
+            estimator = self._fit(chosen, X, y)
+
+        variance = float(y[test].var())
+        metrics = {**{k: round(v, 4) for k, v in scores[chosen].items()},
+                   "r2": round(1 - scores[chosen]["rmse"] ** 2 / variance, 4) if variance > 0 else None,
+                   "holdout": int(len(test)), "candidates": scores,
+                   "train_seconds": round(time.time() - started, 3)}
+        artifact = {"estimator": estimator, "fill": fill, "features": FEATURES, "interval": 1.96 * scores[chosen]["rmse"],
+                    "target_range": (float(y.min()), float(y.max()))}
+        entry = self._register(scope, chosen, len(y), metrics, artifact)
+        self.stats["trainings"] += 1
+        logger.info("Trained %s model v%d for %s on %d records (MAE %.3f)", chosen, entry["version"], scope,
+                    len(y), metrics["mae"])
+        return entry
+
+    def _artifact_path(self, scope: str, version: int) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]+", "_", scope), f"v{version}.joblib")
+
+    def _register(self, scope: str, kind: str, samples: int, metrics: Dict[str, Any],
+                  artifact: Dict[str, Any]) -> Dict[str, Any]:
+        import joblib
+
+        now = time.time()
+        with self._lock, self._conn:
+            version = self._conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM models WHERE scope = ?",
+                                         (scope,)).fetchone()[0]
+            path = ""
+            if self.root:
+                path = self._artifact_path(scope, version)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                joblib.dump(artifact, path + ".tmp")
+                os.replace(path + ".tmp", path)
+            self._conn.execute("UPDATE models SET active = 0 WHERE scope = ?", (scope,))
+            self._conn.execute(
+                "INSERT INTO models (scope, version, kind, samples, metrics, artifact, trained_at, active) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                (scope, version, kind, samples, json.dumps(metrics), path, now)
+            )
+            self._remember((scope, version), artifact)
+        return {"scope": scope, "version": version, "kind": kind, "samples": samples, "metrics": metrics,
+                "trained_at": now, "active": True}
+
+    # ----- Version và cache -----
+
+    def _entry(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {"scope": row["scope"], "version": row["version"], "kind": row["kind"], "samples": row["samples"],
+                "metrics": json.loads(row["metrics"]), "trained_at": row["trained_at"], "active": bool(row["active"])}
+
+    def active_model(self, scope: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM models WHERE scope = ? AND active = 1", (scope,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def versions(self, scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            if scope is None:
+                rows = self._conn.execute("SELECT * FROM models ORDER BY scope, version").fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM models WHERE scope = ? ORDER BY version", (scope,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def activate(self, scope: str, version: int) -> Dict[str, Any]:
+        """Chuyển version đang dùng (vd. rollback về version trước)"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM models WHERE scope = ? AND version = ?",
+                                     (scope, version)).fetchone()
+            if row is None:
+                raise LookupError(f"Model '{scope}' v{version} not found")
+            self._conn.execute("UPDATE models SET active = (version = ?) WHERE scope = ?", (version, scope))
+        return {**self._entry(row), "active": True}
+
+    def _remember(self, key: tuple, artifact: Dict[str, Any]):
+        self._cache[key] = artifact
+        self._cache.move_to_end(key)
+        # Không có root thì cache là nơi lưu duy nhất, không được bỏ bớt
+        while self.root and len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, scope: str, version: int) -> Dict[str, Any]:
+        key = (scope, version)
+        with self._lock:
+            artifact = self._cache.get(key)
+            if artifact is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return artifact
+            row = self._conn.execute("SELECT artifact FROM models WHERE scope = ? AND version = ?",
+                                     (scope, version)).fetchone()
+        if row is None or not row["artifact"]:
+            raise LookupError(f"Model '{scope}' v{version} not found")
+        import joblib
+
+        artifact = joblib.load(row["artifact"])
+        with self._lock:
+            self._remember(key, artifact)
+            self.stats["model_loads"] += 1
+        return artifact
+
+    # ----- Dự báo -----
+
+    def predict(self, scope: str, records: Sequence[Dict[str, Any]], version: Optional[int] = None) -> BatchPrediction:
+        """Dự báo cả lớp một lượt; scope chưa có mô hình thì dùng mô hình chung (GLOBAL_SCOPE)"""
+        entry = None
+        if version is not None:
+            entry = next((e for e in self.versions(scope) if e["version"] == version), None)
+        else:
+            for candidate in dict.fromkeys((scope, GLOBAL_SCOPE)):
+                entry = self.active_model(candidate)
+                if entry is not None:
+                    break
+        if entry is None:
+            raise LookupError(f"No trained model for '{scope}'")
+        artifact = self._load(entry["scope"], entry["version"])
+
+        start = time.perf_counter()
+        X = performance_features(records)
+        X = np.where(np.isnan(X), artifact["fill"], X)
+        bounds = artifact.get("target_range", (0.0, self.grade_scale))
+        predictions = np.clip(artifact["estimator"].predict(X), *bounds) if len(records) else np.zeros(0)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["predictions"] += 1
+        self.stats["students_predicted"] += len(records)
+        student_ids = [r.get("student_id", i) for i, r in enumerate(records)]
+        return BatchPrediction(entry["scope"], entry["version"], entry["kind"], student_ids, predictions,
+                               artifact["interval"], bounds, elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = {row[0]: row[1] for row in
+                        self._conn.execute("SELECT scope, COUNT(*) FROM outcomes GROUP BY scope").fetchall()}
+            models = self._conn.execute("SELECT COUNT(*) FROM models").fetchone()[0]
+        return {"root": self.root, "default_kind": self.kind, "records_by_scope": outcomes, "model_versions": models,
+                "cached_models": len(self._cache), **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(os.getenv("PREDICTION_MODEL_DIR", "./data/models") or None)
+    return _registry
+
+
+def set_model_registry(registry: Optional[ModelRegistry]):
+    global _registry
+    _registry = registry
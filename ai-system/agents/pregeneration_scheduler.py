@@ -0,0 +1,338 @@
+"""
+Content Pregeneration Scheduler
+Tạo trước bài học/bài tập/quiz cho các môn trong catalog vào khung giờ thấp điểm (ưu tiên thấp, có ngân sách),
+lưu vào kho nội dung để request giờ cao điểm theo course_id/topic dùng lại thay vì chờ LLM
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import time
+
+from .state_backend import StateBackend, SharedCounters, get_state_backend
+from .ollama_health import get_ollama_health
+from .ollama_pool import get_ollama_pool
+
+logger = logging.getLogger(__name__)
+
+PREGEN_TASKS = {"lesson": "generate_lesson", "exercise": "generate_exercise", "quiz": "generate_quiz"}
+
+
+def parse_windows(value: str) -> List[Tuple[int, int]]:
+    """"22:00-06:00,12:30-13:30" -> [(phút bắt đầu, phút kết thúc)]; khung qua nửa đêm được giữ nguyên"""
+    windows = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = (_parse_minutes(t) for t in part.split("-"))
+        except ValueError:
+            raise ValueError(f"Invalid pregeneration window '{part}', expected HH:MM-HH:MM")
+        windows.append((start, end))
+    return windows
+
+
+def _parse_minutes(value: str) -> int:
+    hours, minutes = value.strip().split(":")
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total <= 24 * 60 or not 0 <= int(minutes) < 60:
+        raise ValueError(value)
+    return total
+
+
+def _format_window(window: Tuple[int, int]) -> str:
+    return "-".join(f"{m // 60:02d}:{m % 60:02d}" for m in window)
+
+
+@dataclass
+class PregenerationJob:
+    """Một nội dung cần có sẵn: (môn học, loại nội dung, topic)"""
+    course_id: str
+    content_type: str
+    topic: str
+
+    @property
+    def task(self) -> str:
+        return PREGEN_TASKS[self.content_type]
+
+    def request(self) -> Dict[str, Any]:
+        """Cùng dữ liệu với request giờ cao điểm {"course_id", "topic"} nên cùng khóa trong kho nội dung"""
+        return {"course_id": self.course_id, "topic": self.topic}
+
+
+class PregenerationScheduler:
+    """Duyệt job (môn x topic x loại nội dung) trong khung giờ thấp điểm
+
+    - Cursor nằm trên state backend và được lấy bằng incr: chạy lại tiếp từ chỗ dừng, nhiều worker chia nhau job
+    - Ưu tiên thấp: chạy tuần tự một job, nhường khi Ollama đang có request của người dùng hoặc circuit mở
+    - Ngân sách mỗi khung giờ: số nội dung tạo mới và tổng thời gian gọi LLM
+    - Nội dung còn mới (hết hạn sau hơn `refresh_margin` giây) được bỏ qua, không tốn ngân sách
+    """
+
+    NAMESPACE = "pregeneration"
+
+    def __init__(self, agent=None, windows: Optional[str] = None, content_types: Optional[List[str]] = None,
+                 fields: Optional[List[str]] = None, max_jobs_per_window: Optional[int] = None,
+                 max_seconds_per_window: Optional[float] = None, max_foreground_inflight: Optional[int] = None,
+                 refresh_margin: Optional[float] = None, check_interval: Optional[float] = None,
+                 manual_timeout: Optional[float] = None, enabled: Optional[bool] = None, backend: Optional[StateBackend] = None,
+                 clock: Callable[[], datetime] = datetime.now):
+        self._agent = agent
+        self.enabled = enabled if enabled is not None else os.getenv("PREGEN_ENABLED", "false").lower() == "true"
+        self.windows = parse_windows(windows if windows is not None else os.getenv("PREGEN_WINDOWS", "01:00-06:00"))
+        self.content_types = content_types or [
+            t.strip() for t in os.getenv("PREGEN_CONTENT_TYPES", "lesson,exercise,quiz").split(",") if t.strip()
+        ]
+        unknown = [t for t in self.content_types if t not in PREGEN_TASKS]
+        if unknown:
+            raise ValueError(f"Unsupported pregeneration content types {unknown}, expected {list(PREGEN_TASKS)}")
+        self.fields = fields or [f.strip() for f in os.getenv("PREGEN_FIELDS", "").split(",") if f.strip()] or None
+        self.max_jobs_per_window = max_jobs_per_window if max_jobs_per_window is not None else \
+            int(os.getenv("PREGEN_MAX_JOBS_PER_WINDOW", "300"))
+        self.max_seconds_per_window = max_seconds_per_window if max_seconds_per_window is not None else \
+            float(os.getenv("PREGEN_MAX_SECONDS_PER_WINDOW", "14400"))
+        self.max_foreground_inflight = max_foreground_inflight if max_foreground_inflight is not None else \
+            int(os.getenv("PREGEN_MAX_FOREGROUND_INFLIGHT", "0"))
+        self.refresh_margin = refresh_margin if refresh_margin is not None else \
+            float(os.getenv("PREGEN_REFRESH_MARGIN_SECONDS", str(2 * 86400)))
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("PREGEN_CHECK_INTERVAL", "60"))
+        # Lượt chạy thủ công (endpoint quản trị) không có khung giờ để dừng nên cần hạn chót riêng
+        self.manual_timeout = manual_timeout if manual_timeout is not None else \
+            float(os.getenv("PREGEN_MANUAL_TIMEOUT_SECONDS", "300"))
+        self.backend = backend or get_state_backend()
+        self.budget = SharedCounters(f"{self.NAMESPACE}_budget", backend=self.backend)
+        self._clock = clock
+        self._jobs: Optional[List[PregenerationJob]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._completed_window: Optional[str] = None
+        self.running = False
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.stats = {"generated": 0, "skipped_fresh": 0, "failed": 0, "yielded": 0, "generation_seconds": 0.0}
+
+    @property
+    def agent(self):
+        """Agent tạo nội dung (mặc định một ContentGenerationAgent riêng dùng chung kho nội dung)"""
+        if self._agent is None:
+            from .content_generation_agent import ContentGenerationAgent
+            self._agent = ContentGenerationAgent()
+        return self._agent
+
+    # --- Job và khung giờ ---
+
+    async def jobs(self) -> List[PregenerationJob]:
+        """Danh sách job theo thứ tự cố định của catalog (mọi worker có cùng thứ tự)"""
+        if self._jobs is None:
+            from .comprehensive_course_catalog_agent import ComprehensiveCourseCatalogAgent
+            courses = await ComprehensiveCourseCatalogAgent().list_courses(self.fields)
+            self._jobs = [
+                PregenerationJob(course.course_id, content_type, topic)
+                for course in courses for topic in course.topics for content_type in self.content_types
+            ]
+        return self._jobs
+
+    def current_window(self) -> Optional[str]:
+        """ID khung giờ đang mở (ngày + giờ bắt đầu, vd. "2026-10-19T22:00"), None nếu ngoài khung"""
+        now = self._clock()
+        minutes = now.hour * 60 + now.minute
+        for start, end in self.windows:
+            if start < end:
+                inside, day = start <= minutes < end, now.date()
+            else:
+                # Khung qua nửa đêm (hoặc start == end: cả ngày)
+                inside = minutes >= start or minutes < end
+                day = now.date() if minutes >= start else now.date() - timedelta(days=1)
+            if inside:
+                return f"{day.isoformat()}T{start // 60:02d}:{start % 60:02d}"
+        return None
+
+    def budget_used(self, window_id: str) -> Dict[str, float]:
+        return {"jobs": self.budget.get(f"{window_id}:jobs"), "seconds": round(self.budget.get(f"{window_id}:seconds"), 1)}
+
+    def _budget_exhausted(self, window_id: str) -> bool:
+        used = self.budget_used(window_id)
+        return used["jobs"] >= self.max_jobs_per_window or used["seconds"] >= self.max_seconds_per_window
+
+    def _forget_old_budgets(self, window_id: str):
+        for key in self.budget.snapshot():
+            if not key.startswith(f"{window_id}:"):
+                self.backend.delete(self.budget.namespace, key)
+
+    # --- Chạy ---
+
+    def _foreground_inflight(self) -> int:
+        pool = self.agent.ollama_pool or get_ollama_pool()
+        return sum(backend.outstanding for backend in pool.backends)
+
+    async def _wait_for_idle(self, stop_reason: Callable[[], Optional[str]], deadline: Optional[float] = None,
+                             fail_fast: bool = False) -> Optional[str]:
+        """Nhường request của người dùng: chờ đến khi Ollama rảnh (None); trả về lý do dừng nếu hết khung giờ/hạn chót
+        trong lúc chờ, hoặc "ollama_unavailable" ngay khi circuit mở với fail_fast"""
+        while True:
+            available = get_ollama_health().available
+            if available and self._foreground_inflight() <= self.max_foreground_inflight:
+                return None
+            if fail_fast and not available:
+                return "ollama_unavailable"
+            self.stats["yielded"] += 1
+            delay = self.check_interval if deadline is None else \
+                max(0.0, min(self.check_interval, deadline - time.monotonic()))
+            await asyncio.sleep(delay)
+            reason = stop_reason()
+            if reason is not None:
+                return reason
+
+    async def _run_job(self, job: PregenerationJob) -> Tuple[str, float]:
+        """Kết quả ("generated" | "skipped_fresh" | "failed", số giây gọi LLM)"""
+        repository = self.agent.content_repository
+        data = {**job.request(), "pregenerate": True,
+                "max_age_seconds": max(0.0, repository.max_age_seconds - self.refresh_margin)}
+        started = time.perf_counter()
+        result = await self.agent.process(job.task, data)
+        elapsed = time.perf_counter() - started
+        if not result.get("success"):
+            logger.warning(f"Pregeneration of {job.content_type} '{job.topic}' ({job.course_id}) failed: {result.get('error')}")
+            return "failed", elapsed
+        if result.get("reused"):
+            return "skipped_fresh", 0.0
+        return "generated", elapsed
+
+    async def run_pending(self, window_id: str, max_jobs: Optional[int] = None,
+                          should_continue: Callable[[], bool] = lambda: True,
+                          deadline: Optional[float] = None, fail_fast: bool = False) -> Dict[str, Any]:
+        """Chạy job từ cursor dùng chung cho tới khi xong một vòng catalog, hết ngân sách, hết khung giờ
+        hoặc quá `deadline` (time.monotonic()); max_jobs tính mọi job đã chạy, kể cả job lỗi/bỏ qua"""
+        if self.running:
+            raise RuntimeError("Pregeneration is already running")
+        # Đánh dấu trước lần await đầu tiên để hai lượt gọi đồng thời không cùng chạy
+        self.running = True
+
+        def stop_reason() -> Optional[str]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return "deadline"
+            return None if should_continue() else "window_closed"
+
+        summary = {"window": window_id, "attempted": 0, "generated": 0, "skipped_fresh": 0, "failed": 0,
+                   "stopped": None, "started_at": datetime.now().isoformat()}
+        stop_at: Optional[int] = None
+        try:
+            jobs = await self.jobs()
+            while jobs:
+                summary["stopped"] = stop_reason()
+                if summary["stopped"] is not None:
+                    break
+                if self._budget_exhausted(window_id):
+                    summary["stopped"] = "budget_exhausted"
+                    break
+                if max_jobs is not None and summary["attempted"] >= max_jobs:
+                    summary["stopped"] = "max_jobs"
+                    break
+                summary["stopped"] = await self._wait_for_idle(stop_reason, deadline, fail_fast)
+                if summary["stopped"] is not None:
+                    break
+
+                index = int(self.backend.incr(self.NAMESPACE, "cursor")) - 1
+                if stop_at is None:
+                    stop_at = index + len(jobs)
+                elif index >= stop_at:
+                    summary["stopped"] = "pass_complete"
+                    break
+                outcome, elapsed = await self._run_job(jobs[index % len(jobs)])
+                if outcome == "generated":
+                    self.budget.incr(f"{window_id}:jobs")
+                # Lần gọi lỗi cũng tốn thời gian LLM
+                if elapsed:
+                    self.budget.incr(f"{window_id}:seconds", elapsed)
+                summary["attempted"] += 1
+                summary[outcome] += 1
+                self.stats[outcome] += 1
+                self.stats["generation_seconds"] += elapsed
+        finally:
+            self.running = False
+        summary["cursor"] = int(self.backend.get(self.NAMESPACE, "cursor", 0))
+        summary["finished_at"] = datetime.now().isoformat()
+        self.last_run = summary
+        return summary
+
+    async def run_now(self, max_jobs: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Chạy ngay (vd. từ endpoint quản trị), vẫn theo ngân sách của khung giờ hiện tại.
+        Dừng sau `timeout` giây (mặc định manual_timeout) và dừng ngay khi Ollama không khả dụng thay vì chờ"""
+        deadline = time.monotonic() + (self.manual_timeout if timeout is None else timeout)
+        return await self.run_pending(self.current_window() or "manual", max_jobs=max_jobs,
+                                      deadline=deadline, fail_fast=True)
+
+    async def run_window_once(self) -> Optional[Dict[str, Any]]:
+        """Một lượt của vòng nền: chạy nếu đang trong khung giờ và khung này chưa xong một vòng catalog"""
+        window_id = self.current_window()
+        if window_id is None or window_id == self._completed_window or self.running:
+            return None
+        self._forget_old_budgets(window_id)
+        summary = await self.run_pending(window_id, should_continue=lambda: self.current_window() == window_id)
+        if summary["stopped"] in ("pass_complete", "budget_exhausted"):
+            self._completed_window = window_id
+        return summary
+
+    def start(self, agent=None):
+        """Chạy scheduler nền (gọi trong event loop, ví dụ lúc startup); không làm gì khi PREGEN_ENABLED=false"""
+        if agent is not None:
+            self._agent = agent
+        if self.enabled and self.windows and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                summary = await self.run_window_once()
+                if summary is not None:
+                    logger.info(f"Pregeneration window {summary['window']}: {summary['generated']} generated, "
+                                f"{summary['skipped_fresh']} fresh, {summary['failed']} failed ({summary['stopped']})")
+            except Exception as e:
+                logger.warning(f"Pregeneration run failed: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        window_id = self.current_window()
+        return {
+            "enabled": self.enabled,
+            "windows": [_format_window(w) for w in self.windows],
+            "current_window": window_id,
+            "running": self.running,
+            "content_types": self.content_types,
+            "total_jobs": len(self._jobs) if self._jobs is not None else None,
+            "cursor": int(self.backend.get(self.NAMESPACE, "cursor", 0)),
+            "budget": {
+                "max_jobs_per_window": self.max_jobs_per_window,
+                "max_seconds_per_window": self.max_seconds_per_window,
+                "used": self.budget_used(window_id) if window_id else None,
+            },
+            "last_run": self.last_run,
+            **self.stats,
+            "generation_seconds": round(self.stats["generation_seconds"], 1),
+        }
+
+
+_scheduler: Optional[PregenerationScheduler] = None
+
+
+def get_pregeneration_scheduler() -> PregenerationScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PregenerationScheduler()
+    return _scheduler
+
+
+def set_pregeneration_scheduler(scheduler: Optional[PregenerationScheduler]):
+    global _scheduler
+    _scheduler = scheduler
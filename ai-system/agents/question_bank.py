@@ -0,0 +1,401 @@
+"""
+Question Bank
+Ngân hàng câu hỏi trên SQLite (index theo môn, topic, loại câu hỏi, độ khó, điểm) và bộ ghép đề:
+chọn câu hỏi đủ đúng tổng điểm, tỷ lệ loại câu hỏi, thời lượng và không lặp lại với lớp đã làm;
+phần thiếu được trả về dưới dạng "gap" để LLM chỉ tạo thêm đúng số câu còn thiếu
+"""
+
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from .knowledge_store import topic_key
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ("easy", "medium", "hard")
+# Thứ tự xen kẽ độ khó khi chọn câu hỏi: đề cân bằng, nghiêng về mức trung bình
+DIFFICULTY_ROTATION = ("medium", "easy", "hard", "medium")
+# Điểm và thời gian làm bài (phút) mặc định theo loại câu hỏi
+DEFAULT_POINTS = {"multiple_choice": 2, "true_false": 1, "fill_blank": 1, "short_answer": 5, "essay": 10}
+DEFAULT_MINUTES = {"multiple_choice": 1.5, "true_false": 0.5, "fill_blank": 1.0, "short_answer": 5.0, "essay": 12.0}
+LEVEL_DIFFICULTY = {"basic": "easy", "beginner": "easy", "intermediate": "medium", "general": "medium",
+                    "advanced": "hard", "expert": "hard"}
+# Số câu tối đa bỏ ra khi sửa tổng điểm bằng subset-sum
+MAX_REPAIR_DROPS = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    topic_hash TEXT NOT NULL,
+    type TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    minutes REAL NOT NULL,
+    quality REAL NOT NULL DEFAULT 7.0,
+    text_hash TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    use_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_questions_lookup ON questions (subject, topic_hash, type, difficulty, points);
+CREATE TABLE IF NOT EXISTS question_usage (
+    class_id TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    exam_id TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (class_id, question_id)
+);
+"""
+
+
+def _hash(value: str) -> str:
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def normalize_difficulty(value: Optional[str]) -> str:
+    value = (value or "").lower()
+    return value if value in DIFFICULTIES else LEVEL_DIFFICULTY.get(value, "medium")
+
+
+def split_integer(total: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """Chia `total` theo tỷ lệ thành các số nguyên có tổng đúng bằng `total` (largest remainder)"""
+    weight_sum = sum(weights.values()) or 1
+    exact = {key: total * weight / weight_sum for key, weight in weights.items()}
+    parts = {key: int(math.floor(value)) for key, value in exact.items()}
+    for key in sorted(exact, key=lambda k: exact[k] - parts[k], reverse=True)[:total - sum(parts.values())]:
+        parts[key] += 1
+    return parts
+
+
+@dataclass
+class BankQuestion:
+    """Thông tin ghép đề của một câu hỏi (body chỉ được nạp cho câu được chọn)"""
+    id: int
+    topic_hash: str
+    type: str
+    difficulty: str
+    points: int
+    minutes: float
+    quality: float
+    use_count: int
+
+
+@dataclass
+class ExamAssembly:
+    """Kết quả ghép đề: câu hỏi lấy từ ngân hàng và phần còn thiếu theo từng loại câu hỏi"""
+    questions: List[Dict[str, Any]]
+    gaps: List[Dict[str, Any]] = field(default_factory=list)
+    targets: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    candidates: int = 0
+    available: int = 0
+    solve_ms: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return not self.gaps
+
+    @property
+    def total_points(self) -> int:
+        return sum(q["points"] for q in self.questions)
+
+    @property
+    def total_minutes(self) -> float:
+        return round(sum(q["minutes"] for q in self.questions), 1)
+
+
+class QuestionBank:
+    """Ngân hàng câu hỏi SQLite (WAL); dùng chung một connection, khóa bằng threading.Lock"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.stats = {"added": 0, "duplicates": 0, "assemblies": 0, "questions_from_bank": 0, "gap_questions": 0}
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    # --- Thêm câu hỏi ---
+
+    def add_questions(self, questions: List[Dict[str, Any]], subject: str, topic: str = "",
+                      difficulty: Optional[str] = None, quality: float = 7.0) -> List[int]:
+        """Lưu câu hỏi (bỏ qua câu trùng nội dung); trả về ID theo đúng thứ tự, kể cả câu đã có sẵn"""
+        subject_key = topic_key(subject)
+        ids = []
+        now = time.time()
+        with self._lock, self._conn:
+            for question in questions:
+                text = str(question.get("question", "")).strip()
+                if not text:
+                    continue
+                qtype = question.get("type") or "short_answer"
+                q_topic = question.get("topic") or topic
+                text_hash = _hash(f"{subject_key}|{qtype}|{topic_key(text)}")
+                body = {k: v for k, v in question.items() if k not in ("id", "bank_id")}
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO questions (subject, topic, topic_hash, type, difficulty, points, minutes, "
+                    "quality, text_hash, body, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (subject_key, q_topic, _hash(topic_key(q_topic)), qtype,
+                     normalize_difficulty(question.get("difficulty") or difficulty),
+                     max(1, int(round(float(question.get("points") or DEFAULT_POINTS.get(qtype, 1))))),
+                     float(question.get("minutes") or DEFAULT_MINUTES.get(qtype, 3.0)), float(quality),
+                     text_hash, json.dumps(body, ensure_ascii=False, default=str), now)
+                )
+                if cursor.rowcount:
+                    ids.append(cursor.lastrowid)
+                    self.stats["added"] += 1
+                else:
+                    ids.append(self._conn.execute("SELECT id FROM questions WHERE text_hash = ?", (text_hash,)).fetchone()[0])
+                    self.stats["duplicates"] += 1
+        return ids
+
+    # --- Ghép đề ---
+
+    def _candidates(self, subject: str, topics: List[str], types: List[str],
+                    class_id: Optional[str]) -> Tuple[List[BankQuestion], int]:
+        """Câu hỏi lớp `class_id` chưa làm và tổng số câu phù hợp trong ngân hàng"""
+        query = ("SELECT id, topic_hash, type, difficulty, points, minutes, quality, use_count FROM questions "
+                 f"WHERE subject = ? AND type IN ({','.join('?' * len(types))})")
+        params: List[Any] = [topic_key(subject), *types]
+        if topics:
+            query += f" AND topic_hash IN ({','.join('?' * len(topics))})"
+            params.extend(_hash(topic_key(t)) for t in topics)
+        with self._lock:
+            questions = [BankQuestion(*row) for row in self._conn.execute(query, params)]
+        used = self.used_question_ids(class_id)
+        return [q for q in questions if q.id not in used], len(questions)
+
+    def used_question_ids(self, class_id: Optional[str]) -> Set[int]:
+        """ID các câu lớp `class_id` đã làm (rỗng nếu không có lớp)"""
+        if not class_id:
+            return set()
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT question_id FROM question_usage WHERE class_id = ?", (class_id,)
+            )}
+
+    @staticmethod
+    def _priority_order(candidates: List[BankQuestion], rng: random.Random) -> List[BankQuestion]:
+        """Xen kẽ theo topic, trong mỗi topic xen kẽ độ khó; câu ít dùng/chất lượng cao lên trước"""
+        by_topic: Dict[str, Dict[str, List[BankQuestion]]] = {}
+        for question in candidates:
+            by_topic.setdefault(question.topic_hash, {}).setdefault(question.difficulty, []).append(question)
+        topic_queues = []
+        for by_difficulty in by_topic.values():
+            for bucket in by_difficulty.values():
+                bucket.sort(key=lambda q: (q.use_count, -q.quality, rng.random()))
+            rotation = list(DIFFICULTY_ROTATION) + [d for d in by_difficulty if d not in DIFFICULTY_ROTATION]
+            queue, step = [], 0
+            while any(by_difficulty.values()):
+                bucket = by_difficulty.get(rotation[step % len(rotation)])
+                step += 1
+                if bucket:
+                    queue.append(bucket.pop(0))
+            topic_queues.append(queue)
+        ordered = []
+        for i in range(max((len(q) for q in topic_queues), default=0)):
+            ordered.extend(queue[i] for queue in topic_queues if i < len(queue))
+        return ordered
+
+    @staticmethod
+    def _subset_sum(items: List[BankQuestion], target: int, max_minutes: float) -> Optional[List[BankQuestion]]:
+        """Tập con có tổng điểm đúng `target`, ưu tiên câu đứng trước; None nếu không có"""
+        parent: Dict[int, Tuple[int, int]] = {0: (-1, -1)}
+        minutes = {0: 0.0}
+        for index, item in enumerate(items):
+            for total in sorted(parent, reverse=True):
+                new_total = total + item.points
+                if new_total > target or new_total in parent or minutes[total] + item.minutes > max_minutes:
+                    continue
+                parent[new_total] = (total, index)
+                minutes[new_total] = minutes[total] + item.minutes
+            if target in parent:
+                break
+        if target not in parent:
+            return None
+        chosen, total = [], target
+        while total:
+            total, index = parent[total]
+            chosen.append(items[index])
+        return chosen
+
+    def _select_points(self, ordered: List[BankQuestion], target: int, budget: float) -> List[BankQuestion]:
+        """Chọn tham lam theo thứ tự ưu tiên rồi sửa phần điểm còn thiếu bằng subset-sum trên các câu chưa chọn;
+        nếu thời lượng không đủ thì thử lại ưu tiên câu nhiều điểm trên mỗi phút"""
+        best: List[BankQuestion] = []
+        dense = sorted(ordered, key=lambda q: -q.points / max(q.minutes, 0.1))
+        for order in (ordered, dense):
+            chosen = self._greedy_with_repair(order, target, budget)
+            if sum(q.points for q in chosen) == target:
+                return chosen
+            if sum(q.points for q in chosen) > sum(q.points for q in best):
+                best = chosen
+        # Không đạt đúng tổng điểm: giữ lựa chọn gần nhất, phần còn thiếu thành gap
+        return best
+
+    def _greedy_with_repair(self, ordered: List[BankQuestion], target: int, budget: float) -> List[BankQuestion]:
+        chosen, points, minutes = [], 0, 0.0
+        for question in ordered:
+            if points + question.points <= target and minutes + question.minutes <= budget:
+                chosen.append(question)
+                points += question.points
+                minutes += question.minutes
+            if points == target:
+                return chosen
+        greedy = list(chosen)
+        chosen_ids = {q.id for q in chosen}
+        rest = [q for q in ordered if q.id not in chosen_ids]
+        for _ in range(min(MAX_REPAIR_DROPS, len(chosen)) + 1):
+            gap = target - sum(q.points for q in chosen)
+            fill = self._subset_sum(rest, gap, budget - sum(q.minutes for q in chosen))
+            if fill is not None:
+                return chosen + fill
+            if not chosen:
+                break
+            # Bỏ câu ưu tiên thấp nhất đã chọn để mở rộng khoảng trống cần lấp
+            rest.insert(0, chosen.pop())
+        return greedy
+
+    def assemble(self, subject: str, topics: List[str], question_types: Union[List[str], Dict[str, float]],
+                 total_points: Optional[int] = None, question_count: Optional[int] = None,
+                 duration: Optional[float] = None, class_id: Optional[str] = None,
+                 seed: Optional[int] = None) -> ExamAssembly:
+        """Ghép đề từ ngân hàng
+
+        `question_types` là danh sách (chia đều) hoặc dict loại -> tỷ lệ. Có `total_points`: mỗi loại đúng phần
+        điểm của mình; không có: mỗi loại đúng phần số câu của `question_count` (quiz). Tổng thời gian làm bài
+        không vượt `duration`; câu lớp `class_id` đã làm không được chọn lại.
+        """
+        if not total_points and not question_count:
+            raise ValueError("assemble needs total_points or question_count")
+        started = time.perf_counter()
+        weights = dict(question_types) if isinstance(question_types, dict) else {t: 1.0 for t in question_types}
+        rng = random.Random(seed)
+        candidates, available = self._candidates(subject, topics, list(weights), class_id)
+        by_type: Dict[str, List[BankQuestion]] = {t: [] for t in weights}
+        for question in candidates:
+            by_type[question.type].append(question)
+
+        by_points = bool(total_points)
+        shares = split_integer(int(total_points if by_points else question_count), weights)
+        types = list(weights)
+        remaining_minutes = float(duration) if duration else math.inf
+        selected: List[BankQuestion] = []
+        gaps, targets = [], {}
+        for position, qtype in enumerate(types):
+            ordered = self._priority_order(by_type[qtype], rng)
+            # Thời gian còn lại chia theo tỷ lệ điểm/số câu của các loại chưa chọn
+            pending = sum(shares[t] for t in types[position:])
+            budget = remaining_minutes if math.isinf(remaining_minutes) or not pending else \
+                remaining_minutes * shares[qtype] / pending
+            if by_points:
+                chosen = self._select_points(ordered, shares[qtype], budget)
+                missing = shares[qtype] - sum(q.points for q in chosen)
+                targets[qtype] = {"points": shares[qtype]}
+                if missing > 0:
+                    default = DEFAULT_POINTS.get(qtype, 1)
+                    gaps.append({"type": qtype, "points": missing, "count": math.ceil(missing / default)})
+            else:
+                count = shares[qtype]
+                chosen, minutes = [], 0.0
+                for question in ordered:
+                    if len(chosen) >= count:
+                        break
+                    if minutes + question.minutes <= budget:
+                        chosen.append(question)
+                        minutes += question.minutes
+                targets[qtype] = {"count": count}
+                if len(chosen) < count:
+                    gaps.append({"type": qtype, "points": None, "count": count - len(chosen)})
+            selected.extend(chosen)
+            remaining_minutes -= sum(q.minutes for q in chosen)
+
+        questions = self.get_questions([q.id for q in selected])
+        self.stats["assemblies"] += 1
+        self.stats["questions_from_bank"] += len(questions)
+        self.stats["gap_questions"] += sum(g["count"] for g in gaps)
+        return ExamAssembly(questions=questions, gaps=gaps, targets=targets, candidates=len(candidates),
+                            available=available, solve_ms=round((time.perf_counter() - started) * 1000, 2))
+
+    def get_questions(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """Câu hỏi đầy đủ theo ID (giữ thứ tự)"""
+        if not ids:
+            return []
+        with self._lock:
+            rows = {
+                row["id"]: row for row in self._conn.execute(
+                    f"SELECT * FROM questions WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+            }
+        return [
+            {**json.loads(row["body"]), "bank_id": row["id"], "type": row["type"], "topic": row["topic"],
+             "difficulty": row["difficulty"], "points": row["points"], "minutes": row["minutes"]}
+            for row in (rows[i] for i in ids if i in rows)
+        ]
+
+    def record_usage(self, class_id: Optional[str], exam_id: str, question_ids: List[int]):
+        """Ghi nhận câu hỏi đã dùng trong đề (và với lớp `class_id` để không lặp lại)"""
+        if not question_ids:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE questions SET use_count = use_count + 1 WHERE id = ?",
+                                   [(i,) for i in question_ids])
+            if class_id:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO question_usage (class_id, question_id, exam_id, used_at) VALUES (?, ?, ?, ?)",
+                    [(class_id, i, exam_id, now) for i in question_ids]
+                )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_type = {
+                row["type"]: {"count": row["n"], "points": row["p"]}
+                for row in self._conn.execute(
+                    "SELECT type, COUNT(*) AS n, SUM(points) AS p FROM questions GROUP BY type"
+                )
+            }
+            classes = self._conn.execute("SELECT COUNT(DISTINCT class_id) FROM question_usage").fetchone()[0]
+        return {
+            "path": self.path,
+            "total_questions": sum(t["count"] for t in by_type.values()),
+            "question_types": by_type,
+            "classes_tracked": classes,
+            **self.stats,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_bank: Optional[QuestionBank] = None
+
+
+def get_question_bank() -> QuestionBank:
+    global _bank
+    if _bank is None:
+        path = os.getenv("QUESTION_BANK_PATH", "./data/questions.db")
+        _bank = QuestionBank(path or None)
+    return _bank
+
+
+def set_question_bank(bank: Optional[QuestionBank]):
+    global _bank
+    _bank = bank
@@ -0,0 +1,267 @@
+"""
+Cohort Risk Engine
+Chấm điểm rủi ro học tập cho cả khóa cùng lúc: đặc trưng (điểm số, chuyên cần, mức độ tham gia, độ dốc xu hướng)
+được tính vector hóa bằng NumPy cho mọi học sinh, rủi ro = sigmoid của tổng có trọng số (trọng số mặc định
+minh bạch hoặc học từ dữ liệu bằng logistic regression), rồi xếp hạng; LLM chỉ giải thích cho top-k học sinh
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from itertools import chain
+import logging
+import os
+import time
+
+import numpy as np
+
+from .state_backend import SharedDict
+
+logger = logging.getLogger(__name__)
+
+# Dữ liệu đầu vào của mỗi chỉ số và các tên field được chấp nhận (theo thứ tự ưu tiên)
+METRIC_FIELDS = {
+    "grades": ("grades", "recent_grades"),
+    "attendance": ("attendance", "attendance_trend", "attendance_rate"),
+    "engagement": ("engagement", "engagement_scores", "participation"),
+    "assignments": ("assignment_completion", "assignments"),
+}
+# Ngưỡng (thang 0-100) dưới đó chỉ số bắt đầu làm tăng rủi ro, cùng mặc định với early_warning_system
+DEFAULT_THRESHOLDS = {"academic": 70, "attendance": 85, "engagement": 60, "assignments": 80}
+THRESHOLD_KEYS = {"grades": "academic", "attendance": "attendance", "engagement": "engagement",
+                  "assignments": "assignments"}
+
+# Đặc trưng đều theo hướng "càng lớn càng rủi ro": *_gap = (ngưỡng - trung bình) / 100,
+# *_trend = mức giảm mỗi kỳ / 10 điểm
+FEATURES = ("grade_gap", "grade_trend", "attendance_gap", "attendance_trend", "engagement_gap",
+            "engagement_trend", "assignment_gap")
+DEFAULT_WEIGHTS = {"grade_gap": 8.0, "grade_trend": 1.5, "attendance_gap": 10.0, "attendance_trend": 1.0,
+                   "engagement_gap": 5.0, "engagement_trend": 1.0, "assignment_gap": 4.0}
+# Học sinh đúng bằng mọi ngưỡng và không có xu hướng: rủi ro ~0.27
+DEFAULT_BIAS = -1.0
+# Namespace trên state backend chứa trọng số đã huấn luyện (dùng chung giữa các worker, còn sau khi khởi động lại)
+MODEL_NAMESPACE = "risk_model"
+
+
+def numeric_series(record: Dict[str, Any], aliases: Sequence[str]) -> List[float]:
+    """Giá trị số của field đầu tiên có trong record (list, dict theo môn hoặc một số đơn)"""
+    for name in aliases:
+        value = record.get(name)
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            value = list(value.values())
+        elif not isinstance(value, (list, tuple)):
+            value = [value]
+        return [float(v) for v in value if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    return []
+
+
+def series_matrix(series: Sequence[Sequence[float]], window: int) -> np.ndarray:
+    """Ma trận n x window (NaN ở ô trống) từ các chuỗi độ dài khác nhau, chỉ giữ `window` giá trị gần nhất"""
+    series = [s[-window:] for s in series]
+    lengths = np.fromiter(map(len, series), dtype=np.int64, count=len(series))
+    matrix = np.full((len(series), max(int(lengths.max(initial=0)), 1)), np.nan)
+    flat = np.fromiter(chain.from_iterable(series), dtype=np.float64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(series)), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[rows, cols] = flat
+    return matrix
+
+
+def percent_matrix(matrix: np.ndarray) -> np.ndarray:
+    """Đưa chuỗi tỷ lệ 0-1 về phần trăm 0-100; quyết định theo từng dòng (giá trị lớn nhất <= 1 là tỷ lệ), không theo từng ô"""
+    row_max = np.where(np.isnan(matrix), -np.inf, matrix).max(axis=1, initial=-np.inf)
+    return np.where((row_max <= 1.0)[:, None], matrix * 100.0, matrix)
+
+
+def row_trends(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(trung bình, độ dốc bình phương tối thiểu theo kỳ, số giá trị) của từng dòng, bỏ qua NaN"""
+    mask = ~np.isnan(matrix)
+    counts = mask.sum(axis=1)
+    safe = np.maximum(counts, 1)
+    t = np.arange(matrix.shape[1], dtype=np.float64)
+    values = np.where(mask, matrix, 0.0)
+    means = values.sum(axis=1) / safe
+    t_means = (mask * t).sum(axis=1) / safe
+    dt = np.where(mask, t - t_means[:, None], 0.0)
+    denom = (dt * dt).sum(axis=1)
+    numer = (dt * (values - means[:, None])).sum(axis=1)
+    slopes = np.divide(numer, denom, out=np.zeros(len(matrix)), where=denom > 0)
+    return means, slopes, counts
+
+
+@dataclass
+class CohortRisk:
+    student_ids: List[Any]
+    features: np.ndarray       # n x len(FEATURES)
+    contributions: np.ndarray  # features * weights
+    scores: np.ndarray
+    high_risk: float
+    medium_risk: float
+    model: str
+    elapsed_ms: float
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def levels(self) -> np.ndarray:
+        return np.where(self.scores >= self.high_risk, "high",
+                        np.where(self.scores >= self.medium_risk, "medium", "low"))
+
+    def top(self, k: int, min_score: float = 0.0) -> np.ndarray:
+        """Chỉ số top-k học sinh rủi ro cao nhất (giảm dần), chỉ lấy điểm >= min_score"""
+        candidates = np.flatnonzero(self.scores >= min_score)
+        if k < len(candidates):
+            candidates = candidates[np.argpartition(-self.scores[candidates], k - 1)[:k]]
+        return candidates[np.argsort(-self.scores[candidates], kind="stable")]
+
+    def student(self, row: int, max_factors: int = 3) -> Dict[str, Any]:
+        contributions = self.contributions[row]
+        order = [i for i in np.argsort(-contributions)[:max_factors] if contributions[i] > 0]
+        score = float(self.scores[row])
+        return {
+            "student_id": self.student_ids[row],
+            "risk_score": round(score, 4),
+            "risk_level": "high" if score >= self.high_risk else "medium" if score >= self.medium_risk else "low",
+            "risk_factors": [{"feature": FEATURES[i], "value": round(float(self.features[row, i]), 4),
+                              "contribution": round(float(contributions[i]), 4)} for i in order],
+            "features": {name: round(float(v), 4) for name, v in zip(FEATURES, self.features[row])},
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        levels = self.levels()
+        return {
+            "students": len(self),
+            "high": int(np.count_nonzero(levels == "high")),
+            "medium": int(np.count_nonzero(levels == "medium")),
+            "low": int(np.count_nonzero(levels == "low")),
+            "mean_risk": round(float(self.scores.mean()), 4) if len(self) else 0.0,
+            "model": self.model,
+            "scoring_ms": round(self.elapsed_ms, 2),
+        }
+
+
+class RiskEngine:
+    """Mô hình tuyến tính trên đặc trưng vector hóa; đóng góp từng đặc trưng = giải thích của điểm rủi ro
+
+    Với `store`, trọng số học được bởi fit() được lưu vào đó và sync() nạp lại trọng số mới nhất đã lưu.
+    """
+
+    def __init__(self, weights: Dict[str, float] = None, bias: float = None, thresholds: Dict[str, float] = None,
+                 grade_scale: float = None, window: int = None, high_risk: float = None, medium_risk: float = None,
+                 store: Optional[SharedDict] = None):
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.bias = DEFAULT_BIAS if bias is None else bias
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.grade_scale = grade_scale if grade_scale is not None else float(os.getenv("RISK_GRADE_SCALE", "10"))
+        self.window = window if window is not None else int(os.getenv("RISK_TREND_WINDOW", "8"))
+        self.high_risk = high_risk if high_risk is not None else float(os.getenv("RISK_HIGH_THRESHOLD", "0.7"))
+        self.medium_risk = medium_risk if medium_risk is not None else float(os.getenv("RISK_MEDIUM_THRESHOLD", "0.4"))
+        self.model = "weighted"
+        self.trained_at: Optional[float] = None
+        self.store = store
+        self.stats = {"sweeps": 0, "students_scored": 0, "last_sweep_ms": 0.0, "trained_samples": 0}
+
+    def _percent(self, metric: str, matrix: np.ndarray, grade_scale: float) -> np.ndarray:
+        if metric == "grades":
+            return matrix * (100.0 / grade_scale)
+        # Chuyên cần/tham gia/hoàn thành bài: nhận cả tỷ lệ 0-1 và phần trăm 0-100
+        return percent_matrix(matrix)
+
+    def features(self, students: Sequence[Dict[str, Any]], thresholds: Dict[str, float] = None,
+                 grade_scale: float = None) -> np.ndarray:
+        """Ma trận đặc trưng n x len(FEATURES); chỉ số không có dữ liệu = 0 (trung tính)
+
+        `grade_scale` là thang điểm của khóa trong yêu cầu này (4.0, 10, 100...); mặc định theo engine.
+        """
+        thresholds = {**self.thresholds, **(thresholds or {})}
+        grade_scale = float(grade_scale) if grade_scale else self.grade_scale
+        columns = {}
+        for metric, aliases in METRIC_FIELDS.items():
+            matrix = self._percent(metric, series_matrix([numeric_series(s, aliases) for s in students], self.window),
+                                   grade_scale)
+            means, slopes, counts = row_trends(matrix)
+            observed = counts > 0
+            prefix = "grade" if metric == "grades" else "assignment" if metric == "assignments" else metric
+            columns[f"{prefix}_gap"] = np.where(observed, (thresholds[THRESHOLD_KEYS[metric]] - means) / 100.0, 0.0)
+            columns[f"{prefix}_trend"] = (0.0 - slopes) / 10.0
+        return np.column_stack([columns[name] for name in FEATURES]) if len(students) else np.zeros((0, len(FEATURES)))
+
+    def score(self, students: Sequence[Dict[str, Any]], thresholds: Dict[str, float] = None,
+              grade_scale: float = None) -> CohortRisk:
+        start = time.perf_counter()
+        features = self.features(students, thresholds, grade_scale)
+        weights = np.array([self.weights[name] for name in FEATURES])
+        contributions = features * weights
+        scores = 1.0 / (1.0 + np.exp(-(contributions.sum(axis=1) + self.bias)))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["sweeps"] += 1
+        self.stats["students_scored"] += len(students)
+        self.stats["last_sweep_ms"] = round(elapsed_ms, 2)
+        student_ids = [s.get("student_id", i) for i, s in enumerate(students)]
+        return CohortRisk(student_ids, features, contributions, scores, self.high_risk, self.medium_risk,
+                          self.model, elapsed_ms)
+
+    def fit(self, students: Sequence[Dict[str, Any]], labels: Sequence[int], regularization: float = 1.0,
+            grade_scale: float = None) -> Dict[str, Any]:
+        """Học trọng số bằng logistic regression (scikit-learn) từ kết quả thực tế (1 = gặp rủi ro)"""
+        from sklearn.linear_model import LogisticRegression
+
+        labels = np.asarray(labels, dtype=np.int64)
+        if len(labels) != len(students):
+            raise ValueError("labels must have one value per student")
+        if len(np.unique(labels)) < 2:
+            raise ValueError("labels must contain both at-risk and not-at-risk students")
+        classifier = LogisticRegression(C=regularization, max_iter=1000)
+        classifier.fit(self.features(students, grade_scale=grade_scale), labels)
+        self.weights = {name: float(w) for name, w in zip(FEATURES, classifier.coef_[0])}
+        self.bias = float(classifier.intercept_[0])
+        self.model = "logistic_regression"
+        self.trained_at = time.time()
+        self.stats["trained_samples"] = len(labels)
+        if self.store is not None:
+            self.store["model"] = {"model": self.model, "weights": self.weights, "bias": self.bias,
+                                   "trained_samples": len(labels), "trained_at": self.trained_at}
+        logger.info("Risk model trained on %d students (%d at risk)", len(labels), int(labels.sum()))
+        return {"samples": len(labels), "positives": int(labels.sum()), **self.get_model()}
+
+    def sync(self):
+        """Nạp trọng số đã lưu nếu khác bản đang dùng (vd. worker khác vừa huấn luyện)"""
+        saved = self.store.get("model") if self.store is not None else None
+        if not saved or saved["trained_at"] == self.trained_at:
+            return
+        self.weights = {**DEFAULT_WEIGHTS, **saved["weights"]}
+        self.bias = float(saved["bias"])
+        self.model = saved["model"]
+        self.trained_at = saved["trained_at"]
+        self.stats["trained_samples"] = saved["trained_samples"]
+
+    def get_model(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "weights": {name: round(self.weights[name], 4) for name in FEATURES},
+            "bias": round(self.bias, 4),
+            "thresholds": self.thresholds,
+            "levels": {"high": self.high_risk, "medium": self.medium_risk},
+            "trained_at": self.trained_at,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "model": self.model}
+
+
+_engine: Optional[RiskEngine] = None
+
+
+def get_risk_engine() -> RiskEngine:
+    """Engine dùng chung, với trọng số đã huấn luyện mới nhất trên state backend"""
+    global _engine
+    if _engine is None:
+        _engine = RiskEngine(store=SharedDict(MODEL_NAMESPACE))
+    _engine.sync()
+    return _engine
+
+
+def set_risk_engine(engine: Optional[RiskEngine]):
+    global _engine
+    _engine = engine
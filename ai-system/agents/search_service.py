@@ -0,0 +1,460 @@
+"""
+Web Search Service
+Dịch vụ tìm kiếm dùng chung: gọi song song nhiều search engine trong một deadline, chuẩn hóa và khử trùng lặp theo URL, cache theo (query, search_type)
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote_plus
+import xml.etree.ElementTree as ET
+import asyncio
+import logging
+import os
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Query params chỉ dùng để tracking, không làm thay đổi nội dung trang
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "ref_src", "mc_cid", "mc_eid", "igshid"}
+
+
+def canonical_url(url: str) -> str:
+    """URL chuẩn để so trùng: bỏ scheme, www., fragment, tracking params, dấu / cuối; sắp xếp query"""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.startswith("m.") and host.endswith("wikipedia.org"):
+        host = host[2:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or ""
+    return urlunsplit(("", host, path, urlencode(query), "")).lstrip("/")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def make_result(title: str, url: str, snippet: str = "", source: str = "", date: str = "",
+                relevance: Optional[float] = None, engine: str = "") -> Dict[str, Any]:
+    """Kết quả tìm kiếm theo định dạng chung của WebSearchAgent"""
+    return {
+        "title": title or url,
+        "url": url,
+        "snippet": snippet or "",
+        "source": source or engine,
+        "date": date or "",
+        "relevance": relevance,
+        "engine": engine,
+    }
+
+
+class SearchEngine(ABC):
+    """Một nguồn tìm kiếm; engine con cài đặt `search`"""
+    name = "engine"
+    base_url = ""
+    uses_http = True
+
+    @abstractmethod
+    async def search(self, client: httpx.AsyncClient, query: str, search_type: str, max_results: int) -> List[Dict[str, Any]]:
+        """Kết quả đã chuẩn hóa bằng make_result"""
+        pass
+
+
+class SimulatedEngine(SearchEngine):
+    """Kết quả giả lập offline (mặc định khi chưa cấu hình engine thật)"""
+    name = "simulated"
+    uses_http = False
+
+    async def search(self, client, query, search_type, max_results):
+        slug = query.replace(' ', '-')
+        results = [
+            make_result(f"Educational Research on {query}", f"https://education.example.com/{slug}",
+                        f"Latest research and findings about {query} in educational context",
+                        "Educational Research Journal", "2024-01-15", 0.95, self.name),
+            make_result(f"Teaching Methods for {query}", f"https://teaching.example.com/methods/{slug}",
+                        f"Effective teaching strategies and methods for {query}",
+                        "Teaching Excellence Center", "2024-01-10", 0.90, self.name),
+            make_result(f"{query} in Modern Education", f"https://modern-edu.example.com/topics/{slug}",
+                        f"Modern approaches and applications of {query} in education",
+                        "Modern Education Review", "2024-01-05", 0.88, self.name),
+        ]
+        if any(tech in query.lower() for tech in ["ai", "technology", "software", "digital"]):
+            results.append(make_result(f"AI Applications in {query}", f"https://ai-tech.example.com/{slug}",
+                                       f"Latest AI applications and technologies for {query}",
+                                       "AI Technology Review", "2024-01-12", 0.92, self.name))
+        return results[:max_results]
+
+
+class DuckDuckGoEngine(SearchEngine):
+    """DuckDuckGo Instant Answer API"""
+    name = "duckduckgo"
+    base_url = "https://api.duckduckgo.com/"
+
+    async def search(self, client, query, search_type, max_results):
+        response = await client.get(self.base_url, params={"q": query, "format": "json", "no_html": 1, "skip_disambig": 1})
+        response.raise_for_status()
+        data = response.json()
+        results = []
+        if data.get("AbstractURL"):
+            results.append(make_result(data.get("Heading", query), data["AbstractURL"], data.get("AbstractText", ""),
+                                       data.get("AbstractSource", self.name), engine=self.name))
+        topics = list(data.get("RelatedTopics", []))
+        while topics and len(results) < max_results:
+            topic = topics.pop(0)
+            if "Topics" in topic:
+                topics.extend(topic["Topics"])
+            elif topic.get("FirstURL"):
+                text = topic.get("Text", "")
+                results.append(make_result(text.split(" - ")[0], topic["FirstURL"], text, "DuckDuckGo", engine=self.name))
+        return results[:max_results]
+
+
+class WikipediaEngine(SearchEngine):
+    """Wikipedia REST search"""
+    name = "wikipedia"
+    base_url = "https://en.wikipedia.org/w/rest.php/v1/search/page"
+
+    async def search(self, client, query, search_type, max_results):
+        response = await client.get(self.base_url, params={"q": query, "limit": max_results})
+        response.raise_for_status()
+        return [
+            make_result(page.get("title", ""), f"https://en.wikipedia.org/wiki/{quote_plus(page.get('key', ''))}",
+                        page.get("excerpt", "").replace('<span class="searchmatch">', "").replace("</span>", ""),
+                        "Wikipedia encyclopedia", engine=self.name)
+            for page in response.json().get("pages", [])
+        ]
+
+
+class ArxivEngine(SearchEngine):
+    """arXiv Atom API"""
+    name = "arxiv"
+    base_url = "http://export.arxiv.org/api/query"
+    _ns = {"atom": "http://www.w3.org/2005/Atom"}
+
+    async def search(self, client, query, search_type, max_results):
+        response = await client.get(self.base_url, params={"search_query": f"all:{query}", "max_results": max_results})
+        response.raise_for_status()
+        root = ET.fromstring(response.text)
+        results = []
+        for entry in root.findall("atom:entry", self._ns):
+            results.append(make_result(
+                " ".join((entry.findtext("atom:title", "", self._ns)).split()),
+                entry.findtext("atom:id", "", self._ns),
+                " ".join((entry.findtext("atom:summary", "", self._ns)).split())[:300],
+                "arXiv research preprint",
+                entry.findtext("atom:published", "", self._ns)[:10],
+                engine=self.name
+            ))
+        return results
+
+
+class NewsAPIEngine(SearchEngine):
+    """NewsAPI (cần NEWS_API_KEY)"""
+    name = "news_api"
+    base_url = "https://newsapi.org/v2/everything"
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.getenv("NEWS_API_KEY", "")
+
+    async def search(self, client, query, search_type, max_results):
+        if not self.api_key:
+            return []
+        response = await client.get(self.base_url, params={"q": query, "pageSize": max_results, "apiKey": self.api_key})
+        response.raise_for_status()
+        return [
+            make_result(article.get("title", ""), article.get("url", ""), article.get("description") or "",
+                        f"{(article.get('source') or {}).get('name', 'News')} news", (article.get("publishedAt") or "")[:10],
+                        engine=self.name)
+            for article in response.json().get("articles", [])
+        ]
+
+
+class FakeSearchEngine(SearchEngine):
+    """Engine cục bộ cho test/benchmark: kết quả cố định hoặc sinh từ hàm, độ trễ và lỗi cấu hình được"""
+
+    uses_http = False
+
+    def __init__(self, name: str, results: Any = None, latency: float = 0.0, error: Optional[Exception] = None):
+        self.name = name
+        self.results = results
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+
+    async def search(self, client, query, search_type, max_results):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        results = self.results(query, search_type) if callable(self.results) else (self.results or [])
+        return [dict(r, engine=r.get("engine") or self.name) for r in results][:max_results]
+
+
+ENGINE_CLASSES = {
+    "simulated": SimulatedEngine,
+    "duckduckgo": DuckDuckGoEngine,
+    "wikipedia": WikipediaEngine,
+    "arxiv": ArxivEngine,
+    "news_api": NewsAPIEngine,
+}
+
+
+def create_engines(names: List[str]) -> List[SearchEngine]:
+    engines = []
+    for name in names:
+        if name in ENGINE_CLASSES:
+            engines.append(ENGINE_CLASSES[name]())
+        else:
+            logger.warning(f"Unknown search engine '{name}' ignored")
+    return engines
+
+
+@dataclass
+class _CacheEntry:
+    results: List[Dict[str, Any]]
+    engines: Dict[str, Dict[str, Any]]
+    max_results: int
+    expires_at: float
+
+
+class SearchService:
+    """Fan-out tìm kiếm song song tới các engine, gộp kết quả theo URL chuẩn và cache có TTL + giới hạn số entry
+
+    Engine không trả lời kịp `deadline` bị hủy, kết quả của các engine còn lại vẫn được dùng.
+    Các lời gọi đồng thời cùng (query, search_type) dùng chung một lần fan-out.
+    """
+
+    def __init__(self, engines: Optional[List[SearchEngine]] = None, deadline: float = 3.0,
+                 cache_ttl: float = 3600.0, cache_max_entries: int = 1000,
+                 search_types: Optional[Dict[str, List[str]]] = None):
+        self.engines = engines if engines is not None else [SimulatedEngine()]
+        self.deadline = deadline
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        # Engine dùng cho từng search_type (mặc định: tất cả engine)
+        self.search_types = search_types or {}
+        self._cache: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Tạo AsyncClient tốn ~100ms (SSL context): giữ một client cho mỗi event loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        self.stats = {
+            "searches": 0, "cache_hits": 0, "cache_misses": 0, "coalesced": 0, "evictions": 0,
+            "engine_calls": 0, "engine_errors": 0, "engine_timeouts": 0,
+        }
+
+    @property
+    def engine_names(self) -> List[str]:
+        return [engine.name for engine in self.engines]
+
+    def _engines_for(self, search_type: str) -> List[SearchEngine]:
+        names = self.search_types.get(search_type)
+        if not names:
+            return self.engines
+        return [engine for engine in self.engines if engine.name in names] or self.engines
+
+    async def search(self, query: str, search_type: str = "general", max_results: int = 10,
+                     bypass_cache: bool = False) -> Dict[str, Any]:
+        """Tìm kiếm; trả về {"results", "engines", "cached", "total_results", "elapsed_ms"}"""
+        started = time.perf_counter()
+        self.stats["searches"] += 1
+        key = (normalize_query(query), search_type)
+
+        if not bypass_cache:
+            entry = self._cache.get(key)
+            if entry is not None and entry.expires_at > time.time() and entry.max_results >= max_results:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self._response(entry.results[:max_results], entry.engines, True, started)
+            if entry is not None and entry.expires_at <= time.time():
+                del self._cache[key]
+            self.stats["cache_misses"] += 1
+
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight.get_loop() is asyncio.get_running_loop():
+                self.stats["coalesced"] += 1
+                results, engines = await asyncio.shield(inflight)
+                if len(results) >= max_results or all(e.get("count", 0) < max_results for e in engines.values()):
+                    return self._response(results[:max_results], engines, False, started)
+
+        future = asyncio.get_running_loop().create_future()
+        if not bypass_cache:
+            self._inflight[key] = future
+        try:
+            results, engines = await self._fan_out(query, search_type, max_results)
+            future.set_result((results, engines))
+        except BaseException as e:
+            future.set_exception(e)
+            # Tránh cảnh báo "exception was never retrieved" khi không ai chờ
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        if not bypass_cache and any(e["status"] == "ok" for e in engines.values()):
+            self._store(key, _CacheEntry(results, engines, max_results, time.time() + self.cache_ttl))
+        return self._response(results[:max_results], engines, False, started)
+
+    async def _fan_out(self, query: str, search_type: str, max_results: int):
+        engines = self._engines_for(search_type)
+        report: Dict[str, Dict[str, Any]] = {}
+        client = self._get_client() if any(engine.uses_http for engine in engines) else None
+        tasks = {
+            asyncio.ensure_future(self._run_engine(engine, client, query, search_type, max_results)): engine
+            for engine in engines
+        }
+        self.stats["engine_calls"] += len(tasks)
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+            report[tasks[task].name] = {"status": "timeout", "count": 0}
+            self.stats["engine_timeouts"] += 1
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        batches = []
+        for task in done:
+            engine = tasks[task]
+            results, elapsed_ms, error = task.result()
+            if error is not None:
+                self.stats["engine_errors"] += 1
+                report[engine.name] = {"status": "error", "error": error, "count": 0, "elapsed_ms": elapsed_ms}
+            else:
+                report[engine.name] = {"status": "ok", "count": len(results), "elapsed_ms": elapsed_ms}
+                batches.append(results)
+        return self.merge(batches), report
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.deadline, follow_redirects=True)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _run_engine(self, engine: SearchEngine, client, query, search_type, max_results):
+        started = time.perf_counter()
+        try:
+            results = await engine.search(client, query, search_type, max_results)
+            return results, round((time.perf_counter() - started) * 1000, 2), None
+        except Exception as e:
+            logger.warning(f"Search engine {engine.name} failed: {e}")
+            return [], round((time.perf_counter() - started) * 1000, 2), str(e)
+
+    @staticmethod
+    def merge(batches: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Gộp kết quả các engine: trùng URL chuẩn thì giữ bản có relevance cao nhất,
+        cộng thêm điểm khi nhiều engine cùng trả về; sắp xếp theo relevance giảm dần"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for batch in batches:
+            for rank, result in enumerate(batch):
+                url = canonical_url(result.get("url", ""))
+                if not url:
+                    continue
+                relevance = result.get("relevance")
+                if relevance is None:
+                    relevance = max(0.1, 0.9 - 0.05 * rank)
+                engine = result.get("engine", "")
+                existing = merged.get(url)
+                if existing is None:
+                    merged[url] = dict(result, relevance=relevance, canonical_url=url, engines=[engine] if engine else [])
+                    continue
+                if engine and engine not in existing["engines"]:
+                    existing["engines"].append(engine)
+                if relevance > existing["relevance"]:
+                    engines = existing["engines"]
+                    existing.update(result, relevance=relevance, canonical_url=url, engines=engines)
+        results = list(merged.values())
+        for result in results:
+            boost = 0.05 * (len(result["engines"]) - 1)
+            result["relevance"] = round(min(1.0, result["relevance"] + boost), 4)
+        results.sort(key=lambda r: r["relevance"], reverse=True)
+        return results
+
+    def _store(self, key, entry: _CacheEntry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _response(self, results, engines, cached: bool, started: float) -> Dict[str, Any]:
+        return {
+            "results": [dict(r) for r in results],
+            "engines": engines,
+            "cached": cached,
+            "total_results": len(results),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def invalidate(self, query: Optional[str] = None, search_type: Optional[str] = None) -> int:
+        """Xóa cache theo query và/hoặc search_type (không truyền gì thì xóa hết)"""
+        normalized = normalize_query(query) if query is not None else None
+        keys = [
+            key for key in self._cache
+            if (normalized is None or key[0] == normalized) and (search_type is None or key[1] == search_type)
+        ]
+        for key in keys:
+            del self._cache[key]
+        return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["cache_hits"] + self.stats["cache_misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["cache_hits"] / lookups if lookups else 0.0,
+            "cache_entries": len(self._cache),
+            "cache_max_entries": self.cache_max_entries,
+            "cache_ttl_seconds": self.cache_ttl,
+            "deadline_seconds": self.deadline,
+            "engines": self.engine_names,
+        }
+
+
+def _parse_search_types(value: str) -> Dict[str, List[str]]:
+    """"news=news_api|duckduckgo,academic=arxiv|wikipedia" -> {search_type: [engine, ...]}"""
+    search_types = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            search_type, engines = pair.split("=", 1)
+            search_types[search_type.strip()] = [e.strip() for e in engines.split("|") if e.strip()]
+    return search_types
+
+
+_service: Optional[SearchService] = None
+
+
+def get_search_service() -> SearchService:
+    global _service
+    if _service is None:
+        names = [n.strip() for n in os.getenv("SEARCH_ENGINES", "simulated").split(",") if n.strip()]
+        _service = SearchService(
+            engines=create_engines(names),
+            deadline=float(os.getenv("SEARCH_DEADLINE_SECONDS", "3")),
+            cache_ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+            cache_max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000")),
+            search_types=_parse_search_types(os.getenv("SEARCH_ENGINE_ROUTING", "")),
+        )
+    return _service
+
+
+def set_search_service(service: Optional[SearchService]):
+    global _service
+    _service = service
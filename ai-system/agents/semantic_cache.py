@@ -0,0 +1,336 @@
+"""
+Semantic Response Cache
+Cache câu trả lời theo ngữ nghĩa của câu hỏi: câu hỏi diễn đạt khác nhưng cùng ý được trả lời từ cache
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Sequence
+from dataclasses import dataclass, field
+from collections import OrderedDict, deque
+import copy
+import logging
+import os
+import random
+import re
+import time
+import unicodedata
+import uuid
+import numpy as np
+
+from .embedding_service import get_embedding_service
+
+logger = logging.getLogger(__name__)
+
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.…,;:]+$")
+# Token phân biệt nội dung câu trả lời: số, mã lớp/học sinh ("10a1", "hs123"), chữ cái đơn in hoa ("học sinh A")
+_GUARD_RE = re.compile(r"\b(?:\w*\d\w*|[A-ZĐ])\b")
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa câu hỏi: NFC, viết thường, gộp khoảng trắng, bỏ dấu câu cuối"""
+    text = unicodedata.normalize("NFC", str(query)).strip().lower()
+    text = _SPACE_RE.sub(" ", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def guard_tokens(query: str) -> frozenset:
+    """Các token bắt buộc phải trùng khớp để dùng lại câu trả lời (số, mã, tên viết tắt)"""
+    return frozenset(token.lower() for token in _GUARD_RE.findall(unicodedata.normalize("NFC", str(query))))
+
+
+@dataclass
+class CacheEntry:
+    """Một câu trả lời đã cache"""
+    entry_id: str
+    scope: str
+    query: str
+    normalized: str
+    guard: frozenset
+    vector: np.ndarray
+    response: Dict[str, Any]
+    created_at: float
+    expires_at: float
+    tags: frozenset = field(default_factory=frozenset)
+    hits: int = 0
+
+
+@dataclass
+class CacheHit:
+    """Kết quả lookup trúng cache"""
+    entry: CacheEntry
+    similarity: float
+    exact: bool
+    lookup_ms: float
+
+    @property
+    def response(self) -> Dict[str, Any]:
+        return copy.deepcopy(self.entry.response)
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "hit": True,
+            "exact": self.exact,
+            "similarity": round(self.similarity, 4),
+            "cached_query": self.entry.query,
+            "age_seconds": round(time.time() - self.entry.created_at, 1),
+            "lookup_ms": round(self.lookup_ms, 2)
+        }
+
+
+class _ScopeIndex:
+    """Ma trận embedding của các entry trong một scope, dựng lại khi có thay đổi"""
+
+    def __init__(self):
+        self.entry_ids: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.dirty = False
+
+
+class SemanticCache:
+    """Cache câu trả lời theo similarity của embedding câu hỏi
+
+    Mỗi scope (route/agent) có index và ngưỡng similarity riêng. Câu hỏi trùng sau chuẩn hóa
+    trúng ngay không cần embedding. Một tỉ lệ nhỏ các hit gần đúng được chạy lại pipeline thật
+    để đo tỉ lệ false hit (`record_sample`).
+    """
+
+    def __init__(self, embedding_service=None, threshold: float = 0.9, ttl_seconds: float = 3600,
+                 max_entries: int = 5000, sample_rate: float = 0.05, answer_agreement: float = 0.8,
+                 enabled: bool = True):
+        self._embedding_service = embedding_service
+        self.threshold = threshold
+        self.scope_thresholds: Dict[str, float] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sample_rate = sample_rate
+        self.answer_agreement = answer_agreement
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._exact: Dict[tuple, str] = {}
+        self._scopes: Dict[str, _ScopeIndex] = {}
+        self._invalidation_hooks: List[Callable[[List[CacheEntry]], None]] = []
+
+        self.stats = {
+            "lookups": 0, "hits": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+            "bypassed": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0,
+            "sampled": 0, "false_hits": 0
+        }
+        self.scope_stats: Dict[str, Dict[str, int]] = {}
+        self.false_hit_examples: deque = deque(maxlen=50)
+
+    @property
+    def embedding_service(self):
+        if self._embedding_service is None:
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    def set_threshold(self, scope: str, threshold: float):
+        """Ngưỡng similarity riêng cho một scope (vd. "chat:general", "multi_tier")"""
+        self.scope_thresholds[scope] = threshold
+
+    def threshold_for(self, scope: str) -> float:
+        return self.scope_thresholds.get(scope, self.threshold)
+
+    def add_invalidation_hook(self, hook: Callable[[List[CacheEntry]], None]):
+        """Đăng ký callback được gọi với các entry bị xóa do invalidate/hết hạn"""
+        self._invalidation_hooks.append(hook)
+
+    def _count(self, scope: str, key: str):
+        self.stats[key] += 1
+        scope_stats = self.scope_stats.setdefault(scope, {"lookups": 0, "hits": 0, "misses": 0, "stores": 0})
+        if key in scope_stats:
+            scope_stats[key] += 1
+
+    async def lookup(self, query: str, scope: str = "default", bypass: bool = False) -> Optional[CacheHit]:
+        """Tìm câu trả lời đã cache cho câu hỏi tương tự trong cùng scope"""
+        if not self.enabled or bypass:
+            self.stats["bypassed"] += 1
+            return None
+
+        started = time.perf_counter()
+        self._count(scope, "lookups")
+        normalized = normalize_query(query)
+        guard = guard_tokens(query)
+        now = time.time()
+
+        entry_id = self._exact.get((scope, normalized))
+        if entry_id is not None:
+            entry = self._entries.get(entry_id)
+            if entry is not None and entry.expires_at > now:
+                return self._hit(entry, 1.0, True, started)
+
+        index = self._scopes.get(scope)
+        if index is None or not index.entry_ids:
+            self._count(scope, "misses")
+            return None
+
+        vector = await self.embedding_service.embed_one(normalized)
+        # Phần còn lại không có await nên không cần lock giữa các coroutine
+        self._rebuild(index)
+        scores = index.matrix @ vector
+        candidates = np.flatnonzero(scores >= self.threshold_for(scope))
+        for position in candidates[np.argsort(-scores[candidates])]:
+            entry = self._entries.get(index.entry_ids[position])
+            if entry is None or entry.expires_at <= now or entry.guard != guard:
+                continue
+            return self._hit(entry, float(scores[position]), False, started)
+
+        self._count(scope, "misses")
+        return None
+
+    def _hit(self, entry: CacheEntry, similarity: float, exact: bool, started: float) -> CacheHit:
+        entry.hits += 1
+        self._entries.move_to_end(entry.entry_id)
+        self._count(entry.scope, "hits")
+        self.stats["exact_hits" if exact else "semantic_hits"] += 1
+        return CacheHit(entry, similarity, exact, (time.perf_counter() - started) * 1000)
+
+    async def store(self, query: str, response: Dict[str, Any], scope: str = "default",
+                    ttl_seconds: Optional[float] = None, tags: Sequence[str] = ()) -> Optional[CacheEntry]:
+        """Lưu câu trả lời cho câu hỏi"""
+        if not self.enabled:
+            return None
+
+        normalized = normalize_query(query)
+        vector = await self.embedding_service.embed_one(normalized)
+        now = time.time()
+        entry = CacheEntry(
+            entry_id=str(uuid.uuid4()),
+            scope=scope,
+            query=query,
+            normalized=normalized,
+            guard=guard_tokens(query),
+            vector=vector,
+            response=copy.deepcopy(response),
+            created_at=now,
+            expires_at=now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds),
+            tags=frozenset(tags)
+        )
+
+        previous = self._exact.get((scope, normalized))
+        if previous is not None:
+            self._remove([previous])
+        self._entries[entry.entry_id] = entry
+        self._exact[(scope, normalized)] = entry.entry_id
+        index = self._scopes.setdefault(scope, _ScopeIndex())
+        index.entry_ids.append(entry.entry_id)
+        index.dirty = True
+        self._count(scope, "stores")
+
+        if self.stats["stores"] % 100 == 0:
+            self.purge_expired()
+        while len(self._entries) > self.max_entries:
+            self._remove([next(iter(self._entries))])
+            self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, scope: Optional[str] = None, tag: Optional[str] = None,
+                   predicate: Optional[Callable[[CacheEntry], bool]] = None) -> int:
+        """Xóa các entry khớp scope/tag/predicate (không truyền gì = xóa toàn bộ)"""
+        removed = [
+            entry for entry in self._entries.values()
+            if (scope is None or entry.scope == scope)
+            and (tag is None or tag in entry.tags)
+            and (predicate is None or predicate(entry))
+        ]
+        self._remove([entry.entry_id for entry in removed])
+        self.stats["invalidations"] += len(removed)
+        self._notify(removed)
+        return len(removed)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [entry for entry in self._entries.values() if entry.expires_at <= now]
+        self._remove([entry.entry_id for entry in expired])
+        self.stats["expirations"] += len(expired)
+        self._notify(expired)
+        return len(expired)
+
+    def _notify(self, entries: List[CacheEntry]):
+        if not entries:
+            return
+        for hook in self._invalidation_hooks:
+            try:
+                hook(entries)
+            except Exception as e:
+                logger.warning(f"Semantic cache invalidation hook failed: {e}")
+
+    def _remove(self, entry_ids: List[str]):
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                continue
+            if self._exact.get((entry.scope, entry.normalized)) == entry_id:
+                del self._exact[(entry.scope, entry.normalized)]
+            index = self._scopes.get(entry.scope)
+            if index is not None:
+                index.dirty = True
+
+    def _rebuild(self, index: _ScopeIndex):
+        if not index.dirty and index.matrix is not None:
+            return
+        index.entry_ids = [entry_id for entry_id in index.entry_ids if entry_id in self._entries]
+        vectors = [self._entries[entry_id].vector for entry_id in index.entry_ids]
+        dimension = len(vectors[0]) if vectors else 1
+        index.matrix = np.stack(vectors) if vectors else np.zeros((0, dimension), dtype=np.float32)
+        index.dirty = False
+
+    def should_sample(self, hit: CacheHit) -> bool:
+        """Có chạy lại pipeline thật để kiểm tra hit gần đúng này không"""
+        return not hit.exact and random.random() < self.sample_rate
+
+    async def record_sample(self, hit: CacheHit, fresh_text: str, cached_text: str, query: str) -> bool:
+        """So sánh câu trả lời mới với câu trả lời cache; trả về True nếu là false hit"""
+        vectors = await self.embedding_service.embed([fresh_text, cached_text])
+        agreement = float(vectors[0] @ vectors[1])
+        self.stats["sampled"] += 1
+        is_false_hit = agreement < self.answer_agreement
+        if is_false_hit:
+            self.stats["false_hits"] += 1
+            self.false_hit_examples.append({
+                "scope": hit.entry.scope,
+                "query": query,
+                "cached_query": hit.entry.query,
+                "similarity": round(hit.similarity, 4),
+                "answer_agreement": round(agreement, 4),
+                "timestamp": time.time()
+            })
+        return is_false_hit
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        sampled = self.stats["sampled"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "scope_thresholds": dict(self.scope_thresholds),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "false_hit_rate": self.stats["false_hits"] / sampled if sampled else None,
+            "scopes": {scope: dict(stats) for scope, stats in self.scope_stats.items()},
+            "recent_false_hits": list(self.false_hit_examples)[-10:]
+        }
+
+
+_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Cache dùng chung, cấu hình qua biến môi trường SEMANTIC_CACHE_*"""
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+            ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000")),
+            sample_rate=float(os.getenv("SEMANTIC_CACHE_SAMPLE_RATE", "0.05")),
+            enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+        )
+    return _cache
+
+
+def set_semantic_cache(cache: SemanticCache):
+    global _cache
+    _cache = cache
@@ -0,0 +1,378 @@
+"""
+Skills Index
+Chỉ mục kỹ năng dùng chung: parse skills_index.json một lần, tra cứu theo id, BM25/inverted index, facet theo category/domain và tự nạp lại khi file đổi
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from bisect import bisect_left
+from collections import OrderedDict
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import time
+
+from .embedding_service import fold_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "../../antigravity-awesome-skills/skills_index.json")
+IMPLEMENTATION_EXTENSIONS = (".md", ".txt", ".py", ".js")
+BM25_K1, BM25_B = 1.2, 0.75
+MAX_CACHED_QUERIES = 2048
+
+# Facet tính một lần lúc build (khớp chuỗi con trên name + description như trước đây)
+FACET_KEYWORDS = {
+    "domains": {
+        "education": ["education", "teaching", "learning", "academic"],
+    },
+    "functions": {
+        "content_creation": ["content", "creation", "writing", "documentation"],
+        "data_analysis": ["data", "analysis", "analytics", "research"],
+        "automation": ["automation", "workflow", "process", "orchestration"],
+    },
+    "technologies": {
+        "ai_ml": ["ai", "machine learning", "llm", "neural"],
+    },
+}
+EDUCATION_FACETS = (("domains", "education"), ("functions", "content_creation"),
+                    ("functions", "data_analysis"), ("functions", "automation"))
+
+# Dùng khi chưa có skills_index.json
+FALLBACK_SKILLS = [
+    {
+        "id": "content-creator",
+        "category": "content",
+        "name": "Content Creator",
+        "description": "Expert in creating educational content"
+    },
+    {
+        "id": "data-analyst",
+        "category": "data",
+        "name": "Data Analyst",
+        "description": "Expert in data analysis and visualization"
+    }
+]
+
+
+def tokenize(text: str) -> List[str]:
+    """Token chữ thường, bỏ dấu; tách cả theo "-" và "_" để id như "content-creator" khớp từng từ"""
+    return re.findall(r"[a-z0-9]+", fold_text(text or ""))
+
+
+class _Snapshot:
+    """Dữ liệu đã index của một phiên bản file; đổi nguyên khối khi hot reload"""
+
+    def __init__(self, skills: List[Dict[str, Any]], version: int):
+        self.version = version
+        self.skills = skills
+        self.by_id: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: List[int] = []
+        self.categories: Dict[str, List[int]] = {}
+        self.facets: Dict[str, Dict[str, List[int]]] = {name: {} for name in FACET_KEYWORDS}
+
+        for doc, skill in enumerate(skills):
+            skill_id = skill.get("id") or skill.get("name", "")
+            self.by_id.setdefault(skill_id, doc)
+            self.categories.setdefault(skill.get("category", "uncategorized"), []).append(doc)
+
+            # id/name lặp lại để có trọng số cao hơn description
+            tokens = tokenize(f"{skill_id} {skill.get('name', '')} {skill.get('name', '')} {skill.get('description', '')}")
+            self.doc_lengths.append(len(tokens))
+            for token in tokens:
+                counts = self.postings.setdefault(token, {})
+                counts[doc] = counts.get(doc, 0) + 1
+
+            text = f"{skill.get('name', '')} {skill.get('description', '')}".lower()
+            for facet, values in FACET_KEYWORDS.items():
+                for value, keywords in values.items():
+                    if any(keyword in text for keyword in keywords):
+                        self.facets[facet].setdefault(value, []).append(doc)
+
+        self.vocabulary = sorted(self.postings)
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        n = len(skills)
+        self.idf = {token: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for token, docs in self.postings.items()}
+        education = set()
+        for facet, value in EDUCATION_FACETS:
+            education.update(self.facets[facet].get(value, []))
+        self.education_relevant = sorted(education)
+        self.query_cache: Dict[Any, Any] = {}
+
+    def cache(self, key: Any, value: Any) -> Any:
+        if len(self.query_cache) >= MAX_CACHED_QUERIES:
+            self.query_cache.clear()
+        self.query_cache[key] = value
+        return value
+
+    def expand(self, token: str) -> List[str]:
+        """Các token trong vocabulary bắt đầu bằng token (giữ hành vi khớp chuỗi con kiểu "data" -> "database")"""
+        start = bisect_left(self.vocabulary, token)
+        matches = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            matches.append(term)
+        return matches
+
+
+class _Implementation:
+    __slots__ = ("dir_mtime", "file_path", "file_mtime", "text")
+
+    def __init__(self, dir_mtime: int, file_path: Optional[str], file_mtime: int, text: str):
+        self.dir_mtime = dir_mtime
+        self.file_path = file_path
+        self.file_mtime = file_mtime
+        self.text = text
+
+
+class SkillsIndex:
+    """Chỉ mục kỹ năng trong bộ nhớ, dùng chung giữa EnhancedSkillsAgent và UniversalSkillsIntegrationAgent"""
+
+    def __init__(self, path: Optional[str] = None, skills: Optional[List[Dict[str, Any]]] = None,
+                 reload_interval: float = 2.0, max_cached_implementations: int = 256):
+        self.path = os.path.abspath(path or DEFAULT_INDEX_PATH)
+        self.skills_root = os.path.dirname(self.path)
+        self.reload_interval = reload_interval
+        self.max_cached_implementations = max_cached_implementations
+        self._file_signature: Optional[Tuple[int, int]] = None
+        self._failed_signature: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+        self._implementations: "OrderedDict[str, _Implementation]" = OrderedDict()
+        self.stats = {"reloads": 0, "lookups": 0, "searches": 0, "implementation_hits": 0, "implementation_loads": 0}
+        if skills is not None:
+            # Danh sách cố định (test/embedding): không theo dõi file
+            self.reload_interval = None
+            self._snapshot = _Snapshot(skills, 1)
+        else:
+            self._snapshot = _Snapshot([], 0)
+            self.reload(force=True)
+
+    # ----- Nạp / hot reload -----
+
+    def _signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """Nạp lại nếu file đổi (mtime/size); file lỗi thì giữ bản đang dùng"""
+        signature = self._signature()
+        if not force and signature in (self._file_signature, self._failed_signature):
+            return False
+        if signature is None and self._file_signature is not None:
+            # File tạm thời biến mất (đang ghi đè/di chuyển): giữ bản đang dùng
+            return False
+        skills = None
+        if signature is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    skills = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Error loading skills index {self.path}: {e}")
+                self._failed_signature = signature
+                if self._snapshot.skills:
+                    return False
+        self._file_signature = signature
+        self._snapshot = _Snapshot(skills if isinstance(skills, list) else FALLBACK_SKILLS, self._snapshot.version + 1)
+        self.stats["reloads"] += 1
+        return True
+
+    def maybe_reload(self) -> bool:
+        """Kiểm tra file tối đa mỗi reload_interval giây (một lệnh stat)"""
+        if self.reload_interval is None:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.reload_interval
+        return self.reload()
+
+    @property
+    def snapshot(self) -> _Snapshot:
+        self.maybe_reload()
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def __len__(self) -> int:
+        return len(self.snapshot.skills)
+
+    @property
+    def skills(self) -> List[Dict[str, Any]]:
+        return self.snapshot.skills
+
+    # ----- Tra cứu -----
+
+    def get(self, skill_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot
+        self.stats["lookups"] += 1
+        doc = snapshot.by_id.get(skill_id)
+        return snapshot.skills[doc] if doc is not None else None
+
+    def by_category(self, category: str) -> List[Dict[str, Any]]:
+        snapshot = self.snapshot
+        return [snapshot.skills[doc] for doc in snapshot.categories.get(category, [])]
+
+    def facet(self, facet: str, value: str) -> List[Dict[str, Any]]:
+        snapshot = self.snapshot
+        return [snapshot.skills[doc] for doc in snapshot.facets.get(facet, {}).get(value, [])]
+
+    def education_relevant(self) -> List[Dict[str, Any]]:
+        snapshot = self.snapshot
+        return [snapshot.skills[doc] for doc in snapshot.education_relevant]
+
+    def _keyword_docs(self, snapshot: _Snapshot, keyword: str) -> set:
+        """Skill chứa mọi token của keyword (token khớp theo tiền tố)"""
+        docs = None
+        for token in tokenize(keyword):
+            matched = set()
+            for term in snapshot.expand(token):
+                matched.update(snapshot.postings[term])
+            docs = matched if docs is None else docs & matched
+            if not docs:
+                return set()
+        return docs or set()
+
+    def find_by_keywords(self, keywords: Iterable[str], education_only: bool = False) -> List[Dict[str, Any]]:
+        """Skill khớp bất kỳ keyword nào, giữ thứ tự trong file; kết quả cache theo phiên bản index"""
+        snapshot = self.snapshot
+        cache_key = ("keywords", tuple(keywords), education_only)
+        docs = snapshot.query_cache.get(cache_key)
+        if docs is None:
+            matched = set()
+            for keyword in cache_key[1]:
+                matched |= self._keyword_docs(snapshot, keyword)
+            if education_only:
+                matched &= set(snapshot.education_relevant)
+            docs = snapshot.cache(cache_key, sorted(matched))
+        return [snapshot.skills[doc] for doc in docs]
+
+    def search(self, query: str, top_k: int = 10, category: Optional[str] = None,
+               education_only: bool = False) -> List[Tuple[Dict[str, Any], float]]:
+        """Xếp hạng BM25; token không có trong vocabulary được mở rộng theo tiền tố"""
+        snapshot = self.snapshot
+        self.stats["searches"] += 1
+        cache_key = ("search", query, top_k, category, education_only)
+        ranked = snapshot.query_cache.get(cache_key)
+        if ranked is None:
+            scores: Dict[int, float] = {}
+            lengths, avg_length = snapshot.doc_lengths, snapshot.avg_length or 1.0
+            for token in set(tokenize(query)):
+                terms = [token] if token in snapshot.postings else snapshot.expand(token)
+                for term in terms:
+                    idf = snapshot.idf[term]
+                    for doc, tf in snapshot.postings[term].items():
+                        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / avg_length)
+                        scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            allowed = None
+            if category is not None:
+                allowed = set(snapshot.categories.get(category, []))
+            if education_only:
+                education = set(snapshot.education_relevant)
+                allowed = education if allowed is None else allowed & education
+            candidates = scores.items() if allowed is None else ((d, s) for d, s in scores.items() if d in allowed)
+            ranked = snapshot.cache(cache_key, heapq.nlargest(top_k, candidates, key=lambda item: (item[1], -item[0])))
+        return [(snapshot.skills[doc], round(score, 4)) for doc, score in ranked]
+
+    def ecosystem(self) -> Dict[str, Any]:
+        """Dạng categories/domains/functions/technologies mà UniversalSkillsIntegrationAgent dùng"""
+        snapshot = self.snapshot
+        view = snapshot.query_cache.get("ecosystem")
+        if view is None:
+            skills = snapshot.skills
+            view = snapshot.cache("ecosystem", {
+                "total_skills": len(skills),
+                "categories": {name: [skills[d] for d in docs] for name, docs in snapshot.categories.items()},
+                **{facet: {name: [skills[d] for d in docs] for name, docs in values.items()}
+                   for facet, values in snapshot.facets.items()},
+                "education_relevant": [skills[d] for d in snapshot.education_relevant],
+            })
+        return view
+
+    # ----- File triển khai kỹ năng -----
+
+    def _read_implementation(self, skill_dir: str) -> _Implementation:
+        dir_mtime = os.stat(skill_dir).st_mtime_ns
+        files = sorted(f for f in os.listdir(skill_dir) if f.endswith(IMPLEMENTATION_EXTENSIONS))
+        # SKILL.md là file mô tả chính của một skill nếu có
+        files.sort(key=lambda f: f.lower() != "skill.md")
+        for name in files:
+            file_path = os.path.join(skill_dir, name)
+            if os.path.isfile(file_path):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                return _Implementation(dir_mtime, file_path, os.stat(file_path).st_mtime_ns, text)
+        return _Implementation(dir_mtime, None, 0, "")
+
+    def _cached_implementation(self, skill_dir: str) -> Optional[_Implementation]:
+        entry = self._implementations.get(skill_dir)
+        if entry is None:
+            return None
+        try:
+            if os.stat(skill_dir).st_mtime_ns != entry.dir_mtime:
+                return None
+            if entry.file_path and os.stat(entry.file_path).st_mtime_ns != entry.file_mtime:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    async def load_implementation(self, skill: Dict[str, Any]) -> str:
+        """Nội dung file triển khai của skill; đọc trong thread và cache tới khi file/thư mục đổi mtime"""
+        skill_dir = os.path.normpath(os.path.join(self.skills_root, skill.get("path") or os.path.join("skills", skill.get("id", ""))))
+        entry = self._cached_implementation(skill_dir)
+        if entry is not None:
+            self.stats["implementation_hits"] += 1
+            self._implementations.move_to_end(skill_dir)
+        else:
+            try:
+                entry = await asyncio.to_thread(self._read_implementation, skill_dir)
+            except OSError as e:
+                logger.debug(f"Skill implementation unavailable for {skill_dir}: {e}")
+                return "Skill implementation not available"
+            self.stats["implementation_loads"] += 1
+            self._implementations[skill_dir] = entry
+            if len(self._implementations) > self.max_cached_implementations:
+                self._implementations.popitem(last=False)
+        return entry.text or "Skill implementation not available"
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "path": self.path,
+            "version": snapshot.version,
+            "skills": len(snapshot.skills),
+            "categories": len(snapshot.categories),
+            "vocabulary": len(snapshot.vocabulary),
+            "education_relevant": len(snapshot.education_relevant),
+            "cached_queries": len(snapshot.query_cache),
+            "cached_implementations": len(self._implementations),
+            **self.stats,
+        }
+
+
+_index: Optional[SkillsIndex] = None
+
+
+def get_skills_index() -> SkillsIndex:
+    global _index
+    if _index is None:
+        _index = SkillsIndex(
+            path=os.getenv("SKILLS_INDEX_PATH") or None,
+            reload_interval=float(os.getenv("SKILLS_RELOAD_INTERVAL", "2")),
+        )
+    return _index
+
+
+def set_skills_index(index: Optional[SkillsIndex]):
+    global _index
+    _index = index
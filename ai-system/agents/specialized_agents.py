@@ -6,13 +6,18 @@ Các agents chuyên biệt cho từng giai đoạn xử lý dữ liệu
 import asyncio
 import hashlib
 import json
+import os
 import time
-from typing import Dict, Any, List, Set, Tuple
+from typing import Dict, Any, List, Optional, Set, Tuple
 from dataclasses import dataclass
 from concurrent.futures import ThreadPoolExecutor
 import aiofiles
 import httpx
+import numpy as np
 from .base_agent import BaseAgent
+from .text_features import get_text_feature_cache
+from .embedding_service import EmbeddingIndex, get_embedding_service
+from .state_backend import SharedDict
 
 @dataclass
 class DataPacket:
@@ -463,14 +468,14 @@ class DataFilterAgent(BaseAgent):
     async def check_content_quality(self, item: Dict[str, Any], criteria: Dict[str, Any]) -> Dict[str, Any]:
         """Kiểm tra chất lượng nội dung"""
         
-        content = str(item.get("content", ""))
+        content = get_text_feature_cache().features(item.get("content", ""))
         title = str(item.get("title", ""))
         
         # Length checks
-        if len(content) < criteria.get("min_length", 50):
+        if content.char_count < criteria.get("min_length", 50):
             return {"passed": False, "reason": "Content too short", "score": 0.2}
         
-        if len(content) > criteria.get("max_length", 100000):
+        if content.char_count > criteria.get("max_length", 100000):
             return {"passed": False, "reason": "Content too long", "score": 0.3}
         
         # Required fields
@@ -487,7 +492,7 @@ class DataFilterAgent(BaseAgent):
             quality_score += 0.1
         
         # Content structure
-        if any(punct in content for punct in [".", "!", "?"]):
+        if content.has_sentence_punct:
             quality_score += 0.1
         
         return {"passed": True, "reason": "Quality OK", "score": min(quality_score, 1.0)}
@@ -495,7 +500,7 @@ class DataFilterAgent(BaseAgent):
     async def check_spam(self, item: Dict[str, Any], criteria: Dict[str, Any]) -> Dict[str, Any]:
         """Kiểm tra spam"""
         
-        content = str(item.get("content", "")).lower()
+        content = get_text_feature_cache().features(item.get("content", ""))
         source = str(item.get("source", "")).lower()
         
         spam_score = 0.0
@@ -503,7 +508,7 @@ class DataFilterAgent(BaseAgent):
         # Check blacklist keywords
         blacklist_keywords = criteria.get("blacklist_keywords", [])
         for keyword in blacklist_keywords:
-            if keyword in content:
+            if content.contains(keyword):
                 spam_score += 0.3
         
         # Check whitelist domains
@@ -516,11 +521,11 @@ class DataFilterAgent(BaseAgent):
         # Check for spam patterns
         if criteria.get("check_patterns", True):
             # Excessive capitalization
-            if content.upper() == content and len(content) > 50:
+            if content.no_cased_chars and content.char_count > 50:
                 spam_score += 0.2
             
             # Excessive punctuation
-            if content.count("!") > 3 or content.count("?") > 3:
+            if content.exclamations > 3 or content.questions > 3:
                 spam_score += 0.2
         
         is_spam = spam_score > 0.5
@@ -583,8 +588,13 @@ class DataDedupAgent(BaseAgent):
             "semantic": self.semantic_deduplication
         }
         
-        # Global dedup cache
-        self.global_cache = {}
+        # Global dedup cache (dùng chung giữa các worker); embedding vẫn là cache riêng của từng worker
+        self.global_cache = SharedDict("dedup_global_cache")
+        # Mỗi item cache được lưu {"item", "cached_at"}; quá giới hạn thì bỏ item cũ nhất (worker khác ghi là
+        # mọi worker nạp lại cả namespace, nên namespace phải có kích thước chặn trên)
+        self.global_cache_size = int(os.getenv("DEDUP_GLOBAL_CACHE_SIZE", "10000"))
+        self.global_embeddings: Optional[EmbeddingIndex] = None
+        self.embedding_cache_size = int(os.getenv("DEDUP_EMBEDDING_CACHE_SIZE", "100000"))
         self.similarity_threshold = 0.85
     
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -669,15 +679,18 @@ class DataDedupAgent(BaseAgent):
         """Fuzzy deduplication dựa trên similarity"""
         
         unique_items = []
+        unique_features = []
         duplicates = []
         similarity_threshold = config.get("similarity_threshold", self.similarity_threshold)
+        feature_cache = get_text_feature_cache()
         
         for i, item in enumerate(items):
             is_duplicate = False
+            features = feature_cache.item_features(item)
             
-            # Compare with existing unique items
-            for unique_item in unique_items:
-                similarity = await self.calculate_similarity(item, unique_item)
+            # Compare with existing unique items (token set đã tính sẵn, không tokenize lại mỗi cặp)
+            for unique_item, unique_item_features in zip(unique_items, unique_features):
+                similarity = features.jaccard(unique_item_features)
                 
                 if similarity >= similarity_threshold:
                     duplicates.append({
@@ -691,6 +704,7 @@ class DataDedupAgent(BaseAgent):
             
             if not is_duplicate:
                 unique_items.append(item)
+                unique_features.append(features)
         
         return {
             "unique_items": unique_items,
@@ -703,10 +717,110 @@ class DataDedupAgent(BaseAgent):
         }
     
     async def semantic_deduplication(self, items: List[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
-        """Semantic deduplication dựa trên meaning"""
+        """Semantic deduplication dựa trên cosine similarity của embeddings
         
+        So với embeddings của global cache và các item unique trước đó trong batch;
+        similarity được tính theo block bằng phép nhân ma trận.
+        """
+        
+        if not config.get("use_embeddings", True):
+            return await self.feature_semantic_deduplication(items, config)
+        
+        threshold = config.get("similarity_threshold", self.similarity_threshold)
+        block_size = config.get("block_size", 1024)
+        embedding_service = get_embedding_service()
+        vectors = await embedding_service.embed(
+            [f"{item.get('title', '')}\n{item.get('content', '')}" for item in items]
+        )
+        
+        index = self.global_embeddings
+        if index is None or index.dimension != vectors.shape[1]:
+            index = self.global_embeddings = EmbeddingIndex(vectors.shape[1], max_items=self.embedding_cache_size)
+        # View của ma trận tham chiếu, không copy; id/row được đọc trước khi thêm item mới ở cuối hàm
+        reference = index.matrix()
+        reference_ids = list(index.ids)
         unique_items = []
+        unique_rows: List[int] = []
         duplicates = []
+        matched_reference: List[int] = []
+        
+        for start in range(0, len(items), block_size):
+            block = vectors[start:start + block_size]
+            # Best match trong global cache và các item unique của các block trước (tính riêng, không ghép ma trận)
+            best_scores = np.full(len(block), -1.0)
+            best_ids = [""] * len(block)
+            best_reference = np.full(len(block), -1, dtype=np.int64)
+            if len(reference):
+                scores = block @ reference.T
+                best = scores.argmax(axis=1)
+                best_scores = scores[np.arange(len(block)), best]
+                best_reference = best
+                best_ids = [reference_ids[i] for i in best]
+            if unique_rows:
+                # Cùng giới hạn với global cache: chỉ so với embedding_cache_size item unique gần nhất,
+                # nên batch rất lớn vẫn tốn O(n x giới hạn) thay vì O(n^2)
+                compared = unique_rows[-self.embedding_cache_size:]
+                scores = block @ vectors[compared].T
+                best = scores.argmax(axis=1)
+                batch_scores = scores[np.arange(len(block)), best]
+                better = batch_scores > best_scores
+                for offset in np.flatnonzero(better):
+                    best_ids[offset] = items[compared[best[offset]]].get("id", "")
+                best_reference = np.where(better, -1, best_reference)
+                best_scores = np.where(better, batch_scores, best_scores)
+            
+            within = block @ block.T
+            block_unique: List[int] = []
+            for offset in range(len(block)):
+                row = start + offset
+                item = items[row]
+                score, match = float(best_scores[offset]), best_ids[offset]
+                reference_row = int(best_reference[offset])
+                if block_unique:
+                    in_block = within[offset, block_unique]
+                    position = int(in_block.argmax())
+                    if in_block[position] > score:
+                        score, match = float(in_block[position]), items[start + block_unique[position]].get("id", "")
+                        reference_row = -1
+                
+                if score >= threshold:
+                    if reference_row >= 0:
+                        matched_reference.append(reference_row)
+                    duplicates.append({
+                        **item,
+                        "duplicate_of": match,
+                        "semantic_similarity": score,
+                        "dedup_type": "semantic"
+                    })
+                else:
+                    item["semantic_features"] = await self.extract_semantic_features(item)
+                    unique_items.append(item)
+                    block_unique.append(offset)
+            unique_rows.extend(start + offset for offset in block_unique)
+        
+        if matched_reference:
+            index.touch(matched_reference)
+        new_rows = [row for row in unique_rows if items[row].get("id", "")]
+        index.add([items[row]["id"] for row in new_rows], vectors[new_rows])
+        
+        return {
+            "unique_items": unique_items,
+            "duplicates": duplicates,
+            "stats": {
+                "strategy": "semantic",
+                "semantic_threshold": threshold,
+                "embedding_model": embedding_service.embedder.name,
+                "cache_size": len(index),
+                "cache_evictions": index.evictions
+            }
+        }
+    
+    async def feature_semantic_deduplication(self, items: List[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
+        """Semantic deduplication dựa trên keyword/length features (không dùng embeddings)"""
+        
+        unique_items = []
+        duplicates = []
+        cached_items = self.cached_items()
         
         for item in items:
             # Extract semantic features
@@ -714,7 +828,7 @@ class DataDedupAgent(BaseAgent):
             
             # Check against global cache
             is_duplicate = False
-            for cached_hash, cached_item in self.global_cache.items():
+            for cached_item in cached_items:
                 semantic_similarity = await self.calculate_semantic_similarity(
                     semantic_features, cached_item.get("semantic_features", {})
                 )
@@ -746,31 +860,22 @@ class DataDedupAgent(BaseAgent):
     async def calculate_similarity(self, item1: Dict[str, Any], item2: Dict[str, Any]) -> float:
         """Tính toán similarity giữa 2 items"""
         
-        # Simple text similarity (would use more sophisticated methods)
-        text1 = f"{item1.get('title', '')} {item1.get('content', '')}"
-        text2 = f"{item2.get('title', '')} {item2.get('content', '')}"
-        
-        # Jaccard similarity
-        words1 = set(text1.lower().split())
-        words2 = set(text2.lower().split())
-        
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
-        
-        return intersection / union if union > 0 else 0.0
+        # Jaccard similarity trên token set đã cache của "title content"
+        feature_cache = get_text_feature_cache()
+        return feature_cache.item_features(item1).jaccard(feature_cache.item_features(item2))
     
     async def extract_semantic_features(self, item: Dict[str, Any]) -> Dict[str, Any]:
         """Extract semantic features từ item"""
         
-        text = f"{item.get('title', '')} {item.get('content', '')}"
+        text_features = get_text_feature_cache().item_features(item)
         
         # Simple feature extraction (would use NLP models)
         features = {
-            "word_count": len(text.split()),
-            "char_count": len(text),
-            "unique_words": len(set(text.lower().split())),
-            "keywords": self.extract_keywords(text),
-            "language": self.detect_language(text)
+            "word_count": text_features.word_count,
+            "char_count": text_features.char_count,
+            "unique_words": text_features.unique_words,
+            "keywords": list(text_features.keywords),
+            "language": text_features.language
         }
         
         return features
@@ -778,24 +883,14 @@ class DataDedupAgent(BaseAgent):
     def extract_keywords(self, text: str) -> List[str]:
         """Extract keywords từ text"""
         
-        # Simple keyword extraction (would use NLP)
-        words = text.lower().split()
-        # Filter common words and return top keywords
-        common_words = {"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for"}
-        keywords = [word for word in words if len(word) > 3 and word not in common_words]
-        
-        return keywords[:10]  # Return top 10 keywords
+        # Simple keyword extraction (would use NLP); top 10 keywords đã tính sẵn trong feature cache
+        return list(get_text_feature_cache().features(text).keywords)
     
     def detect_language(self, text: str) -> str:
         """Detect language của text"""
         
         # Simple language detection (would use proper language detection)
-        vietnamese_chars = set("àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹ")
-        
-        if any(char in vietnamese_chars for char in text.lower()):
-            return "vi"
-        else:
-            return "en"
+        return get_text_feature_cache().features(text).language
     
     async def calculate_semantic_similarity(self, features1: Dict[str, Any], features2: Dict[str, Any]) -> float:
         """Tính toán semantic similarity"""
@@ -820,10 +915,24 @@ class DataDedupAgent(BaseAgent):
     async def update_global_cache(self, unique_items: List[Dict[str, Any]]) -> None:
         """Cập nhật global cache"""
         
-        for item in unique_items:
-            item_id = item.get("id", "")
-            if item_id:
-                self.global_cache[item_id] = item
+        self.cache_items(unique_items)
+    
+    def cache_items(self, items: List[Dict[str, Any]]) -> int:
+        """Thêm item vào global cache (một lần ghi), bỏ các item cũ nhất khi vượt global_cache_size"""
+        
+        now = time.time()
+        self.global_cache.update({item["id"]: {"item": item, "cached_at": now} for item in items if item.get("id")})
+        entries = self.global_cache.snapshot()
+        overflow = len(entries) - self.global_cache_size
+        if overflow > 0:
+            oldest = sorted(entries, key=lambda key: entries[key].get("cached_at", 0))[:overflow]
+            self.global_cache.delete_many(oldest)
+        return len(entries) - max(overflow, 0)
+    
+    def cached_items(self) -> List[Dict[str, Any]]:
+        """Các item trong global cache (một lần đọc); entry dạng cũ (item trần) vẫn đọc được"""
+        
+        return [entry["item"] if "cached_at" in entry else entry for entry in self.global_cache.values()]
     
     async def find_similar_items(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Tìm các items tương tự"""
@@ -833,7 +942,7 @@ class DataDedupAgent(BaseAgent):
         
         similar_items = []
         
-        for cached_item in self.global_cache.values():
+        for cached_item in self.cached_items():
             similarity = await self.calculate_similarity(query_item, cached_item)
             
             if similarity >= threshold:
@@ -860,14 +969,11 @@ class DataDedupAgent(BaseAgent):
         
         new_items = data.get("items", [])
         
-        for item in new_items:
-            item_id = item.get("id", "")
-            if item_id:
-                self.global_cache[item_id] = item
+        cache_size = self.cache_items(new_items)
         
         return self.format_response(
             {
-                "cache_size": len(self.global_cache),
+                "cache_size": cache_size,
                 "items_added": len(new_items),
                 "cache_updated": True
             },
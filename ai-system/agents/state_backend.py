@@ -0,0 +1,606 @@
+"""
+Shared State Backend
+State dùng chung giữa các worker của gateway: backend memory (một process), SQLite (nhiều worker trên một host)
+hoặc Redis (nhiều host); SharedDict/SharedCounters có cache cục bộ kiểm tra theo version và bus invalidation
+để các cache riêng của từng worker được xóa đồng thời
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Iterable, Iterator, Mapping
+from collections.abc import MutableMapping
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKENDS = ("memory", "sqlite", "redis")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class StateBackend:
+    """Key-value theo namespace; mỗi lần ghi vào một namespace tăng version của namespace đó"""
+
+    name = "base"
+    shared = False
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any) -> int:
+        """Ghi một key; trả về version mới của namespace"""
+        return self.set_many(namespace, {key: value})
+
+    def set_many(self, namespace: str, values: Mapping[str, Any], overwrite: bool = True) -> int:
+        """Ghi nhiều key trong một lần (overwrite=False: chỉ thêm key chưa có); trả về version mới"""
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete_many(self, namespace: str, keys: Iterable[str]) -> int:
+        """Xóa nhiều key trong một lần ghi; trả về số key đã xóa"""
+        return sum(1 for key in keys if self.delete(namespace, key))
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def size(self, namespace: str) -> int:
+        return len(self.items(namespace))
+
+    def clear(self, namespace: str):
+        raise NotImplementedError
+
+    def incr(self, namespace: str, key: str, amount: float = 1) -> float:
+        """Cộng nguyên tử vào một counter; trả về giá trị mới"""
+        raise NotImplementedError
+
+    def version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "shared": self.shared}
+
+
+class MemoryStateBackend(StateBackend):
+    """State trong process (mặc định): chỉ đúng khi chạy một worker"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _bump(self, namespace: str) -> int:
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        return self._versions[namespace]
+
+    def get(self, namespace, key, default=None):
+        return self._data.get(namespace, {}).get(key, default)
+
+    def set_many(self, namespace, values, overwrite=True):
+        with self._lock:
+            data = self._data.setdefault(namespace, {})
+            for key, value in values.items():
+                if overwrite or key not in data:
+                    # Giữ ngữ nghĩa giống backend dùng chung: giá trị được lưu như bản JSON
+                    data[key] = json.loads(_dumps(value))
+            return self._bump(namespace)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            removed = self._data.get(namespace, {}).pop(key, None) is not None
+            if removed:
+                self._bump(namespace)
+            return removed
+
+    def delete_many(self, namespace, keys):
+        with self._lock:
+            data = self._data.get(namespace, {})
+            removed = sum(1 for key in keys if data.pop(key, None) is not None)
+            if removed:
+                self._bump(namespace)
+            return removed
+
+    def items(self, namespace):
+        return dict(self._data.get(namespace, {}))
+
+    def size(self, namespace):
+        return len(self._data.get(namespace, {}))
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.pop(namespace, None)
+            self._bump(namespace)
+
+    def incr(self, namespace, key, amount=1):
+        with self._lock:
+            data = self._data.setdefault(namespace, {})
+            data[key] = data.get(key, 0) + amount
+            self._bump(namespace)
+            return data[key]
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+
+class SQLiteStateBackend(StateBackend):
+    """State trong một file SQLite (WAL) dùng chung cho mọi worker trên cùng host
+
+    Mỗi process mở connection riêng (mở lại sau fork); ghi trong transaction BEGIN IMMEDIATE.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        if path == ":memory:":
+            raise ValueError("SQLiteStateBackend needs a file path shared by all workers")
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        with self._lock:
+            conn = self._connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS state_versions (
+                    namespace TEXT PRIMARY KEY, version INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def _write(self, namespace: str, apply: Callable[[sqlite3.Connection], Any]):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = apply(conn)
+                conn.execute(
+                    "INSERT INTO state_versions (namespace, version) VALUES (?, 1) "
+                    "ON CONFLICT (namespace) DO UPDATE SET version = version + 1", (namespace,)
+                )
+                version = conn.execute("SELECT version FROM state_versions WHERE namespace = ?", (namespace,)).fetchone()[0]
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return result, version
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_many(self, namespace, values, overwrite=True):
+        rows = [(namespace, str(key), _dumps(value)) for key, value in values.items()]
+        conflict = "DO UPDATE SET value = excluded.value" if overwrite else "DO NOTHING"
+        _, version = self._write(namespace, lambda conn: conn.executemany(
+            f"INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) ON CONFLICT (namespace, key) {conflict}", rows
+        ))
+        return version
+
+    def delete(self, namespace, key):
+        removed, _ = self._write(namespace, lambda conn: conn.execute(
+            "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).rowcount > 0)
+        return removed
+
+    def delete_many(self, namespace, keys):
+        rows = [(namespace, str(key)) for key in keys]
+        if not rows:
+            return 0
+        removed, _ = self._write(namespace, lambda conn: conn.executemany(
+            "DELETE FROM state WHERE namespace = ? AND key = ?", rows
+        ).rowcount)
+        return removed
+
+    def items(self, namespace):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM state WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def size(self, namespace):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM state WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+
+    def clear(self, namespace):
+        self._write(namespace, lambda conn: conn.execute("DELETE FROM state WHERE namespace = ?", (namespace,)))
+
+    def incr(self, namespace, key, amount=1):
+        def apply(conn):
+            row = conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            conn.execute(
+                "INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value", (namespace, key, _dumps(value))
+            )
+            return value
+        value, _ = self._write(namespace, apply)
+        return value
+
+    def version(self, namespace):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT version FROM state_versions WHERE namespace = ?", (namespace,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self):
+        return {**super().get_stats(), "path": self.path}
+
+
+class RedisStateBackend(StateBackend):
+    """State trên Redis cho nhiều host: mỗi namespace là một hash, version là một key INCR riêng"""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "edumanager:"):
+        import redis
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, namespace: str) -> str:
+        return f"{self.prefix}{namespace}"
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{self.prefix}{namespace}:version"
+
+    def get(self, namespace, key, default=None):
+        value = self._redis.hget(self._key(namespace), key)
+        return json.loads(value) if value is not None else default
+
+    def set_many(self, namespace, values, overwrite=True):
+        pipe = self._redis.pipeline(transaction=True)
+        for key, value in values.items():
+            if overwrite:
+                pipe.hset(self._key(namespace), key, _dumps(value))
+            else:
+                pipe.hsetnx(self._key(namespace), key, _dumps(value))
+        pipe.incr(self._version_key(namespace))
+        return int(pipe.execute()[-1])
+
+    def delete(self, namespace, key):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hdel(self._key(namespace), key)
+        pipe.incr(self._version_key(namespace))
+        return bool(pipe.execute()[0])
+
+    def delete_many(self, namespace, keys):
+        keys = list(keys)
+        if not keys:
+            return 0
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hdel(self._key(namespace), *keys)
+        pipe.incr(self._version_key(namespace))
+        return int(pipe.execute()[0])
+
+    def items(self, namespace):
+        return {k.decode(): json.loads(v) for k, v in self._redis.hgetall(self._key(namespace)).items()}
+
+    def size(self, namespace):
+        return int(self._redis.hlen(self._key(namespace)))
+
+    def clear(self, namespace):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(self._key(namespace))
+        pipe.incr(self._version_key(namespace))
+        pipe.execute()
+
+    def incr(self, namespace, key, amount=1):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hincrbyfloat(self._key(namespace), key, amount)
+        pipe.incr(self._version_key(namespace))
+        value = float(pipe.execute()[0])
+        return int(value) if value.is_integer() and isinstance(amount, int) else value
+
+    def version(self, namespace):
+        value = self._redis.get(self._version_key(namespace))
+        return int(value) if value is not None else 0
+
+    def close(self):
+        self._redis.close()
+
+    def get_stats(self):
+        return {**super().get_stats(), "url": self.url, "prefix": self.prefix}
+
+
+class SharedDict(MutableMapping):
+    """Dict nằm trên state backend, đọc qua bản sao cục bộ được nạp lại khi version namespace đổi
+
+    `defaults` là giá trị có sẵn ở mọi worker (vd. template mặc định), không ghi xuống backend;
+    `encode`/`decode` chuyển object (vd. dataclass) sang/từ dạng JSON lưu trên backend.
+    """
+
+    def __init__(self, namespace: str, backend: Optional[StateBackend] = None,
+                 defaults: Optional[Mapping[str, Any]] = None, encode: Optional[Callable[[Any], Any]] = None,
+                 decode: Optional[Callable[[Any], Any]] = None):
+        self.namespace = namespace
+        self.backend = backend or get_state_backend()
+        self.defaults = dict(defaults or {})
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+        self._cache: Dict[str, Any] = {}
+        self._version: Optional[int] = None
+        self.reloads = 0
+
+    def _view(self) -> Dict[str, Any]:
+        version = self.backend.version(self.namespace)
+        if version != self._version:
+            stored = {key: self.decode(value) for key, value in self.backend.items(self.namespace).items()}
+            self._cache = {**self.defaults, **stored}
+            self._version = version
+            self.reloads += 1
+        return self._cache
+
+    def _after_write(self, version: int, updates: Mapping[str, Any]):
+        # Không worker nào ghi xen giữa: cập nhật bản sao cục bộ thay vì nạp lại cả namespace
+        if self._version is not None and version == self._version + 1:
+            self._cache.update(updates)
+            self._version = version
+        else:
+            self._version = None
+
+    def __getitem__(self, key):
+        return self._view()[key]
+
+    def get(self, key, default=None):
+        return self._view().get(key, default)
+
+    def __contains__(self, key):
+        return key in self._view()
+
+    def __setitem__(self, key, value):
+        encoded = self.encode(value)
+        version = self.backend.set(self.namespace, key, encoded)
+        self._after_write(version, {key: self.decode(json.loads(_dumps(encoded)))})
+
+    def update(self, values: Mapping[str, Any] = (), **kwargs):
+        """Ghi nhiều key trong một lần ghi xuống backend"""
+        values = {**dict(values), **kwargs}
+        if not values:
+            return
+        encoded = {key: self.encode(value) for key, value in values.items()}
+        version = self.backend.set_many(self.namespace, encoded)
+        self._after_write(version, {key: self.decode(json.loads(_dumps(value))) for key, value in encoded.items()})
+
+    def update_missing(self, values: Mapping[str, Any]) -> int:
+        """Chỉ thêm các key chưa có (một lần ghi); trả về version mới"""
+        if not values:
+            return self.backend.version(self.namespace)
+        encoded = {key: self.encode(value) for key, value in values.items()}
+        version = self.backend.set_many(self.namespace, encoded, overwrite=False)
+        self._version = None
+        return version
+
+    def __delitem__(self, key):
+        if not self.backend.delete(self.namespace, key):
+            raise KeyError(key)
+        self._version = None
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Xóa nhiều key trong một lần ghi xuống backend"""
+        removed = self.backend.delete_many(self.namespace, keys)
+        self._version = None
+        return removed
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._view()))
+
+    def __len__(self):
+        return len(self._view())
+
+    # Mapping mặc định gọi __getitem__ (mỗi lần một truy vấn version) cho từng key; đọc một view duy nhất
+    def keys(self):
+        return self.snapshot().keys()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def clear(self):
+        self.backend.clear(self.namespace)
+        self._version = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self._view())
+
+
+class SharedCounters:
+    """Counter dùng chung (cộng nguyên tử trên backend) cho thống kê của agent"""
+
+    def __init__(self, namespace: str, defaults: Optional[Mapping[str, float]] = None,
+                 backend: Optional[StateBackend] = None):
+        self.namespace = namespace
+        self.backend = backend or get_state_backend()
+        self.defaults = dict(defaults or {})
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        return self.backend.incr(self.namespace, key, amount)
+
+    def set(self, key: str, value: float):
+        self.backend.set(self.namespace, key, value)
+
+    def get(self, key: str) -> float:
+        return self.backend.get(self.namespace, key, self.defaults.get(key, 0))
+
+    def snapshot(self) -> Dict[str, float]:
+        return {**self.defaults, **self.backend.items(self.namespace)}
+
+    def reset(self):
+        self.backend.clear(self.namespace)
+
+
+class InvalidationBus:
+    """Phát sự kiện invalidation tới mọi worker qua state backend
+
+    `publish(topic, payload)` ghi sự kiện có số thứ tự; mỗi worker `poll()` định kỳ và gọi handler đã
+    `subscribe` cho các sự kiện do worker khác phát (worker phát đã tự xử lý cục bộ).
+    """
+
+    NAMESPACE = "_invalidation"
+
+    def __init__(self, backend: Optional[StateBackend] = None, keep_events: int = 256, interval: float = 1.0):
+        self.backend = backend or get_state_backend()
+        self.keep_events = keep_events
+        self.interval = interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], Any]]] = {}
+        self._seen: Dict[str, int] = {}
+        self._gaps: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+
+    def _latest(self, topic: str) -> int:
+        return int(self.backend.get(self.NAMESPACE, topic, 0))
+
+    def subscribe(self, topic: str, handler: Callable[[Dict[str, Any]], Any]):
+        if topic not in self._handlers:
+            self._seen[topic] = self._latest(topic)
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: Optional[Dict[str, Any]] = None) -> int:
+        seq = int(self.backend.incr(self.NAMESPACE, topic))
+        events = f"{self.NAMESPACE}:{topic}"
+        self.backend.set(events, str(seq), {"origin": self.worker_id, "payload": payload or {}, "at": time.time()})
+        if seq > self.keep_events:
+            self.backend.delete(events, str(seq - self.keep_events))
+        self.published += 1
+        return seq
+
+    def poll(self) -> int:
+        """Xử lý sự kiện mới của mọi topic đã subscribe; trả về số sự kiện đã gọi handler"""
+        handled = 0
+        for topic, handlers in self._handlers.items():
+            latest = self._latest(topic)
+            seen = self._seen.get(topic, 0)
+            if latest <= seen:
+                continue
+            events = self.backend.items(f"{self.NAMESPACE}:{topic}")
+            for seq in range(max(seen + 1, latest - self.keep_events + 1), latest + 1):
+                event = events.get(str(seq))
+                if event is None:
+                    # Sự kiện đã có số thứ tự nhưng chưa kịp ghi: chờ thêm một vòng poll rồi mới bỏ qua
+                    if self._gaps.get(topic) != seq:
+                        self._gaps[topic] = seq
+                        break
+                elif event["origin"] != self.worker_id:
+                    for handler in handlers:
+                        try:
+                            handler(event["payload"])
+                        except Exception as e:
+                            logger.warning(f"Invalidation handler for {topic} failed: {e}")
+                    handled += 1
+                self._seen[topic] = seq
+            else:
+                self._gaps.pop(topic, None)
+        self.received += handled
+        return handled
+
+    def start(self):
+        """Poll nền (chỉ cần khi backend dùng chung giữa các worker)"""
+        if self.backend.shared and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Invalidation poll failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "topics": sorted(self._handlers),
+            "published": self.published,
+            "received": self.received,
+            "seen": dict(self._seen),
+        }
+
+
+def create_state_backend(kind: Optional[str] = None) -> StateBackend:
+    """Backend theo STATE_BACKEND (memory | sqlite | redis)"""
+    kind = (kind or os.getenv("STATE_BACKEND", "memory")).lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(os.getenv("STATE_SQLITE_PATH", "./data/state.db"))
+    if kind == "redis":
+        return RedisStateBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                                 os.getenv("STATE_REDIS_PREFIX", "edumanager:"))
+    raise ValueError(f"Unknown STATE_BACKEND '{kind}', expected one of {STATE_BACKENDS}")
+
+
+_backend: Optional[StateBackend] = None
+_bus: Optional[InvalidationBus] = None
+
+
+def get_state_backend() -> StateBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_state_backend()
+    return _backend
+
+
+def set_state_backend(backend: Optional[StateBackend]):
+    global _backend, _bus
+    _backend = backend
+    _bus = None
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    global _bus
+    if _bus is None:
+        _bus = InvalidationBus(interval=float(os.getenv("STATE_INVALIDATION_INTERVAL", "1")))
+    return _bus
@@ -0,0 +1,274 @@
+"""
+Structured Output for Agent Responses
+Parse tăng dần JSON do LLM sinh ra (field có ngay khi sinh xong, trước khi hết response), kiểm tra theo JSON schema và đếm lỗi/retry theo task
+"""
+
+from typing import Dict, Any, List, Optional, Callable
+from dataclasses import dataclass, field
+import json
+import threading
+
+_WHITESPACE = " \t\r\n"
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class IncrementalJSONParser:
+    """Parser JSON một lượt, nhận từng chunk của stream
+
+    Bỏ qua văn bản trước dấu `{`/`[` đầu tiên (lời dẫn, code fence). Mỗi field cấp một của object
+    gốc (hoặc phần tử của array gốc) được decode ngay khi kết thúc và báo qua `on_field`, nên caller
+    dùng được các field đầu trước khi model sinh xong. Mỗi ký tự chỉ được quét một lần.
+    """
+
+    def __init__(self, on_field: Optional[Callable[[Any, Any], None]] = None):
+        self.on_field = on_field
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.items: List[Any] = []
+        self.errors: List[str] = []
+        self.root_type: Optional[str] = None
+        self.done = False
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> "IncrementalJSONParser":
+        """Thêm một chunk và quét phần mới"""
+        if self.done or not chunk:
+            return self
+        self.text += chunk
+        text = self.text
+        i = self._pos
+        end = len(text)
+        while i < end and not self.done:
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self.root_type == "object" and self._expect == "key":
+                        self._key = self._decode(self._string_start, i + 1)
+                        self._expect = "colon"
+            elif self._root_start is None:
+                if char in "{[":
+                    self._root_start = i
+                    self._depth = 1
+                    self.root_type = "object" if char == "{" else "array"
+                    self._expect = "key" if char == "{" else "value"
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+                self._mark_value(i)
+            elif char in "{[":
+                self._mark_value(i)
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i)
+                    self.done = True
+            elif self._depth == 1:
+                if char == ":":
+                    self._expect = "value"
+                elif char == ",":
+                    self._finish_value(i)
+                    self._expect = "key" if self.root_type == "object" else "value"
+                elif char not in _WHITESPACE:
+                    self._mark_value(i)
+            i += 1
+        self._pos = i
+        return self
+
+    def _mark_value(self, index: int):
+        if self._depth == 1 and self._expect == "value" and self._value_start is None:
+            self._value_start = index
+
+    def _decode(self, start: int, end: int) -> Any:
+        return json.loads(self.text[start:end])
+
+    def _finish_value(self, end: int):
+        if self._value_start is None:
+            return
+        start, self._value_start = self._value_start, None
+        try:
+            value = self._decode(start, end)
+        except json.JSONDecodeError as e:
+            self.errors.append(f"Invalid value at offset {start}: {e.msg}")
+            return
+        if self.root_type == "object":
+            if self._key is None:
+                self.errors.append(f"Value without key at offset {start}")
+                return
+            name = self._key
+            self.fields[name] = value
+            self._key = None
+        else:
+            name = len(self.items)
+            self.items.append(value)
+        if self.on_field is not None:
+            self.on_field(name, value)
+
+    @property
+    def started(self) -> bool:
+        return self._root_start is not None
+
+    @property
+    def ok(self) -> bool:
+        return self.done and not self.errors
+
+    @property
+    def value(self) -> Any:
+        """Giá trị gốc (có thể chưa đầy đủ nếu stream bị cắt)"""
+        return self.fields if self.root_type != "array" else self.items
+
+
+def parse_json(text: str) -> IncrementalJSONParser:
+    """Parse một response hoàn chỉnh"""
+    return IncrementalJSONParser().feed(text or "")
+
+
+def validate_schema(value: Any, schema: Optional[Dict[str, Any]], path: str = "$") -> List[str]:
+    """Kiểm tra `value` theo tập con JSON Schema: type, enum, required, properties,
+    additionalProperties, items, minItems/maxItems, minimum/maximum, minLength"""
+    if not schema:
+        return []
+    errors = []
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_is_type(value, t) for t in types):
+            return [f"{path}: expected {'|'.join(types)}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field '{key}'")
+        properties = schema.get("properties", {})
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate_schema(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected field '{key}'")
+    elif isinstance(value, list):
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: expected at most {schema['maxItems']} items")
+        if "items" in schema:
+            for index, item in enumerate(value):
+                errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} < minimum {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} > maximum {schema['maximum']}")
+    elif isinstance(value, str):
+        if "minLength" in schema and len(value) < schema["minLength"]:
+            errors.append(f"{path}: shorter than {schema['minLength']} characters")
+    return errors
+
+
+def _is_type(value: Any, expected: str) -> bool:
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    python_type = _JSON_TYPES.get(expected)
+    return python_type is not None and isinstance(value, python_type)
+
+
+@dataclass
+class StructuredResult:
+    """Kết quả một lần gọi LLM ở chế độ structured output"""
+    value: Any
+    text: str
+    ok: bool
+    attempts: int = 1
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Dict kết quả; khi thất bại trả về {"raw_response": text} như extract_json_from_response"""
+        if self.ok and isinstance(self.value, dict):
+            return self.value
+        if self.ok:
+            return {"data": self.value}
+        return {"raw_response": self.text}
+
+
+@dataclass
+class TaskOutputStats:
+    """Thống kê structured output của một agent/task"""
+    requests: int = 0
+    succeeded: int = 0
+    parse_failures: int = 0
+    validation_failures: int = 0
+    retries: int = 0
+    fallbacks: int = 0
+    errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "succeeded": self.succeeded,
+            "parse_failures": self.parse_failures,
+            "validation_failures": self.validation_failures,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "success_rate": self.succeeded / self.requests if self.requests else 0.0,
+        }
+
+
+class StructuredOutputStats:
+    """Đếm lỗi parse, lỗi schema và retry theo "agent.task" """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tasks: Dict[str, TaskOutputStats] = {}
+
+    def record(self, key: str, **counts: int):
+        with self._lock:
+            stats = self.tasks.setdefault(key, TaskOutputStats())
+            for name, count in counts.items():
+                setattr(stats, name, getattr(stats, name) + count)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {key: stats.to_dict() for key, stats in sorted(self.tasks.items())}
+        totals = TaskOutputStats()
+        for stats in self.tasks.values():
+            for name in ("requests", "succeeded", "parse_failures", "validation_failures", "retries", "fallbacks", "errors"):
+                setattr(totals, name, getattr(totals, name) + getattr(stats, name))
+        return {"totals": totals.to_dict(), "tasks": tasks}
+
+    def clear(self):
+        with self._lock:
+            self.tasks.clear()
+
+
+_stats: Optional[StructuredOutputStats] = None
+
+
+def get_structured_output_stats() -> StructuredOutputStats:
+    global _stats
+    if _stats is None:
+        _stats = StructuredOutputStats()
+    return _stats
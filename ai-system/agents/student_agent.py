@@ -3,8 +3,22 @@ Student Agent - Theo dõi hiệu suất và đánh giá rủi ro học sinh
 """
 
 from typing import Dict, Any, List
+from datetime import datetime
+import asyncio
 import json
+import os
 from .base_agent import BaseAgent
+from .risk_engine import get_risk_engine
+
+RISK_EXPLANATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "warning_signs": {"type": "array", "items": {"type": "string"}},
+        "recommended_interventions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["summary"]
+}
 
 class StudentAgent(BaseAgent):
     def __init__(self):
@@ -13,10 +27,13 @@ class StudentAgent(BaseAgent):
         self.capabilities = [
             "monitor_student_progress",
             "assess_academic_risk",
+            "assess_cohort_risk",
             "analyze_behavior_patterns",
             "provide_study_support",
             "track_engagement"
         ]
+        # Số học sinh rủi ro cao nhất được LLM viết giải thích trong một lượt quét
+        self.risk_explain_top_k = int(os.getenv("RISK_EXPLAIN_TOP_K", "5"))
     
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý các tác vụ liên quan đến học sinh"""
@@ -25,6 +42,8 @@ class StudentAgent(BaseAgent):
             return await self.monitor_student_progress(data)
         elif task == "assess_academic_risk":
             return await self.assess_academic_risk(data)
+        elif task == "assess_cohort_risk":
+            return await self.assess_cohort_risk(data)
         elif task == "analyze_behavior_patterns":
             return await self.analyze_behavior_patterns(data)
         elif task == "provide_study_support":
@@ -73,8 +92,7 @@ class StudentAgent(BaseAgent):
         
         system_prompt = "Bạn là cố vấn học tập tận tâm, luôn đưa ra phân tích chi tiết và gợi ý thiết thực."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        progress_analysis = self.extract_json_from_response(response)
+        progress_analysis = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             progress_analysis,
@@ -94,6 +112,8 @@ class StudentAgent(BaseAgent):
         attendance_trend = data.get("attendance_trend", [])
         behavioral_issues = data.get("behavioral_issues", [])
         social_factors = data.get("social_factors", {})
+        # Điểm rủi ro định lượng tính sẵn để LLM giải thích thay vì tự ước lượng
+        computed_risk = get_risk_engine().score([data], grade_scale=data.get("grade_scale")).student(0)
         
         prompt = f"""
         Bạn là một chuyên gia nhận diện rủi ro học thuật. Hãy đánh giá rủi ro cho học sinh với thông tin:
@@ -103,6 +123,8 @@ class StudentAgent(BaseAgent):
         Xu hướng chuyên cần: {attendance_trend}
         Vấn đề hành vi: {behavioral_issues}
         Yếu tố xã hội: {social_factors}
+        Điểm rủi ro tính từ dữ liệu (0-1): {computed_risk["risk_score"]} ({computed_risk["risk_level"]})
+        Yếu tố đóng góp chính: {json.dumps(computed_risk["risk_factors"])}
         
         Hãy đánh giá và trả về JSON:
         {{
@@ -131,8 +153,7 @@ class StudentAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia đánh giá rủi ro, luôn nhận diện sớm và đưa ra giải pháp hiệu quả."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        risk_assessment = self.extract_json_from_response(response)
+        risk_assessment = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             risk_assessment,
@@ -144,6 +165,45 @@ class StudentAgent(BaseAgent):
             ]
         )
     
+    async def assess_cohort_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Quét rủi ro cả khóa: chấm điểm vector hóa mọi học sinh, LLM chỉ giải thích cho top-k"""
+        
+        students = data.get("students", [])
+        if not students:
+            return {"success": False, "error": "students is required", "timestamp": datetime.now().isoformat()}
+        engine = get_risk_engine()
+        limit = int(data.get("limit", 100))
+        explain_top_k = int(data.get("explain_top_k", self.risk_explain_top_k))
+        
+        cohort = engine.score(students, data.get("risk_thresholds"), data.get("grade_scale"))
+        flagged = [cohort.student(int(row)) for row in cohort.top(limit, min_score=engine.medium_risk)]
+        to_explain = flagged[:explain_top_k]
+        explanations = await asyncio.gather(*(self._explain_risk(entry) for entry in to_explain))
+        for entry, explanation in zip(to_explain, explanations):
+            entry["explanation"] = explanation
+        
+        return {
+            "success": True,
+            "summary": cohort.summary(),
+            "flagged_students": flagged,
+            "llm_calls": len(to_explain),
+            "model": engine.get_model(),
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def _explain_risk(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = f"""
+        Bạn là chuyên gia cảnh báo sớm học tập. Mô hình đã chấm điểm rủi ro cho học sinh dưới đây;
+        hãy giải thích ngắn gọn cho giáo viên chủ nhiệm dựa trên các yếu tố đóng góp và đề xuất can thiệp.
+        
+        ID học sinh: {entry["student_id"]}
+        Điểm rủi ro (0-1): {entry["risk_score"]} ({entry["risk_level"]})
+        Yếu tố đóng góp chính: {json.dumps(entry["risk_factors"])}
+        Đặc trưng (gap = thiếu hụt so với ngưỡng / 100, trend = mức giảm mỗi kỳ / 10): {json.dumps(entry["features"])}
+        """
+        result = await self.generate_structured(prompt, schema=RISK_EXPLANATION_SCHEMA)
+        return result.value if result.ok else {"summary": result.text, "error": "; ".join(result.errors)}
+    
     async def analyze_behavior_patterns(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Phân tích hành vi học tập"""
         
@@ -188,8 +248,7 @@ class StudentAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia phân tích hành vi, luôn đưa ra nhận diện sâu sắc và gợi ý hữu ích."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        behavior_analysis = self.extract_json_from_response(response)
+        behavior_analysis = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             behavior_analysis,
@@ -244,8 +303,7 @@ class StudentAgent(BaseAgent):
         
         system_prompt = "Bạn là trợ lý học tập thân thiện, luôn đưa ra giải pháp cá nhân hóa và hiệu quả."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        support_plan = self.extract_json_from_response(response)
+        support_plan = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             support_plan,
@@ -298,8 +356,7 @@ class StudentAgent(BaseAgent):
         
         system_prompt = "Bạn là chuyên gia phân tích sự tham gia, luôn đưa ra nhận diện chính xác và gợi ý cải thiện."
         
-        response = await self.call_ollama(prompt, system_prompt)
-        engagement_analysis = self.extract_json_from_response(response)
+        engagement_analysis = await self.call_ollama_json(prompt, system_prompt)
         
         return self.format_response(
             engagement_analysis,
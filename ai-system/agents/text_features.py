@@ -0,0 +1,254 @@
+"""
+Shared Text Features for Data Processing Agents
+Tính tokens, shingles, keywords, ngôn ngữ và thống kê độ dài một lần cho mỗi văn bản, dùng chung giữa filter, dedup và evaluation
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from array import array
+from collections import OrderedDict
+import hashlib
+import itertools
+import os
+import sys
+import threading
+
+STOPWORDS = frozenset({"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for"})
+VIETNAMESE_CHARS = frozenset("àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹ")
+MAX_KEYWORDS = 10
+SHINGLE_SIZE = 3
+
+_vocab_versions = itertools.count(1)
+
+
+class TokenVocab:
+    """Intern token thành id số nguyên để so sánh tập token bằng int thay vì chuỗi
+
+    Id chỉ so sánh được trong cùng một vocab; `version` phân biệt các vocab trước/sau khi reset.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.version = next(_vocab_versions)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def encode(self, tokens: List[str]) -> array:
+        ids = self.ids
+        setdefault = ids.setdefault
+        return array("i", [setdefault(token, len(ids)) for token in tokens])
+
+
+class TextFeatures:
+    """Đặc trưng của một văn bản (hoặc ghép nhiều trường của một item)"""
+
+    __slots__ = (
+        "key", "lowered", "token_ids", "token_set", "keywords", "language",
+        "char_count", "word_count", "exclamations", "questions", "has_sentence_punct",
+        "no_cased_chars", "_shingles", "nbytes", "vocab_version"
+    )
+
+    def __init__(self, key: bytes, lowered: str, token_ids: array, keywords: Tuple[str, ...],
+                 language: str, char_count: int, exclamations: int, questions: int,
+                 has_sentence_punct: bool, no_cased_chars: bool, vocab_version: int = 0):
+        self.key = key
+        self.vocab_version = vocab_version
+        self.lowered = lowered
+        self.token_ids = token_ids
+        self.token_set = frozenset(token_ids)
+        self.keywords = keywords
+        self.language = language
+        self.char_count = char_count
+        self.word_count = len(token_ids)
+        self.exclamations = exclamations
+        self.questions = questions
+        self.has_sentence_punct = has_sentence_punct
+        self.no_cased_chars = no_cased_chars
+        self._shingles: Optional[frozenset] = None
+        # Ước lượng bộ nhớ để giới hạn cache theo byte chứ không theo số entry
+        self.nbytes = (
+            sys.getsizeof(lowered) + token_ids.itemsize * len(token_ids)
+            + 40 * len(self.token_set) + 64 * len(keywords) + 256
+        )
+
+    @property
+    def unique_words(self) -> int:
+        return len(self.token_set)
+
+    @property
+    def shingles(self) -> frozenset:
+        """Hash của các shingle SHINGLE_SIZE token liên tiếp (tính khi cần lần đầu)
+
+        Chỉ so sánh được giữa các đặc trưng cùng `vocab_version`.
+        """
+        if self._shingles is None:
+            ids = self.token_ids
+            size = SHINGLE_SIZE if len(ids) >= SHINGLE_SIZE else max(len(ids), 1)
+            self._shingles = frozenset(hash(tuple(ids[i:i + size])) for i in range(max(len(ids) - size + 1, 0)))
+        return self._shingles
+
+    def contains(self, keyword: str) -> bool:
+        """Keyword (đã viết thường) có xuất hiện trong văn bản không"""
+        return keyword in self.lowered
+
+    def jaccard(self, other: "TextFeatures") -> float:
+        """Jaccard similarity trên tập token"""
+        if self.vocab_version == other.vocab_version:
+            left, right = self.token_set, other.token_set
+        else:
+            # Hai vocab khác nhau (cache bị reset giữa chừng): id không so sánh được, dùng lại token chuỗi
+            left, right = frozenset(self.lowered.split()), frozenset(other.lowered.split())
+        if not left and not right:
+            return 0.0
+        intersection = len(left & right)
+        return intersection / (len(left) + len(right) - intersection)
+
+
+class TextFeatureCache:
+    """LRU cache đặc trưng văn bản, key là hash nội dung, giới hạn theo bộ nhớ ước lượng"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_vocab: int = 2_000_000):
+        self.max_bytes = max_bytes
+        self.max_vocab = max_vocab
+        self.vocab = TokenVocab()
+        self._entries: "OrderedDict[bytes, TextFeatures]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "resets": 0}
+
+    @staticmethod
+    def content_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def features(self, text: Any) -> TextFeatures:
+        """Đặc trưng của một văn bản; tính một lần và dùng lại cho các lần gọi sau"""
+        self._maybe_reset()
+        return self._field_features(text)
+
+    def item_features(self, item: Dict[str, Any], fields: Tuple[str, ...] = ("title", "content")) -> TextFeatures:
+        """Đặc trưng của văn bản f"{title} {content}" ghép từ đặc trưng đã cache của từng trường"""
+        self._maybe_reset()
+        parts = [self._field_features(item.get(name, "")) for name in fields]
+        if len({part.vocab_version for part in parts}) > 1:
+            # Vocab bị reset (luồng khác) giữa các trường: tính lại để mọi phần cùng một vocab
+            parts = [self._field_features(item.get(name, "")) for name in fields]
+        key = b"".join(part.key for part in parts)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        return self._store(self._combine(key, parts))
+
+    def _field_features(self, text: Any) -> TextFeatures:
+        text = text if isinstance(text, str) else str(text)
+        key = self.content_key(text)
+        return self._lookup(key) or self._store(self._compute(key, text))
+
+    def _maybe_reset(self):
+        if len(self.vocab) > self.max_vocab:
+            # Id token chỉ có nghĩa trong cùng một vocab nên reset cả cache; đặc trưng cũ mà caller còn giữ
+            # mang vocab_version cũ và không bị so sánh id với đặc trưng mới
+            self.clear()
+            self.stats["resets"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.vocab = TokenVocab()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "vocab_size": len(self.vocab),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+    def _lookup(self, key: bytes) -> Optional[TextFeatures]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+
+    def _store(self, features: TextFeatures) -> TextFeatures:
+        with self._lock:
+            previous = self._entries.pop(features.key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._entries[features.key] = features
+            self.current_bytes += features.nbytes
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+        return features
+
+    def _compute(self, key: bytes, text: str) -> TextFeatures:
+        lowered = text.lower()
+        tokens = lowered.split()
+        keywords = []
+        for token in tokens:
+            if len(token) > 3 and token not in STOPWORDS:
+                keywords.append(token)
+                if len(keywords) == MAX_KEYWORDS:
+                    break
+
+        vocab = self.vocab
+        return TextFeatures(
+            key=key,
+            lowered=lowered,
+            token_ids=vocab.encode(tokens),
+            keywords=tuple(keywords),
+            language="vi" if not VIETNAMESE_CHARS.isdisjoint(lowered) else "en",
+            char_count=len(text),
+            exclamations=text.count("!"),
+            questions=text.count("?"),
+            has_sentence_punct="." in text or "!" in text or "?" in text,
+            no_cased_chars=lowered.upper() == lowered,
+            vocab_version=vocab.version,
+        )
+
+    def _combine(self, key: bytes, parts: List[TextFeatures]) -> TextFeatures:
+        token_ids = array("i")
+        keywords: List[str] = []
+        for part in parts:
+            token_ids.extend(part.token_ids)
+            keywords.extend(part.keywords)
+
+        return TextFeatures(
+            key=key,
+            lowered=" ".join(part.lowered for part in parts),
+            token_ids=token_ids,
+            keywords=tuple(keywords[:MAX_KEYWORDS]),
+            language="vi" if any(part.language == "vi" for part in parts) else "en",
+            char_count=sum(part.char_count for part in parts) + len(parts) - 1,
+            exclamations=sum(part.exclamations for part in parts),
+            questions=sum(part.questions for part in parts),
+            has_sentence_punct=any(part.has_sentence_punct for part in parts),
+            no_cased_chars=all(part.no_cased_chars for part in parts),
+            vocab_version=parts[0].vocab_version if parts else self.vocab.version,
+        )
+
+
+_cache: Optional[TextFeatureCache] = None
+
+
+def get_text_feature_cache() -> TextFeatureCache:
+    """Cache dùng chung cho mọi agent trong process"""
+    global _cache
+    if _cache is None:
+        max_mb = float(os.getenv("TEXT_FEATURE_CACHE_MB", "64"))
+        _cache = TextFeatureCache(max_bytes=int(max_mb * 1024 * 1024))
+    return _cache
+
+
+def set_text_feature_cache(cache: TextFeatureCache):
+    global _cache
+    _cache = cache
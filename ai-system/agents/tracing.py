@@ -0,0 +1,355 @@
+"""
+Request Tracing for EduManager AI System
+Theo dõi span theo từng request qua agents, tiers và LLM/HTTP calls, xuất OTLP JSON
+"""
+
+from typing import Dict, Any, List, Optional, Callable
+from dataclasses import dataclass, field
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds / status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """Một span trong trace"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = None
+    kind: int = SPAN_KIND_INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status_code: int = STATUS_UNSET
+    status_message: str = ""
+    # Span gốc của request trong process này: khóa của buffer (nhiều request có thể chung trace_id)
+    root_span_id: str = ""
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status_code = STATUS_ERROR
+        self.status_message = message
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Convert span sang OTLP JSON"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status_code}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@dataclass
+class TraceConfig:
+    """Cấu hình tracing"""
+    enabled: bool = True
+    service_name: str = "edumanager-ai-gateway"
+    export_path: Optional[str] = None
+    otlp_endpoint: Optional[str] = None
+    sample_rate: float = 0.01
+    slow_threshold_ms: float = 2000.0
+    max_spans_per_trace: int = 512
+    recent_traces: int = 50
+
+    @classmethod
+    def from_env(cls) -> "TraceConfig":
+        return cls(
+            enabled=os.getenv("TRACE_ENABLED", "true").lower() != "false",
+            service_name=os.getenv("TRACE_SERVICE_NAME", "edumanager-ai-gateway"),
+            export_path=os.getenv("TRACE_EXPORT_PATH") or None,
+            otlp_endpoint=os.getenv("TRACE_OTLP_ENDPOINT") or None,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")),
+            slow_threshold_ms=float(os.getenv("TRACE_SLOW_MS", "2000")),
+        )
+
+
+class Tracer:
+    """Tracer với tail-based sampling
+
+    Spans are buffered per root span until it finishes; the whole trace is
+    then kept if it contains an error, is slower than the threshold, or wins the
+    random sample, and dropped otherwise.
+    """
+
+    def __init__(self, config: TraceConfig = None):
+        self.config = config or TraceConfig.from_env()
+        # root span_id -> spans của request đó
+        self._buffers: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self.recent: deque = deque(maxlen=self.config.recent_traces)
+        self.stats = {
+            "traces_started": 0,
+            "traces_kept": 0,
+            "traces_dropped": 0,
+            "spans_dropped": 0,
+            "export_errors": 0
+        }
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def current_trace_id(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.trace_id if span else None
+
+    @contextmanager
+    def start_span(self, name: str, kind: int = SPAN_KIND_INTERNAL,
+                   attributes: Dict[str, Any] = None, trace_id: str = None, parent_span_id: str = None):
+        """Mở span mới, lồng dưới span hiện tại nếu có
+
+        `trace_id`/`parent_span_id` (từ header traceparent) chỉ dùng cho span gốc, nối nó vào span của bên gọi.
+        """
+        if not self.config.enabled:
+            yield Span(name=name, trace_id="", span_id="")
+            return
+
+        parent = _current_span.get()
+        span_id = uuid.uuid4().hex[:16]
+        if parent is not None:
+            trace_id, parent_id, root_id = parent.trace_id, parent.span_id, parent.root_span_id
+        else:
+            trace_id, parent_id, root_id = trace_id or uuid.uuid4().hex, parent_span_id, span_id
+
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=span_id,
+            parent_span_id=parent_id,
+            kind=kind,
+            attributes=dict(attributes or {}),
+            root_span_id=root_id
+        )
+        if parent is None:
+            with self._lock:
+                self._buffers[root_id] = []
+                self.stats["traces_started"] += 1
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if span.status_code == STATUS_UNSET:
+                span.status_code = STATUS_OK
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool):
+        with self._lock:
+            buffer = self._buffers.get(span.root_span_id)
+            if buffer is None:
+                # Span kết thúc sau root (task chạy nền) - bỏ qua
+                self.stats["spans_dropped"] += 1
+                return
+            if len(buffer) < self.config.max_spans_per_trace:
+                buffer.append(span)
+            else:
+                self.stats["spans_dropped"] += 1
+            if not is_root:
+                return
+            spans = self._buffers.pop(span.root_span_id)
+
+        if self._should_keep(span, spans):
+            self.stats["traces_kept"] += 1
+            self.recent.append(self._summarize(span, spans))
+            self._export(spans)
+        else:
+            self.stats["traces_dropped"] += 1
+
+    def _should_keep(self, root: Span, spans: List[Span]) -> bool:
+        if any(s.status_code == STATUS_ERROR for s in spans):
+            return True
+        if root.duration_ms >= self.config.slow_threshold_ms:
+            return True
+        return random.random() < self.config.sample_rate
+
+    def _summarize(self, root: Span, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "duration_ms": round(root.duration_ms, 2),
+            "error": any(s.status_code == STATUS_ERROR for s in spans),
+            "span_count": len(spans),
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_span_id": s.parent_span_id,
+                    "duration_ms": round(s.duration_ms, 2),
+                    "attributes": s.attributes,
+                    "error": s.status_message or None
+                }
+                for s in sorted(spans, key=lambda s: s.start_ns)
+            ]
+        }
+
+    def to_otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        """Đóng gói spans thành OTLP ExportTraceServiceRequest (JSON)"""
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [_otlp_attribute("service.name", self.config.service_name)]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "edumanager.tracing"},
+                    "spans": [s.to_otlp() for s in spans]
+                }]
+            }]
+        }
+
+    def _export(self, spans: List[Span]):
+        if not (self.config.export_path or self.config.otlp_endpoint):
+            return
+        payload = self.to_otlp(spans)
+
+        if self.config.export_path:
+            try:
+                line = json.dumps(payload, ensure_ascii=False)
+                with self._export_lock:
+                    with open(self.config.export_path, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+            except Exception as e:
+                self.stats["export_errors"] += 1
+                logger.warning(f"Trace file export failed: {e}")
+
+        if self.config.otlp_endpoint:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                loop.create_task(self._post_otlp(payload))
+            else:
+                threading.Thread(target=self._post_otlp_sync, args=(payload,), daemon=True).start()
+
+    def _otlp_url(self) -> str:
+        endpoint = self.config.otlp_endpoint.rstrip("/")
+        return endpoint if endpoint.endswith("/v1/traces") else f"{endpoint}/v1/traces"
+
+    async def _post_otlp(self, payload: Dict[str, Any]):
+        import httpx
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                await client.post(self._otlp_url(), json=payload)
+        except Exception as e:
+            self.stats["export_errors"] += 1
+            logger.warning(f"OTLP export failed: {e}")
+
+    def _post_otlp_sync(self, payload: Dict[str, Any]):
+        import httpx
+        try:
+            httpx.post(self._otlp_url(), json=payload, timeout=5.0)
+        except Exception as e:
+            self.stats["export_errors"] += 1
+            logger.warning(f"OTLP export failed: {e}")
+
+    def get_recent_traces(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return list(self.recent)[-limit:][::-1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "open_traces": len(self._buffers), "sample_rate": self.config.sample_rate}
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Tracer dùng chung cho toàn process"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def traced(name: str = None, kind: int = SPAN_KIND_INTERNAL,
+           attributes: Callable[..., Dict[str, Any]] = None):
+    """Decorator bọc hàm (sync hoặc async) trong một span
+
+    `attributes` nhận cùng tham số với hàm được bọc và trả về dict attributes.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        def _attrs(args, kwargs):
+            if attributes is None:
+                return {}
+            try:
+                return attributes(*args, **kwargs)
+            except Exception:
+                return {}
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_tracer().start_span(span_name, kind, _attrs(args, kwargs)):
+                    return await func(*args, **kwargs)
+            async_wrapper.__traced__ = True
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().start_span(span_name, kind, _attrs(args, kwargs)):
+                return func(*args, **kwargs)
+        wrapper.__traced__ = True
+        return wrapper
+
+    return decorator
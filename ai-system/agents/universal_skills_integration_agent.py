@@ -3,11 +3,11 @@ Universal Skills Integration Agent - Tích hợp toàn diện 634+ kỹ năng
 """
 
 from typing import Dict, Any, List, Optional
-import json
-import os
 import asyncio
 from datetime import datetime, timedelta
 from .base_agent import BaseAgent
+from .graph_engine import get_graph_engine
+from .skills_index import get_skills_index
 
 class UniversalSkillsIntegrationAgent(BaseAgent):
     def __init__(self):
@@ -26,11 +26,15 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
             "enterprise_skill_deployment"       # Triển khai kỹ năng doanh nghiệp
         ]
         
-        # Load complete skills ecosystem
-        self.skills_ecosystem = self._load_skills_ecosystem()
+        # Skills index dùng chung với EnhancedSkillsAgent (parse một lần, facet tính sẵn, tự nạp lại khi file đổi)
+        self.skills_index = get_skills_index()
         self.education_mapping = self._create_education_mapping()
         self.skill_relationships = self._build_skill_relationships()
         
+        # Đồ thị kỹ năng trong graph engine dùng chung (node "skill:<tên>", "topic:<lĩnh vực>")
+        self.skill_graph = get_graph_engine()
+        self._populate_skill_graph()
+        
         # Integration frameworks
         self.integration_frameworks = {
             "education": "edu_integration_framework",
@@ -48,79 +52,10 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
             "user_satisfaction": "feedback_analysis"
         }
     
-    def _load_skills_ecosystem(self) -> Dict[str, Any]:
-        """Load complete skills ecosystem from antigravity-awesome-skills"""
-        try:
-            skills_path = os.path.join(os.path.dirname(__file__), "../../antigravity-awesome-skills/skills_index.json")
-            if os.path.exists(skills_path):
-                with open(skills_path, 'r', encoding='utf-8') as f:
-                    skills_index = json.load(f)
-                
-                # Categorize skills by domain and function
-                ecosystem = {
-                    "total_skills": len(skills_index),
-                    "categories": {},
-                    "domains": {},
-                    "functions": {},
-                    "technologies": {},
-                    "education_relevant": []
-                }
-                
-                for skill in skills_index:
-                    category = skill.get("category", "uncategorized")
-                    name = skill.get("name", "").lower()
-                    description = skill.get("description", "").lower()
-                    
-                    # Categorize by domain
-                    if any(keyword in name or keyword in description for keyword in ["education", "teaching", "learning", "academic"]):
-                        if "education" not in ecosystem["domains"]:
-                            ecosystem["domains"]["education"] = []
-                        ecosystem["domains"]["education"].append(skill)
-                        ecosystem["education_relevant"].append(skill)
-                    
-                    # Categorize by function
-                    if any(keyword in name or keyword in description for keyword in ["content", "creation", "writing", "documentation"]):
-                        if "content_creation" not in ecosystem["functions"]:
-                            ecosystem["functions"]["content_creation"] = []
-                        ecosystem["functions"]["content_creation"].append(skill)
-                        ecosystem["education_relevant"].append(skill)
-                    
-                    if any(keyword in name or keyword in description for keyword in ["data", "analysis", "analytics", "research"]):
-                        if "data_analysis" not in ecosystem["functions"]:
-                            ecosystem["functions"]["data_analysis"] = []
-                        ecosystem["functions"]["data_analysis"].append(skill)
-                        ecosystem["education_relevant"].append(skill)
-                    
-                    if any(keyword in name or keyword in description for keyword in ["automation", "workflow", "process", "orchestration"]):
-                        if "automation" not in ecosystem["functions"]:
-                            ecosystem["functions"]["automation"] = []
-                        ecosystem["functions"]["automation"].append(skill)
-                        ecosystem["education_relevant"].append(skill)
-                    
-                    # Categorize by technology
-                    if any(keyword in name or keyword in description for keyword in ["ai", "machine learning", "llm", "neural"]):
-                        if "ai_ml" not in ecosystem["technologies"]:
-                            ecosystem["technologies"]["ai_ml"] = []
-                        ecosystem["technologies"]["ai_ml"].append(skill)
-                    
-                    # Add to categories
-                    if category not in ecosystem["categories"]:
-                        ecosystem["categories"][category] = []
-                    ecosystem["categories"][category].append(skill)
-                
-                return ecosystem
-                
-        except Exception as e:
-            print(f"Error loading skills ecosystem: {e}")
-        
-        return {
-            "total_skills": 0,
-            "categories": {},
-            "domains": {},
-            "functions": {},
-            "technologies": {},
-            "education_relevant": []
-        }
+    @property
+    def skills_ecosystem(self) -> Dict[str, Any]:
+        """Complete skills ecosystem (categories, domains, functions, technologies) from the shared skills index"""
+        return self.skills_index.ecosystem()
     
     def _create_education_mapping(self) -> Dict[str, List[str]]:
         """Create comprehensive education skills mapping"""
@@ -169,6 +104,22 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
             "education-technologist": ["instructional-design", "learning-analytics", "edtech-integration"]
         }
     
+    def _populate_skill_graph(self):
+        """Nạp kỹ năng, quan hệ phụ thuộc và ánh xạ giáo dục vào đồ thị (thêm lại cạnh đã có không tạo trùng)"""
+        graph = self.skill_graph
+        self._graph_skills_version = self.skills_index.version
+        for skill, related in self.skill_relationships.items():
+            for other in related:
+                graph.add_edge(f"skill:{skill}", f"skill:{other}", "depends_on", src_type="skill", dst_type="skill")
+        for area, skills in self.education_mapping.items():
+            for skill in skills:
+                graph.add_edge(f"skill:{skill}", f"topic:{area}", "supports", src_type="skill", dst_type="topic")
+        for category, skills in self.skills_ecosystem["categories"].items():
+            for skill in skills:
+                name = skill.get("id") or skill.get("name")
+                if name:
+                    graph.add_edge(f"skill:{name}", f"topic:{category}", "in_category", src_type="skill", dst_type="topic")
+    
     async def process(self, task: str, data: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Xử lý tác vụ tích hợp kỹ năng toàn diện"""
         
@@ -220,11 +171,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         # Categorize education skills by function
         skill_distribution = {}
         for function, skill_list in self.education_mapping.items():
-            available_skills = [skill for skill in education_skills 
-                              if any(skill_keyword in skill.get("name", "").lower() or 
-                                    skill_keyword in skill.get("description", "").lower()
-                                    for skill_keyword in skill_list)]
-            skill_distribution[function] = available_skills
+            skill_distribution[function] = self.skills_index.find_by_keywords(skill_list, education_only=True)
         
         # Integration prompt
         prompt = f"""
@@ -252,7 +199,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - ROI và benefits
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -276,15 +223,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         mapped_skills = {}
         
         for subject in subject_areas:
-            subject_skills = []
-            subject_keywords = subject.lower().split()
-            
-            for skill in self.skills_ecosystem["education_relevant"]:
-                skill_text = f"{skill.get('name', '')} {skill.get('description', '')}".lower()
-                if any(keyword in skill_text for keyword in subject_keywords):
-                    subject_skills.append(skill)
-            
-            mapped_skills[subject] = subject_skills
+            mapped_skills[subject] = self.skills_index.find_by_keywords(subject.lower().split(), education_only=True)
         
         # Mapping prompt
         prompt = f"""
@@ -312,7 +251,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Tiêu chí đánh giá
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -375,7 +314,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Giám sát và quản lý
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -426,7 +365,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Quản lý rủi ro
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -479,7 +418,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Kết quả mong đợi
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -501,12 +440,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         # Cross-domain analysis
         cross_domain_skills = {}
         for domain in source_domains:
-            domain_skills = []
-            for skill in self.skills_ecosystem["education_relevant"]:
-                skill_text = f"{skill.get('name', '')} {skill.get('description', '')}".lower()
-                if domain.lower() in skill_text:
-                    domain_skills.append(skill)
-            cross_domain_skills[domain] = domain_skills
+            cross_domain_skills[domain] = self.skills_index.find_by_keywords([domain], education_only=True)
         
         # Synthesis prompt
         prompt = f"""
@@ -534,7 +468,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Kế hoạch triển khai
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -588,7 +522,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Giám sát và tối ưu
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -607,9 +541,25 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         relationship_types = data.get("relationship_types", ["dependency", "similarity", "complementarity"])
         visualization_requirements = data.get("visualization_requirements", ["interactive", "hierarchical", "network"])
         
-        # Knowledge graph construction
-        graph_nodes = len(self.skills_ecosystem["education_relevant"])
-        graph_edges = sum(len(relations) for relations in self.skill_relationships.values())
+        skill = data.get("skill")
+        target_skill = data.get("target_skill")
+        depth = data.get("depth", 2)
+        
+        # Truy vấn đồ thị kỹ năng thật thay vì ước lượng số node/cạnh (nạp thêm skill mới nếu index vừa reload)
+        if self.skills_index.version != self._graph_skills_version:
+            self._populate_skill_graph()
+        graph = self.skill_graph
+        graph_stats = graph.get_stats()
+        graph_nodes = graph_stats["node_types"].get("skill", 0)
+        graph_edges = graph_stats["edges"]
+        central_skills = graph.top_nodes(graph.pagerank(), 10, node_types=["skill"])
+        
+        neighborhood = {}
+        learning_path = None
+        if skill and f"skill:{skill}" in graph.node_ids:
+            neighborhood = graph.k_hop(f"skill:{skill}", depth)
+            if target_skill and f"skill:{target_skill}" in graph.node_ids:
+                learning_path = graph.shortest_path(f"skill:{skill}", f"skill:{target_skill}", direction="both")
         
         # Graph prompt
         prompt = f"""
@@ -622,6 +572,8 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         Thông số đồ thị:
         - Nodes (Skills): {graph_nodes}
         - Edges (Relationships): {graph_edges}
+        - Connected components: {graph_stats["components"]}
+        - Central skills: {", ".join(item["node"] for item in central_skills[:5])}
         
         Xây dựng đồ thị kiến thức:
         1. **Node Definition**: Định nghĩa node kỹ năng
@@ -638,12 +590,21 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Ứng dụng thực tế
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
             "graph_type": graph_type,
-            "graph_metrics": {"nodes": graph_nodes, "edges": graph_edges},
+            "graph_metrics": {
+                "nodes": graph_nodes,
+                "edges": graph_edges,
+                "node_types": graph_stats["node_types"],
+                "edge_types": graph_stats["edge_types"],
+                "components": graph_stats["components"]
+            },
+            "central_skills": central_skills,
+            "skill_neighborhood": neighborhood,
+            "learning_path": learning_path,
             "relationship_types": relationship_types,
             "graph_design": ai_response,
             "visualization_requirements": visualization_requirements,
@@ -692,7 +653,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Kế hoạch triển khai
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -746,7 +707,7 @@ class UniversalSkillsIntegrationAgent(BaseAgent):
         - Chiến lược tích hợp
         """
         
-        ai_response = await self._call_ai(prompt)
+        ai_response = await self.call_ollama(prompt)
         
         return {
             "success": True,
@@ -9,6 +9,7 @@ import asyncio
 import httpx
 from datetime import datetime, timedelta
 from .base_agent import BaseAgent
+from .search_service import get_search_service
 
 class WebSearchAgent(BaseAgent):
     def __init__(self):
@@ -25,13 +26,9 @@ class WebSearchAgent(BaseAgent):
             "trend_analysis"                 # Phân tích xu hướng
         ]
         
-        # Search engines and APIs
-        self.search_engines = {
-            "duckduckgo": "https://api.duckduckgo.com/",
-            "wikipedia": "https://en.wikipedia.org/api/rest_v1/",
-            "news_api": "https://newsapi.org/v2/",
-            "arxiv": "http://export.arxiv.org/api/query?"
-        }
+        # Search engines (SEARCH_ENGINES) được gọi song song qua search service dùng chung, có cache kết quả
+        self.search_service = get_search_service()
+        self.search_engines = {engine.name: engine.base_url for engine in self.search_service.engines}
         
         # Content filters
         self.content_filters = {
@@ -86,11 +83,14 @@ class WebSearchAgent(BaseAgent):
         """
         
         try:
-            # Simulate web search (in real implementation, would call actual search APIs)
-            search_results = await self.simulate_web_search(query, search_type, max_results)
+            # Gọi song song các engine đã cấu hình (kết quả được cache theo query + search_type)
+            search = await self.search_service.search(
+                query, search_type, max_results, bypass_cache=data.get("bypass_cache", False)
+            )
+            search_results = search["results"]
             
-            # Process and synthesize results
-            ai_response = await self.call_ollama(prompt)
+            # Process and synthesize results (bỏ qua khi caller chỉ cần kết quả tìm kiếm)
+            ai_response = await self.call_ollama(prompt) if data.get("synthesize", True) else ""
             
             return {
                 "success": True,
@@ -99,6 +99,8 @@ class WebSearchAgent(BaseAgent):
                 "search_results": search_results,
                 "synthesized_content": ai_response,
                 "total_results": len(search_results),
+                "engines": search["engines"],
+                "cached": search["cached"],
                 "search_timestamp": datetime.now().isoformat(),
                 "confidence": 0.85
             }
@@ -110,56 +112,6 @@ class WebSearchAgent(BaseAgent):
                 "query": query
             }
 
-    async def simulate_web_search(self, query: str, search_type: str, max_results: int) -> List[Dict[str, Any]]:
-        """Simulate web search results (replace with actual API calls)"""
-        
-        # Simulated search results based on query
-        results = []
-        
-        # Educational content sources
-        educational_sources = [
-            {
-                "title": f"Educational Research on {query}",
-                "url": f"https://education.example.com/{query.replace(' ', '-')}",
-                "snippet": f"Latest research and findings about {query} in educational context",
-                "source": "Educational Research Journal",
-                "date": "2024-01-15",
-                "relevance": 0.95
-            },
-            {
-                "title": f"Teaching Methods for {query}",
-                "url": f"https://teaching.example.com/methods/{query.replace(' ', '-')}",
-                "snippet": f"Effective teaching strategies and methods for {query}",
-                "source": "Teaching Excellence Center",
-                "date": "2024-01-10",
-                "relevance": 0.90
-            },
-            {
-                "title": f"{query} in Modern Education",
-                "url": f"https://modern-edu.example.com/topics/{query.replace(' ', '-')}",
-                "snippet": f"Modern approaches and applications of {query} in education",
-                "source": "Modern Education Review",
-                "date": "2024-01-05",
-                "relevance": 0.88
-            }
-        ]
-        
-        # Technology sources for tech-related queries
-        if any(tech in query.lower() for tech in ["ai", "technology", "software", "digital"]):
-            tech_sources = [
-                {
-                    "title": f"AI Applications in {query}",
-                    "url": f"https://ai-tech.example.com/{query.replace(' ', '-')}",
-                    "snippet": f"Latest AI applications and technologies for {query}",
-                    "source": "AI Technology Review",
-                    "date": "2024-01-12",
-                    "relevance": 0.92
-                }
-            ]
-            educational_sources.extend(tech_sources)
-        
-        return educational_sources[:max_results]
-
     async def extract_content(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Extract content from web sources"""
         
@@ -0,0 +1 @@
+# Benchmark suite for the EduManager AI gateway and data pipeline
@@ -0,0 +1,165 @@
+"""
+Synthetic Educational Corpus
+Sinh corpus giáo dục tổng hợp (tiếng Việt/tiếng Anh) có thể tái lập, với tỉ lệ trùng lặp và gần trùng lặp điều chỉnh được
+"""
+
+from typing import Dict, Any, List, Iterator
+from dataclasses import dataclass, asdict
+import hashlib
+import math
+import random
+import time
+
+VI_WORDS = (
+    "học sinh giáo viên bài học kiến thức phương trình định lý lớp môn toán vật lý hóa học "
+    "sinh học lịch sử địa lý ngữ văn tiếng anh bài tập kiểm tra đánh giá kết quả chương trình "
+    "giáo dục nghiên cứu phát triển kỹ năng tư duy sáng tạo thực hành thí nghiệm công thức "
+    "chứng minh giải thích phân tích tổng hợp ví dụ minh họa khái niệm nguyên lý ứng dụng"
+).split()
+
+EN_WORDS = (
+    "student teacher lesson knowledge equation theorem class subject mathematics physics "
+    "chemistry biology history geography literature exercise assessment result curriculum "
+    "education research development skill thinking creative practice experiment formula "
+    "proof explanation analysis synthesis example illustration concept principle application "
+    "learning study academic"
+).split()
+
+CATEGORIES = ["education", "academic", "research", "learning", "news", "general"]
+SOURCES = [
+    "https://moet.gov.vn/tai-lieu", "https://hocmai.edu.vn/bai-giang", "https://vi.wikipedia.org/wiki",
+    "https://openstax.org/books", "https://example.com/blog", "https://khanacademy.org/lesson",
+]
+SPAM_PHRASES = ["advertisement", "spam", "BUY NOW!!!", "click here!!!"]
+
+
+@dataclass
+class CorpusConfig:
+    """Tham số sinh corpus"""
+    size: int = 1000
+    seed: int = 42
+    duplicate_rate: float = 0.10
+    near_duplicate_rate: float = 0.10
+    vietnamese_ratio: float = 0.6
+    mean_words: int = 120
+    length_sigma: float = 0.6
+    short_rate: float = 0.05
+    spam_rate: float = 0.02
+    near_duplicate_edits: int = 3
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _sentence_words(rng: random.Random, vocab: List[str], count: int) -> str:
+    words = [rng.choice(vocab) for _ in range(count)]
+    # Chia câu để có dấu câu như văn bản thật
+    parts = []
+    for i in range(0, len(words), 12):
+        sentence = " ".join(words[i:i + 12])
+        parts.append(sentence[:1].upper() + sentence[1:] + ".")
+    return " ".join(parts)
+
+
+def _perturb(rng: random.Random, text: str, vocab: List[str], edits: int) -> str:
+    words = text.split()
+    for _ in range(edits):
+        if not words:
+            break
+        position = rng.randrange(len(words))
+        if rng.random() < 0.5:
+            words[position] = rng.choice(vocab)
+        else:
+            words.insert(position, rng.choice(vocab))
+    return " ".join(words)
+
+
+def iter_corpus(config: CorpusConfig) -> Iterator[Dict[str, Any]]:
+    """Sinh từng item; trùng lặp tham chiếu tới các item gốc đã sinh trước đó
+
+    Item gốc được giữ trong một reservoir có kích thước cố định để bộ nhớ không tăng theo size.
+    """
+    rng = random.Random(config.seed)
+    reservoir: List[Dict[str, Any]] = []
+    reservoir_size = 4096
+    base_time = 1_700_000_000.0
+    mu = math.log(max(config.mean_words, 1)) - config.length_sigma ** 2 / 2
+
+    for index in range(config.size):
+        roll = rng.random()
+        item_id = f"item-{config.seed}-{index}"
+
+        if reservoir and roll < config.duplicate_rate:
+            original = rng.choice(reservoir)
+            yield {**original, "id": item_id, "metadata": dict(original["metadata"])}
+            continue
+
+        if reservoir and roll < config.duplicate_rate + config.near_duplicate_rate:
+            original = rng.choice(reservoir)
+            vocab = VI_WORDS if original["metadata"]["language"] == "vi" else EN_WORDS
+            yield {
+                **original,
+                "id": item_id,
+                "content": _perturb(rng, original["content"], vocab, config.near_duplicate_edits),
+                "metadata": dict(original["metadata"]),
+            }
+            continue
+
+        language = "vi" if rng.random() < config.vietnamese_ratio else "en"
+        vocab = VI_WORDS if language == "vi" else EN_WORDS
+        if rng.random() < config.short_rate:
+            words = rng.randint(2, 6)
+        else:
+            words = max(8, int(rng.lognormvariate(mu, config.length_sigma)))
+
+        content = _sentence_words(rng, vocab, words)
+        if rng.random() < config.spam_rate:
+            content = f"{rng.choice(SPAM_PHRASES)} {content} {rng.choice(SPAM_PHRASES)} !!!!"
+
+        item = {
+            "id": item_id,
+            "title": _sentence_words(rng, vocab, rng.randint(3, 10)).rstrip("."),
+            "content": content,
+            "source": rng.choice(SOURCES),
+            "timestamp": base_time + rng.uniform(0, 90 * 24 * 3600),
+            "metadata": {
+                "author": f"author-{rng.randint(1, 500)}",
+                "date": time.strftime("%Y-%m-%d", time.gmtime(base_time + rng.uniform(0, 3e7))),
+                "category": rng.choice(CATEGORIES),
+                "language": language,
+            },
+        }
+        if len(reservoir) < reservoir_size:
+            reservoir.append(item)
+        else:
+            reservoir[rng.randrange(reservoir_size)] = item
+        yield item
+
+
+def generate_corpus(config: CorpusConfig) -> List[Dict[str, Any]]:
+    """Sinh toàn bộ corpus vào list"""
+    return list(iter_corpus(config))
+
+
+def to_raw_reads(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Chuyển items sang dạng kết quả đọc của DataReaderAgent (đầu vào cho normalize_data)"""
+    return [
+        {
+            "source": f"{item['source']}/{item['id']}",
+            "status": "success",
+            "format": "json",
+            "content": item["content"],
+            "size": len(item["content"]),
+            "read_at": item["timestamp"],
+        }
+        for item in items
+    ]
+
+
+def corpus_fingerprint(items: List[Dict[str, Any]]) -> str:
+    """Hash ổn định của corpus để kiểm tra tính tái lập"""
+    digest = hashlib.md5()
+    for item in items:
+        digest.update(item["id"].encode())
+        digest.update(item["content"].encode())
+    return digest.hexdigest()
@@ -0,0 +1,206 @@
+"""
+Fake Ollama Server for Benchmarks
+Giả lập /api/generate, /api/tags và /api/ps với tốc độ token, time-to-first-token, thời gian load model và tỉ lệ lỗi cấu hình được
+"""
+
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_MODELS = [
+    "llama3:8b-instruct",
+    "llama3:8b",
+    "llama3:70b-instruct",
+    "mistral:7b-instruct",
+    "codellama:7b-instruct",
+]
+
+VOCABULARY = (
+    "học sinh giáo viên bài học kiến thức phương trình định lý lớp môn toán vật lý "
+    "student lesson analysis result teacher exercise knowledge learning progress"
+).split()
+
+
+@dataclass
+class FakeOllamaConfig:
+    """Cấu hình hành vi của fake Ollama"""
+    tokens_per_second: float = 50.0
+    time_to_first_token_ms: float = 200.0
+    response_tokens: int = 120
+    error_rate: float = 0.0
+    error_status: int = 500
+    jitter: float = 0.1
+    load_time_ms: float = 0.0
+    max_loaded_models: int = 1
+    models: List[str] = field(default_factory=lambda: list(DEFAULT_MODELS))
+    seed: Optional[int] = None
+
+
+def create_app(config: FakeOllamaConfig = None) -> FastAPI:
+    """Tạo FastAPI app giả lập Ollama"""
+    config = config or FakeOllamaConfig()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Fake Ollama")
+    app.state.config = config
+    app.state.stats = {"requests": 0, "errors": 0, "tokens": 0, "by_model": {}, "loads": 0, "swaps": 0}
+    # Model đang nằm trong bộ nhớ (LRU) như một host Ollama có giới hạn VRAM
+    app.state.loaded = OrderedDict()
+
+    def _delay(base_seconds: float) -> float:
+        if config.jitter <= 0:
+            return base_seconds
+        return max(0.0, base_seconds * rng.uniform(1 - config.jitter, 1 + config.jitter))
+
+    def _tokens(count: int) -> List[str]:
+        return [rng.choice(VOCABULARY) for _ in range(count)]
+
+    def _render(tokens: List[str], payload: Dict[str, Any]) -> str:
+        if payload.get("format"):
+            # JSON mode: trả về object hợp lệ
+            return json.dumps({"response": " ".join(tokens), "confidence": 0.8}, ensure_ascii=False)
+        return " ".join(tokens)
+
+    async def _ensure_loaded(model: str) -> float:
+        """Nạp model nếu chưa có (đẩy model cũ nhất ra khi đầy); trả về thời gian load (giây)"""
+        loaded = app.state.loaded
+        if model in loaded:
+            loaded.move_to_end(model)
+            return 0.0
+        while len(loaded) >= max(config.max_loaded_models, 1):
+            loaded.popitem(last=False)
+            app.state.stats["swaps"] += 1
+        loaded[model] = time.time()
+        app.state.stats["loads"] += 1
+        load_seconds = config.load_time_ms / 1000
+        if load_seconds:
+            await asyncio.sleep(load_seconds)
+        return load_seconds
+
+    def _final_chunk(model: str, prompt: str, count: int, started: float, load_seconds: float = 0.0) -> Dict[str, Any]:
+        total_ns = int((time.perf_counter() - started) * 1e9)
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "total_duration": total_ns,
+            "load_duration": int(load_seconds * 1e9) + 1_000_000,
+            "prompt_eval_count": len(prompt.split()),
+            "eval_count": count,
+            "eval_duration": int(count / max(config.tokens_per_second, 1e-6) * 1e9),
+        }
+
+    @app.get("/api/tags")
+    async def tags():
+        return {
+            "models": [
+                {"name": name, "model": name, "size": 4_000_000_000, "digest": f"fake-{i}"}
+                for i, name in enumerate(config.models)
+            ]
+        }
+
+    @app.get("/api/ps")
+    async def ps():
+        return {
+            "models": [
+                {"name": name, "model": name, "size": 4_000_000_000, "size_vram": 4_000_000_000}
+                for name in app.state.loaded
+            ]
+        }
+
+    @app.get("/api/stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "")
+        prompt = payload.get("prompt", "")
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+        started = time.perf_counter()
+
+        if model not in config.models:
+            stats["errors"] += 1
+            return JSONResponse({"error": f"model '{model}' not found"}, status_code=404)
+        if payload.get("keep_alive") in (0, "0", "0s", "0m"):
+            app.state.loaded.pop(model, None)
+            return {"model": model, "done": True, "done_reason": "unload", "response": ""}
+        load_seconds = await _ensure_loaded(model)
+        if not prompt:
+            # Prompt rỗng: chỉ nạp model (preload)
+            return {**_final_chunk(model, prompt, 0, started, load_seconds), "response": "", "done_reason": "load"}
+        if config.error_rate and rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": "injected failure"}, status_code=config.error_status)
+
+        count = config.response_tokens
+        per_token = 1.0 / max(config.tokens_per_second, 1e-6)
+        tokens = _tokens(count)
+        stats["tokens"] += count
+
+        if payload.get("stream", True):
+            async def stream():
+                await asyncio.sleep(_delay(config.time_to_first_token_ms / 1000))
+                text = _render(tokens, payload)
+                pieces = text.split(" ")
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(_delay(per_token))
+                    chunk = {"model": model, "response": piece + (" " if i < len(pieces) - 1 else ""), "done": False}
+                    yield json.dumps(chunk, ensure_ascii=False) + "\n"
+                final = _final_chunk(model, prompt, count, started, load_seconds)
+                final["response"] = ""
+                yield json.dumps(final) + "\n"
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        await asyncio.sleep(_delay(config.time_to_first_token_ms / 1000 + count * per_token))
+        result = _final_chunk(model, prompt, count, started, load_seconds)
+        result["response"] = _render(tokens, payload)
+        return result
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Thời gian nạp một model chưa resident")
+    parser.add_argument("--max-loaded-models", type=int, default=1)
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS), help="Model có trên host (phân cách bằng dấu phẩy)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeOllamaConfig(
+        tokens_per_second=args.tokens_per_second,
+        time_to_first_token_ms=args.ttft_ms,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        load_time_ms=args.load_ms,
+        max_loaded_models=args.max_loaded_models,
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
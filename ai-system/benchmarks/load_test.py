@@ -0,0 +1,412 @@
+"""
+Gateway Load Test
+Replay request fixtures vào gateway (chạy với fake Ollama), đo throughput, p50/p95/p99 và event-loop lag theo endpoint
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+AI_SYSTEM_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = AI_SYSTEM_DIR.parent
+
+CONTENT_TASKS = {
+    "generate_lesson": "/api/v1/content/generate/lesson",
+    "generate_exercise": "/api/v1/content/generate/exercise",
+    "generate_exam": "/api/v1/content/generate/exam",
+    "generate_quiz": "/api/v1/content/generate/quiz",
+}
+
+
+@dataclass
+class Scenario:
+    """Một request được replay"""
+    endpoint: str
+    payload: Dict[str, Any]
+    source: str
+
+
+@dataclass
+class EndpointResult:
+    """Kết quả đo của một endpoint"""
+    endpoint: str
+    latencies_ms: List[float] = field(default_factory=list)
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    wall_time_s: float = 0.0
+    loop_lag_ms: List[float] = field(default_factory=list)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile nội suy tuyến tính"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _chat_payload(message: str, context: str = "education_management") -> Dict[str, Any]:
+    return {"task": "chat", "data": {"message": message, "context": context}}
+
+
+def scenarios_from_fixture(obj: Dict[str, Any], source: str, agent: str = "content_generation") -> List[Scenario]:
+    """Map một fixture JSON sang các scenario tương ứng"""
+    task = obj.get("task")
+    data = obj.get("data")
+
+    if task == "chat" or (task is None and "message" in obj):
+        message = (data or obj).get("message", "")
+        return [Scenario("/api/v1/chat", _chat_payload(message), source)]
+
+    if task in CONTENT_TASKS:
+        request = {"task": task, "data": data or {}}
+        return [
+            Scenario(CONTENT_TASKS[task], request, source),
+            Scenario(f"/api/v1/ai/{agent}", request, source),
+        ]
+
+    if task and isinstance(data, dict):
+        return [Scenario(f"/api/v1/ai/{agent}", {"task": task, "data": data}, source)]
+
+    if "topic" in obj:
+        # Fixture chỉ có data của bài học
+        return [Scenario(CONTENT_TASKS["generate_lesson"], {"task": "generate_lesson", "data": obj}, source)]
+
+    # Backlog / recorded requests: dùng nội dung làm tin nhắn chat
+    message = obj.get("body") or obj.get("title") or obj.get("prompt")
+    if message:
+        return [Scenario("/api/v1/chat", _chat_payload(str(message)), source)]
+    return []
+
+
+def load_corpus(paths: List[Path]) -> List[Scenario]:
+    """Đọc các fixture test-*.json và các file JSONL"""
+    scenarios = []
+    for path in paths:
+        try:
+            if path.suffix == ".jsonl":
+                with open(path, encoding="utf-8") as f:
+                    for i, line in enumerate(f):
+                        if line.strip():
+                            scenarios.extend(scenarios_from_fixture(json.loads(line), f"{path.name}:{i + 1}"))
+            else:
+                with open(path, encoding="utf-8") as f:
+                    scenarios.extend(scenarios_from_fixture(json.load(f), path.name))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Skipping fixture {path}: {e}")
+    return scenarios
+
+
+def default_fixture_paths() -> List[Path]:
+    paths = sorted(REPO_ROOT.glob("test-*.json"))
+    paths += [p for p in (REPO_ROOT / "ai_test_request.json", REPO_ROOT / "test_request.json") if p.exists()]
+    paths += sorted(REPO_ROOT.glob("*.jsonl"))
+    return paths
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+class LoopLagProbe:
+    """Đo độ trễ event loop bằng sleep định kỳ trên loop của gateway"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[Tuple[float, float]] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected) * 1000
+            self.samples.append((time.perf_counter(), lag))
+
+    def window(self, start: float, end: float) -> List[float]:
+        return [lag for ts, lag in self.samples if start <= ts <= end]
+
+
+class InProcessGateway:
+    """Chạy gateway (main:app) trong thread riêng với event loop riêng để đo loop lag"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.probe = LoopLagProbe()
+        self._thread: Optional[threading.Thread] = None
+        self._server = None
+
+    def start(self):
+        import uvicorn
+        sys.path.insert(0, str(AI_SYSTEM_DIR))
+        import main as gateway
+
+        config = uvicorn.Config(gateway.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+
+        async def serve():
+            probe_task = asyncio.create_task(self.probe.run())
+            try:
+                await self._server.serve()
+            finally:
+                probe_task.cancel()
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(serve()), daemon=True)
+        self._thread.start()
+        _wait_for(f"http://127.0.0.1:{self.port}/")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+
+def start_fake_ollama(port: int, args) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "benchmarks.fake_ollama",
+        "--port", str(port),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--ttft-ms", str(args.ttft_ms),
+        "--response-tokens", str(args.response_tokens),
+        "--error-rate", str(args.error_rate),
+        "--load-ms", str(args.load_ms),
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, cwd=str(AI_SYSTEM_DIR))
+    _wait_for(f"http://127.0.0.1:{port}/api/tags")
+    return process
+
+
+async def run_endpoint(client: httpx.AsyncClient, base_url: str, endpoint: str, scenarios: List[Scenario],
+                       total_requests: int, concurrency: int) -> EndpointResult:
+    """Replay scenarios của một endpoint với concurrency cố định"""
+    result = EndpointResult(endpoint=endpoint)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        scenario = scenarios[i % len(scenarios)]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}{scenario.endpoint}", json=scenario.payload)
+                status = str(response.status_code)
+                if response.status_code >= 400:
+                    result.errors += 1
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                result.errors += 1
+            result.latencies_ms.append((time.perf_counter() - start) * 1000)
+            result.status_counts[status] = result.status_counts.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    result.wall_time_s = time.perf_counter() - started
+    return result
+
+
+def summarize(result: EndpointResult) -> Dict[str, Any]:
+    count = len(result.latencies_ms)
+    lag = result.loop_lag_ms
+    return {
+        "requests": count,
+        "errors": result.errors,
+        "status_counts": result.status_counts,
+        "throughput_rps": round(count / result.wall_time_s, 3) if result.wall_time_s else None,
+        "latency_ms": {
+            "mean": round(sum(result.latencies_ms) / count, 3) if count else None,
+            "p50": _round(percentile(result.latencies_ms, 50)),
+            "p95": _round(percentile(result.latencies_ms, 95)),
+            "p99": _round(percentile(result.latencies_ms, 99)),
+            "max": _round(max(result.latencies_ms) if count else None),
+        },
+        "event_loop_lag_ms": {
+            "p50": _round(percentile(lag, 50)),
+            "p99": _round(percentile(lag, 99)),
+            "max": _round(max(lag) if lag else None),
+            "samples": len(lag),
+        },
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=str(AI_SYSTEM_DIR), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """So sánh với báo cáo baseline; trả về danh sách regression"""
+    regressions = []
+    for endpoint, stats in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if not base:
+            continue
+        cur_p95, base_p95 = stats["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if cur_p95 and base_p95 and cur_p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {base_p95:.1f}ms -> {cur_p95:.1f}ms")
+        cur_rps, base_rps = stats["throughput_rps"], base["throughput_rps"]
+        if cur_rps and base_rps and cur_rps < base_rps * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {base_rps:.2f} -> {cur_rps:.2f} req/s")
+    return regressions
+
+
+async def run_load_test(base_url: str, scenarios: List[Scenario], args,
+                        probe: Optional[LoopLagProbe] = None) -> Dict[str, Dict[str, Any]]:
+    by_endpoint: Dict[str, List[Scenario]] = {}
+    for scenario in scenarios:
+        by_endpoint.setdefault(scenario.endpoint, []).append(scenario)
+    if args.endpoints:
+        by_endpoint = {k: v for k, v in by_endpoint.items() if k in args.endpoints}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    endpoints = {}
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        for endpoint, items in sorted(by_endpoint.items()):
+            print(f"▶️  {endpoint}: {args.requests} requests @ concurrency {args.concurrency} ({len(items)} fixtures)")
+            window_start = time.perf_counter()
+            result = await run_endpoint(client, base_url, endpoint, items, args.requests, args.concurrency)
+            if probe is not None:
+                result.loop_lag_ms = probe.window(window_start, time.perf_counter())
+            endpoints[endpoint] = summarize(result)
+            stats = endpoints[endpoint]
+            print(f"   {stats['throughput_rps']} req/s, p50={stats['latency_ms']['p50']}ms "
+                  f"p95={stats['latency_ms']['p95']}ms p99={stats['latency_ms']['p99']}ms errors={stats['errors']}")
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the EduManager AI gateway against a fake Ollama")
+    parser.add_argument("--gateway-url", help="Dùng gateway đang chạy thay vì khởi động in-process (không đo loop lag)")
+    parser.add_argument("--ollama-url", help="Dùng Ollama (hoặc fake) đang chạy thay vì khởi động fake_ollama")
+    parser.add_argument("--fixtures", nargs="*", type=Path, help="Fixture JSON/JSONL (mặc định: test-*.json, *.jsonl ở repo root)")
+    parser.add_argument("--endpoints", nargs="*", help="Chỉ chạy các endpoint này")
+    parser.add_argument("--requests", type=int, default=50, help="Số request mỗi endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Thời gian fake Ollama nạp một model chưa resident")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Bật semantic cache của gateway in-process (mặc định tắt để đo pipeline thật)")
+    parser.add_argument("--output", type=Path, default=Path("load_test_report.json"))
+    parser.add_argument("--baseline", type=Path, help="Báo cáo trước đó để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng regression tương đối")
+    args = parser.parse_args()
+
+    scenarios = load_corpus(args.fixtures or default_fixture_paths())
+    if not scenarios:
+        print("❌ No fixtures found")
+        return 1
+
+    fake_process = None
+    gateway = None
+    ollama_stats = None
+    try:
+        ollama_url = args.ollama_url
+        if not ollama_url:
+            port = _free_port()
+            fake_process = start_fake_ollama(port, args)
+            ollama_url = f"http://127.0.0.1:{port}"
+        os.environ["OLLAMA_URL"] = ollama_url
+        os.environ["SEMANTIC_CACHE_ENABLED"] = "true" if args.semantic_cache else "false"
+        # Kho dữ liệu in-memory: lượt đo không được ghi vào data/*.db thật
+        for name in ("CONTENT_REPOSITORY_PATH", "QUESTION_BANK_PATH", "KNOWLEDGE_STORE_PATH"):
+            os.environ[name] = ":memory:"
+        os.environ["PREDICTION_MODEL_DIR"] = ""
+
+        base_url = args.gateway_url
+        if not base_url:
+            gateway = InProcessGateway(_free_port())
+            gateway.start()
+            base_url = f"http://127.0.0.1:{gateway.port}"
+
+        endpoints = asyncio.run(run_load_test(base_url, scenarios, args, gateway.probe if gateway else None))
+        if fake_process is not None:
+            # Số lần load/swap model phía Ollama giả lập
+            ollama_stats = httpx.get(f"{ollama_url}/api/stats", timeout=5.0).json()
+    finally:
+        if gateway is not None:
+            gateway.stop()
+        if fake_process is not None:
+            fake_process.terminate()
+            fake_process.wait(timeout=10)
+
+    report = {
+        "benchmark": "gateway_load_test",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {
+            "requests_per_endpoint": args.requests,
+            "concurrency": args.concurrency,
+            "semantic_cache": args.semantic_cache,
+            "ollama_url": ollama_url,
+            "fake_ollama": None if args.ollama_url else {
+                "tokens_per_second": args.tokens_per_second,
+                "ttft_ms": args.ttft_ms,
+                "response_tokens": args.response_tokens,
+                "error_rate": args.error_rate,
+                "load_ms": args.load_ms,
+            },
+        },
+        "ollama": ollama_stats,
+        "endpoints": endpoints,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"📄 Report written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression: {line}")
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Data Pipeline Microbenchmarks
+Đo thời gian, items/sec và peak RSS cho từng stage xử lý dữ liệu, fit đường cong scaling và kiểm tra ngưỡng regression
+"""
+
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+from dataclasses import dataclass, replace
+from pathlib import Path
+from datetime import datetime
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+AI_SYSTEM_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_SYSTEM_DIR))
+
+from benchmarks.corpus import CorpusConfig, generate_corpus, to_raw_reads, corpus_fingerprint
+
+DEFAULT_THRESHOLDS = Path(__file__).resolve().parent / "pipeline_thresholds.json"
+
+
+def current_rss_bytes() -> int:
+    """RSS hiện tại của process"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSSSampler:
+    """Lấy mẫu RSS trong thread nền để ước lượng peak trong một khoảng đo"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.baseline = current_rss_bytes()
+        self.peak = self.baseline
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+    @property
+    def peak_delta_mb(self) -> float:
+        return (self.peak - self.baseline) / (1024 * 1024)
+
+
+@dataclass
+class Stage:
+    """Một stage được benchmark
+
+    `prepare` dựng agent và input (không tính giờ) từ corpus; `run` thực thi stage trên input đó.
+    `max_size` giới hạn kích thước cho các stage có độ phức tạp bậc hai.
+    """
+    name: str
+    prepare: Callable[[List[Dict[str, Any]]], Any]
+    run: Callable[[Any], Awaitable[Any]]
+    max_size: Optional[int] = None
+
+
+def _fresh(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Các stage ghi đè field lên item; mỗi lần đo dùng bản sao riêng
+    return [dict(item, metadata=dict(item["metadata"])) for item in items]
+
+
+def build_stages(chunk_size: int = 1000) -> List[Stage]:
+    from agents.specialized_agents import DataReaderAgent, DataFilterAgent, DataDedupAgent
+    from agents.distributed_data_agent import DistributedDataAgent, DataChunk, AgentType
+
+    def make_chunks(items: List[Dict[str, Any]]) -> List[DataChunk]:
+        return [
+            DataChunk(
+                chunk_id=f"bench-{i}",
+                source="benchmark",
+                content=items[i:i + chunk_size],
+                metadata={"chunk_index": i // chunk_size},
+                checksum="",
+                size=0,
+                timestamp=time.time()
+            )
+            for i in range(0, len(items), chunk_size)
+        ]
+
+    def dedup_stage(strategy: str, max_size: Optional[int] = None) -> Stage:
+        async def run(payload):
+            agent, items = payload
+            return await agent.deduplicate_data({"items": items, "strategy": strategy})
+        return Stage(f"dedup.{strategy}", lambda items: (DataDedupAgent(), _fresh(items)), run, max_size)
+
+    stages = [
+        Stage(
+            "reader.normalize_data",
+            lambda items: (DataReaderAgent(), to_raw_reads(items)),
+            lambda payload: payload[0].normalize_data({"raw_data": payload[1]})
+        ),
+        Stage(
+            "filter.filter_data",
+            lambda items: (DataFilterAgent(), _fresh(items)),
+            lambda payload: payload[0].filter_data({"items": payload[1]})
+        ),
+        dedup_stage("exact"),
+        dedup_stage("fuzzy", max_size=2_000),
+        dedup_stage("semantic", max_size=50_000),
+    ]
+
+    def distributed_stage(agent_type: AgentType) -> Stage:
+        def prepare(items):
+            chunks = make_chunks(_fresh(items))
+            if agent_type != AgentType.DATA_READER:
+                # Các stage sau data_reader nhận {"data": [...]}
+                for chunk in chunks:
+                    chunk.content = {"data": chunk.content}
+            return DistributedDataAgent(), chunks
+
+        async def run(payload):
+            agent, chunks = payload
+            return await asyncio.gather(*(agent.process_chunk_with_agent(c, agent_type) for c in chunks))
+
+        return Stage(f"distributed.{agent_type.value}", prepare, run)
+
+    stages += [distributed_stage(agent_type) for agent_type in AgentType]
+
+    async def run_pipeline(payload):
+        agent, chunks = payload
+        return await agent.execute_distributed_pipeline(chunks)
+
+    stages.append(Stage(
+        "distributed.end_to_end",
+        lambda items: (DistributedDataAgent(), make_chunks(_fresh(items))),
+        run_pipeline
+    ))
+    return stages
+
+
+def measure(stage: Stage, items: List[Dict[str, Any]], repeats: int) -> Dict[str, Any]:
+    """Chạy stage `repeats` lần, lấy thời gian tốt nhất và peak RSS lớn nhất"""
+    best = math.inf
+    peak_mb = 0.0
+    for _ in range(repeats):
+        payload = stage.prepare(items)
+        gc.collect()
+        with PeakRSSSampler() as sampler:
+            start = time.perf_counter()
+            asyncio.run(stage.run(payload))
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        peak_mb = max(peak_mb, sampler.peak_delta_mb)
+        del payload
+    return {
+        "seconds": round(best, 6),
+        "items_per_sec": round(len(items) / best, 1) if best > 0 else None,
+        "peak_rss_delta_mb": round(peak_mb, 2),
+    }
+
+
+def scaling_exponent(points: List[Dict[str, Any]], min_seconds: float = 0.005) -> Optional[float]:
+    """Hệ số k trong time ~ n^k, fit log-log bằng least squares
+
+    Các điểm quá nhanh (< min_seconds) bị bỏ vì bị chi phối bởi overhead cố định.
+    """
+    usable = [(p["size"], p["seconds"]) for p in points if p["seconds"] >= min_seconds]
+    if len(usable) < 2:
+        return None
+    xs = [math.log(n) for n, _ in usable]
+    ys = [math.log(t) for _, t in usable]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if denominator == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator, 3)
+
+
+def check_thresholds(results: Dict[str, Any], thresholds: Dict[str, Any]) -> List[str]:
+    """Trả về danh sách vi phạm ngưỡng"""
+    failures = []
+    tolerance = thresholds.get("exponent_tolerance", 0.15)
+    for name, limits in thresholds.get("stages", {}).items():
+        stage = results.get(name)
+        if not stage:
+            continue
+        exponent = stage.get("scaling_exponent")
+        max_exponent = limits.get("max_exponent")
+        if exponent is not None and max_exponent is not None and exponent > max_exponent + tolerance:
+            failures.append(f"{name}: scaling exponent {exponent} > {max_exponent} (+{tolerance})")
+        min_rate = limits.get("min_items_per_sec")
+        if min_rate is not None:
+            for point in stage["points"]:
+                rate = point.get("items_per_sec")
+                if rate is not None and point["size"] >= 1000 and rate < min_rate:
+                    failures.append(f"{name}: {rate} items/s at n={point['size']} < {min_rate}")
+    return failures
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=str(AI_SYSTEM_DIR), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(sizes: List[int], corpus_config: CorpusConfig, stage_filter: Optional[List[str]],
+                   repeats: int) -> Dict[str, Any]:
+    stages = build_stages()
+    if stage_filter:
+        stages = [s for s in stages if any(s.name.startswith(prefix) for prefix in stage_filter)]
+
+    results: Dict[str, Any] = {s.name: {"points": []} for s in stages}
+    fingerprints = {}
+    for size in sorted(sizes):
+        corpus = generate_corpus(replace(corpus_config, size=size))
+        fingerprints[size] = corpus_fingerprint(corpus)
+        for stage in stages:
+            if stage.max_size is not None and size > stage.max_size:
+                continue
+            point = {"size": size, **measure(stage, corpus, repeats)}
+            results[stage.name]["points"].append(point)
+            print(f"  {stage.name:<36} n={size:<9} {point['seconds']:>10.4f}s "
+                  f"{point['items_per_sec'] or 0:>12.0f} items/s  +{point['peak_rss_delta_mb']:.1f}MB")
+        del corpus
+        gc.collect()
+
+    for name, stage in results.items():
+        stage["scaling_exponent"] = scaling_exponent(stage["points"])
+    return {"stages": results, "corpus_fingerprints": fingerprints}
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(float(part)) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the data processing pipeline")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1e3,1e4,1e5"),
+                        help="Danh sách kích thước corpus, ví dụ 1e3,1e4,1e5,1e6,1e7")
+    parser.add_argument("--stages", nargs="*", help="Chỉ chạy các stage có prefix này (vd: dedup filter)")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.10)
+    parser.add_argument("--near-duplicate-rate", type=float, default=0.10)
+    parser.add_argument("--vietnamese-ratio", type=float, default=0.6)
+    parser.add_argument("--mean-words", type=int, default=120)
+    parser.add_argument("--thresholds", type=Path, default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--update-thresholds", action="store_true",
+                        help="Ghi lại max_exponent từ lần chạy này vào file ngưỡng")
+    parser.add_argument("--output", type=Path, default=Path("pipeline_bench_report.json"))
+    args = parser.parse_args()
+
+    corpus_config = CorpusConfig(
+        seed=args.seed,
+        duplicate_rate=args.duplicate_rate,
+        near_duplicate_rate=args.near_duplicate_rate,
+        vietnamese_ratio=args.vietnamese_ratio,
+        mean_words=args.mean_words,
+    )
+    print(f"🚀 Pipeline benchmarks, sizes={args.sizes}")
+    results = run_benchmarks(args.sizes, corpus_config, args.stages, args.repeats)
+
+    thresholds = {}
+    if args.thresholds.exists():
+        thresholds = json.loads(args.thresholds.read_text(encoding="utf-8"))
+    failures = check_thresholds(results["stages"], thresholds)
+
+    report = {
+        "benchmark": "pipeline_scaling",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "corpus": {**corpus_config.to_dict(), "sizes": args.sizes, "fingerprints": results["corpus_fingerprints"]},
+        "stages": results["stages"],
+        "threshold_failures": failures,
+    }
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"📄 Report written to {args.output}")
+
+    if args.update_thresholds:
+        stages = thresholds.setdefault("stages", {})
+        for name, stage in results["stages"].items():
+            if stage["scaling_exponent"] is not None:
+                stages.setdefault(name, {})["max_exponent"] = stage["scaling_exponent"]
+        args.thresholds.write_text(json.dumps(thresholds, indent=2) + "\n", encoding="utf-8")
+        print(f"📝 Thresholds updated in {args.thresholds}")
+        return 0
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print("✅ All stages within scaling thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
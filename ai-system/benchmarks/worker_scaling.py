@@ -0,0 +1,185 @@
+"""
+Gateway Worker Scaling Benchmark
+Chạy `uvicorn main:app --workers N` với state backend dùng chung, đo throughput các endpoint không gọi LLM
+theo số worker và hiệu suất scaling so với một worker
+"""
+
+from typing import Dict, Any, List
+from pathlib import Path
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .load_test import AI_SYSTEM_DIR, _free_port, _wait_for, git_commit, percentile, _round
+
+# Endpoint chỉ dùng CPU của gateway và state dùng chung (không gọi Ollama)
+DEFAULT_ENDPOINTS = [
+    "/api/v1/skills/search?q=python%20data%20analysis&top_k=5",
+    "/api/v1/content/templates",
+    "/api/v1/multi-tier-status",
+    "/api/v1/knowledge/search?query=machine%20learning&limit=5",
+]
+
+
+def start_gateway(port: int, workers: int, state_dir: Path, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "STATE_BACKEND": args.state_backend,
+        "STATE_SQLITE_PATH": str(state_dir / "state.db"),
+        "KNOWLEDGE_STORE_PATH": str(state_dir / "knowledge.db"),
+        "WEB_CONCURRENCY": str(workers),
+        # Không có Ollama: circuit mở ngay, probe thưa để không chiếm CPU
+        "OLLAMA_URL": "http://127.0.0.1:9",
+        "OLLAMA_HEALTH_INTERVAL": "3600",
+        "TRACE_ENABLED": "false",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=str(AI_SYSTEM_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def stop_gateway(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _client(base_url: str, endpoints: List[str], concurrency: int, duration: float, queue):
+    """Một process client: `concurrency` request đồng thời trong `duration` giây"""
+
+    async def run():
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=limits) as client:
+            async def loop(offset: int):
+                nonlocal errors
+                i = offset
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(endpoints[i % len(endpoints)])
+                        if response.status_code >= 400:
+                            errors += 1
+                        else:
+                            latencies.append(time.perf_counter() - started)
+                    except httpx.HTTPError:
+                        errors += 1
+                    i += 1
+            await asyncio.gather(*(loop(i) for i in range(concurrency)))
+        return latencies, errors
+
+    queue.put(asyncio.run(run()))
+
+
+def measure(base_url: str, endpoints: List[str], clients: int, concurrency: int, duration: float) -> Dict[str, Any]:
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_client, args=(base_url, endpoints, concurrency, duration, queue))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    latencies = [l for result in results for l in result[0]]
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "throughput_rps": _round(len(latencies) / duration),
+        "p50_ms": _round(percentile(latencies, 50) * 1000) if latencies else None,
+        "p95_ms": _round(percentile(latencies, 95) * 1000) if latencies else None,
+    }
+
+
+def run(args) -> Dict[str, Any]:
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            state_dir = Path(tmp) / f"w{workers}"
+            state_dir.mkdir()
+            port = _free_port()
+            process = start_gateway(port, workers, state_dir, args)
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                _wait_for(f"{base_url}/health", timeout=120.0)
+                # Warmup: mọi worker nạp xong index, template, kết nối SQLite
+                measure(base_url, args.endpoints, args.clients, args.concurrency, args.warmup)
+                result = measure(base_url, args.endpoints, args.clients, args.concurrency, args.duration)
+            finally:
+                stop_gateway(process)
+            result["workers"] = workers
+            runs.append(result)
+            print(f"workers={workers}: {result['throughput_rps']} req/s, p95={result['p95_ms']}ms, errors={result['errors']}")
+
+    base = runs[0]["throughput_rps"] / runs[0]["workers"] if runs and runs[0]["throughput_rps"] else None
+    for result in runs:
+        result["speedup"] = _round(result["throughput_rps"] / runs[0]["throughput_rps"]) if base else None
+        result["efficiency"] = _round(result["throughput_rps"] / (base * result["workers"])) if base else None
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "state_backend": args.state_backend,
+        "endpoints": args.endpoints,
+        "clients": args.clients,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "runs": runs,
+    }
+
+
+def check_efficiency(report: Dict[str, Any], min_efficiency: float) -> List[str]:
+    """Chỉ đánh giá số worker không vượt quá số CPU (client cũng cần CPU)"""
+    problems = []
+    for result in report["runs"]:
+        if result["workers"] > 1 and result["workers"] <= (report["cpu_count"] or 1) \
+                and (result["efficiency"] or 0) < min_efficiency:
+            problems.append(f"workers={result['workers']}: efficiency {result['efficiency']} < {min_efficiency}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gateway throughput scaling with uvicorn worker count")
+    parser.add_argument("--workers", type=lambda v: [int(x) for x in v.split(",")], default=[1, 2, 4],
+                        help="Số worker cần đo, vd. 1,2,4")
+    parser.add_argument("--state-backend", default="sqlite", choices=["memory", "sqlite", "redis"])
+    parser.add_argument("--endpoints", nargs="*", default=DEFAULT_ENDPOINTS)
+    parser.add_argument("--clients", type=int, default=2, help="Số process client sinh tải")
+    parser.add_argument("--concurrency", type=int, default=16, help="Request đồng thời mỗi process client")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--min-efficiency", type=float, default=0.7)
+    parser.add_argument("--output", type=Path, default=Path("worker_scaling_report.json"))
+    args = parser.parse_args()
+
+    report = run(args)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Report written to {args.output}")
+
+    if report["cpu_count"] and max(args.workers) > report["cpu_count"]:
+        print(f"⚠️ Only {report['cpu_count']} CPUs: runs with more workers cannot scale")
+    problems = check_efficiency(report, args.min_efficiency)
+    for problem in problems:
+        print(f"❌ {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
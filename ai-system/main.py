@@ -3,7 +3,7 @@ EduManager AI Gateway - Main FastAPI Application
 Local AI System with Multi-Agents for School Management
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -16,6 +16,8 @@ from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -35,6 +37,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request tracing middleware
+from agents.tracing import get_tracer, SPAN_KIND_SERVER
+from agents.model_manager import get_model_manager
+from agents.ollama_health import get_ollama_health
+from agents.base_agent import contains_llm_error, is_llm_error
+from agents.ollama_pool import get_ollama_pool
+from agents.structured_output import get_structured_output_stats
+from agents.search_service import get_search_service
+from agents.graph_engine import DIRECTIONS, get_graph_engine, save_graph_snapshot
+from agents.skills_index import get_skills_index
+from agents.content_repository import get_content_repository
+from agents.question_bank import get_question_bank
+from agents.pregeneration_scheduler import get_pregeneration_scheduler
+from agents.risk_engine import get_risk_engine
+from agents.prediction_models import get_model_registry, model_scope
+from agents.state_backend import get_state_backend, get_invalidation_bus
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Mở root span cho mỗi request và trả trace id qua header X-Trace-Id"""
+    trace_id = parent_span_id = None
+    traceparent = request.headers.get("traceparent", "")
+    parts = traceparent.split("-")
+    if len(parts) == 4 and len(parts[1]) == 32:
+        trace_id = parts[1]
+        parent_span_id = parts[2] if len(parts[2]) == 16 else None
+    
+    attributes = {"http.method": request.method, "http.target": request.url.path}
+    with get_tracer().start_span(f"{request.method} {request.url.path}", SPAN_KIND_SERVER, attributes,
+                                 trace_id=trace_id, parent_span_id=parent_span_id) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
 # Import agents
 from agents.academic_agent import AcademicAgent
 from agents.student_agent import StudentAgent
@@ -137,6 +176,34 @@ agent_manager = AgentManager()
 async def startup_event():
     """Initialize services on startup"""
     await agent_manager.initialize()
+    
+    # Probe Ollama ở nền: /health chỉ đọc trạng thái có sẵn, circuit breaker chặn request khi Ollama sập
+    get_ollama_health().start()
+    
+    # Nhiều worker: cache riêng của từng worker được xóa theo sự kiện invalidation của worker khác
+    if WEB_CONCURRENCY > 1 and not get_state_backend().shared:
+        print(f"⚠️ WEB_CONCURRENCY={WEB_CONCURRENCY} with STATE_BACKEND=memory: agent state is not shared between workers")
+    bus = get_invalidation_bus()
+    bus.subscribe("semantic_cache", lambda payload: semantic_cache.invalidate(**payload))
+    bus.subscribe("search_cache", lambda payload: get_search_service().invalidate(**payload))
+    bus.start()
+    
+    # Tạo trước nội dung cho các môn trong catalog vào khung giờ thấp điểm (PREGEN_ENABLED/PREGEN_WINDOWS)
+    get_pregeneration_scheduler().start(agent_manager.get_agent("content_generation"))
+    
+    # Nạp trước các model cấu hình trong OLLAMA_PRELOAD_MODELS (không chặn startup)
+    model_manager = get_model_manager()
+    if model_manager.config.preload_models:
+        asyncio.create_task(model_manager.preload())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist shared state on shutdown"""
+    # Lưu snapshot đồ thị kỹ năng/kiến thức (GRAPH_SNAPSHOT_PATH)
+    save_graph_snapshot()
+    await get_ollama_health().stop()
+    await get_invalidation_bus().stop()
+    await get_pregeneration_scheduler().stop()
 
 @app.get("/")
 async def root():
@@ -159,25 +226,14 @@ async def health_check():
         except Exception as e:
             agents_status[name] = f"unhealthy: {str(e)}"
     
+    ollama = get_ollama_health().snapshot()
     return {
-        "status": "healthy",
+        "status": "healthy" if ollama["circuit"]["state"] != "open" else "degraded",
         "agents": agents_status,
-        "ollama_status": await check_ollama_status()
+        "ollama_status": ollama["status"],
+        "ollama": ollama
     }
 
-async def check_ollama_status():
-    """Check if Ollama is running"""
-    try:
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://localhost:11434/api/tags", timeout=5.0)
-            if response.status_code == 200:
-                return "healthy"
-            else:
-                return "unhealthy"
-    except Exception:
-        return "unhealthy"
-
 @app.post("/api/v1/ai/{agent_name}")
 async def call_agent(agent_name: str, request: AIRequest):
     """Main endpoint to call AI agents"""
@@ -230,7 +286,7 @@ async def list_models():
     try:
         import httpx
         async with httpx.AsyncClient() as client:
-            response = await client.get("http://localhost:11434/api/tags")
+            response = await client.get(f"{OLLAMA_URL}/api/tags")
             if response.status_code == 200:
                 return response.json()
             else:
@@ -238,6 +294,36 @@ async def list_models():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching models: {str(e)}")
 
+@app.get("/api/v1/models/status")
+async def models_status():
+    """Resident models (from /api/ps), model swaps, load times and per-model queues"""
+    model_manager = get_model_manager()
+    await model_manager.refresh_resident()
+    return {
+        "success": True,
+        "status": model_manager.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/models/backends")
+async def models_backends():
+    """Ollama backends in the pool: routing load, latency, model inventory and ejection state"""
+    return {
+        "success": True,
+        "pool": get_ollama_pool().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/models/preload")
+async def preload_models(request: AIRequest):
+    """Preload models with keep_alive (data.models, default OLLAMA_PRELOAD_MODELS)"""
+    results = await get_model_manager().preload(request.data.get("models"))
+    return {
+        "success": all(r["success"] for r in results.values()),
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.post("/api/v1/ai/download-model/{model_name}")
 async def download_model(model_name: str):
     """Download a specific Ollama model"""
@@ -245,7 +331,7 @@ async def download_model(model_name: str):
         import httpx
         async with httpx.AsyncClient() as client:
             response = await client.post(
-                "http://localhost:11434/api/pull",
+                f"{OLLAMA_URL}/api/pull",
                 json={"name": model_name}
             )
             if response.status_code == 200:
@@ -555,6 +641,36 @@ async def personalize_content(request: AIRequest):
             detail=f"Error personalizing content: {str(e)}"
         )
 
+@app.post("/api/v1/content/personalize/batch")
+async def personalize_content_batch(request: AIRequest):
+    """Personalize one content item for a whole class, one LLM call per profile cluster"""
+    try:
+        agent = agent_manager.get_agent("content_generation")
+        if not agent:
+            raise HTTPException(status_code=404, detail="Content generation agent not found")
+        
+        import time
+        start_time = time.time()
+        
+        result = await agent.process("personalize_content_batch", request.data)
+        
+        processing_time = time.time() - start_time
+        
+        return AIResponse(
+            agent="content_generation",
+            task="personalize_content_batch",
+            response=result,
+            confidence=result.get("confidence", 0.8),
+            processing_time=processing_time,
+            suggestions=result.get("suggestions", [])
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error personalizing content batch: {str(e)}"
+        )
+
 @app.post("/api/v1/content/assess-quality")
 async def assess_content_quality(request: AIRequest):
     """Assess content quality using AI"""
@@ -618,6 +734,209 @@ async def get_content_templates():
             detail=f"Error getting templates: {str(e)}"
         )
 
+@app.get("/api/v1/content/repository/stats")
+async def get_content_repository_stats():
+    """Get stored content counts, compression ratio and reuse-before-generate hit rate"""
+    return {
+        "success": True,
+        "stats": get_content_repository().get_stats(),
+        "recent": get_content_repository().recent(limit=20),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/content/question-bank/stats")
+async def get_question_bank_stats():
+    """Get question counts per type and exam assembly statistics"""
+    return {
+        "success": True,
+        "stats": get_question_bank().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/content/question-bank/questions")
+async def add_bank_questions(request: AIRequest):
+    """Import questions into the bank (data: subject, topic, difficulty, questions)"""
+    data = request.data
+    if not data.get("subject") or not data.get("questions"):
+        raise HTTPException(status_code=400, detail="subject and questions are required")
+    ids = get_question_bank().add_questions(data["questions"], data["subject"], data.get("topic", ""),
+                                            difficulty=data.get("difficulty"))
+    return {
+        "success": True,
+        "question_ids": ids,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/content/pregeneration/status")
+async def get_pregeneration_status():
+    """Get off-peak pregeneration windows, cursor, budget usage and last run"""
+    return {
+        "success": True,
+        "scheduler": get_pregeneration_scheduler().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/content/pregeneration/run")
+async def run_pregeneration(max_jobs: int = 10):
+    """Pregenerate up to max_jobs catalog contents now (still bounded by the current window budget)"""
+    scheduler = get_pregeneration_scheduler()
+    if scheduler.running:
+        raise HTTPException(status_code=409, detail="Pregeneration is already running")
+    return {
+        "success": True,
+        "run": await scheduler.run_now(max_jobs=max_jobs),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/content/items/{content_id}")
+async def get_content_item(content_id: str):
+    """Get a generated lesson/exercise/exam/quiz by id"""
+    record = get_content_repository().get(content_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Content not found: {content_id}")
+    return {
+        "success": True,
+        "content": record,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/students/risk/sweep")
+async def sweep_cohort_risk(request: AIRequest):
+    """Score early-warning risk for a whole cohort; the LLM only explains the top-k flagged students"""
+    try:
+        agent = agent_manager.get_agent("student")
+        if not agent:
+            raise HTTPException(status_code=404, detail="Student agent not found")
+        
+        import time
+        start_time = time.time()
+        
+        result = await agent.process("assess_cohort_risk", request.data)
+        
+        processing_time = time.time() - start_time
+        
+        return AIResponse(
+            agent="student",
+            task="assess_cohort_risk",
+            response=result,
+            confidence=result.get("confidence", 0.85),
+            processing_time=processing_time,
+            suggestions=result.get("suggestions", [])
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error sweeping cohort risk: {str(e)}"
+        )
+
+@app.get("/api/v1/students/risk/model")
+async def get_risk_model():
+    """Get the risk model weights, thresholds and sweep statistics"""
+    engine = get_risk_engine()
+    return {
+        "success": True,
+        "model": engine.get_model(),
+        "stats": engine.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/students/risk/model/train")
+async def train_risk_model(request: AIRequest):
+    """Fit risk weights from historical outcomes (data: students, labels with 1 = became at risk, optional grade_scale)"""
+    data = request.data
+    try:
+        # Huấn luyện (scikit-learn) chạy ngoài event loop; trọng số được lưu lên state backend cho mọi worker
+        trained = await asyncio.to_thread(get_risk_engine().fit, data.get("students", []), data.get("labels", []),
+                                          regularization=float(data.get("regularization", 1.0)),
+                                          grade_scale=data.get("grade_scale"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "model": trained,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/predictions/records")
+async def add_prediction_records(request: AIRequest):
+    """Add graded outcomes (data: course_id or program, records with final_grade); retrains when enough are new"""
+    data = request.data
+    if not data.get("records"):
+        raise HTTPException(status_code=400, detail="records is required")
+    scope = model_scope(data.get("course_id"), data.get("program"))
+    result = await asyncio.to_thread(get_model_registry().add_records, scope, data["records"],
+                                     data.get("retrain", True))
+    return {
+        "success": True,
+        "scope": scope,
+        **result,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/predictions/train")
+async def train_prediction_model(request: AIRequest):
+    """Train a new model version (data: course_id or program, kind: ridge/gradient_boosting/auto)"""
+    data = request.data
+    scope = model_scope(data.get("course_id"), data.get("program"))
+    try:
+        entry = await asyncio.to_thread(get_model_registry().train, scope, data.get("kind"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "model": entry,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/predictions/predict")
+async def predict_performance(request: AIRequest):
+    """Predict final grades for a whole class in one vectorized call (data: course_id or program, students, pass_grade)"""
+    data = request.data
+    if not data.get("students"):
+        raise HTTPException(status_code=400, detail="students is required")
+    agent = agent_manager.get_agent("education_data")
+    try:
+        prediction = await asyncio.to_thread(get_model_registry().predict,
+                                             model_scope(data.get("course_id"), data.get("program")),
+                                             data["students"], version=data.get("version"))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "success": True,
+        "predictions": prediction.students(float(data.get("pass_grade", agent.pass_grade))),
+        "model": prediction.to_metadata(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/predictions/models")
+async def list_prediction_models(scope: Optional[str] = None):
+    """List model versions (optionally for one scope, e.g. course:MATH101) and registry statistics"""
+    registry = get_model_registry()
+    return {
+        "success": True,
+        "models": registry.versions(scope),
+        "stats": registry.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/v1/predictions/models/activate")
+async def activate_prediction_model(request: AIRequest):
+    """Switch the active version of a scope, e.g. to roll back a retrained model (data: scope or course_id/program, version)"""
+    data = request.data
+    if data.get("version") is None:
+        raise HTTPException(status_code=400, detail="version is required")
+    scope = data.get("scope") or model_scope(data.get("course_id"), data.get("program"))
+    try:
+        entry = get_model_registry().activate(scope, int(data["version"]))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "success": True,
+        "model": entry,
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Import agents
 from agents.academic_agent import AcademicAgent
 from agents.student_agent import StudentAgent
@@ -639,7 +958,8 @@ from agents.ai_training_system import AITrainingSystem
 from agents.ai_training_pipeline import AITrainingPipeline
 from agents.web_search_agent import WebSearchAgent
 from agents.knowledge_integration_agent import KnowledgeIntegrationAgent
-from agents.multi_tier_system_manager import MultiTierAgentSystemManager
+from agents.multi_tier_system_manager import MultiTierAgentSystemManager, PipelineOverloadedError
+from agents.semantic_cache import get_semantic_cache
 
 # Initialize agents
 academic_agent = AcademicAgent()
@@ -687,14 +1007,76 @@ knowledge_integration_agent = KnowledgeIntegrationAgent()
 # Initialize Multi-Tier System Manager
 multi_tier_manager = MultiTierAgentSystemManager()
 
+# Semantic response cache (shared with the multi-tier manager)
+semantic_cache = get_semantic_cache()
+
+@app.exception_handler(PipelineOverloadedError)
+async def pipeline_overloaded_handler(request: Request, exc: PipelineOverloadedError):
+    """Multi-tier system at capacity: tell the client to retry later"""
+    return JSONResponse(
+        status_code=429,
+        content={
+            "success": False,
+            "error": str(exc),
+            "retry_after": exc.retry_after,
+            "timestamp": datetime.now().isoformat()
+        },
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
 @app.post("/api/v1/chat")
 async def chat_endpoint(request: AIRequest):
+    """Chat endpoint with a semantic response cache in front of the agents"""
+    message = request.data.get("message", "")
+    context = request.data.get("context", "general")
+    bypass = bool(request.data.get("bypass_cache") or (request.context or {}).get("bypass_cache"))
+    scope = f"chat:{context}"
+    
+    hit = await semantic_cache.lookup(message, scope, bypass=bypass)
+    if hit is not None:
+        if semantic_cache.should_sample(hit):
+            asyncio.create_task(verify_cached_chat(request, hit))
+        return {
+            **hit.response,
+            "timestamp": datetime.now().isoformat(),
+            "cache": hit.to_metadata()
+        }
+    
+    result = await generate_chat_response(request)
+    # Circuit mở: câu trả lời có thể là response cũ (degraded), không cache
+    if result.get("success") and not contains_llm_error(str(result.get("response", ""))) and not bypass \
+            and get_ollama_health().available:
+        await semantic_cache.store(message, result, scope, tags=["chat"])
+    return {**result, "cache": {"hit": False, "bypassed": bypass}}
+
+async def verify_cached_chat(request: AIRequest, hit):
+    """Chạy lại pipeline cho một hit được lấy mẫu để đo tỉ lệ false hit"""
+    try:
+        message = request.data.get("message", "")
+        fresh = await generate_chat_response(request)
+        # Lần chạy lại bị lỗi (hoặc degraded) không dùng để so sánh, tránh thay câu trả lời tốt bằng thông báo lỗi
+        if not fresh.get("success") or contains_llm_error(str(fresh.get("response", ""))) \
+                or not get_ollama_health().available:
+            return
+        is_false_hit = await semantic_cache.record_sample(
+            hit, str(fresh.get("response", "")), str(hit.entry.response.get("response", "")), message
+        )
+        if is_false_hit:
+            # Câu trả lời cũ không còn đúng cho câu hỏi này: thay bằng câu trả lời mới
+            semantic_cache.invalidate(predicate=lambda entry: entry.entry_id == hit.entry.entry_id)
+            await semantic_cache.store(message, fresh, hit.entry.scope, tags=["chat"])
+    except Exception as e:
+        print(f"Semantic cache verification failed: {str(e)}")
+
+async def generate_chat_response(request: AIRequest):
     """Enhanced chat endpoint that uses actual AI agents"""
     try:
         # Get message from request data
         message = request.data.get("message", "")
         context = request.data.get("context", "general")
         message_lower = message.lower()
+        # False khi agent/LLM lỗi: câu trả lời vẫn gửi cho người dùng nhưng không được cache
+        success = True
         
         # Route to appropriate agent based on message content
         if any(keyword in message_lower for keyword in ["xin chào", "hello", "chào"]):
@@ -774,6 +1156,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 🤖 **Agent sử dụng:** Content Generation Agent với model {content_generation_agent.model}"""
             else:
                 response = f"❌ Lỗi tạo bài học: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["tạo giáo trình", "curriculum", "giáo trình mới"]):
             # Use Content Generation Agent for curriculum
@@ -814,6 +1197,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 🤖 **Agent sử dụng:** Content Generation Agent với model {content_generation_agent.model}"""
             else:
                 response = f"❌ Lỗi tạo giáo trình: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["huấn luyện ai", "ai training", "reinforcement learning", "fine-tuning"]):
             # Use AI Training System
@@ -844,6 +1228,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi huấn luyện AI: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["pipeline huấn luyện", "training pipeline", "automated training"]):
             # Use AI Training Pipeline
@@ -873,6 +1258,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi pipeline: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["fine-tuning", "supervised training", "model tuning"]):
             # Use AI Training System for fine-tuning
@@ -903,6 +1289,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi fine-tuning: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["học liên tục", "continuous learning", "adaptive learning"]):
             # Use AI Training System for continuous learning
@@ -931,6 +1318,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi học tập liên tục: {result.get('error', 'Lỗi không xác định')}"
+                success = False
             # Use Universal Skills Integration Agent
             result = await universal_skills_agent.process("universal_skill_integration", {
                 "integration_scope": "comprehensive",
@@ -957,6 +1345,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi tích hợp toàn diện: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["hệ sinh thái kỹ năng", "skill ecosystem", "xây dựng hệ thống"]):
             # Use Universal Skills Integration Agent for ecosystem building
@@ -985,6 +1374,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi xây dựng hệ sinh thái: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["triển khai doanh nghiệp", "enterprise deployment", "quy mô lớn"]):
             # Use Universal Skills Integration Agent for enterprise deployment
@@ -1011,6 +1401,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi triển khai doanh nghiệp: {result.get('error', 'Lỗi không xác định')}"
+                success = False
             # Use Enhanced Skills Agent
             result = await enhanced_skills_agent.process("skill_integration", {
                 "domain": "education",
@@ -1032,6 +1423,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi tích hợp kỹ năng: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["đề xuất kỹ năng", "skill recommendation", "recommend skills"]):
             # Use Enhanced Skills Agent for recommendations
@@ -1055,6 +1447,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi đề xuất kỹ năng: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["lộ trình kỹ năng", "skill learning path", "learn skills"]):
             # Use Enhanced Skills Agent for learning path
@@ -1080,6 +1473,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi tạo lộ trình kỹ năng: {result.get('error', 'Lỗi không xác định')}"
+                success = False
             # Use Advanced Academic Agent
             result = await advanced_academic_agent.process("deep_learning_analysis", {
                 "student_id": "from_chat",
@@ -1103,6 +1497,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi phân tích sâu: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["dự báo", "predict", "risk", "cảnh báo sớm"]):
             # Use Advanced Student Agent for early warning
@@ -1126,6 +1521,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi dự báo: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["lộ trình cá nhân hóa", "personalized learning", "adaptive"]):
             # Use Advanced Academic Agent for personalized learning
@@ -1150,6 +1546,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi tạo lộ trình: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["tối ưu giảng dạy", "optimize teaching", "pedagogical analysis"]):
             # Use Advanced Teacher Agent
@@ -1174,6 +1571,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi phân tích giảng dạy: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["sức khỏe tinh thần", "mental health", "wellbeing"]):
             # Use Advanced Student Agent for mental health
@@ -1198,6 +1596,7 @@ Bạn cần hỗ trợ với kỹ năng nâng cao nào?"""
 """
             else:
                 response = f"❌ Lỗi đánh giá sức khỏe tinh thần: {result.get('error', 'Lỗi không xác định')}"
+                success = False
             # Use Analytics Agent
             result = await analytics_agent.process("analyze_data", {
                 "data_type": "learning_performance",
@@ -1335,6 +1734,7 @@ Tôi sẽ tạo bộ bài tập phù hợp!"""
                     ollama_prompt = f"Tạo đề thi {subject} lớp 10, thời gian {duration} phút, gồm {tn_count} câu trắc nghiệm và {tl_count} câu tự luận. Đề thi phải có độ khó tăng dần và đáp án chi tiết."
                     
                     ollama_response = await content_generation_agent.call_ollama(ollama_prompt)
+                    success = not is_llm_error(ollama_response)
                     
                     response = f"""✅ **ĐỀ THI ĐÃ TẠO BẰNG AI!**
 
@@ -1349,6 +1749,7 @@ Tôi sẽ tạo bộ bài tập phù hợp!"""
                     
             except Exception as e:
                 response = f"❌ Lỗi tạo đề thi: {str(e)}"
+                success = False
         
         elif "help" in message_lower or "giúp" in message_lower or "hỗ trợ" in message_lower:
             response = """**🤖 AI TRỢ LÝ GIÁO DỤC EDUMANAGER**
@@ -1515,6 +1916,7 @@ Tôi sẽ:
 """
             else:
                 response = f"❌ Lỗi hệ thống multi-tier: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["tìm kiếm", "search", "tìm thông tin", "research", "web search"]):
             # Use Web Search Agent
@@ -1544,6 +1946,7 @@ Tôi sẽ:
 """
             else:
                 response = f"❌ Lỗi tìm kiếm: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["cập nhật kiến thức", "knowledge update", "học từ internet", "internet learning", "real-time learning"]):
             # Use Knowledge Integration Agent
@@ -1567,12 +1970,14 @@ Tôi sẽ:
 - Số nguồn: {result.get('sources_count', 0)}
 - Độ tin cậy: {result.get('credibility_score', 0):.1%}
 - Phạm vi: {result.get('integration_scope', 'comprehensive')}
+- Nguồn dữ liệu: {'kho kiến thức (còn mới)' if result.get('reused') else 'internet'}
 
 🤖 **Agent sử dụng:** Knowledge Integration Agent
 📈 **Thời gian cập nhật:** {result.get('integration_timestamp', 'N/A')}
 """
             else:
                 response = f"❌ Lỗi cập nhật kiến thức: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["huấn luyện với internet", "web enhanced training", "ai training with web", "online learning"]):
             # Use Knowledge Integration Agent for web enhanced training
@@ -1602,6 +2007,7 @@ Tôi sẽ:
 """
             else:
                 response = f"❌ Lỗi huấn luyện tăng cường: {result.get('error', 'Lỗi không xác định')}"
+                success = False
         
         elif any(keyword in message_lower for keyword in ["hệ thống đa tầng", "multi-tier", "xử lý nâng cao", "leann", "vector search"]):
             # Use Multi-Tier System Manager
@@ -1632,6 +2038,7 @@ Tôi sẽ:
 ✅ Response - Tạo phản hồi cuối cùng
 """
             else:
+                success = False
                 response = f"""Tôi đã nhận được tin nhắn: "{message}"
 
 Tôi la AI tro ly giao duc chuyen sau, co the giup ban voi cac van de cu the ve:
@@ -1724,8 +2131,10 @@ Tôi là AI trợ lý giáo dục chuyên sâu, có thể giúp bạn với các
 
 Toi san sang phan tich va dua ra giai phap chi tiet cho van de cua ban!"""
         
+        # Agent trả về thông báo lỗi LLM đã được bọc trong câu trả lời: vẫn là lỗi
+        success = success and not contains_llm_error(response)
         return {
-            "success": True,
+            "success": success,
             "response": response,
             "timestamp": datetime.now().isoformat(),
             "agent": "enhanced_chat_agent",
@@ -1733,6 +2142,8 @@ Toi san sang phan tich va dua ra giai phap chi tiet cho van de cua ban!"""
             "confidence": 0.95
         }
         
+    except PipelineOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -1755,6 +2166,133 @@ async def get_multi_tier_status():
             detail=f"Status error: {str(e)}"
         )
 
+@app.get("/api/v1/traces")
+async def get_recent_traces(limit: int = 20):
+    """Get recently sampled traces"""
+    tracer = get_tracer()
+    return {
+        "success": True,
+        "stats": tracer.get_stats(),
+        "traces": tracer.get_recent_traces(limit),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/cache/semantic")
+async def get_semantic_cache_stats():
+    """Get semantic cache hit-rate and false-hit sampling metrics"""
+    return {
+        "success": True,
+        "stats": semantic_cache.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.delete("/api/v1/cache/semantic")
+async def invalidate_semantic_cache(scope: Optional[str] = None, tag: Optional[str] = None):
+    """Invalidate cached answers by scope and/or tag (no filter clears everything)"""
+    removed = semantic_cache.invalidate(scope=scope, tag=tag)
+    get_invalidation_bus().publish("semantic_cache", {"scope": scope, "tag": tag})
+    return {
+        "success": True,
+        "invalidated": removed,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/cache/search")
+async def get_search_cache_stats():
+    """Get web search fan-out, engine error/timeout and result cache metrics"""
+    return {
+        "success": True,
+        "stats": get_search_service().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.delete("/api/v1/cache/search")
+async def invalidate_search_cache(query: Optional[str] = None, search_type: Optional[str] = None):
+    """Invalidate cached search results by query and/or search type (no filter clears everything)"""
+    removed = get_search_service().invalidate(query=query, search_type=search_type)
+    get_invalidation_bus().publish("search_cache", {"query": query, "search_type": search_type})
+    return {
+        "success": True,
+        "invalidated": removed,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/knowledge/stats")
+async def get_knowledge_store_stats():
+    """Get persistent knowledge store sizes per kind/domain, freshness and upsert counters"""
+    return {
+        "success": True,
+        "stats": knowledge_integration_agent.get_knowledge_base_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/knowledge/search")
+async def search_knowledge_store(query: str, domain: Optional[str] = None, min_credibility: Optional[float] = None, limit: int = 10):
+    """Full-text search over integrated knowledge, filtered by domain and credibility"""
+    return knowledge_integration_agent.search_knowledge({
+        "query": query,
+        "domain": domain,
+        "min_credibility": min_credibility,
+        "limit": limit
+    })
+
+@app.get("/api/v1/graph/stats")
+async def get_graph_stats():
+    """Get shared skill/course/knowledge graph sizes per node and edge type"""
+    return {
+        "success": True,
+        "stats": get_graph_engine().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/graph/neighborhood")
+async def get_graph_neighborhood(node: str, k: int = 2, direction: str = "both", edge_type: Optional[str] = None, node_type: Optional[str] = None):
+    """Get the k-hop neighborhood of a graph node (e.g. skill:data-analyst, topic:<topic>)"""
+    if direction not in DIRECTIONS:
+        raise HTTPException(status_code=400, detail=f"direction must be one of {', '.join(DIRECTIONS)}")
+    graph = get_graph_engine()
+    if node not in graph.node_ids:
+        raise HTTPException(status_code=404, detail=f"Node not found: {node}")
+    neighborhood = graph.k_hop(node, k, direction,
+                               edge_types=[edge_type] if edge_type else None,
+                               node_types=[node_type] if node_type else None)
+    return {
+        "success": True,
+        "node": node,
+        "neighborhood": neighborhood,
+        "graph": graph.subgraph([node] + list(neighborhood)[:200]),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/skills/search")
+async def search_skills(q: str, top_k: int = 10, category: Optional[str] = None):
+    """BM25 search over the shared skills index (reloaded automatically when skills_index.json changes)"""
+    index = get_skills_index()
+    return {
+        "success": True,
+        "query": q,
+        "results": [
+            {"id": skill.get("id"), "name": skill.get("name"), "category": skill.get("category", "uncategorized"),
+             "description": skill.get("description", ""), "score": score}
+            for skill, score in index.search(q, top_k=top_k, category=category)
+        ],
+        "stats": index.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/structured-output/stats")
+async def get_structured_output_metrics():
+    """Get JSON-mode parse failures, schema validation failures and retries per agent task"""
+    return {
+        "success": True,
+        "stats": get_structured_output_stats().get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WEB_CONCURRENCY > 1:
+        # Mỗi worker là một process riêng import lại main:app
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WEB_CONCURRENCY)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Batch Personalization Test Script
+Kiểm tra cá nhân hóa nội dung cho cả lớp: gom học sinh theo (learning style, adaptation level, đặc điểm hồ sơ),
+mỗi nhóm gọi LLM một lần với giới hạn đồng thời và kết quả được gán lại cho từng học sinh
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.content_repository import ContentRepository, set_content_repository
+
+STYLES = ["visual", "Visual ", "auditory", "kinesthetic"]
+
+
+def _class_of(n: int):
+    students = []
+    for i in range(n):
+        students.append({
+            "student_id": f"hs{i:02d}",
+            "learning_style": STYLES[i % len(STYLES)],
+            "adaptation_level": "high" if i % 5 == 0 else "medium",
+            "student_profile": {"level": "basic" if i < 30 else "advanced",
+                                "interests": ["bóng đá", "âm nhạc"] if i % 2 else ["bóng đá"]}
+        })
+    return students
+
+
+def test_class_personalization_is_clustered():
+    """40 học sinh -> số nhóm nhỏ; đúng một lần gọi LLM mỗi nhóm, không vượt giới hạn đồng thời"""
+    print("🧪 Testing batch personalization...")
+    repository = ContentRepository()
+    set_content_repository(repository)
+    try:
+        from agents.content_generation_agent import ContentGenerationAgent
+        agent = ContentGenerationAgent()
+        repository.save("lesson_1", "lesson", {"content": {"title": "Phân số", "content": "Phân số là ..."}},
+                        topic="Phân số")
+        state = {"calls": 0, "running": 0, "peak": 0, "prompts": [], "retried": False}
+
+        async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+            state["calls"] += 1
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            state["prompts"].append(prompt)
+            try:
+                await asyncio.sleep(0.01)
+                if "LEARNING STYLE: kinesthetic" in prompt and '"level": "advanced"' in prompt:
+                    raise RuntimeError("LLM unavailable")
+                if "LEARNING STYLE: auditory" in prompt and '"level": "advanced"' in prompt and not state["retried"]:
+                    # Output sai schema lần đầu: structured output tự gọi lại
+                    state["retried"] = True
+                    return "không phải JSON"
+                text = json.dumps({"personalized_content": f"Bản #{state['calls']}"})
+                if on_chunk is not None:
+                    on_chunk(text)
+                return text
+            finally:
+                state["running"] -= 1
+
+        agent._generate = fake_generate
+        result = asyncio.run(agent.process("personalize_content_batch", {
+            "content_id": "lesson_1", "students": _class_of(40), "max_concurrent": 2
+        }))
+        assert result["success"]
+        summary = result["summary"]
+        # 3 style (visual = "Visual ") x 2 adaptation x 2 level, trừ visual/high/advanced (không có học sinh)
+        assert summary["students"] == 40 and summary["clusters"] == 11 and summary["llm_calls_saved"] == 29
+        # Số lần gọi LLM thật, kể cả lần thử lại
+        assert state["calls"] == 12 and summary["llm_calls"] == 12 and state["peak"] <= 2
+        assert len(result["assignments"]) == 40
+
+        clusters = {c["cluster_id"]: c for c in result["clusters"]}
+        for student_id, cluster_id in result["assignments"].items():
+            assert student_id in clusters[cluster_id]["student_ids"]
+        failed = [c for c in result["clusters"] if not c["success"]]
+        assert summary["failed_clusters"] == len(failed) == 2
+        assert all(c["learning_style"] == "kinesthetic" and "LLM unavailable" in c["error"] for c in failed)
+        ok = [c for c in result["clusters"] if c["success"]]
+        assert all(c["personalized_content"]["personalized_content"].startswith("Bản #") for c in ok)
+        # Prompt dùng sở thích chung của nhóm, không phải của từng học sinh
+        assert all('"group_size"' in p and json.dumps("bóng đá") in p for p in state["prompts"])
+
+        missing = asyncio.run(agent.process("personalize_content_batch", {"content_id": "lesson_1", "students": []}))
+        assert not missing["success"]
+        duplicated = asyncio.run(agent.process("personalize_content_batch", {
+            "content_id": "lesson_1", "students": _class_of(3) + _class_of(2)}))
+        assert not duplicated["success"] and "hs00, hs01" in duplicated["error"] and state["calls"] == 12
+    finally:
+        set_content_repository(None)
+    print("✅ Batch personalization OK")
+    return True
+
+
+def main():
+    print("🚀 Batch Personalization Tests")
+    print("=" * 50)
+    results = [test_class_personalization_is_clustered()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Content Repository Test Script
+Kiểm tra kho nội dung đã tạo: body nén, tìm nội dung dùng lại theo chất lượng/độ mới, lấy theo ID
+cho personalize/assess và chỉ gọi LLM cho nội dung thật sự mới
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.content_repository import BASE_QUALITY_SCORE, ContentRepository, set_content_repository
+
+LESSON_JSON = json.dumps({
+    "title": "Phương trình bậc hai",
+    "main_content": [{"section": "Định nghĩa", "content": "Phương trình dạng ax^2 + bx + c = 0. " * 40}],
+    "summary": "Tóm tắt"
+}, ensure_ascii=False)
+
+
+def test_repository_lookup_and_compression():
+    """Chỉ nội dung cùng khóa, đủ điểm và còn mới mới được dùng lại; body lưu dạng nén"""
+    print("🧪 Testing content repository...")
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = ContentRepository(str(Path(tmp) / "content.db"), min_quality=7.0, max_age_seconds=3600)
+        payload = {"exercises": [{"question": f"Giải phương trình số {i}: x^2 - {i}x + 1 = 0"} for i in range(200)]}
+        key = dict(content_type="exercise", subject="toán", level="medium", topic="Phương Trình  bậc hai",
+                   params={"type": "practice", "count": 5})
+        repository.save("ex_low", payload=payload, quality_score=6.0, **key)
+        assert repository.find_reusable(**key) is None
+        repository.save("ex_good", payload=payload, quality_score=8.0, **key)
+        repository.save("ex_better", payload=payload, quality_score=9.0, **key)
+
+        # Topic chuẩn hóa (hoa/thường, dấu, khoảng trắng) vẫn khớp; tham số khác thì không
+        found = repository.find_reusable("exercise", "toán", "medium", "phuong trinh bac hai",
+                                         params={"count": 5, "type": "practice"})
+        assert found["id"] == "ex_better" and found["payload"] == payload and found["reuse_count"] == 0
+        assert repository.find_reusable(**{**key, "params": {"type": "practice", "count": 10}}) is None
+        assert repository.find_reusable(**{**key, "level": "hard"}) is None
+        assert repository.find_reusable(**key, min_quality=9.5) is None
+
+        repository._conn.execute("UPDATE contents SET created_at = ?", (time.time() - 7200,))
+        assert repository.find_reusable(**key) is None
+        assert repository.get("ex_good")["payload"] == payload and repository.get("missing") is None
+        assert repository.update_quality("ex_low", 9.9) and not repository.update_quality("missing", 1)
+
+        stats = repository.get_stats()
+        assert stats["total_contents"] == 3 and stats["content_types"]["exercise"]["reused"] == 1
+        assert stats["compression_ratio"] > 5
+        plan = " ".join(row[3] for row in repository._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM contents WHERE content_type = ? AND subject = ? AND level = ? "
+            "AND topic_hash = ? AND template_id = ? AND params_hash = ? AND quality_score >= ?", ("a",) * 6 + (0,)))
+        assert "idx_contents_lookup" in plan
+        repository.close()
+    print("✅ Content repository OK")
+    return True
+
+
+def _agent_with_fake_llm():
+    from agents.content_generation_agent import ContentGenerationAgent
+    agent = ContentGenerationAgent()
+    calls = []
+
+    async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+        calls.append(prompt)
+        text = respond(format)
+        if on_chunk is not None:
+            on_chunk(text)
+        return text
+
+    def respond(format):
+        required = format.get("required", []) if isinstance(format, dict) else []
+        if "main_content" in required:
+            return LESSON_JSON
+        if "exercises" in required:
+            return json.dumps({"exercises": [{"question": "Giải x^2 - 1 = 0"}]})
+        if "personalized_content" in required:
+            return json.dumps({"personalized_content": "Bản dành cho học sinh học qua hình ảnh"}, ensure_ascii=False)
+        if "overall_assessment" in required:
+            return json.dumps({"overall_assessment": {"score": 4},
+                               "criteria_scores": {c: {"score": 4} for c in ("clarity", "accuracy")}})
+        return "Mục tiêu 1\nMục tiêu 2"
+
+    agent._generate = fake_generate
+    return agent, calls
+
+
+def test_agent_reuses_before_generating():
+    """Lần tạo thứ hai cùng yêu cầu không gọi LLM; force_new tạo mới; personalize/assess dùng content_id"""
+    print("🧪 Testing reuse-before-generate...")
+    set_content_repository(ContentRepository(min_quality=7.0, max_age_seconds=3600))
+    try:
+        agent, calls = _agent_with_fake_llm()
+        lesson = {"topic": "Phương trình bậc hai", "subject": "toán", "level": "basic", "duration": 45}
+
+        async def scenario():
+            first = await agent.process("generate_lesson", lesson)
+            llm_calls = len(calls)
+            second = await agent.process("generate_lesson", {**lesson, "topic": "phương trình BẬC HAI"})
+            assert len(calls) == llm_calls
+            assert first["reused"] is False and second["reused"] is True
+            assert second["content_id"] == first["content_id"] and second["content"].title == first["content"].title
+            assert second["content"].created_at == first["content"].created_at
+
+            fresh = await agent.process("generate_lesson", {**lesson, "force_new": True})
+            assert fresh["reused"] is False and fresh["content_id"] != first["content_id"] and len(calls) > llm_calls
+
+            exercise = await agent.process("generate_exercise", {"topic": "Phương trình", "count": 1})
+            again = await agent.process("generate_exercise", {"topic": "Phương trình", "count": 1})
+            assert again["reused"] and again["exercises"] == exercise["exercises"]
+
+            personalized = await agent.process("personalize_content", {"content_id": first["content_id"]})
+            assert personalized["success"] and personalized["original_content"]["content_type"] == "lesson"
+            assert "ax^2" in json.dumps(personalized["original_content"]["content"], ensure_ascii=False)
+            missing = await agent.process("personalize_content", {"content_id": "lesson_missing"})
+            assert not missing["success"] and "not found" in missing["error"]
+
+            # Đánh giá thấp: nội dung không còn được dùng lại
+            assessed = await agent.process("assess_quality", {"content_id": exercise["content_id"],
+                                                              "criteria": ["clarity", "accuracy"]})
+            assert assessed["success"] and assessed["overall_score"] == 4
+            regenerated = await agent.process("generate_exercise", {"topic": "Phương trình", "count": 1})
+            assert regenerated["reused"] is False
+
+        asyncio.run(scenario())
+        stats = agent.content_repository.get_stats()
+        assert stats["reuse_hits"] == 2 and stats["content_types"]["lesson"]["count"] == 2
+
+        # Ngưỡng mặc định cao hơn điểm nền: nội dung chỉ có điểm nền (bài tập ngắn) không được dùng lại
+        set_content_repository(ContentRepository())
+        agent, calls = _agent_with_fake_llm()
+        assert agent.content_repository.min_quality > BASE_QUALITY_SCORE
+
+        async def default_gate():
+            await agent.process("generate_exercise", {"topic": "Phương trình", "count": 1})
+            short = await agent.process("generate_exercise", {"topic": "Phương trình", "count": 1})
+            await agent.process("generate_lesson", lesson)
+            long = await agent.process("generate_lesson", lesson)
+            assert short["reused"] is False and long["reused"] is True
+
+        asyncio.run(default_gate())
+    finally:
+        set_content_repository(None)
+    print("✅ Reuse-before-generate OK")
+    return True
+
+
+def main():
+    print("🚀 Content Repository Tests")
+    print("=" * 50)
+    results = [test_repository_lookup_and_compression(), test_agent_reuses_before_generating()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Embedding Service Test Script
+Kiểm tra micro-batching, cache memmap và hashing embedder offline
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.embedding_service import EmbeddingIndex, EmbeddingService, HashingEmbedder, set_embedding_service
+from agents.multi_tier_agent_system import LEANNIntegrationAgent
+from agents.specialized_agents import DataDedupAgent
+
+
+def test_hashing_embedder():
+    """Hashing embedder xác định, chuẩn hóa L2 và đặt câu diễn đạt lại gần nhau hơn câu khác chủ đề"""
+    print("🧪 Testing hashing embedder...")
+    embedder = HashingEmbedder()
+    vectors = embedder.encode(["định lý Pitago là gì", "giải thích định lý Pitago", "công thức tính lãi suất ngân hàng"])
+    assert vectors.shape == (3, 384)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    assert np.array_equal(vectors, HashingEmbedder().encode(["định lý Pitago là gì", "giải thích định lý Pitago", "công thức tính lãi suất ngân hàng"]))
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    print("✅ Hashing embedder OK")
+    return True
+
+
+def test_micro_batching_and_disk_cache():
+    """Request đồng thời được gom batch; vector được cache trên đĩa và đọc lại sau khi khởi động lại"""
+    print("🧪 Testing micro-batching and cache...")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        service = EmbeddingService(embedder=HashingEmbedder(), cache_dir=cache_dir, max_batch_size=16, max_wait_ms=5)
+        texts = [f"bài học số {i}" for i in range(40)]
+
+        async def concurrent_requests():
+            return await asyncio.gather(*(service.embed_one(text) for text in texts + texts[:10]))
+
+        vectors = asyncio.run(concurrent_requests())
+        stats = service.get_stats()
+        assert stats["encoded"] == 40
+        assert stats["batches"] <= 4
+        service.flush()
+
+        # Worker khác chạy cùng lúc nhận slot riêng, ghi của nó không đè lên dòng của worker đầu
+        other = EmbeddingService(embedder=HashingEmbedder(), cache_dir=cache_dir)
+        other.embed_sync([f"câu hỏi khác {i}" for i in range(40)])
+        assert other.cache.path != service.cache.path
+        assert other.get_stats()["cache_hits"] == 0
+        other.cache.close()
+        service.cache.close()
+
+        restarted = EmbeddingService(embedder=HashingEmbedder(), cache_dir=cache_dir)
+        cached = restarted.embed_sync(texts)
+        assert restarted.cache.path == service.cache.path
+        assert restarted.get_stats()["cache_hits"] == 40
+        assert restarted.get_stats()["encoded"] == 0
+        assert np.allclose(cached, np.stack(vectors[:40]), atol=1e-3)
+        restarted.cache.close()
+    print("✅ Micro-batching and cache OK")
+    return True
+
+
+def test_agents_use_embeddings():
+    """LEANN semantic search và semantic dedup dùng embedding thật"""
+    print("🧪 Testing agents with embeddings...")
+    set_embedding_service(EmbeddingService(embedder=HashingEmbedder()))
+
+    agent = LEANNIntegrationAgent()
+    documents = [
+        {"id": "pytago", "title": "Định lý Pitago", "content": "Trong tam giác vuông, bình phương cạnh huyền bằng tổng bình phương hai cạnh góc vuông."},
+        {"id": "lai-suat", "title": "Lãi suất kép", "content": "Công thức tính lãi suất kép theo kỳ hạn gửi tiết kiệm."},
+        {"id": "quang-hop", "title": "Quang hợp", "content": "Cây xanh dùng ánh sáng mặt trời để tổng hợp chất hữu cơ."},
+    ]
+    agent.add_to_index(
+        [{"doc_id": d["id"], "title": d["title"], "content": d["content"]} for d in documents],
+        HashingEmbedder().encode([f"{d['title']}\n{d['content']}" for d in documents])
+    )
+    results = asyncio.run(agent.search_index("bình phương cạnh huyền tam giác vuông", top_k=2))
+    assert results[0]["doc_id"] == "pytago"
+
+    dedup = DataDedupAgent()
+    items = [dict(d) for d in documents] + [{**documents[0], "id": "pytago-copy", "content": documents[0]["content"] + " Ví dụ."}]
+    result = asyncio.run(dedup.semantic_deduplication(items, {}))
+    assert [d["duplicate_of"] for d in result["duplicates"]] == ["pytago"]
+    assert len(result["unique_items"]) == 3
+    # Lần gọi sau so với index của lần trước (không stack lại ma trận)
+    again = asyncio.run(dedup.semantic_deduplication([{**documents[1], "id": "lai-suat-2"}], {}))
+    assert [d["duplicate_of"] for d in again["duplicates"]] == ["lai-suat"] and len(dedup.global_embeddings) == 3
+    # Trong một batch cũng chỉ so với embedding_cache_size item unique gần nhất (chi phí tuyến tính theo batch)
+    bounded = DataDedupAgent()
+    bounded.embedding_cache_size = 2
+    result = asyncio.run(bounded.semantic_deduplication(items, {"block_size": 1}))
+    assert result["duplicates"] == [] and len(result["unique_items"]) == 4
+    print("✅ Agents with embeddings OK")
+    return True
+
+
+def test_embedding_index_bounded_lru():
+    """Index tham chiếu tăng dần không copy lại mỗi lần thêm, giới hạn kích thước và bỏ dòng lâu không dùng nhất"""
+    print("🧪 Testing bounded embedding index...")
+    vectors = np.eye(8, dtype=np.float32)
+    index = EmbeddingIndex(8, max_items=4, initial_rows=2)
+    index.add(["a", "b", "c"], vectors[:3])
+    assert index.ids == ["a", "b", "c"] and index.vectors.shape == (4, 8)
+    assert np.array_equal(index.matrix(), vectors[:3])
+    index.add(["d"], vectors[3:4])
+    index.touch([index.rows["a"]])
+    # Đầy: "b" lâu không dùng nhất bị ghi đè, "a" vừa match vẫn còn
+    index.add(["e"], vectors[4:5])
+    assert len(index) == 4 and "b" not in index.rows and index.evictions == 1
+    assert index.ids[index.rows["e"]] == "e" and np.array_equal(index.matrix()[index.rows["e"]], vectors[4])
+    index.add(["a"], vectors[5:6])
+    assert len(index) == 4 and np.array_equal(index.matrix()[index.rows["a"]], vectors[5])
+    print("✅ Bounded embedding index OK")
+    return True
+
+
+def main():
+    print("🚀 Embedding Service Tests")
+    print("=" * 50)
+    results = [test_hashing_embedder(), test_micro_batching_and_disk_cache(), test_agents_use_embeddings(),
+               test_embedding_index_bounded_lru()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Graph Engine Test Script
+Kiểm tra đồ thị CSR: cập nhật cạnh tăng dần, k-hop, đường đi ngắn nhất, PageRank, thành phần liên thông, snapshot
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.graph_engine import GraphEngine, set_graph_engine
+from agents.embedding_service import EmbeddingService, HashingEmbedder, set_embedding_service
+from agents.knowledge_store import KnowledgeStore, set_knowledge_store
+from agents.search_service import SearchService, FakeSearchEngine, make_result, set_search_service
+
+
+def _course_graph() -> GraphEngine:
+    graph = GraphEngine()
+    graph.add_edges([("course:calculus", "course:algebra"), ("course:ml", "course:calculus"),
+                     ("course:ml", "course:statistics", 3.0), ("course:statistics", "course:algebra")],
+                    "requires", src_type="course", dst_type="course")
+    graph.add_edge("course:ml", "skill:python", "teaches", dst_type="skill")
+    graph.add_edge("course:history", "topic:humanities", "in_topic", src_type="course")
+    return graph
+
+
+def test_graph_queries():
+    """Cạnh trùng cập nhật trọng số, cạnh bị xóa biến mất; truy vấn trả kết quả đúng và snapshot giữ nguyên đồ thị"""
+    print("🧪 Testing graph queries...")
+    graph = _course_graph()
+    graph.add_edge("course:ml", "course:statistics", "requires", 0.5)
+    graph.add_edge("course:ml", "course:algebra", "requires")
+    graph.remove_edge("course:ml", "course:algebra", "requires")
+    assert graph.num_edges == 6
+    assert {n["node"]: n["weight"] for n in graph.neighbors("course:ml", edge_types=["requires"])} == \
+        {"course:calculus": 1.0, "course:statistics": 0.5}
+
+    assert graph.k_hop("course:ml", 1, "out") == {"course:calculus": 1, "course:statistics": 1, "skill:python": 1}
+    assert graph.k_hop("course:ml", 2, "out", node_types=["course"]) == \
+        {"course:calculus": 1, "course:statistics": 1, "course:algebra": 2}
+    assert graph.k_hop("course:algebra", 5, "in", edge_types=["requires"]) == \
+        {"course:calculus": 1, "course:statistics": 1, "course:ml": 2}
+
+    assert graph.shortest_path("course:ml", "course:algebra")["hops"] == 2
+    weighted = graph.shortest_path("course:ml", "course:algebra", weighted=True)
+    assert weighted["path"] == ["course:ml", "course:statistics", "course:algebra"] and weighted["cost"] == 1.5
+    assert graph.shortest_path("course:algebra", "course:ml") is None
+    assert graph.shortest_path("course:algebra", "course:ml", direction="in")["hops"] == 2
+    assert graph.shortest_path("course:history", "course:ml", direction="both") is None
+
+    labels = graph.connected_components()
+    assert len(np.unique(labels)) == 2
+    assert sorted(graph.component_of("topic:humanities")) == ["course:history", "topic:humanities"]
+    ranks = graph.pagerank()
+    assert abs(ranks.sum() - 1) < 1e-6
+    assert graph.top_nodes(ranks, 1, node_types=["course"])[0]["node"] == "course:algebra"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "graph.npz")
+        graph.save(path)
+        # Nhiều worker lưu cùng lúc lúc shutdown: mỗi lần lưu có file tạm riêng, không để lại file hỏng/file tạm
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(lambda _: graph.save(path), range(8)))
+        assert [p.name for p in Path(tmp).iterdir()] == ["graph.npz"]
+        restored = GraphEngine.load(path)
+    assert restored.get_stats()["edge_types"] == graph.get_stats()["edge_types"]
+    assert restored.node_type_names[restored.node_types[restored.node_ids["skill:python"]]] == "skill"
+    restored.add_edge("course:algebra", "course:arithmetic", "requires")
+    assert restored.k_hop("course:ml", 3, "out")["course:arithmetic"] == 3
+    print("✅ Graph queries OK")
+    return True
+
+
+def test_large_graph_performance():
+    """Hàng trăm nghìn cạnh: truy vấn trong mili giây, cập nhật cạnh lẻ không phải dựng lại toàn bộ"""
+    print("🧪 Testing large graph...")
+    rng = np.random.default_rng(7)
+    graph = GraphEngine()
+    num_nodes, num_edges = 50000, 200000
+    for i in range(num_nodes):
+        graph.add_node(f"skill:{i}", "skill")
+    for s, d in zip(rng.integers(0, num_nodes, num_edges).tolist(), rng.integers(0, num_nodes, num_edges).tolist()):
+        graph.add_edge(f"skill:{s}", f"skill:{d}", "depends_on")
+    graph.compact()
+
+    timings = {}
+    for name, query in [("k_hop", lambda: graph.k_hop("skill:1", 2)),
+                        ("shortest_path", lambda: graph.shortest_path("skill:1", "skill:2", direction="both")),
+                        ("weighted_path", lambda: graph.shortest_path("skill:1", "skill:2", weighted=True)),
+                        ("pagerank", lambda: graph.pagerank()),
+                        ("components", lambda: graph.connected_components())]:
+        started = time.perf_counter()
+        query()
+        timings[name] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    graph.add_edge("skill:1", "skill:new", "depends_on", dst_type="skill")
+    assert graph.k_hop("skill:1", 1, "out")["skill:new"] == 1
+    timings["incremental_update"] = (time.perf_counter() - started) * 1000
+
+    print("   " + ", ".join(f"{name}={ms:.1f}ms" for name, ms in timings.items()))
+    assert max(timings.values()) < 1000
+    assert timings["k_hop"] < 100 and timings["incremental_update"] < 200
+    print("✅ Large graph OK")
+    return True
+
+
+def test_agents_build_real_graphs():
+    """Skill graph trả về đường học thật; topic dùng chung nguồn thì liên quan; LEANN gom cụm document theo similar_to"""
+    print("🧪 Testing agent graphs...")
+    from agents.universal_skills_integration_agent import UniversalSkillsIntegrationAgent
+    from agents.knowledge_integration_agent import KnowledgeIntegrationAgent
+    from agents.multi_tier_agent_system import LEANNIntegrationAgent
+
+    async def no_llm(prompt, system_prompt=None, format=None, on_chunk=None):
+        return "phân tích"
+
+    shared = make_result("Learning analytics survey", "https://journal.example.com/analytics")
+    engine = FakeSearchEngine("local", lambda q, t: [shared, make_result(q, f"https://example.com/{len(q)}")])
+    set_graph_engine(GraphEngine())
+    set_embedding_service(EmbeddingService(embedder=HashingEmbedder()))
+    set_search_service(SearchService([engine], cache_ttl=0))
+    set_knowledge_store(KnowledgeStore())
+    try:
+        skills = UniversalSkillsIntegrationAgent()
+        skills._generate = no_llm
+        result = asyncio.run(skills.skill_knowledge_graph({"skill": "content-creator", "target_skill": "prompt-engineering"}))
+        assert result["graph_metrics"]["edge_types"]["depends_on"] == 15
+        assert result["skill_neighborhood"]["skill:copywriting"] == 1
+        assert result["learning_path"]["path"] == ["skill:content-creator", "skill:prompt-engineering"]
+        assert result["central_skills"][0]["node"].startswith("skill:")
+
+        knowledge = KnowledgeIntegrationAgent()
+        knowledge._generate = no_llm
+        asyncio.run(knowledge.build_knowledge_graph({"topic": "Learning analytics"}))
+        topic_graph = asyncio.run(knowledge.build_knowledge_graph({"topic": "Assessment design", "depth": 1}))
+        assert topic_graph["related_topics"] == ["topic:learning analytics"]
+        assert topic_graph["neighborhood_size"] == 3
+        cited = {edge["target"] for edge in topic_graph["graph"]["edges"] if edge["type"] == "cites"}
+        assert cited == {"source:https://journal.example.com/analytics", "source:https://example.com/17"}
+
+        leann = LEANNIntegrationAgent()
+        leann._generate = no_llm
+        texts = ["tam giác vuông cạnh huyền Pitago", "Pitago tam giác vuông bình phương cạnh huyền",
+                 "lãi suất kép tiết kiệm ngân hàng", "lãi suất kép kỳ hạn tiết kiệm"]
+        leann.add_to_index([{"doc_id": f"d{i}", "title": t, "content": t} for i, t in enumerate(texts)],
+                           HashingEmbedder().encode(texts))
+        graph_result = asyncio.run(leann.build_knowledge_graph({"top_k": 1, "min_similarity": 0.3}))
+    finally:
+        set_graph_engine(None)
+        set_embedding_service(None)
+        set_search_service(None)
+        set_knowledge_store(None)
+
+    assert graph_result["success"]
+    assert sorted(map(sorted, graph_result["clusters"])) == [["d0", "d1"], ["d2", "d3"]]
+    assert len(graph_result["central_documents"]) == 4
+    print("✅ Agent graphs OK")
+    return True
+
+
+def main():
+    print("🚀 Graph Engine Tests")
+    print("=" * 50)
+    results = [test_graph_queries(), test_large_graph_performance(), test_agents_build_real_graphs()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
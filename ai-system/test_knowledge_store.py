@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Knowledge Store Test Script
+Kiểm tra kho kiến thức SQLite: upsert tăng dần, tìm kiếm full-text theo domain/độ tin cậy, dùng lại kiến thức còn mới
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.knowledge_store import KnowledgeStore, set_knowledge_store
+from agents.search_service import SearchService, FakeSearchEngine, make_result, set_search_service
+
+
+def test_upsert_search_and_persistence():
+    """Upsert trùng nội dung không tăng version; FTS tìm theo nội dung/nguồn, không dấu; dữ liệu còn sau khi mở lại"""
+    print("🧪 Testing knowledge store...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "knowledge.db")
+        store = KnowledgeStore(path)
+        sources = [make_result("Spaced repetition study", "https://edu.example.com/spaced", relevance=0.9)]
+        assert store.upsert("Spaced Repetition", "Ôn tập ngắt quãng giúp ghi nhớ lâu", sources,
+                            domain="education", credibility=0.8) == "inserted"
+        assert store.upsert("spaced  repetition", "Ôn tập ngắt quãng giúp ghi nhớ lâu", sources) == "unchanged"
+        assert store.upsert("Spaced Repetition", sources=sources + [make_result("More", "https://x.example.com")]) == "updated"
+        store.upsert("Neural networks", "Mạng nơ-ron trong học máy", [], domain="technology", credibility=0.4)
+        store.upsert("Đánh giá năng lực", "Assessment dựa trên năng lực", [], kind="validated_knowledge", domain="education", credibility=0.9)
+        store.close()
+
+        store = KnowledgeStore(path)
+        record = store.get("SPACED repetition")
+        assert record.version == 2 and record.source_count == 2 and record.content.startswith("Ôn tập")
+        assert record.domain == "education" and record.credibility == 0.8
+
+        assert [r.topic for r in store.search("on tap ngat quang")] == ["Spaced Repetition"]
+        assert [r.topic for r in store.search("study")] == ["Spaced Repetition"]
+        assert [r.topic for r in store.search("", domain="education", min_credibility=0.85)] == ["Đánh giá năng lực"]
+        assert store.search("mạng", domain="education") == []
+        assert store.search("mạng")[0].score > 0
+
+        stats = store.get_stats(max_age_seconds=3600)
+        assert stats["fts_enabled"] and stats["total_topics"] == 3 and stats["stale_topics"] == 0
+        assert stats["kinds"] == {"dynamic_knowledge": 2, "validated_knowledge": 1}
+        assert stats["domains"]["education"]["topics"] == 2
+        assert store.stale_topics(["Neural networks", "Quantum"], 3600) == ["Quantum"]
+        assert store.stale_topics(["Neural networks", "Quantum"], 0) == ["Neural networks", "Quantum"]
+        store.close()
+    print("✅ Knowledge store OK")
+    return True
+
+
+def _agent_with_fakes():
+    from agents.knowledge_integration_agent import KnowledgeIntegrationAgent
+
+    engine = FakeSearchEngine("local", lambda q, t: [make_result(f"{q} research journal", f"https://j.example.com/{len(q)}", source="journal")])
+    set_search_service(SearchService([engine], cache_ttl=0))
+    set_knowledge_store(KnowledgeStore())
+    try:
+        agent = KnowledgeIntegrationAgent()
+    finally:
+        set_search_service(None)
+        set_knowledge_store(None)
+
+    agent.llm_calls = 0
+
+    async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+        agent.llm_calls += 1
+        return f"Kiến thức tổng hợp #{agent.llm_calls}"
+
+    agent._generate = fake_generate
+    return agent, engine
+
+
+def test_integrate_reuses_fresh_knowledge():
+    """integrate_knowledge dùng lại kiến thức còn mới, không gọi search/LLM; force_refresh hoặc hết hạn thì sinh lại"""
+    print("🧪 Testing knowledge reuse...")
+    agent, engine = _agent_with_fakes()
+    data = {"topic": "Machine learning in assessment"}
+
+    first = asyncio.run(agent.integrate_knowledge(data))
+    again = asyncio.run(agent.integrate_knowledge(dict(data, topic="machine learning in ASSESSMENT")))
+    assert not first["reused"] and again["reused"]
+    assert again["integrated_knowledge"] == first["integrated_knowledge"] == "Kiến thức tổng hợp #1"
+    assert again["sources_count"] == 1 and again["credibility_score"] == first["credibility_score"]
+    assert first["domain"] == "education"
+    assert engine.calls == 1 and agent.llm_calls == 1
+
+    forced = asyncio.run(agent.integrate_knowledge(dict(data, force_refresh=True)))
+    expired = asyncio.run(agent.integrate_knowledge(dict(data, max_age_seconds=0)))
+    assert not forced["reused"] and not expired["reused"]
+    assert engine.calls == 3 and agent.llm_calls == 3
+    assert agent.knowledge_store.get(data["topic"]).version == 3
+
+    # LLM lỗi: không lưu thông báo lỗi, kiến thức cũ giữ nguyên và lần sau sinh lại
+    async def failing_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+        raise ConnectionError("ollama down")
+
+    working = agent._generate
+    agent._generate = failing_generate
+    failed = asyncio.run(agent.integrate_knowledge(dict(data, force_refresh=True)))
+    assert not failed["success"] and "ollama down" in failed["error"]
+    assert agent.knowledge_store.get(data["topic"]).content == "Kiến thức tổng hợp #3"
+    agent._generate = working
+    agent.knowledge_store.upsert("Legacy topic", "Error: Unable to process request - timeout", [])
+    assert not asyncio.run(agent.integrate_knowledge({"topic": "Legacy topic"}))["reused"]
+    assert agent.knowledge_store.get("Legacy topic").content == "Kiến thức tổng hợp #4"
+
+    found = agent.search_knowledge({"query": "tổng hợp", "domain": "education"})
+    assert found["total_results"] == 1 and found["results"][0]["topic"] == "Machine learning in assessment"
+    print("✅ Knowledge reuse OK")
+    return True
+
+
+def test_real_time_update_refreshes_stale_topics_only():
+    """real_time_knowledge_update chỉ tìm kiếm lại topic đã cũ, giữ nguyên nội dung đã tích hợp"""
+    print("🧪 Testing conditional refresh...")
+    agent, engine = _agent_with_fakes()
+    store = agent.knowledge_store
+    asyncio.run(agent.integrate_knowledge({"topic": "Blended learning"}))
+    store.upsert("Physics labs", "Thí nghiệm ảo", [])
+    store._conn.execute("UPDATE knowledge SET fetched_at = ?, content_at = ? WHERE topic = 'Physics labs'",
+                        (time.time() - 7200, time.time() - 7200))
+    calls_before = engine.calls
+
+    result = asyncio.run(agent.real_time_knowledge_update({
+        "topics": ["Blended learning", "Physics labs", "Learning analytics"], "frequency": "hourly"
+    }))
+    assert result["fresh_topics"] == ["Blended learning"]
+    assert result["refreshed_topics"] == ["Physics labs", "Learning analytics"]
+    assert result["changed_topics"] == ["Physics labs", "Learning analytics"]
+    assert engine.calls - calls_before == 2
+    assert store.get("Physics labs").content == "Thí nghiệm ảo" and store.get("Physics labs").source_count == 1
+    assert store.get("Learning analytics").domain == "research"
+
+    again = asyncio.run(agent.real_time_knowledge_update({"topics": ["Physics labs", "Learning analytics"]}))
+    assert again["refreshed_topics"] == [] and engine.calls - calls_before == 2
+
+    # Làm mới nguồn không làm nội dung LLM cũ "mới" trở lại
+    physics = store.get("Physics labs")
+    assert physics.is_fresh(3600) and not physics.is_content_fresh(3600)
+    regenerated = asyncio.run(agent.integrate_knowledge({"topic": "Physics labs", "max_age_seconds": 3600}))
+    assert not regenerated["reused"] and store.get("Physics labs").is_content_fresh(3600)
+
+    stats = agent.get_knowledge_base_stats()
+    assert stats["dynamic_knowledge_size"] == 3 and stats["stale_topics"] == 0
+    print("✅ Conditional refresh OK")
+    return True
+
+
+def main():
+    print("🚀 Knowledge Store Tests")
+    print("=" * 50)
+    results = [test_upsert_search_and_persistence(), test_integrate_reuses_fresh_knowledge(),
+               test_real_time_update_refreshes_stale_topics_only()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
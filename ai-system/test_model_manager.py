@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Model Manager Test Script
+Kiểm tra alias, keep_alive, gom request theo model để giảm swap (model resident theo từng backend)
+và hạ model theo latency budget
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.base_agent import BaseAgent
+from agents.model_manager import ModelManager, ModelManagerConfig, ModelPolicy, set_model_manager
+from agents.ollama_pool import OllamaPool, set_ollama_pool
+
+
+class SingleSlotHost:
+    """Host giả lập chỉ giữ được một model; đếm số lần phải nạp model khác"""
+
+    def __init__(self):
+        self.current = None
+        self.swaps = 0
+        self.order = []
+
+    async def generate(self, manager: ModelManager, model: str):
+        async with manager.slot(model):
+            if self.current != model:
+                if self.current is not None:
+                    self.swaps += 1
+                self.current = model
+            self.order.append(model)
+            await asyncio.sleep(0.001)
+
+
+def _interleaved(manager: ModelManager, host: SingleSlotHost, count: int = 60):
+    models = ["llama3:8b", "llama3:70b-instruct", "mistral:7b-instruct"]
+
+    async def run():
+        await asyncio.gather(*(host.generate(manager, models[i % len(models)]) for i in range(count)))
+
+    asyncio.run(run())
+
+
+def test_aliases_and_keep_alive():
+    """Alias trỏ về model resident; model pinned giữ vĩnh viễn"""
+    print("🧪 Testing aliases and keep_alive...")
+    manager = ModelManager(ModelManagerConfig(
+        aliases={"llama3:8b-instruct": "llama3:8b", "llama3:latest": "llama3:8b-instruct"},
+        pinned_models=["llama3:8b-instruct"],
+        keep_alive="15m"
+    ))
+    assert manager.resolve("llama3:latest") == "llama3:8b"
+    assert manager.resolve("mistral:7b-instruct") == "mistral:7b-instruct"
+    assert manager.keep_alive_for("llama3:8b") == -1
+    assert manager.keep_alive_for("mistral:7b-instruct") == "15m"
+
+    manager.observe_response("llama3:8b", {"load_duration": 3_200_000_000})
+    manager.observe_response("llama3:8b", {"load_duration": 2_000_000})
+    assert manager.get_stats()["models"]["llama3:8b"]["loads"] == 1
+    print("✅ Aliases and keep_alive OK")
+    return True
+
+
+def test_grouping_reduces_swaps():
+    """Request xen kẽ giữa các model được gom theo model: số swap giảm mạnh so với không scheduling"""
+    print("🧪 Testing model-affinity scheduling...")
+    unscheduled = SingleSlotHost()
+    _interleaved(ModelManager(ModelManagerConfig(scheduling_enabled=False)), unscheduled)
+
+    manager = ModelManager(ModelManagerConfig(max_loaded_models=1, max_concurrent_per_model=4, max_batch_per_model=100))
+    scheduled = SingleSlotHost()
+    _interleaved(manager, scheduled)
+
+    assert len(scheduled.order) == 60
+    assert scheduled.swaps <= 2 < unscheduled.swaps
+    assert manager.swaps == scheduled.swaps
+    print(f"   swaps: {unscheduled.swaps} → {scheduled.swaps}")
+    print("✅ Model-affinity scheduling OK")
+    return True
+
+
+def test_batch_limit_prevents_starvation():
+    """max_batch_per_model buộc nhường lượt khi model khác đang chờ"""
+    print("🧪 Testing starvation guard...")
+    manager = ModelManager(ModelManagerConfig(max_loaded_models=1, max_concurrent_per_model=2, max_batch_per_model=4))
+    host = SingleSlotHost()
+    _interleaved(manager, host, count=30)
+
+    # Không có model nào chạy quá max_batch_per_model + concurrency request liên tiếp khi model khác đang chờ
+    longest, run = 1, 1
+    for previous, current in zip(host.order, host.order[1:]):
+        run = run + 1 if current == previous else 1
+        longest = max(longest, run)
+    assert longest <= 6
+    assert manager.get_stats()["waiting"] == {}
+    print("✅ Starvation guard OK")
+    return True
+
+
+def test_residency_per_backend():
+    """Mỗi backend giữ max_loaded_models model: hai model chạy song song trên hai host, không swap"""
+    print("🧪 Testing per-backend residency...")
+    pool = OllamaPool(["http://a:1", "http://b:1"])
+    set_ollama_pool(pool)
+    try:
+        manager = ModelManager(ModelManagerConfig(max_loaded_models=1, max_concurrent_per_model=2, max_batch_per_model=100))
+        running = {"llama3:8b": 0, "mistral:7b-instruct": 0}
+        overlap = []
+
+        async def generate(model):
+            async with manager.slot(model):
+                running[model] = running.get(model, 0) + 1
+                overlap.append(running["llama3:8b"] > 0 and running["mistral:7b-instruct"] > 0)
+                await asyncio.sleep(0.005)
+                running[model] -= 1
+
+        async def interleaved(models, count=20):
+            await asyncio.gather(*(generate(models[i % len(models)]) for i in range(count)))
+
+        asyncio.run(interleaved(["llama3:8b", "mistral:7b-instruct"]))
+        assert manager.swaps == 0 and any(overlap)
+        placement = manager.get_stats()["scheduled_by_backend"]
+        assert placement == {"http://a:1": ["llama3:8b"], "http://b:1": ["mistral:7b-instruct"]}
+        # Pool gửi request của model tới backend đã được xếp model đó
+        assert pool.pick("mistral:7b-instruct").url == "http://b:1" and pool.pick("llama3:8b").url == "http://a:1"
+
+        # Model thứ ba: cả hai backend đã đầy, swap một model đã rảnh ra
+        asyncio.run(interleaved(["llama3:70b-instruct"], count=4))
+        assert manager.swaps == 1 and "llama3:70b-instruct" in manager.get_stats()["scheduled_models"]
+        assert sum(len(m) for m in manager.get_stats()["scheduled_by_backend"].values()) == 2
+    finally:
+        set_ollama_pool(None)
+    print("✅ Per-backend residency OK")
+    return True
+
+
+def _observe(manager: ModelManager, model: str, tokens_per_second: float, tokens: int = 200):
+    eval_ns = int(tokens / tokens_per_second * 1e9)
+    manager.observe_response(model, {"eval_count": tokens, "eval_duration": eval_ns, "total_duration": eval_ns + 100_000_000})
+
+
+def test_slo_downgrade_under_load():
+    """Khi hàng đợi 70b vượt latency budget thì chọn 8b; hết tải thì quay lại 70b"""
+    print("🧪 Testing SLO-aware model selection...")
+    manager = ModelManager(ModelManagerConfig(pinned_models=["llama3:70b-instruct", "llama3:8b"], max_concurrent_per_model=2))
+    _observe(manager, "llama3:70b-instruct", tokens_per_second=20)   # ~10s mỗi request
+    _observe(manager, "llama3:8b", tokens_per_second=100)            # ~2s mỗi request
+    policy = ModelPolicy("llama3:70b-instruct", ["llama3:8b"], latency_budget=15)
+
+    idle = manager.select_model(policy)
+    assert idle.model == "llama3:70b-instruct" and not idle.degraded
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with manager.slot("llama3:70b-instruct"):
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(6)]
+        await asyncio.sleep(0.01)
+        loaded = manager.select_model(policy)
+        assert manager.estimate_latency("llama3:70b-instruct") > 15
+        tight = manager.select_model(ModelPolicy("llama3:70b-instruct", ["llama3:8b"], latency_budget=1))
+        release.set()
+        await asyncio.gather(*holders)
+        return loaded, tight
+
+    loaded, tight = asyncio.run(scenario())
+    assert loaded.model == "llama3:8b" and loaded.degraded and loaded.reason == "over_budget"
+    # Không model nào kịp budget: chọn model nhanh nhất thay vì chờ 70b
+    assert tight.model == "llama3:8b" and tight.reason == "fastest_available"
+    assert manager.select_model(policy).model == "llama3:70b-instruct"
+    assert manager.get_stats()["downgrades"] == {"llama3:70b-instruct->llama3:8b": 2}
+    print(f"   under load: served by {loaded.model} (estimated {loaded.estimated_seconds:.1f}s)")
+    print("✅ SLO-aware model selection OK")
+    return True
+
+
+class PolicyAgent(BaseAgent):
+    def __init__(self):
+        super().__init__("policy_agent", "llama3:70b-instruct")
+        self.ollama_url = "http://127.0.0.1:9"
+        self.ollama_timeout = 1.0
+        self.model_fallbacks = ["llama3:8b"]
+        self.latency_budget = 5
+        self.task_model_policies = {"batch": {"latency_budget": 0}}
+
+    async def process(self, task, data, context=None):
+        response = await self.call_ollama(data["prompt"])
+        return self.format_response(response)
+
+
+def test_agent_records_served_model():
+    """format_response ghi model thực sự phục vụ; task batch không bao giờ bị hạ model"""
+    print("🧪 Testing served model metadata...")
+    manager = ModelManager(ModelManagerConfig(pinned_models=["llama3:70b-instruct", "llama3:8b"]))
+    _observe(manager, "llama3:70b-instruct", tokens_per_second=20)
+    _observe(manager, "llama3:8b", tokens_per_second=100)
+    set_model_manager(manager)
+    try:
+        agent = PolicyAgent()
+        interactive = asyncio.run(agent.process("chat", {"prompt": "Xin chào"}))
+        batch = asyncio.run(agent.process("batch", {"prompt": "Xin chào"}))
+    finally:
+        set_model_manager(None)
+
+    assert interactive["model_info"]["requested"] == "llama3:70b-instruct"
+    assert interactive["model_info"]["served"] == "llama3:8b"
+    assert interactive["model_info"]["degraded"] and interactive["model_info"]["latency_budget"] == 5
+    assert batch["model_info"]["served"] == "llama3:70b-instruct" and not batch["model_info"]["degraded"]
+    assert "model_info" not in agent.format_response("ngoài process")
+    print("✅ Served model metadata OK")
+    return True
+
+
+def main():
+    print("🚀 Model Manager Tests")
+    print("=" * 50)
+    results = [
+        test_aliases_and_keep_alive(), test_grouping_reduces_swaps(), test_batch_limit_prevents_starvation(),
+        test_residency_per_backend(), test_slo_downgrade_under_load(), test_agent_records_served_model()
+    ]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
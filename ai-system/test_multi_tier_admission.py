@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Multi-Tier Admission Test Script
+Kiểm tra admission control của MultiTierAgentSystemManager (semaphore + hàng đợi giới hạn, timeout, 429),
+ring buffer tóm tắt pipeline đã xong và chỉ cache câu trả lời thành công
+"""
+
+import asyncio
+import sys
+import tracemalloc
+from types import SimpleNamespace
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.embedding_service import EmbeddingService, HashingEmbedder
+from agents.multi_tier_agent_system import ResponseAgent
+from agents.multi_tier_system_manager import MultiTierAgentSystemManager, PipelineOverloadedError, SystemState
+from agents.ollama_health import CircuitBreaker, OllamaHealthMonitor, set_ollama_health
+from agents.semantic_cache import SemanticCache
+
+
+def _manager(**kwargs) -> MultiTierAgentSystemManager:
+    manager = MultiTierAgentSystemManager(**kwargs)
+    manager.semantic_cache = SemanticCache(enabled=False)
+    return manager
+
+
+def _stub_pipeline(manager, delay: float = 0.0, fail_every: int = 0):
+    """Thay các tier bằng một bước giả: giữ task có text dài như output LLM thật"""
+    calls = {"n": 0, "running": 0, "peak": 0}
+
+    async def execute_pipeline(pipeline):
+        calls["n"] += 1
+        calls["running"] += 1
+        calls["peak"] = max(calls["peak"], calls["running"])
+        try:
+            pipeline.started_at = pipeline.created_at
+            pipeline.tasks.append(SimpleNamespace(status=None, result={"text": "x" * 20000}))
+            await asyncio.sleep(delay)
+            if fail_every and calls["n"] % fail_every == 0:
+                raise RuntimeError("tier exploded")
+            pipeline.state = SystemState.IDLE
+            return {"success": True, "pipeline_id": pipeline.pipeline_id, "final_response": "y" * 20000,
+                    "quality_scores": {"overall": 0.8}}
+        finally:
+            calls["running"] -= 1
+
+    manager.execute_pipeline = execute_pipeline
+    return calls
+
+
+def test_admission_limits_concurrency_and_rejects():
+    """Tối đa max_concurrent pipeline chạy; hàng đợi đầy bị từ chối ngay, chờ quá timeout cũng bị từ chối"""
+    print("🧪 Testing admission control...")
+    manager = _manager(max_concurrent_pipelines=2, max_queued_pipelines=2, queue_timeout=5, history_size=10)
+    calls = _stub_pipeline(manager, delay=0.1)
+
+    async def burst():
+        return await asyncio.gather(*(manager.process_query(f"q{i}") for i in range(6)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    rejected = [r for r in results if isinstance(r, PipelineOverloadedError)]
+    assert len(rejected) == 2 and all(r.retry_after >= 1 for r in rejected)
+    assert sum(1 for r in results if isinstance(r, dict) and r["success"]) == 4
+    assert calls["peak"] == 2
+    stats = manager.admission.get_stats()
+    assert stats["admitted"] == 4 and stats["rejected_queue_full"] == 2 and stats["active"] == stats["waiting"] == 0
+    assert stats["average_queue_wait"] > 0
+
+    slow = _manager(max_concurrent_pipelines=1, max_queued_pipelines=5, queue_timeout=0.05)
+    _stub_pipeline(slow, delay=0.3)
+
+    async def timeout():
+        return await asyncio.gather(slow.process_query("first"), slow.process_query("second"), return_exceptions=True)
+
+    first, second = asyncio.run(timeout())
+    assert first["success"] and isinstance(second, PipelineOverloadedError)
+    assert slow.admission.rejected_timeout == 1 and slow.admission.waiting == 0
+    print("✅ Admission control OK")
+    return True
+
+
+def test_finished_pipelines_become_bounded_summaries():
+    """Pipeline xong (kể cả lỗi) rời current_pipelines; chỉ giữ history_size bản tóm tắt mới nhất"""
+    print("🧪 Testing pipeline history ring buffer...")
+    manager = _manager(max_concurrent_pipelines=4, max_queued_pipelines=100, queue_timeout=5, history_size=16)
+    _stub_pipeline(manager, fail_every=3)
+
+    async def sustained(n):
+        for start in range(0, n, 8):
+            await asyncio.gather(*(manager.process_query(f"query {i}") for i in range(start, start + 8)))
+
+    # Log lỗi pipeline bị tắt khi đo: handler capture log (vd. của pytest) giữ lại từng record
+    manager.logger.disabled = True
+    try:
+        asyncio.run(sustained(64))
+        tracemalloc.start()
+        asyncio.run(sustained(64))
+        baseline, _ = tracemalloc.get_traced_memory()
+        asyncio.run(sustained(512))
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        manager.logger.disabled = False
+    print(f"   memory growth over 512 pipelines: {(after - baseline) / 1024:.1f}KB")
+    assert after - baseline < 64 * 1024
+
+    assert manager.current_pipelines == {} and manager.system_state == SystemState.IDLE
+    assert len(manager.pipeline_history) == 16
+    newest = manager.pipeline_history[-1]
+    assert newest.query == "query 511" and manager.get_pipeline_summary(newest.pipeline_id)["query"] == "query 511"
+    failed = [s for s in manager.pipeline_history if not s.success]
+    assert failed and all(s.error == "tier exploded" for s in failed)
+    assert all(s.quality_score == 0.8 for s in manager.pipeline_history if s.success)
+
+    status = manager.get_system_status(recent=5)
+    assert status["active_pipelines"] == 0 and len(status["recent_pipelines"]) == 5
+    assert status["admission"]["admitted"] == 640
+    print("✅ Pipeline history ring buffer OK")
+    return True
+
+
+def test_only_successful_answers_are_cached():
+    """Câu trả lời lỗi của LLM làm pipeline thất bại; chỉ câu trả lời đầy đủ khi circuit đóng mới được cache"""
+    print("🧪 Testing semantic cache admission...")
+    agent = ResponseAgent()
+
+    async def failing_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+        raise ConnectionError("ollama down")
+
+    agent._generate = failing_generate
+    failed = asyncio.run(agent.generate_response({"original_query": "q", "quality_scores": {}}))
+    assert not failed["success"] and "ollama down" in failed["error"]
+
+    manager = _manager()
+    manager.semantic_cache = SemanticCache(embedding_service=EmbeddingService(embedder=HashingEmbedder()))
+    outcomes = iter([{"success": False, "error": "response failed"},
+                     {"success": True, "analysis": "partial result of a retried tier"},
+                     {"success": True, "final_response": "degraded"},
+                     {"success": True, "final_response": "fresh answer"}])
+
+    async def execute_pipeline(pipeline):
+        return next(outcomes)
+
+    manager.execute_pipeline = execute_pipeline
+    health = OllamaHealthMonitor(breaker=CircuitBreaker(failure_threshold=1), enabled=True)
+    set_ollama_health(health)
+    try:
+        query = "Giải thích định lý Pitago"
+        assert not asyncio.run(manager.process_query(query))["success"]
+        asyncio.run(manager.process_query(query))
+        health.record_failure(ConnectionError("ollama down"))
+        assert not health.available
+        asyncio.run(manager.process_query(query))
+        assert manager.semantic_cache.get_stats()["entries"] == 0
+    finally:
+        set_ollama_health(None)
+    # Monitor mới (circuit đóng): câu trả lời đầy đủ được cache
+    assert asyncio.run(manager.process_query(query))["final_response"] == "fresh answer"
+    assert asyncio.run(manager.process_query(query))["cache"]["hit"]
+    print("✅ Semantic cache admission OK")
+    return True
+
+
+def main():
+    print("🚀 Multi-Tier Admission Tests")
+    print("=" * 50)
+    results = [test_admission_limits_concurrency_and_rejects(), test_finished_pipelines_become_bounded_summaries(),
+               test_only_successful_answers_are_cached()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Ollama Health Test Script
+Kiểm tra probe nền và circuit breaker: mở sau lỗi liên tiếp, thất bại ngay khi mở, half-open rồi đóng lại, dùng response đã cache
+"""
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.ollama_pool import OllamaPool
+from agents.ollama_health import (
+    CircuitBreaker, OllamaHealthMonitor, CircuitOpenError, set_ollama_health, CLOSED, OPEN, HALF_OPEN
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeOllama:
+    """HTTP server tối giản thay cho Ollama; `up=False` thì trả 500"""
+
+    def __init__(self):
+        self.up = True
+        self.requests = []
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode().split("\r\n")
+        path = lines[0].split(" ")[1]
+        length = next((int(l.split(":")[1]) for l in lines if l.lower().startswith("content-length")), 0)
+        body = json.loads(await reader.readexactly(length)) if length else {}
+        self.requests.append(path)
+        if not self.up:
+            payload, status = {"error": "overloaded"}, "500 Internal Server Error"
+        elif path == "/api/tags":
+            payload, status = {"models": [{"name": "llama3:8b"}]}, "200 OK"
+        elif path == "/api/ps":
+            payload, status = {"models": [{"name": "llama3:8b", "size": 4, "size_vram": 4}]}, "200 OK"
+        else:
+            payload, status = {"response": f"answer to {body.get('prompt')}", "done": True}, "200 OK"
+        data = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+        writer.close()
+
+
+def test_circuit_breaker_states():
+    """closed -> open sau N lỗi; open từ chối; hết recovery_timeout thì half-open giới hạn lượt thử"""
+    print("🧪 Testing circuit breaker...")
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30, half_open_max_calls=1,
+                             success_threshold=2, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    try:
+        breaker.check()
+        assert False, "circuit should reject"
+    except CircuitOpenError as e:
+        assert e.retry_after == 30
+
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == HALF_OPEN and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.retry_after() == 30
+
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_success()
+    assert breaker.state == CLOSED and breaker.to_dict()["rejected"] == 3
+    print("✅ Circuit breaker OK")
+    return True
+
+
+def test_agent_fails_fast_and_recovers():
+    """Ollama lỗi thì circuit mở: call_ollama trả ngay (response cache nếu có); probe thấy Ollama sống lại thì đóng"""
+    print("🧪 Testing fail-fast LLM calls...")
+    from agents.academic_agent import AcademicAgent
+
+    async def scenario():
+        fake = FakeOllama()
+        url = await fake.start()
+        clock = FakeClock()
+        monitor = OllamaHealthMonitor(OllamaPool([url]), interval=60, probe_timeout=1, enabled=True,
+                                      breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=30, clock=clock))
+        set_ollama_health(monitor)
+        try:
+            agent = AcademicAgent()
+            agent.ollama_url = url
+            snapshot = await monitor.probe()
+            assert snapshot["status"] == "healthy" and snapshot["available_models"] == ["llama3:8b"]
+            assert "llama3:8b" in snapshot["loaded_models"]
+
+            cached = await agent.call_ollama("lesson plan")
+            assert cached == "answer to lesson plan"
+
+            fake.up = False
+            errors = [await agent.call_ollama(f"q{i}") for i in range(2)]
+            assert all(e.startswith("Error: Unable to process request") for e in errors)
+            assert monitor.breaker.state == OPEN
+
+            generate_calls = fake.requests.count("/api/generate")
+            started = time.perf_counter()
+            rejected = await agent.call_ollama("q3")
+            degraded = await agent.call_ollama("lesson plan")
+            elapsed = time.perf_counter() - started
+            assert "circuit open" in rejected and degraded == "answer to lesson plan"
+            assert fake.requests.count("/api/generate") == generate_calls and elapsed < 0.05
+
+            structured = await agent.generate_structured("q4")
+            assert not structured.ok and "circuit open" in structured.text
+
+            await monitor.probe()
+            health = monitor.snapshot()
+            assert health["status"] == "unhealthy" and health["circuit"]["state"] == OPEN
+            assert health["calls"] == {"succeeded": 1, "failed": 2, "rejected": 3, "served_from_cache": 1}
+
+            fake.up = True
+            await monitor.probe()
+            assert monitor.snapshot()["circuit"]["state"] == HALF_OPEN
+            assert await agent.call_ollama("q5") == "answer to q5"
+            assert monitor.snapshot()["circuit"]["state"] == CLOSED
+
+            # 404 (model không có) không làm mở circuit
+            monitor.breaker.failure_threshold = 1
+            agent.ollama_url = url + "/missing"
+            await agent.call_ollama("q6")
+            assert monitor.breaker.state == CLOSED
+        finally:
+            set_ollama_health(None)
+            await monitor.stop()
+            await fake.stop()
+
+    asyncio.run(scenario())
+    print("✅ Fail-fast LLM calls OK")
+    return True
+
+
+def test_health_snapshot_is_constant_time():
+    """snapshot() không gọi mạng và chỉ tính lại khi trạng thái đổi; circuit hết hạn mở được phản ánh ngay"""
+    print("🧪 Testing health snapshot...")
+    clock = FakeClock()
+    monitor = OllamaHealthMonitor(OllamaPool(["http://127.0.0.1:9"]), interval=60, probe_timeout=0.5, enabled=True,
+                                  breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=5, clock=clock))
+    snapshot = asyncio.run(monitor.probe())
+    assert snapshot["status"] == "unhealthy" and snapshot["circuit"]["state"] == OPEN and snapshot["last_error"]
+
+    started = time.perf_counter()
+    for _ in range(10000):
+        monitor.snapshot()
+    per_call_us = (time.perf_counter() - started) / 10000 * 1e6
+    print(f"   snapshot={per_call_us:.2f}µs")
+    assert per_call_us < 50
+
+    clock.now += 5
+    assert monitor.snapshot()["circuit"]["state"] == HALF_OPEN
+
+    # Lần gọi LLM chỉ đánh dấu snapshot cũ; tính lại một lần khi /health đọc
+    refreshes = []
+    refresh = monitor._refresh_snapshot
+    monitor._refresh_snapshot = lambda: (refreshes.append(1), refresh())
+    for _ in range(1000):
+        monitor.record_success(0.05)
+    assert refreshes == []
+    snapshot = monitor.snapshot()
+    assert snapshot["calls"]["succeeded"] == 1000 and snapshot["circuit"]["state"] == CLOSED
+    monitor.snapshot()
+    assert len(refreshes) == 1
+    disabled = OllamaHealthMonitor(OllamaPool(["http://127.0.0.1:9"]), enabled=False)
+    disabled.before_call()
+    assert disabled.snapshot()["circuit"] == {"state": "disabled"} and disabled.available
+    print("✅ Health snapshot OK")
+    return True
+
+
+def main():
+    print("🚀 Ollama Health Tests")
+    print("=" * 50)
+    results = [test_circuit_breaker_states(), test_agent_fails_fast_and_recovers(), test_health_snapshot_is_constant_time()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Ollama Pool Test Script
+Kiểm tra pool nhiều backend Ollama (chạy nhiều process fake Ollama): inventory model, least-outstanding + affinity,
+failover, loại/nhận lại backend lỗi và hedged request
+"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.ollama_pool import OllamaPool, set_ollama_pool
+from agents.ollama_health import OllamaUnavailableError, CLOSED, OPEN, HALF_OPEN
+
+AI_SYSTEM_DIR = Path(__file__).parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeOllamaProcess:
+    """benchmarks.fake_ollama chạy trong process riêng"""
+
+    def __init__(self, models: str = "llama3:8b-instruct", ttft_ms: float = 20, port: int = None):
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.args = [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(self.port), "--models", models,
+                     "--ttft-ms", str(ttft_ms), "--response-tokens", "5", "--tokens-per-second", "1000"]
+        self.process = None
+
+    def start(self) -> "FakeOllamaProcess":
+        self.process = subprocess.Popen(self.args, cwd=AI_SYSTEM_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return self
+
+    def wait_ready(self, timeout: float = 20.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.url}/api/tags", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Fake Ollama at {self.url} did not start")
+
+    def stats(self):
+        return httpx.get(f"{self.url}/api/stats", timeout=2.0).json()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+            self.process = None
+
+
+def _start(*servers):
+    for server in servers:
+        server.start()
+    for server in servers:
+        server.wait_ready()
+    return servers
+
+
+def test_routing_prefers_idle_backend_with_model():
+    """Least-outstanding có cộng affinity; backend không có model hoặc bị loại không được chọn"""
+    print("🧪 Testing routing decisions...")
+    pool = OllamaPool(["http://a:1", "http://b:1/", "http://c:1", "http://a:1"], affinity_weight=2)
+    a, b, c = pool.backends
+    assert pool.urls == ["http://a:1", "http://b:1", "http://c:1"]
+    a.models = b.models = {"llama3:8b"}
+    c.models = {"mistral:7b"}
+    b.loaded = {"llama3:8b": {}}
+
+    # b đã nạp model: được chọn tới khi bận hơn a quá affinity_weight request
+    assert pool.pick("llama3:8b") is b
+    b.outstanding = 2
+    assert pool.candidates("llama3:8b")[0] is a
+    b.outstanding = 1
+    assert pool.candidates("llama3:8b") == [b, a]
+    assert pool.candidates("mistral:7b") == [c]
+    # Không backend nào có model: thử mọi backend còn hoạt động
+    assert len(pool.candidates("unknown:1b")) == 3
+
+    latency = OllamaPool(["http://a:1", "http://b:1"], strategy="latency", affinity_weight=0)
+    fast, slow = latency.backends
+    fast.latency, slow.latency = 0.5, 2.0
+    fast.outstanding = 4
+    assert latency.pick("m") is slow
+    fast.outstanding = 2
+    assert latency.pick("m") is fast
+
+    for _ in range(3):
+        b.record_failure(Exception("boom"))
+    assert b.ejected and pool.candidates("llama3:8b") == [a]
+    assert pool.should_hedge(100, stream=False) is False
+    try:
+        OllamaPool(["http://a:1"], strategy="random")
+        assert False, "unknown strategy should be rejected"
+    except ValueError:
+        pass
+    print("✅ Routing decisions OK")
+    return True
+
+
+def test_pool_against_fake_ollama_processes():
+    """Ba process fake Ollama: request chia đều theo model, backend chết bị loại, khởi động lại thì được nhận lại"""
+    print("🧪 Testing pool with fake Ollama processes...")
+    from agents.academic_agent import AcademicAgent
+    from agents.ollama_health import OllamaHealthMonitor, set_ollama_health
+    from agents.model_manager import ModelManager, ModelManagerConfig, set_model_manager
+
+    first, second, mistral = _start(FakeOllamaProcess(), FakeOllamaProcess(), FakeOllamaProcess("mistral:7b-instruct"))
+    restarted = FakeOllamaProcess(port=first.port)
+    pool = OllamaPool([first.url, second.url, mistral.url], failure_threshold=2, eject_seconds=60)
+    monitor = OllamaHealthMonitor(pool, interval=60, probe_timeout=2, enabled=True)
+    set_ollama_pool(pool)
+    set_ollama_health(monitor)
+    set_model_manager(ModelManager(ModelManagerConfig(max_concurrent_per_model=4, max_loaded_models=2)))
+    try:
+        agent = AcademicAgent()
+        mistral_agent = AcademicAgent()
+        mistral_agent.model = "mistral:7b-instruct"
+
+        async def burst(n, target=agent):
+            return await asyncio.gather(*(target.call_ollama(f"câu hỏi {i}") for i in range(n)))
+
+        async def scenario():
+            snapshot = await monitor.probe()
+            assert snapshot["status"] == "healthy"
+            assert pool.backend(mistral.url).models == {"mistral:7b-instruct"}
+            assert "mistral:7b-instruct" in snapshot["available_models"]
+
+            answers = await burst(12)
+            assert not any(a.startswith("Error") for a in answers)
+            counts = [first.stats()["requests"], second.stats()["requests"], mistral.stats()["requests"]]
+            assert counts[2] == 0 and counts[0] + counts[1] == 12 and min(counts[:2]) >= 3, counts
+            assert not (await burst(2, mistral_agent))[0].startswith("Error")
+            assert mistral.stats()["by_model"] == {"mistral:7b-instruct": 2}
+
+            first.stop()
+            answers = await burst(6)
+            assert not any(a.startswith("Error") for a in answers)
+            assert pool.backend(first.url).ejected and pool.failovers >= 1
+            assert second.stats()["requests"] >= counts[1] + 6
+
+            snapshot = await monitor.probe()
+            assert snapshot["status"] == "degraded" and monitor.breaker.state == CLOSED
+            ejected = [b for b in snapshot["backends"]["backends"] if b["url"] == first.url][0]
+            assert ejected["circuit"] == OPEN and not ejected["healthy"]
+
+            restarted.start().wait_ready()
+            await monitor.probe()
+            assert pool.backend(first.url).breaker.state == HALF_OPEN
+            await burst(8)
+            assert pool.backend(first.url).breaker.state == CLOSED
+            return first.stats()["requests"]
+
+        readmitted_requests = asyncio.run(scenario())
+        assert readmitted_requests >= 1
+    finally:
+        set_ollama_pool(None)
+        set_ollama_health(None)
+        set_model_manager(None)
+        for server in (first, second, mistral, restarted):
+            server.stop()
+    print("✅ Fake Ollama processes OK")
+    return True
+
+
+def test_hedged_request_beats_slow_backend():
+    """Backend chọn trước chậm: sau hedge_delay gửi thêm bản thứ hai, lấy kết quả về trước và hủy bản còn lại"""
+    print("🧪 Testing hedged requests...")
+    slow, fast = _start(FakeOllamaProcess(ttft_ms=1500), FakeOllamaProcess(ttft_ms=20))
+    pool = OllamaPool([slow.url, fast.url], hedge_delay=0.1, hedge_max_prompt_chars=500)
+    set_ollama_pool(pool)
+    try:
+        from agents.academic_agent import AcademicAgent
+        agent = AcademicAgent()
+
+        async def scenario():
+            started = time.perf_counter()
+            answer = await agent.call_ollama("câu hỏi ngắn")
+            elapsed = time.perf_counter() - started
+            long_prompt_started = time.perf_counter()
+            await agent.call_ollama("x" * 600)
+            return answer, elapsed, time.perf_counter() - long_prompt_started
+
+        answer, elapsed, unhedged = asyncio.run(scenario())
+        print(f"   hedged={elapsed * 1000:.0f}ms, long prompt (not hedged)={unhedged * 1000:.0f}ms")
+        assert not answer.startswith("Error") and elapsed < 1.0
+        assert pool.hedges == 1 and pool.hedge_wins == 1
+        assert all(b.outstanding == 0 for b in pool.backends)
+        assert all(b.breaker.state == CLOSED for b in pool.backends)
+    finally:
+        set_ollama_pool(None)
+        slow.stop()
+        fast.stop()
+
+    empty = OllamaPool(["http://127.0.0.1:9"], failure_threshold=1)
+
+    async def no_backend():
+        async def send(backend):
+            raise httpx.ConnectError("refused")
+        for _ in range(2):
+            try:
+                await empty.request("m", send)
+            except (httpx.ConnectError, OllamaUnavailableError) as e:
+                last = e
+        return last
+
+    assert isinstance(asyncio.run(no_backend()), OllamaUnavailableError)
+    print("✅ Hedged requests OK")
+    return True
+
+
+def main():
+    print("🚀 Ollama Pool Tests")
+    print("=" * 50)
+    results = [test_routing_prefers_idle_backend_with_model(), test_pool_against_fake_ollama_processes(),
+               test_hedged_request_beats_slow_backend()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Prediction Models Test Script
+Kiểm tra registry mô hình dự báo điểm: huấn luyện theo môn, version trên đĩa và nạp lại lười, dự báo vector hóa
+cả lớp trong vài micro giây mỗi học sinh, tự huấn luyện lại khi có điểm mới và agent không gọi LLM khi đã có mô hình
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.prediction_models import (GLOBAL_SCOPE, ModelRegistry, model_scope, performance_features,
+                                      set_model_registry)
+
+
+def _history(n: int, seed: int = 5, semester: str = "HK1"):
+    """Kết quả học tập giả lập: điểm tổng kết phụ thuộc điểm bài tập, điểm kiểm tra, xu hướng và chuyên cần"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        ability = rng.uniform(3.0, 9.5)
+        slope = rng.uniform(-0.3, 0.3)
+        assignments = [min(10.0, max(0.0, ability + slope * w + rng.gauss(0, 0.5))) for w in range(rng.randint(4, 10))]
+        exams = [min(10.0, max(0.0, ability + rng.gauss(0, 0.7))) for _ in range(rng.randint(1, 3))]
+        attendance = rng.uniform(0.6, 1.0)
+        final = 0.5 * np.mean(assignments) + 0.4 * np.mean(exams) + 3 * slope + 2.0 * (attendance - 0.8) + 0.6
+        records.append({"student_id": f"sv{i:05d}", "semester": semester, "assignment_scores": assignments,
+                        "exam_scores": exams, "attendance_rate": attendance,
+                        "final_grade": round(float(min(10.0, max(0.0, final + rng.gauss(0, 0.2)))), 2)})
+    return records
+
+
+def test_registry_versions_and_batch_inference():
+    """Huấn luyện theo môn, version mới khi huấn luyện lại, registry mới nạp lười từ đĩa, dự báo cả lớp một lượt"""
+    print("🧪 Testing model registry...")
+    features = performance_features([{"assignment_scores": [6, 7, 8], "attendance_rate": 90}, {}])
+    assert features.shape == (2, 8) and features[0, 0] == 7.0 and abs(features[0, 1] - 1.0) < 1e-9
+    assert features[0, 5] == 90.0 and np.isnan(features[1]).sum() == 7 and features[1, 2] == 0
+    attendance = performance_features([{"attendance": [90, 1, 1]}, {"attendance": [0.9, 1.0]}])[:, 5]
+    assert abs(attendance[0] - 92 / 3) < 1e-9 and abs(attendance[1] - 95.0) < 1e-9
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp, kind="auto", min_samples=20, retrain_min_new=10 ** 6)
+        scope = model_scope("MATH101")
+        assert scope == "course:MATH101" and model_scope(None, "CS") == "program:CS" and model_scope() == GLOBAL_SCOPE
+        history = _history(1500)
+        assert registry.add_records(scope, history)["added"] == 1500
+        # final_grade kiểu bool hoặc không hữu hạn bị bỏ qua, không làm hỏng lần huấn luyện
+        invalid = [{"student_id": f"bad{i}", "final_grade": v} for i, v in enumerate((True, float("nan"), float("inf"), "8"))]
+        assert registry.add_records(scope, invalid) == {"added": 0, "updated": 0, "skipped": 4, "pending": 1500,
+                                                        "retrained": None}
+        try:
+            registry.predict(scope, history[:1])
+            assert False, "scope without a model must be rejected"
+        except LookupError:
+            pass
+
+        first = registry.train(scope)
+        assert first["version"] == 1 and first["kind"] in ("ridge", "gradient_boosting")
+        assert first["metrics"]["mae"] < 0.6 and set(first["metrics"]["candidates"]) == {"ridge", "gradient_boosting"}
+        second = registry.train(scope, kind="gradient_boosting")
+        assert second["version"] == 2 and [v["active"] for v in registry.versions(scope)] == [False, True]
+        assert (Path(tmp) / "course_MATH101" / "v2.joblib").exists()
+        registry.activate(scope, 1)
+        assert registry.active_model(scope)["version"] == 1
+
+        # Worker khác: đọc registry trên đĩa, nạp mô hình lần đầu dùng rồi giữ trong cache
+        reloaded = ModelRegistry(tmp)
+        students = [{k: v for k, v in r.items() if k != "final_grade"} for r in _history(2000, seed=9)]
+        truth = np.array([r["final_grade"] for r in _history(2000, seed=9)])
+        reloaded.predict(scope, students[:1])
+        batch = reloaded.predict(scope, students)
+        assert batch.version == 1 and reloaded.stats["model_loads"] == 1 and reloaded.stats["cache_hits"] == 1
+        assert np.abs(batch.predictions - truth).mean() < 0.6
+        per_student_us = batch.elapsed_ms * 1000 / len(students)
+        print(f"   {len(students)} students in {batch.elapsed_ms:.1f} ms ({per_student_us:.1f} µs/student)")
+        assert per_student_us < 500
+        rows = batch.students(pass_grade=5.0)
+        assert rows[0]["student_id"] == "sv00000" and len(rows[0]["confidence_interval"]) == 2
+        assert all(r["at_risk"] == (r["predicted_grade"] < 5.0) for r in rows)
+        # Dự báo và khoảng tin cậy nằm trong khoảng điểm của dữ liệu huấn luyện
+        low, high = min(r["final_grade"] for r in history), max(r["final_grade"] for r in history)
+        assert batch.bounds == (low, high)
+        assert all(low <= r["confidence_interval"][0] <= r["predicted_grade"] <= r["confidence_interval"][1] <= high
+                   for r in rows)
+
+        # Môn chưa có mô hình dùng mô hình chung
+        reloaded.train(GLOBAL_SCOPE, kind="ridge")
+        assert reloaded.predict(model_scope("PHYS101"), students[:5]).scope == GLOBAL_SCOPE
+    print("✅ Model registry OK")
+    return True
+
+
+def test_incremental_retraining_and_agents():
+    """Đủ điểm mới thì tự huấn luyện version mới; agent dự báo bằng mô hình, LLM chỉ dùng khi chưa có mô hình"""
+    print("🧪 Testing incremental retraining and agents...")
+    registry = ModelRegistry(None, kind="ridge", min_samples=20, retrain_min_new=50)
+    set_model_registry(registry)
+    try:
+        from agents.academic_agent import AcademicAgent
+        from agents.education_data_agent import EducationDataAgent
+        scope = model_scope("MATH101")
+        first = registry.add_records(scope, _history(30))
+        assert first["retrained"] is None and first["pending"] == 30
+        second = registry.add_records(scope, _history(40, seed=6, semester="HK2"))
+        assert second["retrained"]["version"] == 1 and registry.pending(scope) == 0
+        # Cập nhật điểm của cùng học sinh/học kỳ không tạo bản ghi mới
+        updated = registry.add_records(scope, _history(40, seed=7, semester="HK2"))
+        assert updated["added"] == 0 and updated["updated"] == 40
+        assert registry.get_stats()["records_by_scope"] == {scope: 70} and registry.pending(scope) == 40
+        # Bản ghi không có student_id: khóa theo nội dung, bản khác nhau không ghi đè nhau, bản trùng hệt chỉ lưu một
+        anonymous = [{k: v for k, v in r.items() if k != "student_id"} for r in _history(3, seed=10, semester="HK2")]
+        stored = registry.add_records(model_scope("ANON"), anonymous + anonymous[:1], retrain=False)
+        assert stored["added"] == 3 and stored["updated"] == 1
+        assert registry.get_stats()["records_by_scope"][model_scope("ANON")] == 3
+
+        agent = EducationDataAgent()
+        result = asyncio.run(agent.process("student_performance_prediction", {
+            "course_id": "MATH101", "historical_data": _history(60, seed=8, semester="HK3"),
+            "students": [{"student_id": "good", "assignment_scores": [9, 9.5, 9], "exam_scores": [9]},
+                         {"student_id": "weak", "assignment_scores": [5, 4, 3], "exam_scores": [3.5],
+                          "attendance_rate": 0.6}]
+        }))
+        assert result["success"] and result["training"]["retrained"]["version"] == 2
+        assert result["model"]["version"] == 2 and result["at_risk_students"] == ["weak"]
+        # Điểm đạt theo từng yêu cầu (vd. môn yêu cầu 9.8)
+        strict = asyncio.run(agent.process("student_performance_prediction", {
+            "course_id": "MATH101", "pass_grade": 9.8,
+            "students": [{"student_id": "good", "assignment_scores": [9, 9.5, 9], "exam_scores": [9]}]}))
+        assert strict["at_risk_students"] == ["good"]
+        # Lịch sử của một học sinh không có student_id trong từng bản ghi: gắn student_id của yêu cầu
+        own = asyncio.run(agent.process("student_performance_prediction", {
+            "course_id": "MATH101", "student_id": "sv_own",
+            "historical_data": [{"semester": term, "assignment_scores": [7, 8], "final_grade": grade}
+                                for term, grade in (("HK1", 7.5), ("HK2", 8.0))],
+            "current_performance": {"assignment_scores": [8, 8]}}))
+        assert own["training"]["added"] == 2
+        keys = {row[0] for row in registry._conn.execute("SELECT record_key FROM outcomes WHERE scope = ?", (scope,))}
+        assert {"sv_own|HK1|", "sv_own|HK2|"} <= keys
+
+        academic = AcademicAgent()
+        calls = []
+
+        async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+            calls.append(prompt)
+            text = '{"predicted_gpa": 7.0}'
+            if on_chunk is not None:
+                on_chunk(text)
+            return text
+
+        academic._generate = fake_generate
+        predicted = asyncio.run(academic.process("predict_academic_outcomes", {
+            "student_id": "weak", "course_id": "MATH101",
+            "current_performance": {"assignment_scores": [5, 4, 3], "exam_scores": [3.5]}}))
+        assert calls == [] and predicted["response"]["at_risk"] and predicted["response"]["model"]["version"] == 2
+        lenient = asyncio.run(academic.process("predict_academic_outcomes", {
+            "student_id": "weak", "course_id": "MATH101", "pass_grade": 0,
+            "current_performance": {"assignment_scores": [5, 4, 3], "exam_scores": [3.5]}}))
+        assert not lenient["response"]["at_risk"]
+        # Môn chưa có mô hình (và chưa có mô hình chung): vẫn dự báo bằng LLM
+        asyncio.run(academic.process("predict_academic_outcomes", {"student_id": "x", "course_id": "BIO101"}))
+        assert len(calls) == 1
+    finally:
+        set_model_registry(None)
+    print("✅ Incremental retraining and agents OK")
+    return True
+
+
+def main():
+    print("🚀 Prediction Models Tests")
+    print("=" * 50)
+    results = [test_registry_versions_and_batch_inference(), test_incremental_retraining_and_agents()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
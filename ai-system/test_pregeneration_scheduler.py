@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Pregeneration Scheduler Test Script
+Kiểm tra tạo trước nội dung catalog ngoài giờ cao điểm: khung giờ (kể cả qua nửa đêm), ngân sách mỗi khung,
+chạy tiếp từ cursor, nhường request của người dùng và request giờ cao điểm theo course_id trở thành cache hit
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.content_repository import ContentRepository, set_content_repository
+from agents.ollama_health import CircuitBreaker, OllamaHealthMonitor, set_ollama_health
+from agents.question_bank import QuestionBank, set_question_bank
+from agents.pregeneration_scheduler import PregenerationScheduler, parse_windows
+from agents.state_backend import MemoryStateBackend, SQLiteStateBackend
+
+
+class Clock:
+    def __init__(self, value: str):
+        self.now = datetime.fromisoformat(value)
+
+    def __call__(self):
+        return self.now
+
+
+def _agent_with_fake_llm():
+    from agents.content_generation_agent import ContentGenerationAgent
+    agent = ContentGenerationAgent()
+    calls = []
+
+    async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+        calls.append(prompt)
+        required = format.get("required", []) if isinstance(format, dict) else []
+        if "main_content" in required:
+            text = json.dumps({"title": "Bài học", "main_content": [{"section": "Nội dung", "content": "x " * 300}]})
+        elif "exercises" in required:
+            text = json.dumps({"exercises": [{"question": "Câu hỏi"}]})
+        elif "questions" in required:
+            text = json.dumps({"questions": [{"question": "Câu hỏi", "options": ["a", "b"], "correct_answer": "a"}]})
+        else:
+            text = "Mục tiêu 1"
+        if on_chunk is not None:
+            on_chunk(text)
+        return text
+
+    agent._generate = fake_generate
+    return agent, calls
+
+
+def test_windows():
+    """Khung giờ thường và qua nửa đêm; ID khung của đêm trước giữ nguyên sau 0h"""
+    print("🧪 Testing off-peak windows...")
+    assert parse_windows("22:00-06:00, 12:30-13:30") == [(1320, 360), (750, 810)]
+    try:
+        parse_windows("25:00-06:00")
+        assert False, "invalid window must be rejected"
+    except ValueError:
+        pass
+
+    clock = Clock("2026-10-19T23:30:00")
+    scheduler = PregenerationScheduler(windows="22:00-06:00,12:30-13:30", backend=MemoryStateBackend(), clock=clock)
+    assert scheduler.current_window() == "2026-10-19T22:00"
+    clock.now = datetime.fromisoformat("2026-10-20T05:59:00")
+    assert scheduler.current_window() == "2026-10-19T22:00"
+    clock.now = datetime.fromisoformat("2026-10-20T09:00:00")
+    assert scheduler.current_window() is None
+    clock.now = datetime.fromisoformat("2026-10-20T12:45:00")
+    assert scheduler.current_window() == "2026-10-20T12:30"
+    print("✅ Off-peak windows OK")
+    return True
+
+
+def test_pregeneration_budget_resume_and_hits():
+    """Ngân sách dừng lượt chạy, lượt sau chạy tiếp từ cursor; nội dung còn mới bị bỏ qua; giờ cao điểm là cache hit"""
+    print("🧪 Testing pregeneration run...")
+    set_content_repository(ContentRepository(min_quality=0, max_age_seconds=30 * 86400))
+    set_question_bank(QuestionBank())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = str(Path(tmp) / "state.db")
+            clock = Clock("2026-10-19T02:00:00")
+            agent, calls = _agent_with_fake_llm()
+            scheduler = PregenerationScheduler(agent, windows="01:00-06:00", fields=["k12_education"],
+                                               max_jobs_per_window=4, max_seconds_per_window=3600,
+                                               backend=SQLiteStateBackend(state_path), clock=clock)
+
+            async def scenario():
+                jobs = await scheduler.jobs()
+                assert jobs[0].course_id == "K12_MATH101" and [j.content_type for j in jobs[:3]] == ["lesson", "exercise", "quiz"]
+                scheduler._jobs = jobs[:6]
+
+                first = await scheduler.run_window_once()
+                assert first["generated"] == 4 and first["stopped"] == "budget_exhausted"
+                assert await scheduler.run_window_once() is None
+
+                # Khung giờ hôm sau, "worker mới" (scheduler mới cùng state): chạy tiếp từ job thứ 5, rồi bỏ qua job đã có
+                clock.now = datetime.fromisoformat("2026-10-20T01:30:00")
+                resumed = PregenerationScheduler(agent, windows="01:00-06:00", max_jobs_per_window=4,
+                                                 max_seconds_per_window=3600,
+                                                 backend=SQLiteStateBackend(state_path), clock=clock)
+                resumed._jobs = jobs[:6]
+                second = await resumed.run_window_once()
+                assert second["generated"] == 2 and second["skipped_fresh"] == 4 and second["stopped"] == "pass_complete"
+                assert resumed.budget_used("2026-10-20T01:00")["jobs"] == 2
+                assert resumed.budget.snapshot().keys() == {"2026-10-20T01:00:jobs", "2026-10-20T01:00:seconds"}
+
+                # Giờ cao điểm: request theo course_id + topic không gọi LLM
+                llm_calls = len(calls)
+                topic = jobs[0].topic
+                lesson = await agent.process("generate_lesson", {"course_id": "K12_MATH101", "topic": topic})
+                quiz = await agent.process("generate_quiz", {"course_id": "K12_MATH101", "topic": topic.upper()})
+                assert lesson["reused"] and quiz["reused"] and len(calls) == llm_calls
+                assert lesson["content"].metadata["subject"].startswith("Toán Lớp 1")
+                missing = await agent.process("generate_lesson", {"course_id": "NOPE999", "topic": topic})
+                assert not missing["success"] and "not found" in missing["error"]
+
+            asyncio.run(scenario())
+            stats = agent.content_repository.get_stats()
+            # Kiểm tra của scheduler không được tính là lần dùng lại
+            assert stats["total_contents"] == 6 and stats["reuse_hits"] == 2
+    finally:
+        set_content_repository(None)
+        set_question_bank(None)
+    print("✅ Pregeneration run OK")
+    return True
+
+
+def test_yields_to_foreground_requests():
+    """Khi Ollama đang phục vụ request của người dùng, scheduler chờ; hết khung giờ thì dừng"""
+    print("🧪 Testing low-priority yielding...")
+    set_content_repository(ContentRepository(min_quality=0))
+    try:
+        clock = Clock("2026-10-19T05:59:00")
+        agent, calls = _agent_with_fake_llm()
+        scheduler = PregenerationScheduler(agent, windows="01:00-06:00", max_jobs_per_window=10, check_interval=0.01,
+                                           backend=MemoryStateBackend(), clock=clock)
+        scheduler._foreground_inflight = lambda: 1
+
+        async def scenario():
+            scheduler._jobs = (await scheduler.jobs())[:3]
+            task = asyncio.create_task(scheduler.run_window_once())
+            await asyncio.sleep(0.05)
+            clock.now = datetime.fromisoformat("2026-10-19T06:00:00")
+            return await task
+
+        summary = asyncio.run(scenario())
+        assert summary["stopped"] == "window_closed" and summary["generated"] == 0 and calls == []
+        assert scheduler.stats["yielded"] >= 2
+    finally:
+        set_content_repository(None)
+    print("✅ Low-priority yielding OK")
+    return True
+
+
+def test_manual_run_is_bounded():
+    """Lượt chạy thủ công: max_jobs tính cả job bỏ qua, dừng ngay khi circuit mở, có hạn chót khi Ollama bận,
+    không chạy song song với lượt đang chạy"""
+    print("🧪 Testing manual run limits...")
+    set_content_repository(ContentRepository(min_quality=0, max_age_seconds=30 * 86400))
+    try:
+        agent, _ = _agent_with_fake_llm()
+        scheduler = PregenerationScheduler(agent, windows="01:00-06:00", max_jobs_per_window=100, check_interval=0.01,
+                                           backend=MemoryStateBackend(), clock=Clock("2026-10-19T12:00:00"))
+
+        async def scenario():
+            scheduler._jobs = (await scheduler.jobs())[:3]
+            first = await scheduler.run_now(max_jobs=2)
+            assert first["window"] == "manual" and first["generated"] == 2 and first["stopped"] == "max_jobs"
+            # Job thứ ba, rồi cursor quay lại: job đã có bị bỏ qua nhưng vẫn tính vào max_jobs
+            await scheduler.run_now(max_jobs=1)
+            skipped = await scheduler.run_now(max_jobs=2)
+            assert skipped["attempted"] == 2 and skipped["skipped_fresh"] == 2 and skipped["stopped"] == "max_jobs"
+
+            scheduler._foreground_inflight = lambda: 1
+            busy = await asyncio.wait_for(scheduler.run_now(timeout=0.05), timeout=5)
+            assert busy["stopped"] == "deadline" and busy["attempted"] == 0
+
+            health = OllamaHealthMonitor(breaker=CircuitBreaker(failure_threshold=1), enabled=True)
+            health.record_failure(ConnectionError("ollama down"))
+            set_ollama_health(health)
+            try:
+                down = await asyncio.wait_for(scheduler.run_now(timeout=60), timeout=5)
+                assert down["stopped"] == "ollama_unavailable" and down["attempted"] == 0
+            finally:
+                set_ollama_health(None)
+
+            scheduler.running = True
+            try:
+                await scheduler.run_now()
+                assert False, "concurrent run must be refused"
+            except RuntimeError:
+                pass
+            assert scheduler.running
+
+        asyncio.run(scenario())
+    finally:
+        set_content_repository(None)
+    print("✅ Manual run limits OK")
+    return True
+
+
+def main():
+    print("🚀 Pregeneration Scheduler Tests")
+    print("=" * 50)
+    results = [test_windows(), test_pregeneration_budget_resume_and_hits(), test_yields_to_foreground_requests(),
+               test_manual_run_is_bounded()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Question Bank Test Script
+Kiểm tra ngân hàng câu hỏi và bộ ghép đề: đúng tổng điểm, tỷ lệ loại câu hỏi, thời lượng, không lặp câu trong
+một lớp, ghép đề 40 câu trong vài mili giây và LLM chỉ được gọi để tạo phần còn thiếu
+"""
+
+import asyncio
+import json
+import random
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.content_repository import ContentRepository, set_content_repository
+from agents.question_bank import QuestionBank, set_question_bank, split_integer
+
+
+def _seed_bank(bank: QuestionBank, n: int = 1500):
+    rng = random.Random(7)
+    questions = []
+    for i in range(n):
+        qtype = rng.choice(["multiple_choice", "short_answer", "essay"])
+        points = {"multiple_choice": rng.choice([1, 2, 3]), "short_answer": rng.choice([3, 4, 5]),
+                  "essay": rng.choice([8, 10, 12])}[qtype]
+        questions.append({"question": f"Câu {i} ({qtype})", "type": qtype, "points": points,
+                          "difficulty": rng.choice(["easy", "medium", "hard"]),
+                          "topic": rng.choice(["Đạo hàm", "Tích phân", "Giới hạn"]), "answer": f"Đáp án {i}"})
+    bank.add_questions(questions, "Toán")
+
+
+def test_assembly_constraints_and_speed():
+    """Đề 40 câu: đúng điểm từng loại, không quá thời lượng, không lặp trong lớp, ghép trong vài ms"""
+    print("🧪 Testing exam assembly...")
+    assert split_integer(100, {"a": 1, "b": 1, "c": 1}) == {"a": 34, "b": 33, "c": 33}
+    bank = QuestionBank()
+    _seed_bank(bank)
+    first = bank.get_questions([1])[0]
+    # Trùng nội dung (sau chuẩn hóa) với câu đã có: không thêm mới, trả về ID cũ
+    assert bank.add_questions([{"question": first["question"].upper() + " ", "type": first["type"]}], "toán") == [1]
+    assert bank.stats["duplicates"] == 1
+
+    used = set()
+    timings = []
+    for exam in range(3):
+        assembly = bank.assemble("toan", ["dao ham", "Tích phân"], {"multiple_choice": 0.6, "short_answer": 0.4},
+                                 total_points=100, duration=90, class_id="12A1", seed=exam)
+        timings.append(assembly.solve_ms)
+        assert assembly.complete and assembly.total_points == 100 and assembly.total_minutes <= 90
+        by_type = {}
+        for question in assembly.questions:
+            by_type[question["type"]] = by_type.get(question["type"], 0) + question["points"]
+            assert question["topic"] in ("Đạo hàm", "Tích phân")
+        assert by_type == {"multiple_choice": 60, "short_answer": 40}
+        ids = {q["bank_id"] for q in assembly.questions}
+        assert not ids & used and len(assembly.questions) >= 30
+        used |= ids
+        bank.record_usage("12A1", f"exam_{exam}", list(ids))
+    print(f"   assembly: {timings} ms for ~{len(assembly.questions)} questions")
+    assert min(timings) < 50
+
+    # Lớp khác được dùng lại câu hỏi; điểm không ghép được (chỉ có essay 8/10/12) thành gap
+    other = bank.assemble("toan", [], ["essay"], total_points=33, class_id="12A2")
+    assert other.total_points == 32 and other.gaps == [{"type": "essay", "points": 1, "count": 1}]
+
+    quiz = bank.assemble("toan", ["Giới hạn"], ["multiple_choice"], question_count=40, duration=30)
+    assert len(quiz.questions) == 20 and quiz.gaps == [{"type": "multiple_choice", "points": None, "count": 20}]
+    print("✅ Exam assembly OK")
+    return True
+
+
+def test_agent_calls_llm_only_for_gaps():
+    """Ngân hàng trống: tạo cả đề rồi đưa vào ngân hàng; sau đó đề được ghép, LLM chỉ tạo câu còn thiếu"""
+    print("🧪 Testing exam generation from the bank...")
+    set_content_repository(ContentRepository())
+    set_question_bank(QuestionBank())
+    try:
+        from agents.content_generation_agent import ContentGenerationAgent
+        agent = ContentGenerationAgent()
+        prompts = []
+        repeat = False
+
+        async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+            prompts.append(prompt)
+            required = format.get("required", []) if isinstance(format, dict) else []
+            if "sections" in required:
+                text = json.dumps({"exam_info": {"title": "Đề Toán"}, "sections": [
+                    {"name": "Trắc nghiệm", "topics": ["Đạo hàm"], "questions": [
+                        {"type": "multiple_choice", "question": f"Trắc nghiệm {i}", "points": 5, "answer": "A"}
+                        for i in range(10)]},
+                    {"name": "Tự luận", "topics": ["Đạo hàm"], "questions": [
+                        {"type": "essay", "question": f"Tự luận {i}", "points": 10, "answer": "..."} for i in range(5)]}
+                ]}, ensure_ascii=False)
+            elif repeat:
+                # LLM lặp lại câu lớp đã làm và lặp câu trong cùng lượt
+                old = "Trắc nghiệm 0" if "multiple_choice" in prompt else "Tự luận 0"
+                text = json.dumps({"questions": [{"question": q, "answer": "B"} for q in (old, "Câu lặp", "Câu lặp")]},
+                                  ensure_ascii=False)
+            else:
+                count = int(prompt.split("Write ")[1].split()[0])
+                text = json.dumps({"questions": [{"question": f"Câu mới {len(prompts)}-{i}", "answer": "B"}
+                                                 for i in range(count)]}, ensure_ascii=False)
+            if on_chunk is not None:
+                on_chunk(text)
+            return text
+
+        agent._generate = fake_generate
+        request = {"subject": "Toán", "topics": ["Đạo hàm"], "duration": 120, "total_points": 100,
+                   "question_types": ["multiple_choice", "essay"], "class_id": "12A1"}
+
+        async def scenario():
+            first = await agent.process("generate_exam", request)
+            assert first["success"] and len(prompts) == 1 and first["metadata"]["assembly"]["from_bank"] == 0
+            assert agent.question_bank.get_stats()["total_questions"] == 15
+
+            # Lớp khác: ghép hoàn toàn từ ngân hàng, không gọi LLM
+            second = await agent.process("generate_exam", {**request, "class_id": "12A2"})
+            assembly = second["metadata"]["assembly"]
+            assert len(prompts) == 1 and assembly["from_bank"] == 15 and assembly["gaps"] == []
+            assert second["exam"]["exam_info"]["total_points"] == 100
+            assert [s["points"] for s in second["exam"]["sections"]] == [50, 50]
+            assert second["exam"]["answer_key"]["answers"]["1"] == "A"
+
+            # Lớp 12A1 đã làm hết câu trong ngân hàng: LLM chỉ tạo đúng số câu còn thiếu theo từng loại
+            third = await agent.process("generate_exam", request)
+            assert len(prompts) == 3 and "25 new multiple_choice" in prompts[1] and "5 new essay" in prompts[2]
+            assert third["metadata"]["assembly"]["generated"] == 30
+            assert third["exam"]["exam_info"]["total_points"] == 100
+
+            # Câu trùng câu lớp đã làm hoặc trùng trong lượt bị bỏ và tính là còn thiếu: đề chưa đủ nên không lưu
+            nonlocal repeat
+            repeat = True
+            used = agent.question_bank.used_question_ids("12A1")
+            fourth = await agent.process("generate_exam", request)
+            fourth_ids = [q["bank_id"] for s in fourth["exam"]["sections"] for q in s["questions"]]
+            assert fourth["metadata"]["assembly"]["generated"] == 2 and len(set(fourth_ids)) == 2
+            assert not used & set(fourth_ids) and agent.content_repository.get(fourth["content_id"]) is None
+            return second, third
+
+        second, third = asyncio.run(scenario())
+        first_ids = {q["bank_id"] for s in second["exam"]["sections"] for q in s["questions"]}
+        third_ids = {q["bank_id"] for s in third["exam"]["sections"] for q in s["questions"]}
+        assert not first_ids & third_ids
+    finally:
+        set_content_repository(None)
+        set_question_bank(None)
+    print("✅ Exam generation from the bank OK")
+    return True
+
+
+def main():
+    print("🚀 Question Bank Tests")
+    print("=" * 50)
+    results = [test_assembly_constraints_and_speed(), test_agent_calls_llm_only_for_gaps()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Risk Engine Test Script
+Kiểm tra quét rủi ro cả khóa: đặc trưng vector hóa (trung bình, độ dốc xu hướng, thang điểm), xếp hạng,
+huấn luyện trọng số bằng logistic regression và LLM chỉ được gọi để giải thích top-k học sinh
+"""
+
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.risk_engine import FEATURES, RiskEngine, get_risk_engine, row_trends, series_matrix, set_risk_engine
+from agents.state_backend import SQLiteStateBackend, set_state_backend
+
+
+def _cohort(n: int, seed: int = 3):
+    """Học sinh ngẫu nhiên; nhãn = thực sự gặp rủi ro (điểm thấp/giảm, vắng nhiều)"""
+    rng = random.Random(seed)
+    students, labels = [], []
+    for i in range(n):
+        base = rng.uniform(4.0, 9.5)
+        slope = rng.uniform(-0.5, 0.3)
+        weeks = rng.randint(3, 10)
+        grades = [min(10.0, max(0.0, base + slope * w + rng.gauss(0, 0.3))) for w in range(weeks)]
+        attendance = [min(1.0, max(0.0, rng.uniform(0.6, 1.0) + rng.gauss(0, 0.02))) for _ in range(weeks)]
+        student = {"student_id": f"hs{i:05d}", "grades": grades, "attendance": attendance}
+        if i % 3:
+            student["engagement"] = [rng.uniform(30, 95) for _ in range(weeks)]
+        students.append(student)
+        labels.append(int(grades[-1] < 5.0 or sum(attendance) / weeks < 0.75))
+    return students, labels
+
+
+def test_vectorized_features():
+    """Độ dốc/trung bình vector hóa khớp polyfit; tỷ lệ 0-1 và phần trăm cho cùng kết quả; thiếu dữ liệu = trung tính"""
+    print("🧪 Testing vectorized risk features...")
+    matrix = series_matrix([[1.0, 2.0, 4.0], [5.0], [], [9.0, 7.0, 5.0, 3.0, 1.0]], window=4)
+    assert matrix.shape == (4, 4) and np.isnan(matrix[1, 1:]).all()
+    means, slopes, counts = row_trends(matrix)
+    assert counts.tolist() == [3, 1, 0, 4]
+    assert abs(slopes[0] - np.polyfit([0, 1, 2], [1, 2, 4], 1)[0]) < 1e-9 and slopes[1] == 0 and slopes[2] == 0
+    # Chỉ giữ 4 kỳ gần nhất: 7, 5, 3, 1
+    assert abs(means[3] - 4.0) < 1e-9 and abs(slopes[3] + 2.0) < 1e-9
+
+    engine = RiskEngine(grade_scale=10, window=8)
+    fractions = engine.features([{"grades": [6, 5, 4], "attendance": [0.9, 0.8, 0.7]}])
+    percents = engine.features([{"recent_grades": {"toan": 6, "van": 5, "anh": 4}, "attendance_trend": [90, 80, 70]}])
+    assert np.allclose(fractions, percents)
+    row = dict(zip(FEATURES, fractions[0]))
+    assert abs(row["grade_gap"] - 0.2) < 1e-9 and abs(row["grade_trend"] - 1.0) < 1e-9
+    assert row["engagement_gap"] == 0 and row["assignment_gap"] == 0
+    # Thang điểm theo từng yêu cầu: khóa thang 100 và thang 4.0 cho cùng đặc trưng với thang 10 mặc định
+    hundred = engine.features([{"grades": [60, 50, 40], "attendance": [90, 80, 70]}], grade_scale=100)
+    four = engine.score([{"grades": [2.4, 2.0, 1.6], "attendance": [90, 80, 70]}], grade_scale=4.0).features
+    assert np.allclose(hundred, fractions) and np.allclose(four, fractions)
+    # Tỷ lệ hay phần trăm được quyết định theo cả chuỗi: [90, 1, 1] là phần trăm (vắng gần hết), không phải [90, 100, 100]
+    mixed = dict(zip(FEATURES, engine.features([{"attendance": [90, 1, 1]}, {"attendance": [0.9, 1, 1]}])[0]))
+    assert abs(mixed["attendance_gap"] - (85 - 92 / 3) / 100) < 1e-9
+    print("✅ Vectorized risk features OK")
+    return True
+
+
+def test_cohort_sweep_ranking_and_training():
+    """20k học sinh chấm trong một lượt; học sinh sa sút xếp trên học sinh ổn định; trọng số học được tốt hơn ngẫu nhiên"""
+    print("🧪 Testing cohort risk sweep...")
+    students, labels = _cohort(20000)
+    engine = RiskEngine(grade_scale=10)
+    start = time.perf_counter()
+    cohort = engine.score(students)
+    elapsed = time.perf_counter() - start
+    print(f"   scored {len(cohort)} students in {elapsed * 1000:.0f} ms")
+    assert len(cohort) == 20000 and elapsed < 5
+
+    summary = cohort.summary()
+    assert summary["high"] + summary["medium"] + summary["low"] == 20000 and summary["model"] == "weighted"
+    top = cohort.top(100)
+    assert len(top) == 100 and np.all(np.diff(cohort.scores[top]) <= 0)
+    assert cohort.scores[top[-1]] >= np.sort(cohort.scores)[-100]
+    # Thứ tự xếp hạng khớp với nhãn: top 10% có tỷ lệ rủi ro thực cao hơn hẳn cả khóa
+    labels_arr = np.asarray(labels)
+    assert labels_arr[cohort.top(2000)].mean() > 2 * labels_arr.mean()
+
+    declining = {"student_id": "down", "grades": [8, 7, 6, 5], "attendance": [0.95] * 4}
+    stable = {"student_id": "flat", "grades": [6.5] * 4, "attendance": [0.95] * 4}
+    pair = engine.score([stable, declining])
+    assert pair.top(2).tolist() == [1, 0]
+    assert pair.student(1)["risk_factors"][0]["feature"] == "grade_trend"
+
+    # Trọng số học từ 5000 học sinh đầu, đánh giá trên phần còn lại: top 3000 chính xác hơn trọng số mặc định
+    holdout = labels_arr[5000:]
+    default_precision = holdout[engine.score(students[5000:]).top(3000)].mean()
+    trained = engine.fit(students[:5000], labels[:5000])
+    assert trained["model"] == "logistic_regression" and engine.stats["trained_samples"] == 5000
+    trained_precision = holdout[engine.score(students[5000:]).top(3000)].mean()
+    assert trained_precision > 0.95 and trained_precision >= default_precision
+    try:
+        engine.fit(students[:10], [0] * 10)
+        assert False, "single-class labels must be rejected"
+    except ValueError:
+        pass
+    print("✅ Cohort risk sweep OK")
+    return True
+
+
+def test_agent_explains_only_top_k():
+    """StudentAgent quét cả khóa; LLM chỉ viết giải thích cho explain_top_k học sinh rủi ro cao nhất"""
+    print("🧪 Testing cohort risk agent...")
+    set_risk_engine(RiskEngine(grade_scale=10))
+    try:
+        from agents.student_agent import StudentAgent
+        agent = StudentAgent()
+        prompts = []
+
+        async def fake_generate(prompt, system_prompt=None, format=None, on_chunk=None):
+            prompts.append(prompt)
+            text = json.dumps({"summary": "Điểm giảm liên tục", "warning_signs": ["vắng học"]}, ensure_ascii=False)
+            if on_chunk is not None:
+                on_chunk(text)
+            return text
+
+        agent._generate = fake_generate
+        students, _ = _cohort(2000, seed=11)
+        result = asyncio.run(agent.process("assess_cohort_risk", {"students": students, "limit": 50,
+                                                                   "explain_top_k": 3}))
+        assert result["success"] and result["llm_calls"] == 3 and len(prompts) == 3
+        flagged = result["flagged_students"]
+        assert 0 < len(flagged) <= 50 and all(s["risk_level"] in ("high", "medium") for s in flagged)
+        assert [s["risk_score"] for s in flagged] == sorted((s["risk_score"] for s in flagged), reverse=True)
+        assert all(s["explanation"]["summary"] == "Điểm giảm liên tục" for s in flagged[:3])
+        assert all("explanation" not in s for s in flagged[3:])
+        assert all(s["student_id"] in p for s, p in zip(flagged, prompts))
+
+        missing = asyncio.run(agent.process("assess_cohort_risk", {"students": []}))
+        assert not missing["success"]
+    finally:
+        set_risk_engine(None)
+    print("✅ Cohort risk agent OK")
+    return True
+
+
+def test_trained_weights_are_shared():
+    """Trọng số huấn luyện ở một worker được lưu lên state backend: worker khác và lần khởi động sau dùng lại"""
+    print("🧪 Testing risk model persistence...")
+    students, labels = _cohort(500, seed=5)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "state.db")
+        try:
+            set_state_backend(SQLiteStateBackend(path))
+            set_risk_engine(None)
+            trainer = get_risk_engine()
+            set_state_backend(SQLiteStateBackend(path))
+            set_risk_engine(None)
+            other = get_risk_engine()
+            assert other is not trainer and other.model == "weighted"
+
+            trained = trainer.fit(students, labels)
+            assert get_risk_engine() is other
+            assert other.get_model() == trainer.get_model() and other.trained_at == trained["trained_at"]
+            assert other.stats["trained_samples"] == 500
+
+            # Khởi động lại: engine mới nạp trọng số đã lưu
+            set_state_backend(SQLiteStateBackend(path))
+            set_risk_engine(None)
+            restarted = get_risk_engine()
+            assert restarted.model == "logistic_regression" and restarted.weights == trainer.weights
+            assert np.allclose(restarted.score(students).scores, trainer.score(students).scores)
+        finally:
+            set_risk_engine(None)
+            set_state_backend(None)
+    print("✅ Risk model persistence OK")
+    return True
+
+
+def main():
+    print("🚀 Risk Engine Tests")
+    print("=" * 50)
+    results = [test_vectorized_features(), test_cohort_sweep_ranking_and_training(), test_agent_explains_only_top_k(),
+               test_trained_weights_are_shared()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Search Service Test Script
+Kiểm tra fan-out song song có deadline, khử trùng lặp theo URL chuẩn và cache kết quả dùng chung giữa các agent
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.search_service import SearchService, FakeSearchEngine, canonical_url, make_result, set_search_service
+
+
+def _results(prefix: str):
+    return lambda query, search_type: [
+        make_result(f"{query} ({prefix} {i})", f"https://{prefix}.example.com/{query.replace(' ', '-')}/{i}")
+        for i in range(3)
+    ]
+
+
+def test_canonical_url():
+    """URL khác scheme, www, fragment, tracking params hay dấu / cuối được coi là một"""
+    print("🧪 Testing URL canonicalization...")
+    assert canonical_url("https://www.Example.com/a/b/?utm_source=x&id=2&b=1#top") == "example.com/a/b?b=1&id=2"
+    assert canonical_url("http://example.com/a/b?id=2&b=1") == canonical_url("https://example.com/a/b/?b=1&id=2&fbclid=z")
+    assert canonical_url("https://example.com:8080/a") == "example.com:8080/a"
+    assert canonical_url("https://example.com/a") != canonical_url("https://example.com/a?page=2")
+    print("✅ URL canonicalization OK")
+    return True
+
+
+def test_fan_out_deadline_and_dedup():
+    """Engine chậm bị cắt theo deadline, engine lỗi không làm hỏng kết quả; URL trùng được gộp"""
+    print("🧪 Testing fan-out...")
+    shared = make_result("Pitago", "https://www.shared.example.com/pitago/?utm_medium=email", relevance=0.6)
+    engines = [
+        FakeSearchEngine("fast", lambda q, t: _results("fast")(q, t) + [shared], latency=0.01),
+        FakeSearchEngine("also_fast", [dict(shared, url="http://shared.example.com/pitago", relevance=0.7)]),
+        FakeSearchEngine("slow", _results("slow"), latency=1.0),
+        FakeSearchEngine("broken", error=RuntimeError("HTTP 503")),
+    ]
+    service = SearchService(engines, deadline=0.2)
+
+    started = time.perf_counter()
+    response = asyncio.run(service.search("dinh ly pitago", "general", 10))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.4
+    assert response["engines"]["slow"]["status"] == "timeout"
+    assert response["engines"]["broken"]["status"] == "error"
+    assert response["engines"]["fast"]["status"] == "ok"
+    urls = [r["canonical_url"] for r in response["results"]]
+    assert len(urls) == len(set(urls)) == 4
+    merged = next(r for r in response["results"] if r["canonical_url"] == "shared.example.com/pitago")
+    assert sorted(merged["engines"]) == ["also_fast", "fast"] and merged["relevance"] == 0.75
+    assert response["results"][0] is not merged and response["results"][0]["relevance"] >= 0.75
+    print(f"   {len(urls)} unique results in {elapsed * 1000:.0f}ms")
+    print("✅ Fan-out OK")
+    return True
+
+
+def test_cache_shared_by_agents():
+    """WebSearchAgent và KnowledgeIntegrationAgent dùng chung cache; truy vấn đồng thời chỉ gọi engine một lần"""
+    print("🧪 Testing shared result cache...")
+    engine = FakeSearchEngine("local", _results("local"), latency=0.02)
+    service = SearchService([engine], cache_ttl=60, cache_max_entries=2)
+    set_search_service(service)
+    try:
+        from agents.knowledge_integration_agent import KnowledgeIntegrationAgent
+        from agents.web_search_agent import WebSearchAgent
+
+        knowledge = KnowledgeIntegrationAgent()
+        web = WebSearchAgent()
+        topics = ["AI in education", "blended learning"]
+
+        async def scenario():
+            first = await asyncio.gather(*(knowledge.web_search(f"{t} latest research developments", "news", 5) for t in topics * 3))
+            again = await knowledge.web_search("AI in EDUCATION latest research  developments", "news", 3)
+            via_agent = await web.web_search({"query": "AI in education latest research developments", "search_type": "news",
+                                              "max_results": 3, "synthesize": False})
+            other_type = await knowledge.web_search("AI in education latest research developments", "academic", 3)
+            return first, again, via_agent, other_type
+
+        first, again, via_agent, other_type = asyncio.run(scenario())
+    finally:
+        set_search_service(None)
+
+    assert all(r["success"] for r in first)
+    assert again["cached"] and len(again["search_results"]) == 3
+    assert via_agent["cached"] and via_agent["synthesized_content"] == ""
+    assert not other_type["cached"]
+    stats = service.get_stats()
+    # 2 chủ đề x 3 lời gọi đồng thời -> 2 lần gọi engine; thêm 1 lần cho search_type khác
+    assert engine.calls == 3
+    assert stats["coalesced"] == 4 and stats["cache_hits"] == 2
+    assert stats["cache_entries"] == 2 and stats["evictions"] == 1
+    print("✅ Shared result cache OK")
+    return True
+
+
+def main():
+    print("🚀 Search Service Tests")
+    print("=" * 50)
+    results = [test_canonical_url(), test_fan_out_deadline_and_dedup(), test_cache_shared_by_agents()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
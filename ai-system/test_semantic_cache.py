@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Semantic Cache Test Script
+Kiểm tra cache câu trả lời theo ngữ nghĩa: hit/miss, scope, guard token, TTL và invalidation
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.embedding_service import EmbeddingService, HashingEmbedder
+from agents.semantic_cache import SemanticCache, normalize_query, guard_tokens
+
+
+def _cache(**kwargs) -> SemanticCache:
+    return SemanticCache(embedding_service=EmbeddingService(embedder=HashingEmbedder()), **kwargs)
+
+
+def test_normalization_and_guards():
+    """Chuẩn hóa câu hỏi và trích token phân biệt"""
+    print("🧪 Testing query normalization...")
+    assert normalize_query("  Định lý   Pitago là gì??  ") == "định lý pitago là gì"
+    assert guard_tokens("Phân tích học sinh A lớp 10A1") == frozenset({"a", "10a1"})
+    assert guard_tokens("Định lý Pitago là gì") == frozenset()
+    print("✅ Normalization OK")
+    return True
+
+
+def test_lookup_and_scopes():
+    """Câu hỏi gần giống trúng cache trong cùng scope; khác scope hoặc khác guard thì miss"""
+    print("🧪 Testing lookup...")
+    cache = _cache(threshold=0.8)
+
+    async def scenario():
+        await cache.store("Giải thích định lý Pitago cho học sinh", {"response": "a² + b² = c²"}, "chat:general")
+        exact = await cache.lookup("giải thích định lý pitago cho học sinh?", "chat:general")
+        similar = await cache.lookup("Giải thích giúp định lý Pitago cho học sinh", "chat:general")
+        other_scope = await cache.lookup("Giải thích định lý Pitago cho học sinh", "chat:exam")
+        bypassed = await cache.lookup("Giải thích định lý Pitago cho học sinh", "chat:general", bypass=True)
+
+        await cache.store("Dự báo rủi ro học tập lớp 10A", {"response": "lớp 10A"}, "chat:general")
+        guarded = await cache.lookup("Dự báo rủi ro học tập lớp 10B", "chat:general")
+        return exact, similar, other_scope, bypassed, guarded
+
+    exact, similar, other_scope, bypassed, guarded = asyncio.run(scenario())
+    assert exact is not None and exact.exact
+    assert similar is not None and not similar.exact and similar.similarity >= 0.8
+    assert similar.response == {"response": "a² + b² = c²"}
+    assert other_scope is None and bypassed is None and guarded is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["bypassed"] == 1
+    assert stats["scopes"]["chat:general"]["hits"] == 2
+    print("✅ Lookup OK")
+    return True
+
+
+def test_ttl_invalidation_and_sampling():
+    """Entry hết hạn không được trả về; invalidate theo tag gọi hook; false hit được ghi nhận"""
+    print("🧪 Testing TTL, invalidation and sampling...")
+    cache = _cache(threshold=0.8, sample_rate=1.0)
+    invalidated = []
+    cache.add_invalidation_hook(lambda entries: invalidated.extend(e.query for e in entries))
+
+    async def scenario():
+        await cache.store("Công thức nghiệm phương trình bậc hai", {"response": "x = (-b ± √Δ) / 2a"}, ttl_seconds=0.05)
+        await asyncio.sleep(0.1)
+        expired = await cache.lookup("Công thức nghiệm phương trình bậc hai")
+
+        await cache.store("Lịch thi học kỳ môn Toán", {"response": "Thứ hai"}, tags=["schedule"])
+        hit = await cache.lookup("Lịch thi học kỳ của môn Toán")
+        sampled = cache.should_sample(hit)
+        false_hit = await cache.record_sample(hit, "Lịch thi đã dời sang thứ sáu tuần sau", "Thứ hai", "Lịch thi học kỳ của môn Toán")
+        removed = cache.invalidate(tag="schedule")
+        after = await cache.lookup("Lịch thi học kỳ môn Toán")
+        return expired, sampled, false_hit, removed, after
+
+    expired, sampled, false_hit, removed, after = asyncio.run(scenario())
+    assert expired is None
+    assert sampled and false_hit
+    assert removed == 1 and after is None
+    assert invalidated == ["Lịch thi học kỳ môn Toán"]
+    assert cache.get_stats()["false_hit_rate"] == 1.0
+    print("✅ TTL, invalidation and sampling OK")
+    return True
+
+
+def test_chat_does_not_cache_wrapped_llm_errors():
+    """Agent trả về lỗi LLM được bọc trong câu trả lời: chat báo thất bại và không cache"""
+    print("🧪 Testing chat cache admission...")
+    import main as gateway
+    from agents.base_agent import LLM_ERROR_PREFIX
+
+    agent = gateway.advanced_student_agent
+    original_process, original_cache = agent.process, gateway.semantic_cache
+    gateway.semantic_cache = _cache()
+    profiles = iter([f"{LLM_ERROR_PREFIX}connection refused", "Ổn định, cần theo dõi áp lực thi cử"])
+
+    async def process(task, data, context=None):
+        return {"success": True, "mental_health_profile": next(profiles), "confidence": 0.8}
+
+    agent.process = process
+    try:
+        request = gateway.AIRequest(task="chat", data={"message": "Đánh giá sức khỏe tinh thần học sinh"})
+        failed = asyncio.run(gateway.chat_endpoint(request))
+        assert not failed["success"] and gateway.semantic_cache.get_stats()["entries"] == 0
+        answered = asyncio.run(gateway.chat_endpoint(request))
+        assert answered["success"] and gateway.semantic_cache.get_stats()["entries"] == 1
+    finally:
+        agent.process, gateway.semantic_cache = original_process, original_cache
+    print("✅ Chat cache admission OK")
+    return True
+
+
+def main():
+    print("🚀 Semantic Cache Tests")
+    print("=" * 50)
+    results = [test_normalization_and_guards(), test_lookup_and_scopes(), test_ttl_invalidation_and_sampling(),
+               test_chat_does_not_cache_wrapped_llm_errors()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Skills Index Test Script
+Kiểm tra chỉ mục kỹ năng dùng chung: tra cứu theo id, BM25, facet, hot reload và cache file triển khai theo mtime
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.skills_index import SkillsIndex, set_skills_index
+
+CATEGORIES = ["content", "data", "development", "automation", "security", "business", "design"]
+
+
+def _skills(count: int = 700):
+    skills = [
+        {"id": "data-analyst", "category": "data", "name": "Data Analyst", "description": "Data analysis and visualization for schools", "path": "skills/data-analyst"},
+        {"id": "database-admin", "category": "data", "name": "Database Admin", "description": "Operate PostgreSQL clusters", "path": "skills/database-admin"},
+        {"id": "content-creator", "category": "content", "name": "Content Creator", "description": "Create educational content and lesson plans", "path": "skills/content-creator"},
+        {"id": "workflow-automation", "category": "automation", "name": "Workflow Automation", "description": "Automate approval workflow steps", "path": "skills/workflow-automation"},
+        {"id": "pentest", "category": "security", "name": "Pentest", "description": "Find vulnerabilities in web apps", "path": "skills/pentest"},
+    ]
+    for i in range(len(skills), count):
+        skills.append({"id": f"skill-{i}", "category": CATEGORIES[i % len(CATEGORIES)], "name": f"Skill {i}",
+                       "description": f"Generic capability number {i} for {CATEGORIES[(i * 3) % len(CATEGORIES)]} teams",
+                       "path": f"skills/skill-{i}"})
+    return skills
+
+
+def _write(path: Path, skills):
+    path.write_text(json.dumps(skills), encoding="utf-8")
+    # mtime đổi rõ ràng dù hai lần ghi trong cùng một tick đồng hồ
+    stamp = time.time() + len(skills)
+    os.utime(path, (stamp, stamp))
+
+
+def test_lookups_and_ranking():
+    """Tra cứu theo id/category và BM25 trả kết quả đúng, đủ nhanh cho 700 kỹ năng"""
+    print("🧪 Testing lookups and ranking...")
+    index = SkillsIndex(skills=_skills())
+    assert index.get("content-creator")["name"] == "Content Creator" and index.get("missing") is None
+    assert len(index.by_category("data")) == sum(1 for s in _skills() if s["category"] == "data")
+
+    ranked = index.search("data analysis", top_k=3)
+    assert ranked[0][0]["id"] == "data-analyst" and ranked[0][1] > ranked[1][1]
+    assert index.search("phân tích", top_k=3) == []
+    assert [s["id"] for s, _ in index.search("lesson", category="content")] == ["content-creator"]
+
+    # "data" khớp theo tiền tố như substring trước đây ("database"), nhiều từ trong keyword phải khớp cùng lúc
+    assert [s["id"] for s in index.find_by_keywords(["data"])][:2] == ["data-analyst", "database-admin"]
+    assert [s["id"] for s in index.find_by_keywords(["content-creator", "approval workflow"])] == ["content-creator", "workflow-automation"]
+    education = index.education_relevant()
+    assert len(education) == len({s["id"] for s in education})
+    assert {"data-analyst", "content-creator", "workflow-automation"} <= {s["id"] for s in education}
+    assert [s["id"] for s in index.find_by_keywords(["vulnerabilities"])] == ["pentest"]
+    assert index.find_by_keywords(["vulnerabilities"], education_only=True) == []
+
+    started = time.perf_counter()
+    for i in range(10000):
+        index.get(f"skill-{i % 700}")
+    lookup_us = (time.perf_counter() - started) / 10000 * 1e6
+    index.search("automation workflow", top_k=8)
+    started = time.perf_counter()
+    for _ in range(1000):
+        index.search("automation workflow", top_k=8)
+        index.find_by_keywords(["data", "analytics"])
+    query_us = (time.perf_counter() - started) / 1000 * 1e6
+    print(f"   lookup={lookup_us:.2f}µs, cached search+keywords={query_us:.2f}µs")
+    assert lookup_us < 50 and query_us < 200
+    print("✅ Lookups and ranking OK")
+    return True
+
+
+def test_hot_reload():
+    """File đổi thì index nạp lại; file hỏng giữ nguyên bản đang dùng"""
+    print("🧪 Testing hot reload...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "skills_index.json"
+        _write(path, _skills(10))
+        index = SkillsIndex(str(path), reload_interval=0)
+        version = index.version
+        assert len(index) == 10 and index.get("skill-20") is None
+
+        _write(path, _skills(30))
+        assert index.get("skill-20")["name"] == "Skill 20"
+        assert index.version == version + 1
+
+        path.write_text("{not json", encoding="utf-8")
+        assert len(index) == 30 and index.version == version + 1
+
+        throttled = SkillsIndex(str(path.with_name("missing.json")), reload_interval=60)
+        assert throttled.get("content-creator") is not None
+        assert index.get_stats()["reloads"] == 2
+    print("✅ Hot reload OK")
+    return True
+
+
+def test_implementation_cache_and_agents():
+    """File triển khai đọc ngoài event loop, cache tới khi mtime đổi; hai agent dùng chung một index"""
+    print("🧪 Testing implementation cache...")
+    from agents.enhanced_skills_agent import EnhancedSkillsAgent
+    from agents.universal_skills_integration_agent import UniversalSkillsIntegrationAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "skills_index.json"
+        _write(path, _skills(50))
+        skill_dir = Path(tmp) / "skills" / "content-creator"
+        skill_dir.mkdir(parents=True)
+        (skill_dir / "notes.txt").write_text("phụ", encoding="utf-8")
+        skill_file = skill_dir / "SKILL.md"
+        skill_file.write_text("# Content Creator v1", encoding="utf-8")
+
+        index = SkillsIndex(str(path), reload_interval=0)
+        set_skills_index(index)
+        try:
+            enhanced = EnhancedSkillsAgent()
+            universal = UniversalSkillsIntegrationAgent()
+        finally:
+            set_skills_index(None)
+        assert enhanced.skills_index is universal.skills_index is index
+
+        prompts = []
+
+        async def capture(prompt, system_prompt=None, format=None, on_chunk=None):
+            prompts.append(prompt)
+            return "ok"
+
+        enhanced._generate = capture
+
+        async def scenario():
+            first = await enhanced.skill_execution({"skill_id": "content-creator"})
+            await enhanced.skill_execution({"skill_id": "content-creator"})
+            skill_file.write_text("# Content Creator v2", encoding="utf-8")
+            stamp = time.time() + 5
+            os.utime(skill_file, (stamp, stamp))
+            await enhanced.skill_execution({"skill_id": "content-creator"})
+            missing = await index.load_implementation(index.get("data-analyst"))
+            return first, missing
+
+        first, missing = asyncio.run(scenario())
+        assert first["success"] and first["skill_name"] == "Content Creator"
+        assert "v1" in prompts[0] and "v1" in prompts[1] and "v2" in prompts[2]
+        assert missing == "Skill implementation not available"
+        stats = index.get_stats()
+        assert stats["implementation_loads"] == 2 and stats["implementation_hits"] == 1
+
+        recommended = asyncio.run(enhanced.skill_recommendation({"goals": ["data insights", "lesson planning"]}))
+        ids = [s["id"] for s in recommended["recommended_skills"]]
+        assert ids[0] == "data-analyst" and "content-creator" in ids
+        assert recommended["recommended_skills"][0]["relevance_score"] == 1.0
+
+        _write(path, _skills(60))
+        assert universal.skills_ecosystem["total_skills"] == 60
+    print("✅ Implementation cache OK")
+    return True
+
+
+def main():
+    print("🚀 Skills Index Tests")
+    print("=" * 50)
+    results = [test_lookups_and_ranking(), test_hot_reload(), test_implementation_cache_and_agents()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
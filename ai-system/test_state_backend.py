@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+State Backend Test Script
+Kiểm tra state dùng chung giữa các worker: backend memory/SQLite (Redis nếu có server), SharedDict nạp lại theo version,
+counter cộng từ nhiều process và bus invalidation cache giữa các worker
+"""
+
+import asyncio
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.state_backend import (
+    MemoryStateBackend, SQLiteStateBackend, RedisStateBackend, SharedDict, SharedCounters, InvalidationBus,
+    set_state_backend
+)
+
+
+def _redis_backend():
+    try:
+        backend = RedisStateBackend("redis://localhost:6379/15", prefix="test_state:")
+        backend._redis.ping()
+        return backend
+    except Exception:
+        return None
+
+
+def _check_backend(backend):
+    backend.clear("ns")
+    start = backend.version("ns")
+    assert backend.get("ns", "a", "missing") == "missing"
+    backend.set("ns", "a", {"x": 1})
+    assert backend.set_many("ns", {"a": 2, "b": [1, 2]}, overwrite=False) == start + 2
+    assert backend.items("ns") == {"a": {"x": 1}, "b": [1, 2]} and backend.size("ns") == 2
+    assert backend.incr("ns", "count") == 1 and backend.incr("ns", "count", 2.5) == 3.5
+    assert backend.delete("ns", "a") and not backend.delete("ns", "a")
+    version = backend.set_many("ns", {"c": 1, "d": 2})
+    assert backend.delete_many("ns", ["b", "c", "missing"]) == 2 and backend.version("ns") == version + 1
+    assert set(backend.items("ns")) == {"count", "d"}
+    backend.clear("ns")
+    assert backend.items("ns") == {} and backend.version("ns") > start
+
+
+def _worker_increments(path: str, n: int):
+    backend = SQLiteStateBackend(path)
+    counters = SharedCounters("hits", backend=backend)
+    cache = SharedDict("cache", backend=backend)
+    for i in range(n):
+        counters.incr("requests")
+        counters.incr("seconds", 0.5)
+    cache[f"pid-{multiprocessing.current_process().pid}"] = n
+    backend.close()
+
+
+def test_backends_share_semantics():
+    """Mọi backend có cùng ngữ nghĩa get/set/set_many/incr/delete/clear và version tăng theo mỗi lần ghi"""
+    print("🧪 Testing state backends...")
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [MemoryStateBackend(), SQLiteStateBackend(str(Path(tmp) / "state.db"))]
+        redis_backend = _redis_backend()
+        if redis_backend is not None:
+            backends.append(redis_backend)
+        else:
+            print("   redis not reachable, skipping RedisStateBackend")
+        for backend in backends:
+            _check_backend(backend)
+            backend.close()
+        try:
+            SQLiteStateBackend(":memory:")
+            assert False, "in-memory SQLite cannot be shared between workers"
+        except ValueError:
+            pass
+    print("✅ State backends OK")
+    return True
+
+
+def test_shared_state_across_processes():
+    """Bốn process cùng ghi một file SQLite: counter không mất lượt cộng, SharedDict thấy key của process khác"""
+    print("🧪 Testing shared state across processes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "state.db")
+        backend = SQLiteStateBackend(path)
+        cache = SharedDict("cache", backend=backend, defaults={"builtin": True})
+        assert dict(cache) == {"builtin": True}
+        reloads = cache.reloads
+
+        processes = [multiprocessing.Process(target=_worker_increments, args=(path, 200)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+
+        counters = SharedCounters("hits", backend=backend)
+        assert counters.snapshot() == {"requests": 800, "seconds": 400.0}
+        assert len(cache) == 5 and cache["builtin"] and cache.reloads == reloads + 1
+
+        # Không có ghi mới: đọc từ bản sao cục bộ, không nạp lại
+        for _ in range(100):
+            cache.get("builtin")
+        assert cache.reloads == reloads + 1
+        cache["local"] = 1
+        assert cache["local"] == 1 and cache.reloads == reloads + 1
+        cache.update_missing({"local": 2, "new": 3})
+        assert cache["local"] == 1 and cache["new"] == 3
+        backend.close()
+    print("✅ Shared state across processes OK")
+    return True
+
+
+def test_agents_share_state_between_workers():
+    """Hai "worker" (hai connection tới cùng file): template, dedup cache và thống kê của agent là một"""
+    print("🧪 Testing agent state between workers...")
+    from agents.content_generation_agent import ContentGenerationAgent
+    from agents.distributed_data_agent import DistributedDataAgent, ProcessingResult
+    from agents.specialized_agents import DataDedupAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "state.db")
+        try:
+            set_state_backend(SQLiteStateBackend(path))
+            first_content, first_data, first_dedup = ContentGenerationAgent(), DistributedDataAgent(), DataDedupAgent()
+            set_state_backend(SQLiteStateBackend(path))
+            second_content, second_data, second_dedup = ContentGenerationAgent(), DistributedDataAgent(), DataDedupAgent()
+
+            asyncio.run(first_content.create_template({"id": "custom_lab", "name": "Lab", "structure": {"steps": 3}}))
+            template = asyncio.run(second_content.get_template({"template_id": "custom_lab"}))["template"]
+            assert template.name == "Lab" and template.structure == {"steps": 3}
+            assert "lesson_basic" in second_content.templates
+
+            first_data.update_processing_stats([ProcessingResult("c1", "s", "success", {}, 0.9, 2.0, {}),
+                                                ProcessingResult("c2", "s", "error", {}, 0.0, 0.0, {})])
+            second_data.update_processing_stats([ProcessingResult("c3", "s", "success", {}, 0.9, 4.0, {})])
+            stats = first_data.stats
+            assert stats["total_chunks_processed"] == 3 and stats["processing_errors"] == 1
+            assert stats["average_processing_time"] == 3.0 and second_data.stats == stats
+
+            # items()/values() đọc một view (một truy vấn version), không phải một truy vấn mỗi key
+            shared = SharedDict("views", backend=first_dedup.global_cache.backend)
+            shared.update({f"k{i}": i for i in range(50)})
+            versions = []
+            version = shared.backend.version
+            shared.backend.version = lambda namespace: versions.append(namespace) or version(namespace)
+            assert sum(v for _, v in shared.items()) == sum(shared.values()) == sum(range(50))
+            assert len(versions) == 2
+            shared.backend.version = version
+
+            # Global dedup cache có giới hạn: item cũ nhất bị bỏ, worker kia thấy cùng nội dung
+            first_dedup.global_cache_size = second_dedup.global_cache_size = 5
+            first_dedup.cache_items([{"id": f"old{i}", "content": "cũ"} for i in range(4)])
+            time.sleep(0.01)
+            assert second_dedup.cache_items([{"id": f"new{i}", "content": "mới"} for i in range(3)]) == 5
+            assert sorted(item["id"] for item in first_dedup.cached_items()) == ["new0", "new1", "new2", "old2", "old3"]
+        finally:
+            set_state_backend(None)
+    print("✅ Agent state between workers OK")
+    return True
+
+
+def test_invalidation_bus_reaches_other_workers():
+    """Sự kiện invalidation tới worker khác đúng một lần; worker phát không xử lý lại sự kiện của chính nó"""
+    print("🧪 Testing invalidation bus...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "state.db")
+        publisher = InvalidationBus(SQLiteStateBackend(path), keep_events=4)
+        subscriber = InvalidationBus(SQLiteStateBackend(path), keep_events=4)
+        published, received = [], []
+        publisher.subscribe("search_cache", published.append)
+        subscriber.subscribe("search_cache", received.append)
+
+        publisher.publish("search_cache", {"query": "python", "search_type": None})
+        publisher.publish("search_cache", {"query": None, "search_type": "news"})
+        assert subscriber.poll() == 2 and subscriber.poll() == 0
+        assert received == [{"query": "python", "search_type": None}, {"query": None, "search_type": "news"}]
+        assert publisher.poll() == 0 and published == []
+
+        # Subscriber tụt lại quá keep_events: chỉ xử lý các sự kiện còn giữ
+        for i in range(6):
+            publisher.publish("search_cache", {"query": f"q{i}", "search_type": None})
+        assert subscriber.poll() == 4 and received[-1]["query"] == "q5"
+
+        async def background():
+            subscriber.interval = 0.02
+            subscriber.start()
+            publisher.publish("search_cache", {"query": "late", "search_type": None})
+            await asyncio.sleep(0.2)
+            await subscriber.stop()
+
+        asyncio.run(background())
+        assert received[-1]["query"] == "late"
+        memory_bus = InvalidationBus(MemoryStateBackend())
+        memory_bus.start()
+        assert memory_bus._task is None
+    print("✅ Invalidation bus OK")
+    return True
+
+
+def main():
+    print("🚀 State Backend Tests")
+    print("=" * 50)
+    results = [test_backends_share_semantics(), test_shared_state_across_processes(),
+               test_agents_share_state_between_workers(), test_invalidation_bus_reaches_other_workers()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Structured Output Test Script
+Kiểm tra parse JSON tăng dần, kiểm tra schema và retry/đếm lỗi theo task
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.base_agent import BaseAgent
+from agents.structured_output import IncrementalJSONParser, parse_json, validate_schema, get_structured_output_stats
+
+LESSON_JSON = '{"title": "Định lý Pitago", "objectives": ["a² + b² = c²", "ứng dụng {tam giác}"], "main_content": [{"section": "Giới thiệu", "content": "Tam giác \\"vuông\\""}], "score": 8.5, "draft": false}'
+
+
+def test_incremental_parsing():
+    """Field cấp một có ngay khi sinh xong, trước khi hết response; lời dẫn và phần thừa bị bỏ qua"""
+    print("🧪 Testing incremental parsing...")
+    seen = []
+    parser = IncrementalJSONParser(on_field=lambda name, value: seen.append(name))
+    text = "Đây là kết quả:\n```json\n" + LESSON_JSON + "\n```"
+    early = []
+    for i in range(0, len(text), 7):
+        parser.feed(text[i:i + 7])
+        if "title" in parser.fields and not parser.done:
+            early.append(i)
+    assert parser.ok and early and early[0] < len(text) // 4
+    assert seen == ["title", "objectives", "main_content", "score", "draft"]
+    assert parser.value["objectives"][1] == "ứng dụng {tam giác}"
+    assert parser.value["main_content"][0]["content"] == 'Tam giác "vuông"'
+
+    truncated = parse_json(LESSON_JSON[:60])
+    assert not truncated.ok and truncated.fields == {"title": "Định lý Pitago"}
+    assert parse_json("[1, {\"a\": [2]}, \"x\"]").value == [1, {"a": [2]}, "x"]
+    assert not parse_json('{"a": tru}').ok
+    print("✅ Incremental parsing OK")
+    return True
+
+
+def test_schema_validation():
+    """Kiểm tra type, required, items, enum và khoảng giá trị"""
+    print("🧪 Testing schema validation...")
+    schema = {
+        "type": "object",
+        "required": ["title", "questions"],
+        "properties": {
+            "title": {"type": "string"},
+            "level": {"enum": ["basic", "advanced"]},
+            "score": {"type": "number", "minimum": 0, "maximum": 10},
+            "questions": {"type": "array", "minItems": 1, "items": {"type": "object", "required": ["question"]}}
+        }
+    }
+    assert validate_schema({"title": "Quiz", "score": 7, "questions": [{"question": "1 + 1?"}]}, schema) == []
+    errors = validate_schema({"title": 3, "level": "expert", "score": 12, "questions": [{}]}, schema)
+    assert errors == [
+        "$.title: expected string, got int",
+        "$.level: 'expert' not in ['basic', 'advanced']",
+        "$.score: 12 > maximum 10",
+        "$.questions[0]: missing required field 'question'",
+    ]
+    assert validate_schema(True, {"type": "integer"}) == ["$: expected integer, got bool"]
+    print("✅ Schema validation OK")
+    return True
+
+
+class ScriptedAgent(BaseAgent):
+    """Agent trả về lần lượt các response soạn sẵn thay vì gọi Ollama"""
+
+    def __init__(self, responses):
+        super().__init__("scripted_agent")
+        self.responses = list(responses)
+        self.formats = []
+        self.prompts = []
+
+    async def _generate(self, prompt, system_prompt=None, format=None, on_chunk=None):
+        self.formats.append(format)
+        self.prompts.append(prompt)
+        text = self.responses.pop(0)
+        emitted = []
+        for i in range(0, len(text), 5):
+            emitted.append(text[i:i + 5])
+            if on_chunk(text[i:i + 5]) is True:
+                break
+        return "".join(emitted)
+
+    async def process(self, task, data, context=None):
+        return await self.call_ollama_json(data["prompt"], schema=data.get("schema"))
+
+
+def test_retry_and_counters():
+    """Response sai schema được thử lại kèm mô tả lỗi; stream dừng khi JSON đã đóng; lỗi được đếm theo task"""
+    print("🧪 Testing retries and counters...")
+    get_structured_output_stats().clear()
+    schema = {"type": "object", "required": ["risk_level"], "properties": {"risk_level": {"enum": ["low", "medium", "high"]}}}
+
+    agent = ScriptedAgent(['{"risk": "cao"}', '{"risk_level": "high"} và giải thích thêm rất dài'])
+    result = asyncio.run(agent.process("risk_assessment", {"prompt": "Đánh giá rủi ro", "schema": schema}))
+    assert result == {"risk_level": "high"}
+    assert agent.formats == [schema, schema]
+    assert "missing required field 'risk_level'" in agent.prompts[1]
+
+    broken = ScriptedAgent(["không phải JSON", '{"a": 1'])
+    fallback = asyncio.run(broken.process("summary", {"prompt": "Tóm tắt"}))
+    assert fallback == {"raw_response": '{"a": 1'}
+    assert broken.formats == ["json", "json"]
+
+    stats = get_structured_output_stats().get_stats()["tasks"]
+    assert stats["scripted_agent.risk_assessment"]["validation_failures"] == 1
+    assert stats["scripted_agent.risk_assessment"]["retries"] == 1
+    assert stats["scripted_agent.risk_assessment"]["succeeded"] == 1
+    assert stats["scripted_agent.summary"]["parse_failures"] == 2
+    assert stats["scripted_agent.summary"]["fallbacks"] == 1
+    assert agent.extract_json_from_response('Kết quả: {"a": {"b": 1}} xong. {"c": 2}') == {"a": {"b": 1}}
+    print("✅ Retries and counters OK")
+    return True
+
+
+def main():
+    print("🚀 Structured Output Tests")
+    print("=" * 50)
+    results = [test_incremental_parsing(), test_schema_validation(), test_retry_and_counters()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Text Feature Cache Test Script
+Kiểm tra đặc trưng văn bản dùng chung giữa filter, dedup và evaluation
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from agents.text_features import TextFeatureCache, get_text_feature_cache
+from agents.specialized_agents import DataFilterAgent, DataDedupAgent
+
+
+def test_features_match_direct_computation():
+    """Đặc trưng cache giống cách tính trực tiếp trên f"{title} {content}" """
+    print("🧪 Testing text features...")
+    cache = TextFeatureCache()
+    item = {"title": "Định lý Pythagoras", "content": "The theorem: a^2 + b^2 = c^2 in every right triangle!"}
+    text = f"{item['title']} {item['content']}"
+
+    features = cache.item_features(item)
+    assert features.word_count == len(text.split())
+    assert features.char_count == len(text)
+    assert features.unique_words == len(set(text.lower().split()))
+    assert features.language == "vi"
+    assert list(features.keywords) == [w for w in text.lower().split() if len(w) > 3 and w != "the"][:10]
+    assert features.contains("right triangle")
+
+    # Lần gọi thứ hai lấy từ cache, không tokenize lại
+    hits = cache.stats["hits"]
+    assert cache.item_features(dict(item)) is features
+    assert cache.stats["hits"] == hits + 3
+    print("✅ Text features OK")
+    return True
+
+
+def test_cache_memory_bound():
+    """Cache LRU không vượt quá giới hạn bộ nhớ"""
+    print("🧪 Testing cache bound...")
+    cache = TextFeatureCache(max_bytes=50_000)
+    for i in range(500):
+        cache.features(f"bài học số {i} " * 20)
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 50_000
+    assert stats["evictions"] > 0
+    print("✅ Cache bound OK")
+    return True
+
+
+def test_vocab_reset_keeps_similarity_correct():
+    """Vocab bị reset khi caller còn giữ đặc trưng cũ: similarity vẫn đúng, không so id của hai vocab"""
+    print("🧪 Testing vocab reset...")
+    cache = TextFeatureCache(max_vocab=5)
+    old = cache.features("alpha beta gamma delta")
+    cache.features("one two three four five six")
+    new = cache.features("epsilon zeta eta theta")
+    assert cache.stats["resets"] == 1 and old.vocab_version != new.vocab_version
+    # Trước khi sửa: cùng id 0..3 ở hai vocab nên hai văn bản khác hẳn nhau có similarity 1.0
+    assert old.jaccard(new) == 0.0
+    assert old.jaccard(cache.features("alpha beta gamma delta")) == 1.0
+    print("✅ Vocab reset OK")
+    return True
+
+
+def test_agents_share_features():
+    """Filter, dedup và language detection dùng chung một entry cho cùng nội dung"""
+    print("🧪 Testing shared features across agents...")
+    filter_agent, dedup_agent = DataFilterAgent(), DataDedupAgent()
+    item = {"id": "a", "title": "Học sinh giỏi", "content": "Học sinh luyện tập phương trình bậc hai mỗi ngày. " * 3}
+    near = {**item, "id": "b", "content": item["content"] + "Thêm bài tập."}
+
+    cache = get_text_feature_cache()
+    quality = asyncio.run(filter_agent.check_content_quality(item, filter_agent.filter_criteria["content_quality"]))
+    misses = cache.stats["misses"]
+    spam = asyncio.run(filter_agent.check_spam(item, filter_agent.filter_criteria["spam_detection"]))
+    assert dedup_agent.detect_language(item["content"]) == "vi"
+    assert cache.stats["misses"] == misses
+    assert quality["passed"] and spam["passed"]
+
+    result = asyncio.run(dedup_agent.fuzzy_deduplication([item, near], {"similarity_threshold": 0.7}))
+    assert [d["id"] for d in result["duplicates"]] == ["b"]
+    print("✅ Shared features OK")
+    return True
+
+
+def main():
+    print("🚀 Text Feature Tests")
+    print("=" * 50)
+    results = [test_features_match_direct_computation(), test_cache_memory_bound(), test_vocab_reset_keeps_similarity_correct(),
+               test_agents_share_features()]
+    print("=" * 50)
+    print(f"📊 {sum(results)}/{len(results)} tests passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)